@@ -0,0 +1,91 @@
+"""Benchmark cell-by-cell against column-batched cell conversion.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_cell_conversion
+
+For the survey and choices sheets of a large synthetic XlsForm, this
+reports rows per second when every cell goes through
+`Worksheet.cell_to_value` (before) and when whole columns go through
+`Worksheet.get_column_blocks` (after). The streaming .xlsx reader is
+always measured. xlrd is measured too if the installed version can
+read .xlsx files.
+"""
+import argparse
+import os.path
+import tempfile
+import time
+
+import xlrd
+
+from odk2stata.odkform.components import Worksheet
+from odk2stata.odkform.workbook import XlsxWorkbook
+from .synthetic import write_xlsform
+
+
+def convert_by_cell(sheet, datemode: int) -> int:
+    """Convert a sheet cell by cell, returning the number of rows."""
+    nrows = 0
+    for row in sheet.get_rows():
+        [Worksheet.cell_to_value(cell, datemode) for cell in row]
+        nrows += 1
+    return nrows
+
+
+def convert_by_column(sheet, datemode: int) -> int:
+    """Convert a sheet in column blocks, returning the number of rows."""
+    header = Worksheet.get_header(sheet, datemode)
+    nrows = 1
+    blocks = Worksheet.get_column_blocks(sheet, len(header), datemode)
+    for _, columns in blocks:
+        nrows += len(columns[0])
+    return nrows
+
+
+def best_rate(func, sheet, datemode: int, repeat: int) -> float:
+    """Get the best rows per second out of several runs."""
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        nrows = func(sheet, datemode)
+        elapsed = time.perf_counter() - start
+        best = max(best, nrows / elapsed)
+    return best
+
+
+def report(label: str, workbook, repeat: int) -> None:
+    """Print before and after rates for the survey and choices sheets."""
+    for sheet_name in ('survey', 'choices'):
+        sheet = workbook.sheet_by_name(sheet_name)
+        before = best_rate(convert_by_cell, sheet, workbook.datemode, repeat)
+        after = best_rate(convert_by_column, sheet, workbook.datemode, repeat)
+        print(f'{label:<8} {sheet_name:<8} {before:>12,.0f} {after:>12,.0f} '
+              f'{after / before:>8.2f}x')
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=20000,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--choices', type=int, default=100000,
+                        help='Rows in the choices sheet')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement; the best is kept')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(path, args.survey, args.choices)
+        print(f'{"reader":<8} {"sheet":<8} {"before rows/s":>12} '
+              f'{"after rows/s":>12} {"speedup":>9}')
+        report('stream', XlsxWorkbook(path), args.repeat)
+        try:
+            book = xlrd.open_workbook(path)
+        except xlrd.XLRDError:
+            print('xlrd     (skipped: this xlrd version cannot read .xlsx)')
+        else:
+            report('xlrd', book, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
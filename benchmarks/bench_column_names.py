@@ -0,0 +1,62 @@
+"""Benchmark building the datasets of an XlsForm, for every naming.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_column_names
+
+This writes synthetic XlsForms of growing size, with deeply nested
+groups and some repeats, and parses each one once. It then reports the
+wall-clock time to build the DatasetCollection for BRIEFCASE,
+AGGREGATE and NO_GROUPS together, which names every column three ways.
+Column name prefixes are memoized per nesting path, so the time per
+survey row should stay about the same as the form grows.
+"""
+import argparse
+import os.path
+import tempfile
+import time
+
+from odk2stata.dataset import DatasetCollection
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.odkform import OdkForm
+from .synthetic import write_xlsform
+
+
+def time_datasets(odkform: OdkForm, repeat: int) -> float:
+    """Get the best wall-clock time, in seconds, to build all datasets."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dataset_source in DatasetSource:
+            DatasetCollection(odkform, dataset_source)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[5000, 10000, 20000],
+                        help='Rows in the survey sheet, one form per size')
+    parser.add_argument('--depth', type=int, default=20,
+                        help='How deep questions are nested in groups')
+    parser.add_argument('--repeats', type=int, default=50,
+                        help='Repeats to spread questions across')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement; the best is kept')
+    args = parser.parse_args()
+    print(f'depth={args.depth} repeats={args.repeats}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in args.sizes:
+            path = os.path.join(tmpdir, f'bench{size}.xlsx')
+            write_xlsform(path, size, 1000, n_repeats=args.repeats,
+                          depth=args.depth)
+            odkform = OdkForm(path)
+            elapsed = time_datasets(odkform, args.repeat)
+            per_row = elapsed / len(odkform.survey) * 1e6
+            print(f'survey={size:>7} {elapsed:8.3f} s  {per_row:6.2f} us/row')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark writing a Stata dataset or Parquet from an export CSV.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_dta
+
+This writes a synthetic XlsForm and an export CSV for it, then applies
+the do file in Python with DtaExport or ArrowExport: profiling the CSV,
+then writing the .dta, .parquet or .arrow file. It reports the time for
+each step, and the peak memory while writing, measured with
+tracemalloc. The peak should not grow with the number of rows, since
+the rows are streamed. The Parquet and Arrow formats need pyarrow.
+"""
+import argparse
+import csv
+import functools
+import os.path
+import random
+import tempfile
+import time
+import tracemalloc
+
+from odk2stata.dataset import DatasetCollection
+from odk2stata.dofile.do_file import DoFile
+from odk2stata.dofile.dta_export import DtaExport
+from .synthetic import write_xlsform
+
+
+def get_value(rng: random.Random, column) -> str:
+    """Get a random value for a column of an export CSV."""
+    row = column.survey_row
+    if row is None:
+        return ''
+    row_type = row.row_type
+    if row_type.is_select and row.choice_list is not None:
+        names = [str(choice.row_name) for choice in row.choice_list]
+        if row_type.is_select_multiple:
+            return ' '.join(rng.sample(names, min(len(names), 2)))
+        return rng.choice(names)
+    if row_type.type_string == 'integer':
+        return str(rng.randint(0, 1000))
+    if row_type.type_string == 'decimal':
+        return f'{rng.random() * 100:.2f}'
+    return rng.choice(('', 'Some text', 'A "quoted"\nanswer'))
+
+
+def write_export(path: str, dataset, n_rows: int) -> None:
+    """Write a synthetic export CSV for a dataset."""
+    rng = random.Random(0)
+    columns = list(dataset)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([column.column_name for column in columns])
+        for _ in range(n_rows):
+            writer.writerow([get_value(rng, column) for column in columns])
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=200,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--choices', type=int, default=500,
+                        help='Rows in the choices sheet')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[20000, 80000],
+                        help='Records in the export CSV, one run for each')
+    parser.add_argument('--format', choices=['dta', 'parquet', 'ipc'],
+                        default='dta', help='The file format to write')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        form_path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(form_path, args.survey, args.choices)
+        collection = DatasetCollection.from_file(form_path, 'briefcase')
+        do_file = DoFile(collection.primary)
+        print(f'survey={args.survey} variables={len(do_file.dataset.vars)}')
+        for n_rows in args.rows:
+            csv_path = os.path.join(tmpdir, f'bench{n_rows}.csv')
+            out_path = os.path.join(tmpdir, f'bench{n_rows}.{args.format}')
+            write_export(csv_path, collection.primary, n_rows)
+            start = time.perf_counter()
+            if args.format == 'dta':
+                export = DtaExport(do_file, csv_path)
+                write = functools.partial(export.write, out_path)
+            else:
+                from odk2stata.dofile.arrow_export import ArrowExport
+                export = ArrowExport(do_file, csv_path)
+                write = functools.partial(export.write, out_path, args.format)
+            profiled = time.perf_counter()
+            tracemalloc.start()
+            write()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            written = time.perf_counter()
+            size = os.path.getsize(csv_path) / 2 ** 20
+            print(f'rows={n_rows:<8d} csv={size:6.1f} MiB  '
+                  f'profile {profiled - start:6.2f} s  '
+                  f'write {written - profiled:6.2f} s  '
+                  f'({n_rows / (written - profiled):8.0f} rows/s)  '
+                  f'write peak {peak / 2 ** 20:5.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark joining a repeat CSV with its parent, in memory and spilled.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_join
+
+This writes a synthetic XlsForm with a repeat, and export CSVs for it
+with a few repeat rows for each parent row. It reports the time to
+stream the join with RepeatJoin, and the peak memory measured with
+tracemalloc in a second run. It does both with the default memory
+budget, and with a small one that makes the index spill to SQLite.
+With the small budget, the peak should not grow with the number of
+rows.
+"""
+import argparse
+import csv
+import os.path
+import random
+import tempfile
+import time
+import tracemalloc
+
+from odk2stata.dataset import DatasetCollection
+from odk2stata.dataset.join import DEFAULT_MEMORY_BUDGET, RepeatJoin
+from .synthetic import write_xlsform
+
+
+def write_exports(data_dir: str, collection, n_rows: int) -> None:
+    """Write synthetic export CSVs for a primary dataset and a repeat."""
+    rng = random.Random(0)
+    primary = collection.primary
+    repeat = collection.get_repeat_datasets()[0]
+    begin_repeat = repeat.begin_repeat.column_name
+    with open(os.path.join(data_dir, primary.dataset_filename), 'w',
+              newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        names = [column.column_name for column in primary]
+        writer.writerow(names + ['KEY'])
+        for i in range(n_rows):
+            values = [f'uuid:{i}/x' if name == begin_repeat
+                      else f'value {i}' for name in names]
+            writer.writerow(values + [f'uuid:{i}'])
+    with open(os.path.join(data_dir, repeat.dataset_filename), 'w',
+              newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        names = [column.column_name for column in repeat]
+        writer.writerow(names + ['PARENT_KEY', 'KEY', begin_repeat])
+        for i in range(n_rows):
+            for j in range(rng.randint(0, 5)):
+                key = f'uuid:{i}/x[{j + 1}]'
+                values = [str(rng.randint(0, 1000)) for _ in names]
+                writer.writerow(values + [f'uuid:{i}', key, f'uuid:{i}/x'])
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=40,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[20000, 80000],
+                        help='Parent records in the export, one run for '
+                             'each')
+    parser.add_argument('--small-budget', type=int, default=2 ** 20,
+                        help='The memory budget, in bytes, for the spilled '
+                             'run')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        form_path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(form_path, args.survey, 50, n_lists=10, n_repeats=1)
+        collection = DatasetCollection.from_file(form_path, 'briefcase')
+        repeat = collection.get_repeat_datasets()[0]
+        for n_rows in args.rows:
+            write_exports(tmpdir, collection, n_rows)
+            size = os.path.getsize(os.path.join(tmpdir,
+                                                repeat.dataset_filename))
+            for budget in DEFAULT_MEMORY_BUDGET, args.small_budget:
+                join = RepeatJoin(repeat, tmpdir, memory_budget=budget)
+                start = time.perf_counter()
+                rows = sum(1 for _ in join)
+                elapsed = time.perf_counter() - start
+                tracemalloc.start()
+                sum(1 for _ in join)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f'rows={n_rows:<8d} repeat csv={size / 2 ** 20:6.1f} '
+                      f'MiB  budget={budget / 2 ** 20:6.1f} MiB  '
+                      f'joined={rows:<8d} {elapsed:6.2f} s  '
+                      f'({rows / elapsed:8.0f} rows/s)  '
+                      f'peak {peak / 2 ** 20:6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
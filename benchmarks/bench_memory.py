@@ -0,0 +1,88 @@
+"""Benchmark the memory used per survey row by the object model.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_memory
+
+This writes a synthetic XlsForm and measures, with tracemalloc, the
+memory that stays allocated after each step: parsing the OdkForm, then
+building the DatasetCollection, then importing the Stata variables. For
+batch jobs over many forms, this object graph is the main memory cost.
+
+The total per survey row must stay under BUDGET_BYTES_PER_ROW, or the
+benchmark exits with an error. The budget covers the survey table with
+its text cells, the SurveyRow, Column and StataVar objects, and their
+lookups. It leaves some headroom over the measured cost, so that only a
+real regression fails.
+
+Module attributes:
+    BUDGET_BYTES_PER_ROW: The most memory per survey row that is allowed
+"""
+import argparse
+import gc
+import os.path
+import sys
+import tempfile
+import tracemalloc
+
+from odk2stata.dataset import DatasetCollection
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.dofile.imported_dataset import ImportedDataset
+from odk2stata.odkform import OdkForm
+from .synthetic import write_xlsform
+
+
+BUDGET_BYTES_PER_ROW = 1280
+
+
+def traced() -> int:
+    """Get the memory allocated now, in bytes, after a collection."""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=20000,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--choices', type=int, default=1000,
+                        help='Rows in the choices sheet')
+    parser.add_argument('--repeats', type=int, default=20,
+                        help='Repeats to spread questions across')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='How deep questions are nested in groups')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(path, args.survey, args.choices,
+                      n_repeats=args.repeats, depth=args.depth)
+        tracemalloc.start()
+        start = traced()
+        odkform = OdkForm(path)
+        after_form = traced()
+        collection = DatasetCollection(odkform, DatasetSource.BRIEFCASE)
+        after_datasets = traced()
+        imported = [ImportedDataset(dataset, False, False, False)
+                    for dataset in collection.get_datasets()]
+        after_import = traced()
+        tracemalloc.stop()
+    n_rows = len(odkform.survey)
+    steps = (
+        ('OdkForm', after_form - start),
+        ('DatasetCollection', after_datasets - after_form),
+        ('ImportedDataset', after_import - after_datasets),
+    )
+    print(f'survey rows={n_rows} datasets={len(imported)}')
+    for name, size in steps:
+        print(f'{name:<18} {size / n_rows:8.0f} bytes/row')
+    per_row = (after_import - start) / n_rows
+    print(f'{"total":<18} {per_row:8.0f} bytes/row  '
+          f'(budget {BUDGET_BYTES_PER_ROW})')
+    if per_row > BUDGET_BYTES_PER_ROW:
+        sys.exit(f'Over budget: {per_row:.0f} > {BUDGET_BYTES_PER_ROW} '
+                 f'bytes per survey row')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark sequential against parallel parsing of an XlsForm.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_parallel_parse
+
+This writes a synthetic XlsForm with large choices and external_choices
+tabs and reports the wall-clock time to parse it with
+`OdkForm(path)` and with `OdkForm(path, parallel=True)`. Both times
+include loading the external_choices tab, which a sequential parse
+only does when it is first needed.
+"""
+import argparse
+import os.path
+import tempfile
+import time
+
+from odk2stata.odkform import OdkForm
+from .synthetic import write_xlsform
+
+
+def time_parse(path: str, parallel: bool, repeat: int) -> float:
+    """Get the best wall-clock time, in seconds, to parse a form."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        odkform = OdkForm(path, parallel=parallel)
+        len(odkform.choices.external_choices)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=5000,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--choices', type=int, default=50000,
+                        help='Rows in the choices sheet')
+    parser.add_argument('--external', type=int, default=50000,
+                        help='Rows in the external_choices sheet')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement; the best is kept')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(path, args.survey, args.choices, args.external)
+        sequential = time_parse(path, False, args.repeat)
+        parallel = time_parse(path, True, args.repeat)
+    print(f'survey={args.survey} choices={args.choices} '
+          f'external={args.external} cpus={os.cpu_count()}')
+    print(f'sequential {sequential:8.2f} s')
+    print(f'parallel   {parallel:8.2f} s  ({sequential / parallel:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
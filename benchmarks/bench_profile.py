@@ -0,0 +1,83 @@
+"""Benchmark profiling an export CSV, sequentially and in parallel.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_profile
+
+This writes a synthetic export CSV with numeric, categorical, long text
+and empty columns, and reports the wall-clock time to profile it with
+`profile_csv(path)` and with a process pool. The parallel time depends
+on the number of CPUs.
+"""
+import argparse
+import csv
+from concurrent.futures import ProcessPoolExecutor
+import os.path
+import random
+import tempfile
+import time
+
+from odk2stata.dataset.profile import profile_csv
+
+
+def write_csv(path: str, n_rows: int, n_columns: int) -> None:
+    """Write a synthetic export CSV.
+
+    The columns cycle through numbers, a few categories, long text with
+    quotes and newlines, and empty values.
+    """
+    rng = random.Random(0)
+    header = [f'grp-q{i}' for i in range(n_columns)]
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for _ in range(n_rows):
+            row = []
+            for i in range(n_columns):
+                kind = i % 4
+                if kind == 0:
+                    row.append(str(rng.randint(0, 100000)))
+                elif kind == 1:
+                    row.append(rng.choice(('yes', 'no', 'dk')))
+                elif kind == 2:
+                    row.append('A "long"\nanswer ' * rng.randint(0, 20))
+                else:
+                    row.append('')
+            writer.writerow(row)
+
+
+def time_profile(path: str, executor, repeat: int) -> float:
+    """Get the best wall-clock time, in seconds, to profile a CSV."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        profile_csv(path, executor)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='Records in the CSV')
+    parser.add_argument('--columns', type=int, default=40,
+                        help='Columns in the CSV')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per measurement; the best is kept')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.csv')
+        write_csv(path, args.rows, args.columns)
+        size = os.path.getsize(path) / 2 ** 20
+        sequential = time_profile(path, None, args.repeat)
+        with ProcessPoolExecutor() as executor:
+            parallel = time_profile(path, executor, args.repeat)
+    print(f'rows={args.rows} columns={args.columns} size={size:.0f} MiB '
+          f'cpus={os.cpu_count()}')
+    print(f'sequential {sequential:8.2f} s  ({size / sequential:.0f} MiB/s)')
+    print(f'parallel   {parallel:8.2f} s  ({sequential / parallel:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
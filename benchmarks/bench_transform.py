@@ -0,0 +1,69 @@
+"""Benchmark rewriting an export CSV for a faster Stata import.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_transform
+
+This writes a synthetic XlsForm and an export CSV for it, then rewrites
+the CSV with CsvTransform: dropping columns, numbering the select_ones
+and reordering the columns. It reports the time with the default block
+size and with one row per block, and the peak memory with the default
+block size, measured with tracemalloc in a separate run. The peak
+should not grow with the number of rows, since the rows are streamed.
+"""
+import argparse
+import os.path
+import tempfile
+import time
+import tracemalloc
+
+from odk2stata.dataset import DatasetCollection
+from odk2stata.dofile.csv_transform import CsvTransform
+from odk2stata.dofile.do_file import DoFile
+from .bench_dta import write_export
+from .synthetic import write_xlsform
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--survey', type=int, default=200,
+                        help='Rows in the survey sheet')
+    parser.add_argument('--choices', type=int, default=500,
+                        help='Rows in the choices sheet')
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[20000, 80000],
+                        help='Records in the export CSV, one run for each')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        form_path = os.path.join(tmpdir, 'bench.xlsx')
+        write_xlsform(form_path, args.survey, args.choices)
+        collection = DatasetCollection.from_file(form_path, 'briefcase')
+        do_file = DoFile(collection.primary)
+        print(f'survey={args.survey} '
+              f'select_ones={len(do_file.encode_select_one.select_ones)} '
+              f'dropped={len(do_file.drop_column.drop)}')
+        for n_rows in args.rows:
+            csv_path = os.path.join(tmpdir, f'bench{n_rows}.csv')
+            out_path = os.path.join(tmpdir, f'bench{n_rows}_encoded.csv')
+            write_export(csv_path, collection.primary, n_rows)
+            size = os.path.getsize(csv_path) / 2 ** 20
+            for block_rows in None, 1:
+                transform = CsvTransform(do_file, csv_path, block_rows)
+                start = time.perf_counter()
+                transform.write(out_path)
+                elapsed = time.perf_counter() - start
+                print(f'rows={n_rows:<8d} csv={size:6.1f} MiB  '
+                      f'block={transform.block_rows:<6d} '
+                      f'{elapsed:6.2f} s  ({n_rows / elapsed:8.0f} rows/s)  '
+                      f'out={os.path.getsize(out_path) / 2 ** 20:6.1f} MiB')
+            transform = CsvTransform(do_file, csv_path)
+            tracemalloc.start()
+            transform.write(out_path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'rows={n_rows:<8d} peak {peak / 2 ** 20:5.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Write synthetic XlsForms for benchmarks.
+
+Only the standard library is used, so benchmarks do not need a
+spreadsheet writer. Text cells go in a shared strings table, the same
+as in files saved by Excel.
+
+Module attributes:
+    write_xlsx: Write sheets of rows to an .xlsx file
+    write_xlsform: Write a synthetic XlsForm of a given size
+"""
+from typing import Dict, List, Sequence
+from xml.sax.saxutils import escape
+import zipfile
+
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'content-types">'
+    '<Default Extension="rels" ContentType="application/'
+    'vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '</Types>'
+)
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships"><Relationship Id="rId1" Type="http://schemas.'
+    'openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+    '2006/main"><cellXfs count="1"><xf numFmtId="0"/></cellXfs>'
+    '</styleSheet>'
+)
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def column_letters(colx: int) -> str:
+    """Convert a 0-indexed column to letters, e.g. 27 to "AB"."""
+    letters = ''
+    colx += 1
+    while colx:
+        colx, remainder = divmod(colx - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def write_xlsx(path: str, sheets: Dict[str, List[Sequence]]) -> None:
+    """Write sheets of rows to an .xlsx file.
+
+    Args:
+        path: Where to write the file
+        sheets: A dictionary of sheet name to a list of rows. Cells can
+            be str, int, float or None.
+    """
+    shared = {}
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/styles.xml', STYLES)
+        sheet_elems = []
+        rels = []
+        for i, (name, rows) in enumerate(sheets.items(), start=1):
+            sheet_elems.append(f'<sheet name="{escape(name)}" sheetId="{i}" '
+                               f'r:id="rId{i}"/>')
+            rels.append(f'<Relationship Id="rId{i}" Type="{REL_TYPE}/'
+                        f'worksheet" Target="worksheets/sheet{i}.xml"/>')
+            with archive.open(f'xl/worksheets/sheet{i}.xml', 'w') as file:
+                file.write(f'<worksheet xmlns="{MAIN_NS}"><sheetData>'
+                           .encode('utf-8'))
+                for rowx, row in enumerate(rows, start=1):
+                    cells = []
+                    for colx, value in enumerate(row):
+                        if value is None or value == '':
+                            continue
+                        ref = f'{column_letters(colx)}{rowx}'
+                        if isinstance(value, str):
+                            index = shared.setdefault(value, len(shared))
+                            cells.append(f'<c r="{ref}" t="s">'
+                                         f'<v>{index}</v></c>')
+                        else:
+                            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+                    file.write(f'<row r="{rowx}">{"".join(cells)}</row>'
+                               .encode('utf-8'))
+                file.write(b'</sheetData></worksheet>')
+        n = len(sheets)
+        rels.append(f'<Relationship Id="rId{n + 1}" Type="{REL_TYPE}/styles" '
+                    'Target="styles.xml"/>')
+        rels.append(f'<Relationship Id="rId{n + 2}" Type="{REL_TYPE}/'
+                    'sharedStrings" Target="sharedStrings.xml"/>')
+        archive.writestr('xl/workbook.xml', (
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+            f'{"".join(sheet_elems)}</sheets></workbook>'
+        ))
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+            f'2006/relationships">{"".join(rels)}</Relationships>'
+        ))
+        strings = ''.join(f'<si><t>{escape(text)}</t></si>' for text in shared)
+        archive.writestr('xl/sharedStrings.xml', (
+            f'<sst xmlns="{MAIN_NS}" count="{len(shared)}" '
+            f'uniqueCount="{len(shared)}">{strings}</sst>'
+        ))
+
+
+SURVEY_HEADER = ['type', 'name', 'label::English', 'label::French', 'hint',
+                 'relevant', 'constraint', 'required', 'appearance',
+                 'calculation']
+CHOICES_HEADER = ['list_name', 'name', 'label::English', 'label::French',
+                  'o2s_number']
+
+
+def write_xlsform(path: str, n_survey: int, n_choices: int,
+                  n_external: int = 0, n_lists: int = 50,
+                  n_repeats: int = 0, depth: int = 1) -> None:
+    """Write a synthetic XlsForm.
+
+    The survey has a mix of select_one, select_multiple, integer, text
+    and geopoint questions, split across groups and repeats.
+
+    Args:
+        path: Where to write the file
+        n_survey: The number of questions in the survey
+        n_choices: The number of rows in the choices sheet
+        n_external: The number of rows in the external_choices sheet
+        n_lists: The number of choice lists in the choices sheet
+        n_repeats: The number of repeats to spread questions across
+        depth: How deep questions are nested. Each group or repeat of
+            questions is inside `depth - 1` more groups.
+    """
+    survey = [SURVEY_HEADER]
+    kinds = ('select_one list{}', 'integer', 'text', 'select_multiple list{}',
+             'decimal', 'geopoint', 'note', 'select_one_external village')
+    per_group = max(n_survey // max(n_repeats, 1), 1)
+    outer_groups = [['end group']] * (depth - 1)
+    for i in range(n_survey):
+        if i % per_group == 0:
+            if i:
+                survey.append(['end repeat' if n_repeats else 'end group'])
+                survey.extend(outer_groups)
+            for level in range(depth - 1):
+                survey.append(['begin group', f'outer{i}_{level}',
+                               f'Outer group {i} {level}'])
+            kind = 'begin repeat' if n_repeats else 'begin group'
+            survey.append([kind, f'grp{i}', f'Group {i}'])
+        row_type = kinds[i % len(kinds)].format(i % max(n_lists, 1))
+        if not n_external and 'external' in row_type:
+            row_type = 'text'
+        survey.append([row_type, f'q{i}', f'{i}. Question number {i}?',
+                       f'{i}. Question numero {i}?', f'Hint {i}',
+                       '${q0} != 1' if i % 5 == 0 else None,
+                       '. > 0' if 'integer' in row_type else None,
+                       'yes' if i % 2 else None, None, None])
+    if n_survey:
+        survey.append(['end repeat' if n_repeats else 'end group'])
+        survey.extend(outer_groups)
+    choices = [CHOICES_HEADER]
+    for i in range(n_choices):
+        list_name = f'list{i % max(n_lists, 1)}'
+        choices.append([list_name, i, f'Option {i}', f'Choix {i}',
+                        i if i % 3 == 0 else None])
+    sheets = {'survey': survey, 'choices': choices}
+    if n_external:
+        external = [['list_name', 'name', 'label', 'district']]
+        for i in range(n_external):
+            external.append(['village', f'v{i}', f'Village {i}',
+                             f'd{i % 100}'])
+        sheets['external_choices'] = external
+    sheets['settings'] = [['form_title', 'form_id'], ['Benchmark', 'bench']]
+    write_xlsx(path, sheets)
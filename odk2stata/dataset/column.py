@@ -1,10 +1,15 @@
 """A module defining the Column class."""
+import sys
+
 from ..odkform.survey import SurveyRow
 
 
 class Column:
     """Describe a column in the dataset.
 
+    A form has a Column per survey row for each dataset source, so the
+    class uses slots, and column names are interned.
+
     Instance attributes:
         column_name: The column name in the original CSV
         survey_row: The SurveyRow associated with this Column
@@ -12,6 +17,8 @@ class Column:
             column, if there is one.
     """
 
+    __slots__ = ('column_name', 'survey_row', 'repeat_dataset')
+
     def __init__(self, column_name: str, survey_row: SurveyRow):
         """Initialize a Column instance.
 
@@ -19,13 +26,14 @@ class Column:
             column_name: The column name in the original CSV
             survey_row: The SurveyRow associated with this Column
         """
-        self.column_name = column_name
+        self.column_name = sys.intern(column_name)
         self.survey_row = survey_row
         self.repeat_dataset = None
 
     def from_single_odk_row(self) -> bool:
-        has_survey_row = self.survey_row is not None
-        return has_survey_row and self.survey_row.becomes_single_column()
+        if self.survey_row is None:
+            return False
+        return self.survey_row.row_type.becomes_single_column
 
     def based_on_odk_row(self) -> bool:
         return self.survey_row is not None
@@ -36,7 +44,7 @@ class Column:
     def get_odk_type(self):
         if self.survey_row is None:
             return None
-        return self.survey_row.get_type()
+        return self.survey_row.row_type.type_string
 
     def get_odk_name(self):
         if self.survey_row is None:
@@ -46,7 +54,7 @@ class Column:
     def is_numeric(self):
         if self.survey_row is None:
             return False
-        return self.survey_row.is_numeric_type()
+        return self.survey_row.row_type.is_numeric
 
     def __hash__(self):
         """Make a hash based on the column name and the survey row."""
@@ -1,8 +1,12 @@
 """A module for describing datasets and importing them."""
-from typing import List
+from typing import List, Optional
 
 from .column import Column
-from .utils import DatasetSource, get_column_name, strip_illegal_chars
+from .export_files import CsvLocation, get_csv_filename
+from .header import HeaderReconciliation
+from .profile import CsvProfile
+from .utils import (DatasetSource, get_column_separator,
+                    strip_illegal_chars)
 from ..odkform import OdkForm
 from ..odkform.survey import SurveyRow
 
@@ -18,18 +22,36 @@ class Dataset:
             attribute is the Column that begins the repeat group
         import_context: An object to keep track of state during import
         columns: A list of Columns contained in this dataset
+        parent: The dataset that has the column that begins this repeat
+            group dataset, or None for the primary dataset
+        children: The repeat group datasets that begin in this dataset,
+            in order
+        header_reconciliation: The match of the columns against the
+            header of the real export CSV, or None if it was not read
+        data_profile: The profile of the data in the real export CSV,
+            or None if it was not profiled
+        export_location: Where the real export CSV was found, a path or
+            a ZipMember, or None if it was not looked for or not found
     """
 
+    __slots__ = ('odkform', 'dataset_source', 'begin_repeat',
+                 'dataset_filename', 'columns', 'parent', 'children',
+                 'header_reconciliation', 'data_profile', 'export_location')
+
     def __init__(self, odkform: OdkForm, dataset_source: DatasetSource,
-                 begin_repeat: Column = None):
+                 begin_repeat: Column = None, parent: 'Dataset' = None):
         """Initialize a Dataset.
 
+        A repeat group dataset is added to the children of its parent.
+
         Args:
             odkform: The OdkForm from whence this dataset comes
             dataset_filename: The filename for this dataset
             dataset_source: The program that created this dataset
             begin_repeat: If this is a repeat group dataset, then this
                 attribute is the Column that begins the repeat group
+            parent: If this is a repeat group dataset, then this is the
+                dataset that has the begin_repeat column
         """
         self.odkform = odkform
         self.dataset_source = dataset_source
@@ -38,6 +60,13 @@ class Dataset:
             self.odkform, self.dataset_source, self.begin_repeat
         )
         self.columns: List[Column] = []
+        self.parent: Optional[Dataset] = parent
+        self.children: List[Dataset] = []
+        self.header_reconciliation: Optional[HeaderReconciliation] = None
+        self.data_profile: Optional[CsvProfile] = None
+        self.export_location: Optional[CsvLocation] = None
+        if parent is not None:
+            parent.children.append(self)
 
         from_briefcase = self.dataset_source == DatasetSource.BRIEFCASE
         if from_briefcase and begin_repeat is None:
@@ -67,6 +96,19 @@ class Dataset:
         full_filename = f'{filename}.csv'
         return full_filename
 
+    def get_csv_filename(self) -> str:
+        """Get the file name of the export CSV of this dataset.
+
+        This is the name of the real export CSV if it was found, which
+        can be the name ODK Central gives it, else `dataset_filename`.
+
+        Returns:
+            The file name, not including any path
+        """
+        if self.export_location is None:
+            return self.dataset_filename
+        return get_csv_filename(self.export_location)
+
     def start_with_submission_date(self):
         """Start the dataset with a column called SubmissionDate.
 
@@ -122,15 +164,13 @@ class Dataset:
             A list of Columns associated with this survey row
         """
         columns = []
-        row_name = survey_row.row_name
-        ancestors = self.get_ancestors(survey_row)
-        column_name = get_column_name(row_name, ancestors, self.dataset_source)
-        if survey_row.is_gps():
+        column_name = self.get_column_name(survey_row)
+        if survey_row.row_type.is_gps:
             for suffix in 'Latitude', 'Longitude', 'Altitude', 'Accuracy':
                 next_column_name = f'{column_name}-{suffix}'
                 next_column = Column(next_column_name, survey_row)
                 columns.append(next_column)
-        elif survey_row.is_begin_repeat():
+        elif survey_row.row_type.is_begin_repeat:
             # TODO: write a test if the repeat is inside a group.
             # TODO: is it the fully-qualified name? or just the row name?
             next_column_name = f'SET-OF-{column_name}'
@@ -141,39 +181,73 @@ class Dataset:
             columns.append(next_column)
         return columns
 
-    def get_ancestors(self, survey_row: SurveyRow) -> List[str]:
-        """Get ancestors for the SurveyRow.
+    def get_column_name(self, survey_row: SurveyRow) -> str:
+        """Get the column name for a SurveyRow in this dataset.
 
-        For naming purposes, we need to know the ancestors of rows
-        within repeats or groups. If a row is inside a begin repeat,
-        then we only take ancestors after that begin repeat.
+        This is the name of the row, after the names of its ancestors
+        inside this dataset. The prefix for the ancestors is memoized
+        in the row's AncestorPath.
 
         Args:
-            survey_row: The row for which to get ancestors
+            survey_row: The row for which to get the column name
 
         Returns:
-            A list of the names of the ancestor nodes.
+            The column name, without the suffixes for a geopoint or a
+            repeat
+
+        Raises:
+            TypeError: If the row name is not a str
         """
-        ancestors = list(survey_row.ancestors)
-        if self.begin_repeat is not None:
-            while ancestors:
-                if self.begin_repeat.survey_row is ancestors.pop(0):
-                    break
-        return [i.row_name for i in ancestors]
+        row_name = survey_row.row_name
+        if not isinstance(row_name, str):
+            msg = (f'Parameter "row_name" must be of type "str". Got '
+                   f'{type(row_name)} instead')
+            raise TypeError(msg)
+        start = self.get_ancestor_start(survey_row)
+        separator = get_column_separator(self.dataset_source)
+        prefix = survey_row.ancestor_path.get_prefix(start, separator)
+        return prefix + row_name
+
+    def get_ancestor_start(self, survey_row: SurveyRow) -> int:
+        """Get where the ancestors inside this dataset start.
+
+        If a row is inside a begin repeat, then we only take ancestors
+        after that begin repeat. A row in a repeat dataset is usually
+        directly inside its repeat, so the start is the recorded
+        `repeat_start` of its path.
+
+        Args:
+            survey_row: The row for which to get the start
+
+        Returns:
+            The index of the first ancestor inside this dataset
+        """
+        if self.begin_repeat is None:
+            return 0
+        begin_row = self.begin_repeat.survey_row
+        ancestors = survey_row.ancestors
+        start = survey_row.ancestor_path.repeat_start
+        if start and ancestors[start - 1] is begin_row:
+            return start
+        for i, ancestor in enumerate(ancestors, start=1):
+            if ancestor is begin_row:
+                return i
+        return len(ancestors)
 
     def get_datasets(self) -> list:
         """Return this dataset and repeat datasets under it.
 
-        This is a depth-first search.
+        This is a depth-first search over the children, at any depth.
+        DatasetCollection keeps the result for the primary dataset, so
+        prefer `DatasetCollection.get_datasets`.
 
         Returns:
-            A list of Datasets. This dataset is last in the list.
+            A list of Datasets. Each dataset comes after the datasets
+            nested under it, so this dataset is last in the list.
         """
         datasets = []
-        for column in self:
-            if column.repeat_dataset is not None:
-                repeats = column.repeat_dataset.get_datasets()
-                datasets.extend(repeats)
+        for child in self.children:
+            datasets.extend(child.get_datasets())
         datasets.append(self)
         return datasets
 
@@ -212,10 +286,38 @@ class Dataset:
             if column.repeat_dataset is not None:
                 yield from column.repeat_dataset.inserted_iter()
 
+    def reconcile_header(self, header: List[str]) -> HeaderReconciliation:
+        """Match the columns against the header of the real export CSV.
+
+        The result is kept in `header_reconciliation`, so that the real
+        column positions are used from then on.
+
+        Args:
+            header: The column names in the export CSV, in order
+
+        Returns:
+            The reconciliation
+        """
+        predicted = [column.column_name for column in self]
+        self.header_reconciliation = HeaderReconciliation(predicted, header)
+        return self.header_reconciliation
+
     def is_repeat_dataset(self) -> bool:
         """Return if this dataset is a repeat dataset."""
         return self.begin_repeat is not None
 
+    def get_depth(self) -> int:
+        """Return how many repeats this dataset is nested under.
+
+        The primary dataset has depth 0, and a repeat in it depth 1.
+        """
+        depth = 0
+        parent = self.parent
+        while parent is not None:
+            depth += 1
+            parent = parent.parent
+        return depth
+
     def __getitem__(self, key):
         """Return column specified by key."""
         return self.columns[key]
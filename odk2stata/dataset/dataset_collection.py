@@ -1,26 +1,46 @@
 """A module for handling datasets derived from ODK files."""
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Dict, Iterator, List, Tuple
 
+from .column import Column
 from .dataset import Dataset
+from .export_files import CsvLocation, ExportFiles
+from .header import HeaderReconciliation, read_csv_header
+from .join import DEFAULT_MEMORY_BUDGET, RepeatJoin
+from .profile import CsvProfile, profile_csv
 from .utils import DatasetSource
 from ..odkform import OdkForm
+from ..odkform.cache import FormCache
+from ..odkform.source import FormSource, is_path
+from ..odkform.survey import SurveyRow
 
 
 class DatasetCollection:
     """A class to represent all data associated with an ODK form.
 
+    The datasets form a tree of repeats, which can be nested to any
+    depth. Each Dataset links to its parent and children. The tree and
+    its traversal orders are built once, so the queries on a collection
+    do not search the tree again.
+
     Instance attributes:
         odkform: The source ODK form
         dataset_source: From whence the dataset originates
         primary: The primary dataset. This always exists
+        datasets: All datasets, each after the datasets nested under it,
+            so the primary dataset is last
+        inserted_columns: All columns in the original ODK ordering.
+            The columns of a repeat come right after the column that
+            begins it.
+        appended_columns: All columns in appended (merged) order. The
+            columns of a dataset come first, then those of each repeat
+            dataset in it, in turn.
     """
 
     def __init__(self, odkform: OdkForm, dataset_source: DatasetSource):
         """Initialize a DatasetCollection.
 
-        Right now, support multiple, but not nested repeats. Therefore,
-        repeats are stored as a list.
-
         Args:
             odkform: The source ODK form
             dataset_source: From whence the dataset originates
@@ -28,12 +48,22 @@ class DatasetCollection:
         self.odkform = odkform
         self.dataset_source = dataset_source
         self.primary = self.odkform_to_dataset(odkform, dataset_source)
+        self.datasets: List[Dataset] = self.primary.get_datasets()
+        self.inserted_columns: Tuple[Column, ...] = \
+            tuple(self.primary.inserted_iter())
+        self.appended_columns: Tuple[Column, ...] = \
+            tuple(self.primary.appended_iter())
 
     @staticmethod
     def odkform_to_dataset(odkform: OdkForm, dataset_source: DatasetSource) \
             -> Dataset:
         """Convert an OdkForm into a Dataset.
 
+        Each survey row goes in the dataset of the innermost repeat it
+        is nested under, or in the primary dataset. A "begin repeat"
+        row makes a new repeat dataset, a child of the dataset that the
+        row goes in.
+
         Args:
             odkform: The source ODK form
             dataset_source: From whence the dataset originates
@@ -41,26 +71,28 @@ class DatasetCollection:
         Returns:
             A Dataset representing the primary dataset
         """
-        dataset_stack = []
         primary_dataset = Dataset(odkform, dataset_source)
-        current_dataset = primary_dataset
+        repeat_datasets: Dict[SurveyRow, Dataset] = {}
         for row in odkform.survey:
-            if row.becomes_column():
-                new_columns = current_dataset.add_next(row)
-                if row.is_begin_repeat():
-                    dataset_stack.append(current_dataset)
-                    new_column = new_columns[0]
-                    new_column.repeat_dataset = Dataset(odkform, dataset_source,
-                                                        begin_repeat=new_column)
-                    current_dataset = new_column.repeat_dataset
-            elif row.is_end_repeat():
-                current_dataset = dataset_stack.pop()
+            if not row.row_type.becomes_column:
+                continue
+            dataset = primary_dataset
+            repeat_start = row.ancestor_path.repeat_start
+            if repeat_start:
+                dataset = repeat_datasets[row.ancestors[repeat_start - 1]]
+            new_columns = dataset.add_next(row)
+            if row.row_type.is_begin_repeat:
+                new_column = new_columns[0]
+                new_column.repeat_dataset = Dataset(
+                    odkform, dataset_source, begin_repeat=new_column,
+                    parent=dataset
+                )
+                repeat_datasets[row] = new_column.repeat_dataset
         return primary_dataset
 
     def get_repeat_datasets(self) -> List[Dataset]:
         """Return the repeat Datasets in this collection."""
-        all_datasets = self.get_datasets()
-        return all_datasets[:-1]
+        return self.datasets[:-1]
 
     def get_datasets(self) -> List[Dataset]:
         """Return all Datasets in this collection.
@@ -68,50 +100,200 @@ class DatasetCollection:
         This includes the primary dataset as the last element.
 
         Returns:
-            A list of datasets in this collection.
+            A list of datasets in this collection. It must not be
+            changed.
         """
-        return self.primary.get_datasets()
+        return self.datasets
 
     def can_merge_single_repeat(self) -> bool:
         """Return if there a single repeat.
 
         We can merge a single repeat if there are exactly two datasets.
         """
-        return len(self.get_datasets()) == 2
+        return len(self.datasets) == 2
+
+    def reconcile_headers(self, data_dir: str) \
+            -> Dict[str, HeaderReconciliation]:
+        """Match the datasets against the headers of the export CSVs.
+
+        Each dataset is looked for by its file name in the directory or
+        zip file, see ExportFiles. Where it is found is kept in
+        `Dataset.export_location`. Only the header line of each CSV is
+        read.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them, as ODK Central downloads them
+
+        Returns:
+            A dictionary of dataset file name to its reconciliation, for
+            the datasets whose CSV was found
+
+        Raises:
+            DatasetError: If data_dir is neither a directory nor a zip
+                file
+        """
+        result = {}
+        for dataset, path in self._find_data_files(data_dir):
+            header = read_csv_header(path)
+            reconciliation = dataset.reconcile_header(header)
+            result[dataset.dataset_filename] = reconciliation
+        return result
+
+    def profile_data(self, data_dir: str, parallel: bool = False) \
+            -> Dict[str, CsvProfile]:
+        """Profile the data in the export CSVs.
+
+        Each dataset is looked for by its file name in the directory or
+        zip file. Its profile is kept in `Dataset.data_profile`.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            parallel: If true, profile the chunks of each CSV in a
+                process pool. This is ignored with only one CPU.
+
+        Returns:
+            A dictionary of dataset file name to its profile, for the
+            datasets whose CSV was found
+
+        Raises:
+            DatasetError: If data_dir is neither a directory nor a zip
+                file
+        """
+        data_files = list(self._find_data_files(data_dir))
+        result = {}
+        executor = None
+        if parallel and data_files and (os.cpu_count() or 1) > 1:
+            executor = ProcessPoolExecutor()
+        try:
+            for dataset, path in data_files:
+                dataset.data_profile = profile_csv(path, executor)
+                result[dataset.dataset_filename] = dataset.data_profile
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return result
+
+    def join_repeats(self, data_dir: str, path_to_dir: str,
+                     merge_append: bool = True,
+                     memory_budget: int = DEFAULT_MEMORY_BUDGET) -> List[str]:
+        """Join each repeat dataset with the datasets it is nested in.
+
+        For each repeat dataset, if the export CSVs of it and of all the
+        datasets it is nested in are found, their join is written as a
+        long CSV, named after the repeat CSV with "_long" added. See
+        RepeatJoin. The output directory is created if it does not
+        exist.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            path_to_dir: Path to the output directory
+            merge_append: If true, the columns of each repeat come after
+                all the columns of its parent. If false, they are
+                inserted after the column that begins the repeat.
+            memory_budget: The memory budget of the index of each
+                repeat, in bytes
+
+        Returns:
+            The paths to the CSVs written
+
+        Raises:
+            DatasetError: If data_dir is neither a directory nor a zip
+                file, or a CSV does not have the columns to join on
+        """
+        found = {dataset for dataset, _ in self._find_data_files(data_dir)}
+        os.makedirs(path_to_dir, exist_ok=True)
+        paths = []
+        for dataset in self.get_repeat_datasets():
+            ancestor = dataset
+            while ancestor is not None and ancestor in found:
+                ancestor = ancestor.parent
+            if ancestor is not None:
+                continue
+            join = RepeatJoin(dataset, data_dir, merge_append, memory_budget)
+            base, _ = os.path.splitext(dataset.get_csv_filename())
+            path = os.path.join(path_to_dir, f'{base}_long.csv')
+            join.write_csv(path)
+            paths.append(path)
+        return paths
+
+    def _find_data_files(self, data_dir: str) \
+            -> Iterator[Tuple[Dataset, CsvLocation]]:
+        """Find the export CSV of each dataset in a directory or zip file.
+
+        Where each CSV is found is kept in `Dataset.export_location`.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+
+        Yields:
+            Each dataset whose CSV was found, and the location of the
+            CSV
+
+        Raises:
+            DatasetError: If data_dir is neither a directory nor a zip
+                file
+        """
+        export_files = ExportFiles(data_dir)
+        for dataset in self.datasets:
+            location = export_files.find(dataset)
+            dataset.export_location = location
+            if location is not None:
+                yield dataset, location
 
     def merged_iter(self):
         """Iterate over the columns in merged dataset order.
 
+        This is the appended order. See `appended_columns`.
+
         Yields:
             The next Column
         """
-        yield from self.primary.merged_iter()
+        return iter(self.appended_columns)
 
     def ordered_iter(self):
         """Iterate over the columns as in the original ODK ordering.
 
+        See `inserted_columns`.
+
         Yields:
             The next Column
         """
-        yield from self.primary.ordered_iter()
+        return iter(self.inserted_columns)
 
     @classmethod
-    def from_file(cls, path: str, dataset_source: str):
+    def from_file(cls, path: FormSource, dataset_source: str,
+                  cache: FormCache = None, parallel: bool = False,
+                  filename: str = None):
         """Initialize a DatasetCollection with a filename.
 
         This method is provided to initialize a DatasetCollection
         easily, possibly from the command-line or REPL.
 
         Args:
-            path: The path where to find the ODK file
+            path: The path where to find the ODK file, or the ODK file
+                in memory. See OdkForm.
             dataset_source: From whence the dataset originates. This
                 must be a string that DatasetSource understands.
+            cache: A cache of parsed ODK files. If None, or if the ODK
+                file is in memory, then the ODK file is always parsed.
+            parallel: If true, parse the sheets of the ODK file at the
+                same time
+            filename: The logical file name of the ODK file. If None,
+                this is the path.
 
         Returns:
             An initialized DatasetCollection
         """
         source = DatasetSource.from_string(dataset_source)
-        odkform = OdkForm(path)
+        if cache is not None and is_path(path):
+            odkform = cache.get_odkform(path, parallel=parallel,
+                                        filename=filename)
+        else:
+            odkform = OdkForm(path, parallel=parallel, filename=filename)
         return cls(odkform, source)
 
     def __repr__(self):
@@ -0,0 +1,191 @@
+"""A module to find and open the export CSVs of a form.
+
+The export CSVs are either files in a directory, as ODK Briefcase
+writes them, or members of a zip file, as ODK Central downloads them.
+A zip file is never extracted: its members are read as streams, and
+decompressed as they are read.
+
+ODK Central names the CSV of the primary dataset after the form ID, and
+the CSV of a repeat after the form ID and the repeat name, joined by a
+hyphen. Both these names and the names that Briefcase uses, see
+`Dataset.get_dataset_filename`, are looked for.
+
+Module attributes:
+    ZipMember: A CSV in a zip file
+    CsvLocation: The type of the location of a CSV: a path, or a
+        ZipMember
+    ZipMemberText: A zip member opened as text, which owns its zip file
+    open_csv: Open a CSV as text, wherever it is
+    get_csv_filename: Get the file name of a CSV, wherever it is
+    get_export_filenames: Get the file names an export CSV can have
+    ExportFiles: The export CSVs of a form, in a directory or a zip
+        file
+"""
+from collections import namedtuple
+import io
+import os.path
+from typing import BinaryIO, Dict, List, Optional, TextIO, Union
+import zipfile
+
+from ..error import DatasetError
+
+
+class ZipMember(namedtuple('ZipMember', ('archive', 'name'))):
+    """A CSV in a zip file.
+
+    Args:
+        archive: The path to the zip file
+        name: The name of the member in the zip file
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        """Get the member as a path inside the zip file, for messages."""
+        return f'{self.archive}/{self.name}'
+
+
+CsvLocation = Union[str, ZipMember]
+
+
+class ZipMemberText(io.TextIOWrapper):
+    """A zip member opened as text, which owns its zip file.
+
+    Instance attributes:
+        archive: The open zip file, closed with this file
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, member: BinaryIO):
+        """Initialize a ZipMemberText.
+
+        Args:
+            archive: The open zip file
+            member: The member, opened from the zip file
+        """
+        super().__init__(member, encoding='utf-8-sig', newline='')
+        self.archive = archive
+
+    def close(self) -> None:
+        """Close the member, and then the zip file."""
+        try:
+            super().close()
+        finally:
+            self.archive.close()
+
+
+def open_csv(location: CsvLocation) -> TextIO:
+    """Open a CSV as text, wherever it is.
+
+    The text is decoded as UTF-8, without a byte order mark, and with
+    newlines untranslated, as the csv module expects. A zip member is
+    decompressed as it is read.
+
+    Args:
+        location: A path to a CSV, or a ZipMember
+
+    Returns:
+        A text file object. Closing it also closes the zip file that a
+        zip member is in, so use it in a `with` statement.
+
+    Raises:
+        OSError: If the CSV cannot be opened
+        KeyError: If the zip file has no such member
+    """
+    if isinstance(location, ZipMember):
+        archive = zipfile.ZipFile(location.archive)
+        try:
+            member = archive.open(location.name)
+        except BaseException:
+            archive.close()
+            raise
+        return ZipMemberText(archive, member)
+    return open(location, encoding='utf-8-sig', newline='')
+
+
+def get_csv_filename(location: CsvLocation) -> str:
+    """Get the file name of a CSV, without its directory."""
+    if isinstance(location, ZipMember):
+        return location.name.rsplit('/', 1)[-1]
+    return os.path.basename(location)
+
+
+def get_export_filenames(dataset) -> List[str]:
+    """Get the file names that the export CSV of a dataset can have.
+
+    Args:
+        dataset: A Dataset
+
+    Returns:
+        The file name that Briefcase uses, then the one that Central
+        uses, if it is different
+    """
+    result = [dataset.dataset_filename]
+    form_id = str(dataset.odkform.settings.form_id)
+    if dataset.begin_repeat is None:
+        central = f'{form_id}.csv'
+    else:
+        central = f'{form_id}-{dataset.begin_repeat.survey_row.row_name}.csv'
+    if central not in result:
+        result.append(central)
+    return result
+
+
+class ExportFiles:
+    """The export CSVs of a form, in a directory or a zip file.
+
+    Instance attributes:
+        path: The path to the directory or the zip file
+        is_zip: True if the path is a zip file
+    """
+
+    def __init__(self, path: str):
+        """Initialize ExportFiles.
+
+        Only the list of members is read from a zip file.
+
+        Args:
+            path: The path to the directory or the zip file
+
+        Raises:
+            DatasetError: If the path is neither a directory nor a zip
+                file
+            OSError: If the zip file cannot be read
+        """
+        self.path = path
+        self.is_zip = os.path.isfile(path) and zipfile.is_zipfile(path)
+        if not self.is_zip and not os.path.isdir(path):
+            msg = f'"{path}" is neither a directory nor a zip file'
+            raise DatasetError(msg)
+        self._members: Dict[str, str] = {}
+        if self.is_zip:
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    filename = name.rsplit('/', 1)[-1]
+                    if filename.lower().endswith('.csv'):
+                        self._members.setdefault(filename, name)
+
+    def find(self, dataset) -> Optional[CsvLocation]:
+        """Find the export CSV of a dataset.
+
+        Args:
+            dataset: A Dataset
+
+        Returns:
+            The location of the CSV, or None if it is not found
+        """
+        for filename in get_export_filenames(dataset):
+            if self.is_zip:
+                name = self._members.get(filename)
+                if name is not None:
+                    return ZipMember(self.path, name)
+            else:
+                path = os.path.join(self.path, filename)
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        kind = 'zip file' if self.is_zip else 'directory'
+        msg = f'<ExportFiles in {kind} "{self.path}">'
+        return msg
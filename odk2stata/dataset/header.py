@@ -0,0 +1,169 @@
+"""A module to check predicted columns against the header of an export.
+
+The columns of a dataset are predicted from the form. When the form
+has changed since the data were exported, or the export tool names
+columns differently, the predicted columns and the real ones differ.
+Only the header line of the export CSV is needed to find out, so the
+data are never read, even for exports that are many columns wide.
+
+Module attributes:
+    EXPORT_ONLY_COLUMNS: Columns that export tools add, which are not
+        predicted from the form and are not reported as extra
+    read_csv_header: Read only the header of a CSV file
+    longest_increasing_run: Find the largest set of values in order
+    HeaderReconciliation: The result of matching predicted columns
+        against a real header
+"""
+from bisect import bisect_left
+import csv
+from typing import Dict, List, Optional, Sequence, Set
+
+from .export_files import CsvLocation, open_csv
+
+
+EXPORT_ONLY_COLUMNS = frozenset((
+    'KEY', 'PARENT_KEY', 'meta-instanceID', 'meta:instanceID',
+    'meta-instanceName', 'meta:instanceName',
+))
+
+
+def read_csv_header(path: CsvLocation) -> List[str]:
+    """Read only the header of a CSV file.
+
+    The file is read up to the end of the first record, so the size of
+    the data does not matter. A CSV in a zip file is only decompressed
+    that far.
+
+    Args:
+        path: The path to the CSV file, in UTF-8, or a ZipMember
+
+    Returns:
+        The column names, in order. This is empty for an empty file.
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    with open_csv(path) as file:
+        return next(csv.reader(file), [])
+
+
+def longest_increasing_run(values: Sequence[int]) -> Set[int]:
+    """Find the largest set of values that are already in order.
+
+    This is a longest strictly increasing subsequence, found in
+    O(n log n) time.
+
+    Args:
+        values: A sequence of numbers
+
+    Returns:
+        The indexes in `values` of the subsequence
+    """
+    tails: List[int] = []
+    tail_indexes: List[int] = []
+    previous: List[int] = []
+    for i, value in enumerate(values):
+        j = bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_indexes.append(i)
+        else:
+            tails[j] = value
+            tail_indexes[j] = i
+        previous.append(tail_indexes[j - 1] if j else -1)
+    result = set()
+    i = tail_indexes[-1] if tail_indexes else -1
+    while i != -1:
+        result.add(i)
+        i = previous[i]
+    return result
+
+
+class HeaderReconciliation:
+    """The result of matching predicted columns against a real header.
+
+    Columns are matched by name with a hashed lookup. If a name is
+    repeated, then its occurrences are matched in order.
+
+    Instance attributes:
+        predicted: The predicted column names, in order
+        header: The real column names, in order
+        column_positions: For each predicted column, its 1-indexed
+            position in the real header, or None if it is missing
+        missing: The predicted columns that are not in the header
+        extra: The columns in the header that are not predicted,
+            except those in EXPORT_ONLY_COLUMNS
+        reordered: The predicted columns that are in the header, but
+            out of order. This is the fewest columns that would have to
+            move to get the predicted order.
+    """
+
+    def __init__(self, predicted: Sequence[str], header: Sequence[str]):
+        """Initialize a HeaderReconciliation.
+
+        Args:
+            predicted: The predicted column names, in order
+            header: The real column names, in order
+        """
+        self.predicted = list(predicted)
+        self.header = list(header)
+        occurrences: Dict[str, List[int]] = {}
+        for position in range(len(self.header), 0, -1):
+            occurrences.setdefault(self.header[position - 1],
+                                   []).append(position)
+        self.column_positions: List[Optional[int]] = []
+        for name in self.predicted:
+            found = occurrences.get(name)
+            self.column_positions.append(found.pop() if found else None)
+        self.missing = [name for name, position
+                        in zip(self.predicted, self.column_positions)
+                        if position is None]
+        used = set(filter(None, self.column_positions))
+        unused = [name for position, name in enumerate(self.header, 1)
+                  if position not in used]
+        self.extra = [name for name in unused
+                      if name not in EXPORT_ONLY_COLUMNS]
+        matched = [(name, position) for name, position
+                   in zip(self.predicted, self.column_positions)
+                   if position is not None]
+        in_order = longest_increasing_run([i[1] for i in matched])
+        self.reordered = [name for i, (name, _) in enumerate(matched)
+                          if i not in in_order]
+
+    def get_position(self, index: int) -> Optional[int]:
+        """Get the real position of a predicted column.
+
+        Args:
+            index: The 0-indexed position of the predicted column
+
+        Returns:
+            The 1-indexed position in the real header, or None if the
+            column is missing
+        """
+        return self.column_positions[index]
+
+    def is_consistent(self) -> bool:
+        """Return if the header has every predicted column, in order."""
+        return not (self.missing or self.extra or self.reordered)
+
+    def get_report(self) -> List[str]:
+        """Get a description of the differences, one line each.
+
+        Returns:
+            The lines of the report. This is empty if the header is
+            consistent.
+        """
+        lines = []
+        for kind, names in (('Missing', self.missing),
+                            ('Extra', self.extra),
+                            ('Reordered', self.reordered)):
+            if names:
+                lines.append(f'{kind} columns ({len(names)}): '
+                             f'{", ".join(names)}')
+        return lines
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<HeaderReconciliation, {len(self.missing)} missing, '
+               f'{len(self.extra)} extra, {len(self.reordered)} reordered>')
+        return msg
@@ -0,0 +1,410 @@
+"""A module to join repeat datasets with the datasets they are in.
+
+ODK exports a CSV for each repeat group. Each row of a repeat CSV has a
+PARENT_KEY, which is the KEY of its row in the CSV of the dataset that
+the repeat is in. Nested repeats chain the same way. The do file can
+only merge a single repeat, with Stata's `merge 1:m`. RepeatJoin joins
+any repeat with all of the datasets it is nested in, in Python.
+
+The CSV of each repeat in the chain is put in a hash index by
+PARENT_KEY. Then the CSV of the primary dataset is streamed, and each
+row is joined with its repeat rows, depth first. Only the indexes are
+kept, and an index that grows past its memory budget is spilled to a
+temporary SQLite database.
+
+Module attributes:
+    KEY: The column with the key of each row
+    PARENT_KEY: The column with the key of the row of a repeat's parent
+    DEFAULT_MEMORY_BUDGET: The default memory budget of an index, in
+        bytes
+    ROW_OVERHEAD: The bytes of memory counted for each row in an index,
+        besides its data
+    SPILL_BATCH_ROWS: The number of rows inserted at once into a
+        spilled index
+    KeyIndex: An index of rows by a key, spilled to disk when large
+    RepeatJoin: A join of a repeat dataset with the datasets it is in
+"""
+import csv
+import marshal
+from operator import itemgetter
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+from .dataset import Dataset
+from .export_files import CsvLocation, ExportFiles, open_csv
+from .header import read_csv_header
+from ..error import DatasetError
+
+
+KEY = 'KEY'
+PARENT_KEY = 'PARENT_KEY'
+DEFAULT_MEMORY_BUDGET = 256 * 2 ** 20
+ROW_OVERHEAD = 64
+SPILL_BATCH_ROWS = 10000
+
+
+class KeyIndex:
+    """An index of rows by a key, spilled to disk when large.
+
+    Rows are kept in memory, serialized with marshal, until they take
+    more than the memory budget. Then they all move to a SQLite
+    database in a temporary file, which SQLite removes when it is
+    closed, and later rows go there too.
+
+    Rows are removed from the index when they are taken, so the rows
+    left at the end are those whose key was never looked up.
+
+    Instance attributes:
+        memory_budget: The most bytes of rows to keep in memory
+        size: The bytes of rows in memory, including ROW_OVERHEAD each
+        rows: The number of rows in the index
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        """Initialize a KeyIndex.
+
+        Args:
+            memory_budget: The most bytes of rows to keep in memory
+        """
+        self.memory_budget = memory_budget
+        self.size = 0
+        self.rows = 0
+        self._memory: Dict[str, List[bytes]] = {}
+        self._database: Optional[sqlite3.Connection] = None
+        self._pending: List[tuple] = []
+        self._has_key_index = False
+
+    def is_spilled(self) -> bool:
+        """Return if the rows were moved to disk."""
+        return self._database is not None
+
+    def add(self, key: str, row: List[str]) -> None:
+        """Add a row to the index.
+
+        Args:
+            key: The key of the row
+            row: The values in the row
+        """
+        data = marshal.dumps(row)
+        self.rows += 1
+        if self._database is not None:
+            self._pending.append((key, data))
+            if len(self._pending) >= SPILL_BATCH_ROWS:
+                self._flush()
+            return
+        rows = self._memory.get(key)
+        if rows is None:
+            self._memory[key] = [data]
+        else:
+            rows.append(data)
+        self.size += len(data) + ROW_OVERHEAD
+        if self.size > self.memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        """Move the rows in memory to a temporary database."""
+        database = sqlite3.connect('')
+        database.execute('PRAGMA journal_mode = OFF')
+        database.execute('PRAGMA synchronous = OFF')
+        database.execute('CREATE TABLE rows (key TEXT, row BLOB)')
+        database.executemany('INSERT INTO rows VALUES (?, ?)', (
+            (key, data) for key, rows in self._memory.items() for data in rows
+        ))
+        self._database = database
+        self._memory.clear()
+        self.size = 0
+
+    def _flush(self) -> None:
+        """Insert the rows that are waiting into the database."""
+        self._database.executemany('INSERT INTO rows VALUES (?, ?)',
+                                   self._pending)
+        self._pending.clear()
+
+    def take(self, key: str) -> List[List[str]]:
+        """Take the rows with a key out of the index.
+
+        Args:
+            key: The key to look up
+
+        Returns:
+            The rows with the key, in the order they were added
+        """
+        if self._database is None:
+            rows = self._memory.pop(key, ())
+            for data in rows:
+                self.size -= len(data) + ROW_OVERHEAD
+        else:
+            self._flush()
+            if not self._has_key_index:
+                self._database.execute('CREATE INDEX rows_key ON rows (key)')
+                self._has_key_index = True
+            rows = [data for data, in self._database.execute(
+                'SELECT row FROM rows WHERE key = ? ORDER BY rowid', (key,)
+            )]
+            if rows:
+                self._database.execute('DELETE FROM rows WHERE key = ?',
+                                       (key,))
+        self.rows -= len(rows)
+        return [marshal.loads(data) for data in rows]
+
+    def take_rest(self) -> Iterator[List[str]]:
+        """Take all rows that are left out of the index.
+
+        Yields:
+            The rows, grouped by key
+        """
+        if self._database is None:
+            while self._memory:
+                key = next(iter(self._memory))
+                yield from self.take(key)
+            return
+        self._flush()
+        cursor = self._database.execute(
+            'SELECT row FROM rows ORDER BY key, rowid'
+        )
+        for data, in cursor:
+            yield marshal.loads(data)
+        self._database.execute('DELETE FROM rows')
+        self.rows = 0
+
+    def close(self) -> None:
+        """Drop all rows, and remove the temporary database."""
+        self._memory.clear()
+        self._pending.clear()
+        self.size = 0
+        self.rows = 0
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+
+    def __enter__(self):
+        """Return this index."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close this index."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of rows in the index."""
+        return self.rows
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        where = 'on disk' if self.is_spilled() else f'{self.size} bytes'
+        msg = f'<KeyIndex, {self.rows} rows, {where}>'
+        return msg
+
+
+def _read_rows(path: CsvLocation, width: int) -> Iterator[List[str]]:
+    """Stream the rows of a CSV after its header, padded to a width."""
+    padding = [''] * width
+    with open_csv(path) as file:
+        rows = filter(None, csv.reader(file))
+        next(rows, None)
+        for row in rows:
+            if len(row) < width:
+                row = row + padding[len(row):]
+            elif len(row) > width:
+                del row[width:]
+            yield row
+
+
+class RepeatJoin:
+    """A join of a repeat dataset with the datasets it is nested in.
+
+    The result is long: there is a row for each row of the repeat, with
+    the values of the rows it is nested in. As with Stata's
+    `merge 1:m`, a row with no repeat rows is kept once, with empty
+    repeat columns, and repeat rows whose parent is not found come last,
+    with empty parent columns. Where a column name is in more than one
+    dataset, only the column of the outermost one is kept.
+
+    Instance attributes:
+        datasets: The datasets joined, from the primary dataset to the
+            repeat
+        paths: The location of the export CSV of each dataset, a path
+            or a ZipMember
+        headers: The header of the export CSV of each dataset
+        merge_append: If true, the columns of each repeat come after all
+            the columns of its parent. If false, they are inserted after
+            the column that begins the repeat.
+        memory_budget: The memory budget of the index of each repeat
+        header: The column names of the result, in order
+    """
+
+    def __init__(self, repeat: Dataset, data_dir: str,
+                 merge_append: bool = True,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        """Initialize a RepeatJoin, reading the headers of the CSVs.
+
+        Args:
+            repeat: The repeat dataset to join
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            merge_append: If true, the columns of each repeat come after
+                all the columns of its parent. If false, they are
+                inserted after the column that begins the repeat.
+            memory_budget: The memory budget of the index of each repeat
+
+        Raises:
+            DatasetError: If the dataset is not a repeat, or a CSV is
+                not found or does not have the columns to join on
+            OSError: If a CSV cannot be read
+        """
+        if not repeat.is_repeat_dataset():
+            raise DatasetError('Only a repeat dataset can be joined with '
+                               'the datasets it is nested in')
+        self.datasets: List[Dataset] = []
+        dataset = repeat
+        while dataset is not None:
+            self.datasets.insert(0, dataset)
+            dataset = dataset.parent
+        export_files = ExportFiles(data_dir)
+        self.paths: List[CsvLocation] = []
+        for dataset in self.datasets:
+            path = export_files.find(dataset)
+            if path is None:
+                msg = (f'Unable to find the export CSV of dataset '
+                       f'"{dataset.dataset_filename}" in "{data_dir}"')
+                raise DatasetError(msg)
+            self.paths.append(path)
+        self.headers = [read_csv_header(path) for path in self.paths]
+        self.merge_append = merge_append
+        self.memory_budget = memory_budget
+        self._key_positions = [self._find(i, KEY)
+                               for i in range(len(self.datasets) - 1)]
+        self._parent_key_positions = [None] + [
+            self._find(i, PARENT_KEY) for i in range(1, len(self.datasets))
+        ]
+        self._offsets = [0]
+        for header in self.headers:
+            self._offsets.append(self._offsets[-1] + len(header))
+        self._layout = self._get_layout()
+        self.header = [self._get_name(i) for i in self._layout]
+        if len(self._layout) == 1:
+            self._select = lambda row: (row[self._layout[0]],)
+        else:
+            self._select = itemgetter(*self._layout)
+
+    def _find(self, level: int, column_name: str) -> int:
+        """Find the position of a column in a CSV of the join."""
+        try:
+            return self.headers[level].index(column_name)
+        except ValueError:
+            msg = (f'Unable to find column "{column_name}" in '
+                   f'"{self.paths[level]}"')
+            raise DatasetError(msg) from None
+
+    def _get_layout(self) -> List[int]:
+        """Get the position of each result column in a joined row.
+
+        A joined row is the rows of all datasets, one after the other.
+        """
+        layout = []
+        names = set()
+        for level, header in enumerate(self.headers):
+            columns = []
+            for position, name in enumerate(header):
+                if name not in names:
+                    names.add(name)
+                    columns.append(self._offsets[level] + position)
+            insert_at = len(layout)
+            if level and not self.merge_append:
+                begin_repeat = self.datasets[level].begin_repeat.column_name
+                parent_header = self.headers[level - 1]
+                if begin_repeat in parent_header:
+                    begin = self._offsets[level - 1] + \
+                        parent_header.index(begin_repeat)
+                    if begin in layout:
+                        insert_at = layout.index(begin) + 1
+            layout[insert_at:insert_at] = columns
+        return layout
+
+    def _get_name(self, position: int) -> str:
+        """Get the column name of a position in a joined row."""
+        for level, header in enumerate(self.headers):
+            if position < self._offsets[level + 1]:
+                return header[position - self._offsets[level]]
+        raise IndexError(position)
+
+    def __iter__(self) -> Iterator[tuple]:
+        """Stream the rows of the join.
+
+        The repeat CSVs are indexed first, then the CSV of the primary
+        dataset is streamed.
+
+        Yields:
+            The values of each row of the result, in the order of
+            `header`
+        """
+        indexes = [None]
+        try:
+            for level in range(1, len(self.datasets)):
+                indexes.append(self._build_index(level))
+            select = self._select
+            width = len(self.headers[0])
+            for row in _read_rows(self.paths[0], width):
+                for joined in self._expand(0, row, indexes):
+                    yield select(joined)
+            for level in range(1, len(self.datasets)):
+                empty = [''] * self._offsets[level]
+                for row in indexes[level].take_rest():
+                    for joined in self._expand(level, row, indexes):
+                        yield select(empty + joined)
+        finally:
+            for index in indexes[1:]:
+                index.close()
+
+    def _build_index(self, level: int) -> KeyIndex:
+        """Index the rows of a repeat CSV by PARENT_KEY."""
+        index = KeyIndex(self.memory_budget)
+        position = self._parent_key_positions[level]
+        for row in _read_rows(self.paths[level], len(self.headers[level])):
+            index.add(row[position], row)
+        return index
+
+    def _expand(self, level: int, row: List[str],
+                indexes: List[KeyIndex]) -> Iterator[List[str]]:
+        """Join a row with the rows nested in it, depth first.
+
+        Yields:
+            The joined rows, from this level to the innermost
+        """
+        if level == len(self.datasets) - 1:
+            yield row
+            return
+        key = row[self._key_positions[level]]
+        children = indexes[level + 1].take(key) if key else ()
+        if not children:
+            empty = [''] * (self._offsets[-1] - self._offsets[level + 1])
+            yield row + empty
+            return
+        for child in children:
+            for joined in self._expand(level + 1, child, indexes):
+                yield row + joined
+
+    def write_csv(self, path: str) -> int:
+        """Stream the join into a CSV file.
+
+        Args:
+            path: The path to the CSV file
+
+        Returns:
+            The number of rows written
+        """
+        rows = 0
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.header)
+            for row in self:
+                writer.writerow(row)
+                rows += 1
+        return rows
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        names = ' > '.join(dataset.dataset_filename
+                           for dataset in self.datasets)
+        msg = f'<RepeatJoin {names}, {len(self.header)} columns>'
+        return msg
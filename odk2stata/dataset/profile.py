@@ -0,0 +1,589 @@
+"""A module to profile the data in export CSVs.
+
+What to destring, drop and how to store each column is otherwise
+decided only from the form. A profile of the real data tells, for each
+column, how many values are not empty, whether all of them are numbers,
+how long the longest one is, and about how many distinct values there
+are.
+
+An export CSV can have millions of rows. It is memory-mapped and split
+into chunks at record boundaries, and the chunks are profiled in a
+process pool. The profiles of the chunks are then merged. A CSV in a
+zip file is cut into chunks as it is decompressed instead.
+
+Module attributes:
+    DEFAULT_CHUNK_BYTES: The size of a chunk of a CSV to profile at once
+    BATCH_CELLS: The number of cells to transpose into columns at once
+    STREAM_SEARCH_BYTES: How far back from the end of what was read to
+        look for a record boundary, in a CSV read as a stream
+    STR_MAXLEN: The longest string that Stata stores as str#, in bytes
+    NUMBER: A regular expression for a number that Stata can destring
+    DistinctSketch: An estimate of the number of distinct values
+    ColumnProfile: The profile of one column
+    CsvProfile: The profile of every column in a CSV
+    find_chunks: Split a CSV into chunks at record boundaries
+    profile_csv: Profile the columns of a CSV
+"""
+from collections import deque
+from concurrent.futures import Executor
+import csv
+import hashlib
+import io
+from itertools import islice
+import math
+import mmap
+import os
+import re
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+import zipfile
+
+from .export_files import CsvLocation, ZipMember
+
+
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+BATCH_CELLS = 1_000_000
+STREAM_SEARCH_BYTES = 1024 * 1024
+STR_MAXLEN = 2045
+NUMBER = re.compile(r'\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*')
+
+UTF8_BOM = b'\xef\xbb\xbf'
+
+
+class DistinctSketch:
+    """An estimate of the number of distinct values.
+
+    Up to EXACT_LIMIT distinct values are kept, so small counts are
+    exact. After that, a HyperLogLog of 2 ** PRECISION registers is
+    used, with a standard error of about 3%. Sketches from different
+    processes can be merged, since the values are hashed with a fixed
+    hash function.
+
+    Instance attributes:
+        values: The distinct values, or None after switching to the
+            registers
+        registers: The HyperLogLog registers, or None while the values
+            are kept
+
+    Class attributes:
+        EXACT_LIMIT: The most distinct values to keep
+        PRECISION: The number of hash bits that select a register
+    """
+
+    __slots__ = ('values', 'registers')
+
+    EXACT_LIMIT = 256
+    PRECISION = 10
+
+    def __init__(self):
+        """Initialize an empty DistinctSketch."""
+        self.values: Optional[set] = set()
+        self.registers: Optional[bytearray] = None
+
+    def update(self, values: Iterable[str]) -> None:
+        """Add values to the sketch.
+
+        Args:
+            values: The values to add, preferably without duplicates
+        """
+        if self.values is not None:
+            self.values.update(values)
+            if len(self.values) > self.EXACT_LIMIT:
+                values, self.values = self.values, None
+                self.registers = bytearray(1 << self.PRECISION)
+            else:
+                return
+        self._add_to_registers(values)
+
+    def _add_to_registers(self, values: Iterable[str]) -> None:
+        """Add values to the HyperLogLog registers."""
+        registers = self.registers
+        precision = self.PRECISION
+        mask = (1 << precision) - 1
+        rest = 64 - precision
+        for value in values:
+            digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+            hashed = int.from_bytes(digest, 'big')
+            index = hashed & mask
+            rank = rest - (hashed >> precision).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: 'DistinctSketch') -> None:
+        """Add the values of another sketch to this one.
+
+        Args:
+            other: The other sketch
+        """
+        if other.values is not None:
+            self.update(other.values)
+            return
+        if self.values is not None:
+            values = self.values
+            self.values = None
+            self.registers = bytearray(other.registers)
+            self._add_to_registers(values)
+        else:
+            self.registers = bytearray(map(max, self.registers,
+                                           other.registers))
+
+    def count(self) -> int:
+        """Get the number of distinct values, exact or estimated."""
+        if self.values is not None:
+            return len(self.values)
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -i for i in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<DistinctSketch, ~{self.count()} distinct>'
+        return msg
+
+
+class ColumnProfile:
+    """The profile of one column.
+
+    Values are counted as empty only if they are the empty string.
+
+    Instance attributes:
+        name: The column name in the header
+        non_empty: The number of values that are not empty
+        numeric: True if every value that is not empty is a number
+        integral: True if every value that is not empty is a whole
+            number
+        minimum: The smallest number, or None if there is none or the
+            column is not numeric
+        maximum: The largest number, or None if there is none or the
+            column is not numeric
+        max_length: The length of the longest value, in UTF-8 bytes
+        distinct: The sketch of the distinct values
+    """
+
+    __slots__ = ('name', 'non_empty', 'numeric', 'integral', 'minimum',
+                 'maximum', 'max_length', 'distinct')
+
+    def __init__(self, name: str):
+        """Initialize an empty ColumnProfile.
+
+        Args:
+            name: The column name in the header
+        """
+        self.name = name
+        self.non_empty = 0
+        self.numeric = True
+        self.integral = True
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.max_length = 0
+        self.distinct = DistinctSketch()
+
+    def update(self, values: Tuple[str, ...]) -> None:
+        """Add a batch of values of this column to the profile.
+
+        The work on a batch is mostly done by built-in functions, which
+        is why values are added a column at a time.
+
+        Args:
+            values: The values
+        """
+        non_empty = len(values) - values.count('')
+        if not non_empty:
+            return
+        self.non_empty += non_empty
+        distinct = set(values)
+        distinct.discard('')
+        self.max_length = max(self.max_length,
+                              *map(len, map(str.encode, distinct)))
+        self.distinct.update(distinct)
+        if not self.numeric:
+            return
+        if not all(map(NUMBER.fullmatch, distinct)):
+            self._set_not_numeric()
+            return
+        numbers = list(map(float, distinct))
+        self._add_range(min(numbers), max(numbers))
+        if self.integral:
+            self.integral = all(map(float.is_integer, numbers))
+
+    def _set_not_numeric(self) -> None:
+        """Record that a value is not a number."""
+        self.numeric = False
+        self.minimum = None
+        self.maximum = None
+
+    def _add_range(self, minimum: float, maximum: float) -> None:
+        """Widen the range of numbers to include another range."""
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+
+    def merge(self, other: 'ColumnProfile') -> None:
+        """Add the profile of the same column in another chunk.
+
+        Args:
+            other: The other profile
+        """
+        self.non_empty += other.non_empty
+        if not other.numeric:
+            self._set_not_numeric()
+        elif self.numeric and other.minimum is not None:
+            self._add_range(other.minimum, other.maximum)
+        self.integral = self.integral and other.integral
+        self.max_length = max(self.max_length, other.max_length)
+        self.distinct.merge(other.distinct)
+
+    def is_empty(self) -> bool:
+        """Return if every value is empty."""
+        return self.non_empty == 0
+
+    def is_numeric(self) -> bool:
+        """Return if there are values, and they are all numbers."""
+        return self.non_empty > 0 and self.numeric
+
+    def count_distinct(self) -> int:
+        """Get the number of distinct values that are not empty.
+
+        Returns:
+            The number, exact for small counts and estimated otherwise.
+            See DistinctSketch.
+        """
+        return self.distinct.count()
+
+    def get_storage_type(self) -> str:
+        """Get the Stata storage type that fits the values.
+
+        Whole numbers get the smallest integer type that holds their
+        range, other numbers get double. Strings get str#, or strL if
+        they are longer than STR_MAXLEN bytes. An empty column gets
+        byte, as in Stata's import.
+
+        Returns:
+            The storage type, e.g. "int", "str12" or "strL"
+        """
+        if self.is_empty():
+            return 'byte'
+        if self.numeric:
+            if self.integral:
+                for stata_type, low, high in (('byte', -127, 100),
+                                              ('int', -32767, 32740),
+                                              ('long', -2147483647,
+                                               2147483620)):
+                    if low <= self.minimum and self.maximum <= high:
+                        return stata_type
+            return 'double'
+        if self.max_length > STR_MAXLEN:
+            return 'strL'
+        return f'str{self.max_length}'
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<ColumnProfile "{self.name}", {self.non_empty} non-empty, '
+               f'{self.get_storage_type()}>')
+        return msg
+
+
+class CsvProfile:
+    """The profile of every column in a CSV.
+
+    Instance attributes:
+        path: The path to the CSV, or its ZipMember
+        header: The column names in the header, in order
+        rows: The number of records after the header
+        columns: The ColumnProfile of each column, in order
+        columns_by_name: A dictionary of column name to its profile. If
+            a name is repeated, then this has the first column.
+    """
+
+    def __init__(self, path: CsvLocation, header: List[str], rows: int,
+                 columns: List[ColumnProfile]):
+        """Initialize a CsvProfile.
+
+        Args:
+            path: The path to the CSV, or its ZipMember
+            header: The column names in the header, in order
+            rows: The number of records after the header
+            columns: The ColumnProfile of each column, in order
+        """
+        self.path = path
+        self.header = header
+        self.rows = rows
+        self.columns = columns
+        self.columns_by_name: Dict[str, ColumnProfile] = {}
+        for column in reversed(columns):
+            self.columns_by_name[column.name] = column
+
+    def get(self, name: str) -> Optional[ColumnProfile]:
+        """Get the profile of a column by name.
+
+        Args:
+            name: The column name
+
+        Returns:
+            The profile, or None if there is no such column
+        """
+        return self.columns_by_name.get(name)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<CsvProfile "{self.path}", {self.rows} rows, '
+               f'{len(self.columns)} columns>')
+        return msg
+
+
+def _find_record_start(buffer, record_start: int, target: int) -> int:
+    """Find the first record that starts at or after a position.
+
+    Quoted values can span lines, so a newline ends a record only if an
+    even number of quotes came before it in the record. Doubled quotes
+    inside a quoted value do not change that.
+
+    Args:
+        buffer: The CSV, as an mmap
+        record_start: A position where a record starts
+        target: The position to search from
+
+    Returns:
+        The position where the record starts, or the size of the buffer
+    """
+    size = len(buffer)
+    if target >= size:
+        return size
+    odd = buffer[record_start:target].count(b'"') % 2
+    while True:
+        newline = buffer.find(b'\n', target)
+        if newline == -1:
+            return size
+        odd ^= buffer[target:newline].count(b'"') % 2
+        if not odd:
+            return newline + 1
+        target = newline + 1
+
+
+def find_chunks(buffer, chunk_bytes: int = DEFAULT_CHUNK_BYTES) \
+        -> Tuple[int, List[Tuple[int, int]]]:
+    """Split a CSV into chunks at record boundaries.
+
+    Args:
+        buffer: The CSV, as an mmap
+        chunk_bytes: About how many bytes to put in each chunk
+
+    Returns:
+        The end of the header, and the start and end of each chunk of
+        the records after it
+    """
+    start = len(UTF8_BOM) if buffer[:len(UTF8_BOM)] == UTF8_BOM else 0
+    header_end = _find_record_start(buffer, start, start)
+    chunks = []
+    position = header_end
+    while position < len(buffer):
+        end = _find_record_start(buffer, position, position + chunk_bytes)
+        chunks.append((position, end))
+        position = end
+    return header_end, chunks
+
+
+def _read_records(path: str, start: int, end: int) -> Iterator[List[str]]:
+    """Read the records in part of a CSV, skipping blank lines."""
+    with open(path, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        text = buffer[start:end].decode('utf-8-sig')
+    return filter(None, csv.reader(io.StringIO(text, newline='')))
+
+
+def _profile_records(records: Iterator[List[str]],
+                     header: List[str]) -> Tuple[int, List[ColumnProfile]]:
+    """Profile the columns in a stream of records.
+
+    Records are transposed into columns in batches of about BATCH_CELLS
+    cells. Short records are padded with empty values, and values past
+    the header are ignored.
+
+    Args:
+        records: The records, without the header
+        header: The column names in the header
+
+    Returns:
+        The number of records, and the profile of each column
+    """
+    width = len(header)
+    profiles = [ColumnProfile(name) for name in header]
+    batch_rows = max(1, BATCH_CELLS // max(width, 1))
+    padding = [''] * width
+    rows = 0
+    while True:
+        batch = [(row + padding)[:width] if len(row) != width else row
+                 for row in islice(records, batch_rows)]
+        if not batch:
+            break
+        rows += len(batch)
+        for profile, values in zip(profiles, zip(*batch)):
+            profile.update(values)
+    return rows, profiles
+
+
+def _profile_chunk(path: str, start: int, end: int,
+                   header: List[str]) -> Tuple[int, List[ColumnProfile]]:
+    """Profile the columns in a chunk of a CSV file.
+
+    Args:
+        path: The path to the CSV
+        start: The start of the chunk
+        end: The end of the chunk
+        header: The column names in the header
+
+    Returns:
+        The number of records, and the profile of each column
+    """
+    return _profile_records(_read_records(path, start, end), header)
+
+
+def _profile_bytes(data: bytes,
+                   header: List[str]) -> Tuple[int, List[ColumnProfile]]:
+    """Profile the columns in a chunk of a CSV, given as bytes.
+
+    Args:
+        data: Whole records, in UTF-8
+        header: The column names in the header
+
+    Returns:
+        The number of records, and the profile of each column
+    """
+    text = data.decode('utf-8')
+    records = filter(None, csv.reader(io.StringIO(text, newline='')))
+    return _profile_records(records, header)
+
+
+def _iter_stream_chunks(stream: BinaryIO, chunk_bytes: int) \
+        -> Iterator[bytes]:
+    """Split a CSV stream into chunks at record boundaries.
+
+    The stream is read a chunk at a time, so only about two chunks are
+    in memory. The first chunk yielded is the header, without the byte
+    order mark.
+
+    Args:
+        stream: The CSV, as a binary file object
+        chunk_bytes: About how many bytes to put in each chunk
+
+    Yields:
+        The header, then each chunk of the records after it
+    """
+    pending = stream.read(chunk_bytes)
+    if pending[:len(UTF8_BOM)] == UTF8_BOM:
+        pending = pending[len(UTF8_BOM):]
+    header_found = False
+    while True:
+        block = stream.read(chunk_bytes)
+        if not block:
+            break
+        pending += block
+        # Search near the end, but count quotes from the start
+        target = 0 if not header_found \
+            else max(0, len(pending) - STREAM_SEARCH_BYTES)
+        end = _find_record_start(pending, 0, target)
+        if end < len(pending):
+            yield pending[:end]
+            pending = pending[end:]
+            header_found = True
+    if not header_found:
+        end = _find_record_start(pending, 0, 0)
+        yield pending[:end]
+        pending = pending[end:]
+    if pending:
+        yield pending
+
+
+def _profile_stream(location: ZipMember, executor: Optional[Executor],
+                    chunk_bytes: int) -> CsvProfile:
+    """Profile a CSV that can only be read as a stream.
+
+    Chunks are cut from the stream as it is read. With an executor, a
+    few chunks at most wait to be profiled at any time.
+
+    Args:
+        location: The ZipMember of the CSV
+        executor: An executor to profile the chunks at the same time,
+            or None
+        chunk_bytes: About how many bytes to profile at once
+
+    Returns:
+        The profile
+    """
+    with zipfile.ZipFile(location.archive) as archive, \
+            archive.open(location.name) as stream:
+        chunks = _iter_stream_chunks(stream, chunk_bytes)
+        header_text = next(chunks, b'').decode('utf-8')
+        header = next(csv.reader(io.StringIO(header_text, newline='')), [])
+        rows = 0
+        columns = [ColumnProfile(name) for name in header]
+
+        def merge(result: Tuple[int, List[ColumnProfile]]) -> int:
+            chunk_rows, profiles = result
+            for column, profile in zip(columns, profiles):
+                column.merge(profile)
+            return chunk_rows
+
+        if executor is None:
+            for chunk in chunks:
+                rows += merge(_profile_bytes(chunk, header))
+        else:
+            window = 2 * (os.cpu_count() or 1)
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_profile_bytes, chunk,
+                                               header))
+                if len(pending) >= window:
+                    rows += merge(pending.popleft().result())
+            while pending:
+                rows += merge(pending.popleft().result())
+    return CsvProfile(location, header, rows, columns)
+
+
+def profile_csv(path: CsvLocation, executor: Executor = None,
+                chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> CsvProfile:
+    """Profile the columns of a CSV.
+
+    A CSV file is memory-mapped to find the chunks, and each chunk is
+    profiled separately, in the executor if one is given. A CSV in a
+    zip file is decompressed as a stream, and cut into chunks as it is
+    read, so it is never extracted.
+
+    Args:
+        path: The path to the CSV, in UTF-8, or a ZipMember
+        executor: An executor to profile the chunks at the same time,
+            usually a ProcessPoolExecutor. If None, the chunks are
+            profiled in this process, one after another.
+        chunk_bytes: About how many bytes to profile at once
+
+    Returns:
+        The profile
+    """
+    if isinstance(path, ZipMember):
+        return _profile_stream(path, executor, chunk_bytes)
+    with open(path, 'rb') as file:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            return CsvProfile(path, [], 0, [])
+        with buffer:
+            header_end, chunks = find_chunks(buffer, chunk_bytes)
+            header_text = buffer[:header_end].decode('utf-8-sig')
+    header = next(csv.reader(io.StringIO(header_text, newline='')), [])
+    arguments = [(path, start, end, header) for start, end in chunks]
+    if executor is not None and len(chunks) > 1:
+        results = executor.map(_profile_chunk, *zip(*arguments))
+    else:
+        results = (_profile_chunk(*i) for i in arguments)
+    rows = 0
+    columns = [ColumnProfile(name) for name in header]
+    for chunk_rows, profiles in results:
+        rows += chunk_rows
+        for column, profile in zip(columns, profiles):
+            column.merge(profile)
+    return CsvProfile(path, header, rows, columns)
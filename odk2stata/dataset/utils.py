@@ -1,7 +1,7 @@
 """A collection of useful dataset-related functions."""
 from enum import Enum
 import string
-from typing import List
+from typing import Optional
 
 
 class DatasetSource(Enum):
@@ -23,27 +23,25 @@ class DatasetSource(Enum):
             raise ValueError(input)
 
 
-def get_column_name(row_name: str, ancestors: List[str],
-                    dataset_source: DatasetSource) -> str:
-    """Get the column name based on the node hierarchy.
+def get_column_separator(dataset_source: DatasetSource) -> Optional[str]:
+    """Get what follows each group name in a column name.
 
     Args:
-        row_name: The name defined in XLSForm.
-        ancestors: The names of node ancestors, if any. These are the
-            enclosing repeats and begin groups.
         dataset_source: The kind of dataset
+
+    Returns:
+        "-" for Briefcase, ":" for Aggregate, or None for NO_GROUPS,
+        whose column names are only the row names
+
+    Raises:
+        ValueError: If the dataset source is not known
     """
-    if not isinstance(row_name, str):
-        msg = (f'Parameter "row_name" must be of type "str". Got '
-               f'{type(row_name)} instead')
-        raise TypeError(msg)
-    chunks = [*ancestors, row_name]
     if dataset_source == DatasetSource.BRIEFCASE:
-        return '-'.join(chunks)
+        return '-'
     elif dataset_source == DatasetSource.AGGREGATE:
-        return ':'.join(chunks)
+        return ':'
     elif dataset_source == DatasetSource.NO_GROUPS:
-        return row_name
+        return None
     else:
         msg = (f'Dataset source "{dataset_source}" should be one of '
                f'{list(DatasetSource)}')
@@ -0,0 +1,224 @@
+"""A module to write the cleaned dataset as Parquet or Arrow IPC.
+
+ArrowExport applies the plan of a do file to an export CSV, like
+DtaExport, but writes typed columns for Python and R instead of a Stata
+dataset. The rows are streamed in batches of about BATCH_CELLS cells,
+each one a row group in Parquet or a record batch in Arrow IPC, so
+memory does not grow with the size of the export.
+
+This needs pyarrow, which is an optional dependency. Install it with
+`pip install odk2stata[arrow]`.
+
+Module attributes:
+    ARROW_TYPES: A dictionary of Stata numeric type to its Arrow type
+    FILE_FORMATS: A dictionary of file format to its file extension
+    BATCH_CELLS: The default number of cells in a batch
+    ArrowExport: A writer of a Parquet or Arrow IPC file from an export
+        CSV
+"""
+import json
+from typing import Callable, Dict, List, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .export_plan import ExportColumn, ExportPlan
+from ..error import DoFileError
+
+
+ARROW_TYPES = {
+    'byte': pa.int8(),
+    'int': pa.int16(),
+    'long': pa.int32(),
+    'float': pa.float32(),
+    'double': pa.float64(),
+}
+FILE_FORMATS = {
+    'parquet': '.parquet',
+    'ipc': '.arrow',
+}
+BATCH_CELLS = 1_000_000
+
+ENCODED_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+
+class ArrowExport(ExportPlan):
+    """A writer of a Parquet or Arrow IPC file from an export CSV.
+
+    The variables are the same as in the Stata dataset, with these
+    types:
+
+    - Destrung numbers are integers or floats, as wide as the Stata
+      storage type.
+    - Encoded select_ones are dictionary-encoded. The dictionary is the
+      choice names in the order they were numbered.
+    - The binaries of a split select_multiple are booleans.
+    - The rest are strings.
+
+    Empty values are null. Each field has its variable label and the
+    name of its value label in its metadata, under "label" and
+    "value_label". The value labels are JSON in the schema metadata,
+    under "value_labels": an object of value label name to "labels", an
+    object of number to label, and for encoded choice lists "codes", an
+    object of choice name to number. Values that are not in a choice
+    list are added at the end of the dictionary, and are their own
+    label.
+
+    See ExportPlan for the plan, and how it differs from Stata.
+
+    Instance attributes:
+        batch_rows: The number of rows in a batch
+    """
+
+    def __init__(self, *args, batch_rows: int = None, **kwargs):
+        """Initialize an ArrowExport.
+
+        Args:
+            *args: Passed to ExportPlan
+            batch_rows: The number of rows in a batch. If None, this is
+                about BATCH_CELLS cells.
+            **kwargs: Passed to ExportPlan
+        """
+        super().__init__(*args, **kwargs)
+        if batch_rows is None:
+            batch_rows = max(1, BATCH_CELLS // max(len(self.columns), 1))
+        self.batch_rows = batch_rows
+
+    def write(self, path: str, file_format: str = 'parquet') -> int:
+        """Stream the CSV into a Parquet or Arrow IPC file.
+
+        Args:
+            path: The path to the file
+            file_format: "parquet", or "ipc" for the Arrow IPC file
+                format, also known as Feather V2
+
+        Returns:
+            The number of rows written
+
+        Raises:
+            DoFileError: If the file format is not known
+        """
+        if file_format not in FILE_FORMATS:
+            msg = (f'Unknown file format "{file_format}". Expected one of '
+                   f'{", ".join(FILE_FORMATS)}.')
+            raise DoFileError(msg)
+        fields, builders = self._get_fields()
+        schema = pa.schema(fields, metadata={
+            'value_labels': json.dumps(self._get_value_labels_metadata()),
+        })
+        if file_format == 'parquet':
+            writer = pq.ParquetWriter(path, schema)
+        else:
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            writer = pa.ipc.new_file(path, schema, options=options)
+        rows = 0
+        with writer:
+            batch = []
+            for values in self.iter_rows():
+                batch.append(values)
+                if len(batch) == self.batch_rows:
+                    writer.write_batch(self._make_batch(batch, schema,
+                                                        builders))
+                    rows += len(batch)
+                    batch.clear()
+            if batch:
+                writer.write_batch(self._make_batch(batch, schema, builders))
+                rows += len(batch)
+        return rows
+
+    @staticmethod
+    def _make_batch(batch: List[List], schema: pa.Schema,
+                    builders: List[Callable]) -> pa.RecordBatch:
+        """Make a record batch from rows of values."""
+        arrays = [build(values)
+                  for build, values in zip(builders, zip(*batch))]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def _get_fields(self):
+        """Get the field of each variable, and a function to build it.
+
+        Returns:
+            A list of pyarrow fields, and a list of functions of the
+            values in a batch to the pyarrow array
+        """
+        binaries = set()
+        for first, count, _ in self.splits:
+            binaries.update(range(first, first + count))
+        fields = []
+        builders = []
+        for i, column in enumerate(self.columns):
+            variable = column.variable
+            if i in binaries:
+                arrow_type = pa.bool_()
+                build = _build_binary
+            elif variable.value_label in self.value_codes \
+                    and column.convert is not None:
+                arrow_type = ENCODED_TYPE
+                build = _make_build_encoded(
+                    self.value_codes[variable.value_label])
+            elif variable.stata_type in ARROW_TYPES:
+                arrow_type = ARROW_TYPES[variable.stata_type]
+                build = _make_build_numeric(arrow_type)
+            else:
+                arrow_type = pa.string()
+                build = _build_string
+            fields.append(pa.field(variable.name, arrow_type,
+                                   metadata=self._get_field_metadata(column)))
+            builders.append(build)
+        return fields, builders
+
+    @staticmethod
+    def _get_field_metadata(column: ExportColumn) -> Dict[str, str]:
+        """Get the labels of a variable, for the metadata of its field."""
+        metadata = {}
+        if column.variable.label:
+            metadata['label'] = column.variable.label
+        if column.variable.value_label:
+            metadata['value_label'] = column.variable.value_label
+        return metadata
+
+    def _get_value_labels_metadata(self) -> Dict[str, Dict]:
+        """Get the value labels, for the metadata of the schema."""
+        result = {}
+        for name, labels in self.value_labels.items():
+            result[name] = {
+                'labels': {str(number): text
+                           for number, text in labels.items()},
+            }
+            if name in self.value_codes:
+                result[name]['codes'] = dict(self.value_codes[name])
+        return result
+
+
+def _build_string(values: Sequence) -> pa.Array:
+    """Build a string array, with empty strings as null."""
+    array = pa.array(values, pa.string())
+    return pc.if_else(pc.equal(array, ''), pa.scalar(None, pa.string()),
+                      array)
+
+
+def _build_binary(values: Sequence) -> pa.Array:
+    """Build a boolean array from the 1, 0 or None of a binary."""
+    return pa.array(values, pa.int8()).cast(pa.bool_())
+
+
+def _make_build_numeric(arrow_type: pa.DataType) -> Callable:
+    """Get a function to build a numeric array of a type."""
+    return lambda values: pa.array(values, arrow_type)
+
+
+def _make_build_encoded(codes: Dict[str, int]) -> Callable:
+    """Get a function to build a dictionary array for encoded values.
+
+    The codes can grow between batches, as values that are not in the
+    choice list are encoded. New codes are always added at the end, so
+    the dictionary of each batch extends the one before.
+    """
+    def build(values: Sequence) -> pa.Array:
+        numbers = pa.array(list(codes.values()), pa.int32())
+        indices = pc.index_in(pa.array(values, pa.int32()),
+                              value_set=numbers)
+        dictionary = pa.array(list(codes), pa.string())
+        return pa.DictionaryArray.from_arrays(indices, dictionary)
+    return build
@@ -1,12 +1,29 @@
 """Module for the command-line interface to odk2stata.
 
+Module attributes:
+    DATA_DIR_OPTIONS: The options that need --data-dir
+
 Module functions:
     cli: Run the command-line interface
+    get_parser: Get the parser for the command-line arguments
+    check_args: Check the options that need other options
+    write_datasets: Write the datasets asked for on the command line
+    lint: Print all problems in an XlsForm and its settings
+    report_headers: Print how the datasets differ from the export CSVs
 """
 import argparse
 import sys
+from typing import List
 
 from .do_file_collection import DoFileCollection
+from .lint import lint_form
+from ..dataset.export_files import get_export_filenames
+from ..odkform.cache import FormCache
+from ..error import DatasetError, DoFileError
+from ..odkform.diagnostic import ERROR, format_diagnostic
+
+
+DATA_DIR_OPTIONS = ('profile', 'dta_dir', 'arrow_dir', 'join_dir', 'csv_dir')
 
 
 def cli():
@@ -16,11 +33,42 @@ def cli():
         print(f'odk2stata v{__version__}')
         return
 
+    parser = get_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    if args.lint:
+        sys.exit(lint(args.xlsform, args.settings))
+    cache = FormCache(args.cache_dir) if args.cache else None
+    try:
+        do_file_collection = DoFileCollection.from_file(
+            args.xlsform, dataset_source=args.dataset_source,
+            settings_path=args.settings, cache=cache, parallel=args.parallel,
+            data_dir=args.data_dir, profile=args.profile
+        )
+        if args.data_dir:
+            report_headers(do_file_collection)
+        paths = write_datasets(do_file_collection, args)
+    except (DatasetError, DoFileError) as err:
+        parser.exit(1, f'odk2stata: error: {err}\n')
+    for path in paths:
+        print(f'Saved dataset to "{path}"', file=sys.stderr)
+    if args.outpath:
+        do_file_collection.write_out(args.outpath)
+        print(f'Saved do file to "{args.outpath}"')
+    else:
+        print(do_file_collection.render())
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Get the parser for the command-line arguments."""
     parser = argparse.ArgumentParser(
         prog='odk2stata',
         description='Generate a configurable do file from an XlsForm.'
     )
-    parser.add_argument('xlsform', help='The XlsForm to analyze.')
+    parser.add_argument('xlsform', help='The XlsForm to analyze. This can '
+                                        'also be a directory with a CSV file '
+                                        'per sheet, a JSON file, or a '
+                                        'compiled XForm (.xml).')
     parser.add_argument('-s', '--settings',
         help='The settings file. If not supplied then sensible default '
              'settings are used. Access those with '
@@ -36,14 +84,159 @@ def cli():
     parser.add_argument('-o', '--outpath', help='Where to save the do file. '
                                                 'If not supplied, then the do '
                                                 'file is written to STDOUT.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Cache the parsed XlsForm on disk, and use a '
+                             'previously parsed copy if the XlsForm is '
+                             'unchanged. Off by default.')
+    parser.add_argument('--cache-dir',
+                        help='Where to cache parsed XlsForms, with --cache. '
+                             'Default is '
+                             f'"{FormCache.default_cache_dir()}".')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Parse the sheets of the XlsForm at the same '
+                             'time. This is faster for XlsForms with large '
+                             'choices or external_choices tabs.')
+    parser.add_argument('--data-dir',
+                        help='The directory with the export CSVs, or a zip '
+                             'file of them as downloaded from ODK Central, '
+                             'which is read without extracting it. If '
+                             'given, the columns predicted from the XlsForm '
+                             'are checked against the header of each CSV '
+                             'found there, and the real column positions '
+                             'are used. Differences are reported on '
+                             'STDERR.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Also scan the data in the export CSVs found '
+                             'with --data-dir, so that settings such as '
+                             '"drop_empty_columns" and '
+                             '"destring_numeric_data" can use it. With '
+                             '--parallel, the CSVs are scanned in chunks at '
+                             'the same time.')
+    parser.add_argument('--dta-dir',
+                        help='Also apply the do file in Python to each '
+                             'export CSV found with --data-dir, and save a '
+                             'Stata dataset (.dta) for each in this '
+                             'directory. Then Stata only needs "use".')
+    parser.add_argument('--arrow-dir',
+                        help='Like --dta-dir, but save typed columns for '
+                             'Python and R instead, in the format of '
+                             '--arrow-format. This needs pyarrow: "pip '
+                             'install odk2stata[arrow]".')
+    parser.add_argument('--arrow-format', choices=['parquet', 'ipc'],
+                        default='parquet',
+                        help='The format for --arrow-dir: "parquet", or '
+                             '"ipc" for the Arrow IPC file format. Default '
+                             'is "parquet".')
+    parser.add_argument('--csv-dir',
+                        help='Rewrite each export CSV found with --data-dir '
+                             'into this directory, without the dropped '
+                             'columns and with the select_ones already '
+                             'numbered. The do file then imports these CSVs, '
+                             'and uses "label values" instead of the slow '
+                             '"encode".')
+    parser.add_argument('--join-dir',
+                        help='Join each repeat found with --data-dir with '
+                             'the datasets it is nested in, on KEY and '
+                             'PARENT_KEY, and save the long result as a CSV '
+                             'in this directory.')
+    parser.add_argument('--lint', action='store_true',
+                        help='Check the XlsForm and the settings, and report '
+                             'all problems at once instead of generating a '
+                             'do file. The exit status is 1 if there are '
+                             'errors.')
     parser.add_argument('-V', '--version', action='store_true',
                         help='Print the software version and exit')
-    args = parser.parse_args()
-    do_file_collection = DoFileCollection.from_file(args.xlsform,
-            dataset_source=args.dataset_source, settings_path=args.settings
-    )
-    if args.outpath:
-        do_file_collection.write_out(args.outpath)
-        print(f'Saved do file to "{args.outpath}"')
-    else:
-        print(do_file_collection.render())
+    return parser
+
+
+def check_args(parser: argparse.ArgumentParser,
+               args: argparse.Namespace) -> None:
+    """Check the options that need other options.
+
+    Args:
+        parser: The parser, to report an error with
+        args: The parsed arguments
+    """
+    for option in DATA_DIR_OPTIONS:
+        if getattr(args, option) and not args.data_dir:
+            flag = '--' + option.replace('_', '-')
+            parser.error(f'{flag} requires --data-dir')
+    if args.cache_dir and not args.cache:
+        parser.error('--cache-dir requires --cache')
+
+
+def write_datasets(do_file_collection: DoFileCollection,
+                   args: argparse.Namespace) -> List[str]:
+    """Write the datasets asked for with --dta-dir, --arrow-dir, etc.
+
+    Args:
+        do_file_collection: The do file collection, after its datasets
+            were reconciled with the export CSVs in --data-dir
+        args: The parsed arguments
+
+    Returns:
+        The paths to the datasets written
+
+    Raises:
+        DatasetError, DoFileError: If a dataset cannot be written
+    """
+    paths = []
+    if args.dta_dir:
+        paths += do_file_collection.write_dta(args.data_dir, args.dta_dir,
+                                              args.parallel)
+    if args.arrow_dir:
+        paths += do_file_collection.write_arrow(
+            args.data_dir, args.arrow_dir, args.arrow_format, args.parallel
+        )
+    if args.join_dir:
+        paths += do_file_collection.dataset_collection.join_repeats(
+            args.data_dir, args.join_dir,
+            do_file_collection.settings.get_merge_append()
+        )
+    if args.csv_dir:
+        paths += do_file_collection.write_csv(args.data_dir, args.csv_dir)
+    return paths
+
+
+def lint(path: str, settings_path: str = None) -> int:
+    """Print all problems in an XlsForm and its settings.
+
+    Args:
+        path: The path to the XlsForm
+        settings_path: The path to the settings file, or None
+
+    Returns:
+        The exit status: 1 if there are errors, otherwise 0
+    """
+    diagnostics = lint_form(path, settings_path)
+    for diagnostic in diagnostics:
+        print(format_diagnostic(diagnostic, path))
+    errors = sum(1 for i in diagnostics if i.severity == ERROR)
+    warnings = len(diagnostics) - errors
+    print(f'{errors} error(s), {warnings} warning(s)', file=sys.stderr)
+    return 1 if errors else 0
+
+
+def report_headers(do_file_collection: DoFileCollection) -> None:
+    """Print how the datasets differ from the headers of the export CSVs.
+
+    Each dataset whose export CSV was not found is reported too. The
+    report goes to STDERR, so that it does not mix with a do file
+    written to STDOUT.
+
+    Args:
+        do_file_collection: The do file collection, after its datasets
+            were reconciled with the export CSVs
+    """
+    for dataset in do_file_collection.dataset_collection.get_datasets():
+        if dataset.export_location is None:
+            filenames = ' or '.join(f'"{filename}"' for filename
+                                    in get_export_filenames(dataset))
+            print(f'{dataset.dataset_filename}: export CSV not found, '
+                  f'looked for {filenames}', file=sys.stderr)
+            continue
+        reconciliation = dataset.header_reconciliation
+        if reconciliation is None:
+            continue
+        for line in reconciliation.get_report():
+            print(f'{dataset.get_csv_filename()}: {line}', file=sys.stderr)
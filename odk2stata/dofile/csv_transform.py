@@ -0,0 +1,283 @@
+"""A module to rewrite an export CSV so that Stata imports it faster.
+
+A do file imports every column of an export CSV, drops the columns it
+does not need, and encodes each select_one with Stata's `encode`, which
+is slow on millions of rows. CsvTransform does the first and the last
+of these while it streams the CSV, and writes a CSV that Stata only has
+to import:
+
+- The columns that the drop columns section drops are left out.
+- The values of each encoded select_one are replaced by the numbers of
+  their choices, see `EncodeChoiceList.get_value_label`.
+- The columns are put in the order of the variables of the do file.
+
+The do file of a DoFile with a `csv_transform` imports that CSV, and
+its encode section uses `label values` instead of `encode`. The other
+sections are the same.
+
+Module attributes:
+    BLOCK_CELLS: The default number of cells in a block of rows
+    TransformColumn: A column of the rewritten CSV
+    CsvTransform: A rewrite of an export CSV, to import into Stata
+"""
+from collections import namedtuple
+import csv
+import io
+from itertools import islice
+from operator import itemgetter
+import os.path
+from typing import Callable, Dict, List, Optional
+
+from .do_file import DoFile
+from .export_plan import get_imported_name, get_vars_by_position, is_applied
+from ..dataset.export_files import CsvLocation, open_csv
+from ..dataset.header import read_csv_header
+
+
+BLOCK_CELLS = 16_384
+
+TransformColumn = namedtuple('TransformColumn', ('name', 'source', 'codes'))
+TransformColumn.__doc__ = """A column of the rewritten CSV.
+
+Args:
+    name: The name of the column, which is the name that Stata gives the
+        variable when it imports the export CSV
+    source: The 0-indexed position of the column in the export CSV
+    codes: The name of the value label whose numbers replace the values,
+        or None to keep the values
+"""
+
+
+def _get_selector(sources: List[int]) -> Callable[[list], tuple]:
+    """Get a function that selects some values of a row, as a tuple.
+
+    itemgetter is used where it can be: it needs at least one position,
+    and does not return a tuple for only one.
+
+    Args:
+        sources: The 0-indexed positions of the values to select
+
+    Returns:
+        The function, of a row
+    """
+    if len(sources) >= 2:
+        return itemgetter(*sources)
+
+    def select(row: list) -> tuple:
+        return tuple(row[i] for i in sources)
+    return select
+
+
+class _Codes(dict):
+    """The number of each value of a choice list, as text.
+
+    A value that is not in the choice list is numbered when it is first
+    seen, with the next number after the largest, as Stata's `encode`
+    does. Empty values stay empty.
+
+    Instance attributes:
+        labels: The value label, a dictionary of number to text. Values
+            that are numbered are added, as their own label.
+        added: A dictionary of number to value, for the values that were
+            numbered
+    """
+
+    def __init__(self, codes: Dict[str, int], labels: Dict[int, str]):
+        """Initialize the numbers of a choice list.
+
+        Args:
+            codes: A dictionary of choice name to number
+            labels: The value label, a dictionary of number to text
+        """
+        super().__init__((name, str(code)) for name, code in codes.items())
+        self[''] = ''
+        self.labels = labels
+        self.added: Dict[int, str] = {}
+
+    def __missing__(self, value: str) -> str:
+        """Give a value that is not in the choice list the next number.
+
+        Args:
+            value: The value
+
+        Returns:
+            The new number, as text
+        """
+        code = max(self.labels, default=0) + 1
+        self.labels[code] = value
+        self.added[code] = value
+        self[value] = str(code)
+        return self[value]
+
+
+class CsvTransform:
+    """A rewrite of an export CSV, to import into Stata.
+
+    The plan is made from the do file sections when this is
+    initialized, from only the header of the CSV. Sections that are
+    skipped or omitted are not applied.
+
+    In the rewritten CSV, the header has the name that Stata gives each
+    variable when it imports the export CSV, so that the rest of the do
+    file works as it is, even for variables that Stata names after
+    their position, such as `v12`. Columns that are not predicted from
+    the form, such as KEY, come after the others, in the order they are
+    in the export CSV.
+
+    Instance attributes:
+        do_file: The do file whose plan is applied
+        csv_path: The path to the export CSV, or its ZipMember, or the
+            path to the CSV of the join if the do file merges a repeat
+        header: The header of the export CSV
+        columns: The TransformColumn of each column of the rewritten
+            CSV, in order
+        value_labels: A dictionary of the value label name of each
+            encoded choice list to the labels, a dictionary of number to
+            text. Values that are not in the choice list are added while
+            rows are written.
+        block_rows: The number of rows in a block
+        filename: The file name of the rewritten CSV, once it is
+            written, else None
+    """
+
+    def __init__(self, do_file: DoFile, csv_path: CsvLocation,
+                 block_rows: int = None):
+        """Initialize a CsvTransform, reading the header of the CSV.
+
+        Args:
+            do_file: The do file whose plan is applied
+            csv_path: The path to the export CSV, or its ZipMember. If
+                the do file merges a repeat into its dataset, this is
+                the path to the CSV of their join, see
+                `RepeatJoin.write_csv`.
+            block_rows: The number of rows in a block. If None, this is
+                about BLOCK_CELLS cells.
+
+        Raises:
+            OSError: If the CSV cannot be read
+        """
+        self.do_file = do_file
+        self.csv_path = csv_path
+        self.header = read_csv_header(csv_path)
+        self.columns: List[TransformColumn] = []
+        self.value_labels: Dict[str, Dict[int, str]] = {}
+        self._codes: Dict[str, _Codes] = {}
+        self._plan()
+        if block_rows is None:
+            block_rows = max(1, BLOCK_CELLS // max(len(self.header), 1))
+        self.block_rows = block_rows
+        self.filename: Optional[str] = None
+
+    def _plan(self) -> None:
+        """Make the columns of the rewritten CSV."""
+        do_file = self.do_file
+        vars_by_position = get_vars_by_position(do_file, self.header)
+        dropped = set()
+        if is_applied(do_file.drop_column):
+            dropped.update(do_file.drop_column.drop)
+        encode = {}
+        if is_applied(do_file.encode_select_one):
+            encode = self._get_encode_lists()
+        positions = {var: position
+                     for position, var in vars_by_position.items()}
+        extra = []
+        imported_names = set()
+        for position, column_name in enumerate(self.header):
+            var = vars_by_position.get(position)
+            if var is None:
+                name = get_imported_name(do_file, column_name, position,
+                                         imported_names)
+                extra.append(TransformColumn(name, position, None))
+            else:
+                imported_names.add(var.orig_varname)
+        for var in do_file.dataset.vars:
+            if var in dropped or var not in positions:
+                continue
+            self.columns.append(TransformColumn(
+                var.orig_varname, positions[var], encode.get(var)
+            ))
+        self.columns.extend(extra)
+
+    def _get_encode_lists(self) -> Dict:
+        """Get the value label of each select_one to encode.
+
+        The value labels are added to `value_labels`, with their codes.
+
+        Returns:
+            A dictionary of StataVar to the name of its value label
+        """
+        details = self.do_file.encode_select_one.get_encode_details()
+        for encode_choice_list in details.encode_choice_lists:
+            list_name = encode_choice_list.list_name
+            codes, labels = encode_choice_list.get_value_label()
+            self.value_labels[list_name] = labels
+            self._codes[list_name] = _Codes(codes, labels)
+        return {var: var.get_survey_row().choice_list.name
+                for var in details.select_ones}
+
+    def get_added_labels(self) -> Dict[str, Dict[int, str]]:
+        """Get the values that were numbered, but are not choices.
+
+        Returns:
+            A dictionary of value label name to a dictionary of number
+            to value, for the value labels that have such values
+        """
+        return {list_name: codes.added
+                for list_name, codes in self._codes.items() if codes.added}
+
+    def write(self, path: str) -> int:
+        """Stream the CSV into the rewritten CSV.
+
+        The rows are read, rewritten and written in blocks of
+        `block_rows` rows. The values of a block are selected and
+        encoded a column at a time, and the block is formatted in one
+        reused text buffer before it is written. Blocks of many more
+        cells than BLOCK_CELLS are slower, not faster, as they no longer
+        fit in the CPU caches.
+
+        Args:
+            path: The path to the rewritten CSV
+
+        Returns:
+            The number of rows written
+        """
+        width = len(self.header)
+        padding = [''] * width
+        sources = [column.source for column in self.columns]
+        select = _get_selector(sources)
+        lookups = [(i, self._codes[column.codes].__getitem__)
+                   for i, column in enumerate(self.columns)
+                   if column.codes is not None]
+        buffer = io.StringIO(newline='')
+        writer = csv.writer(buffer)
+        rows = 0
+        with open_csv(self.csv_path) as file, \
+                open(path, 'w', encoding='utf-8', newline='') as out:
+            writer.writerow([column.name for column in self.columns])
+            records = filter(None, csv.reader(file))
+            next(records, None)
+            while True:
+                block = list(islice(records, self.block_rows))
+                if not block:
+                    break
+                rows += len(block)
+                selected = [select(row) if len(row) >= width
+                            else select(row + padding) for row in block]
+                if lookups:
+                    values = list(zip(*selected))
+                    for i, lookup in lookups:
+                        values[i] = map(lookup, values[i])
+                    selected = zip(*values)
+                writer.writerows(selected)
+                out.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+            out.write(buffer.getvalue())
+        self.filename = os.path.basename(path)
+        return rows
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<CsvTransform "{self.csv_path}", '
+               f'{len(self.columns)} columns>')
+        return msg
@@ -8,6 +8,7 @@ class Destring(DoFileSection):
 
     DEFAULT_SETTINGS = {
         'odk_names_to_destring': [],
+        'destring_numeric_data': False,
     }
 
     def __init__(self, dataset: ImportedDataset, settings: dict = None,
@@ -32,8 +33,17 @@ class Destring(DoFileSection):
             should_destring = True
         elif var.get_odk_name() in self.odk_names_to_destring:
             should_destring = True
+        elif self.destring_numeric_data and not self.is_select(var):
+            profile = var.get_profile()
+            should_destring = profile is not None and profile.is_numeric()
         return should_destring
 
+    @staticmethod
+    def is_select(var: StataVar) -> bool:
+        """Return if a variable is a select, which is encoded or split."""
+        survey_row = var.get_survey_row()
+        return survey_row is not None and survey_row.row_type.is_select
+
     def destring_vars_iter(self):
         return (var.varname for var in self.destring)
 
@@ -51,4 +61,9 @@ class Destring(DoFileSection):
         result = self.settings['odk_names_to_destring']
         return result
 
+    @property
+    def destring_numeric_data(self):
+        """If true, destring variables whose profiled data are numbers."""
+        return self.settings['destring_numeric_data']
+
 
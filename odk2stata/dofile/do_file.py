@@ -32,6 +32,9 @@ class DoFile:
         split_select_multiple: A do file section for splititng
             select_multiple variables
         label_variable: A do file section for labeling variables
+        csv_transform: The CsvTransform that rewrote the export CSV, or
+            None. If set, the do file imports the rewritten CSV, and
+            labels the select_ones instead of encoding them.
     """
 
     def __init__(self, dataset: Dataset,
@@ -67,6 +70,7 @@ class DoFile:
         self.label_variable = LabelVariable(
             self.dataset, label_variable_settings, populate=True
         )
+        self.csv_transform = None
 
     def get_imported_dataset(self) -> ImportedDataset:
         """Return an ImportedDataset instance based on the source data."""
@@ -95,6 +99,7 @@ class DoFile:
             split_select_multiple=self.split_select_multiple,
             ssm_details=self.split_select_multiple.get_ssm_details(),
             label_variable=self.label_variable,
+            csv_transform=self.csv_transform,
         )
         return result
 
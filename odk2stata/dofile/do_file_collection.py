@@ -1,9 +1,19 @@
 """A module for the DoFileCollection class."""
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
+from typing import Callable, List
 
+from .csv_transform import CsvTransform
 from .do_file import DoFile
+from .dta_export import DtaExport
 from .settings import SettingsManager
 from ..dataset import DatasetCollection
+from ..dataset.export_files import ExportFiles
+from ..dataset.join import RepeatJoin
+from ..error import DoFileError
+from ..odkform.cache import FormCache
+from ..odkform.source import FormSource
 
 
 class DoFileCollection:
@@ -48,19 +58,42 @@ class DoFileCollection:
                 self.do_files.append(do_file)
 
     @classmethod
-    def from_file(cls, path: str, dataset_source: str = 'briefcase',
-                  settings_path: str = None):
+    def from_file(cls, path: FormSource, dataset_source: str = 'briefcase',
+                  settings_path: str = None, cache: FormCache = None,
+                  parallel: bool = False, filename: str = None,
+                  data_dir: str = None, profile: bool = False):
         """Initialize an instance based on input file paths.
 
         Args:
-            path: The path to the source XLSForm
+            path: The path to the source XLSForm, or the XLSForm in
+                memory. See OdkForm.
             dataset_source: Where the dataset source comes from
             settings_path: The path to the settings file
+            cache: A cache of parsed XLSForms. If None, or if the
+                XLSForm is in memory, then the XLSForm is always parsed.
+            parallel: If true, parse the sheets of the XLSForm at the
+                same time
+            filename: The logical file name of the XLSForm, shown in do
+                file metadata. If None, this is the path.
+            data_dir: The directory with the export CSVs, or a zip file
+                of them. If given, the datasets are reconciled with the
+                headers of the CSVs found there. See
+                DatasetCollection.reconcile_headers.
+            profile: If true, and data_dir is given, then also profile
+                the data in the CSVs. See DatasetCollection.profile_data.
+                The chunks of the CSVs are profiled in parallel if
+                `parallel` is true.
 
         Returns:
             An initialized do file collection instance.
         """
-        dataset_collection = DatasetCollection.from_file(path, dataset_source)
+        dataset_collection = DatasetCollection.from_file(path, dataset_source,
+                                                         cache, parallel,
+                                                         filename)
+        if data_dir is not None:
+            dataset_collection.reconcile_headers(data_dir)
+            if profile:
+                dataset_collection.profile_data(data_dir, parallel)
         settings = SettingsManager(settings_path)
         return cls(dataset_collection, settings)
 
@@ -85,6 +118,174 @@ class DoFileCollection:
                 render = do_file.render()
                 file.write(render)
 
+    def write_dta(self, data_dir: str, path_to_dir: str,
+                  parallel: bool = False) -> List[str]:
+        """Apply the do files to the export CSVs, writing Stata datasets.
+
+        Each do file is applied to the CSV of its primary dataset, if it
+        is found. The dataset has the same file name as the CSV, but
+        ends with .dta. See DtaExport. If a do file merges a repeat into
+        its dataset, it is applied to the join of their CSVs.
+        The output directory is created if it does not exist.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            path_to_dir: Path to the output directory
+            parallel: If true, profile the CSVs that were not already
+                profiled in a process pool. This is ignored with only
+                one CPU.
+
+        Returns:
+            The paths to the datasets written
+
+        Raises:
+            DatasetError: If the CSVs of a merged dataset do not have
+                the columns to join on
+        """
+        def write(do_file: DoFile, export_args: tuple) -> str:
+            path = os.path.join(path_to_dir, do_file.metadata.primary_dta)
+            DtaExport(*export_args).write(path)
+            return path
+        os.makedirs(path_to_dir, exist_ok=True)
+        return self._write_exports(data_dir, write, parallel)
+
+    def write_arrow(self, data_dir: str, path_to_dir: str,
+                    file_format: str = 'parquet',
+                    parallel: bool = False) -> List[str]:
+        """Apply the do files to the export CSVs, writing typed columns.
+
+        Each do file is applied to the CSV of its primary dataset, if it
+        is found. The file has the same name as the CSV, but ends with
+        .parquet or .arrow. See ArrowExport. This needs pyarrow. If a do
+        file merges a repeat into its dataset, it is applied to the join
+        of their CSVs.
+        The output directory is created if it does not exist.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            path_to_dir: Path to the output directory
+            file_format: "parquet", or "ipc" for the Arrow IPC file
+                format
+            parallel: If true, profile the CSVs that were not already
+                profiled in a process pool. This is ignored with only
+                one CPU.
+
+        Returns:
+            The paths to the files written
+
+        Raises:
+            DoFileError: If pyarrow is not installed, or the file format
+                is not known
+            DatasetError: If the CSVs of a merged dataset do not have
+                the columns to join on
+        """
+        try:
+            from .arrow_export import ArrowExport, FILE_FORMATS
+        except ImportError as err:
+            msg = ('Writing Parquet or Arrow files needs pyarrow. Install '
+                   'it with "pip install odk2stata[arrow]".')
+            raise DoFileError(msg) from err
+        if file_format not in FILE_FORMATS:
+            msg = (f'Unknown file format "{file_format}". Expected one of '
+                   f'{", ".join(FILE_FORMATS)}.')
+            raise DoFileError(msg)
+        extension = FILE_FORMATS[file_format]
+
+        def write(do_file: DoFile, export_args: tuple) -> str:
+            filename = f'{do_file.metadata.primary_base}{extension}'
+            path = os.path.join(path_to_dir, filename)
+            ArrowExport(*export_args).write(path, file_format)
+            return path
+        os.makedirs(path_to_dir, exist_ok=True)
+        return self._write_exports(data_dir, write, parallel)
+
+    def write_csv(self, data_dir: str, path_to_dir: str) -> List[str]:
+        """Rewrite the export CSVs so that Stata imports them faster.
+
+        Each do file's CsvTransform is applied to the CSV of its primary
+        dataset, if it is found, and kept in `DoFile.csv_transform`, so
+        that the do file is rendered to import the rewritten CSV. That
+        CSV is named after the export CSV, with "_encoded" added. If a
+        do file merges a repeat into its dataset, it is applied to the
+        join of their CSVs. The output directory is created if it does
+        not exist.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            path_to_dir: Path to the output directory
+
+        Returns:
+            The paths to the CSVs written
+
+        Raises:
+            DatasetError: If the CSVs of a merged dataset do not have
+                the columns to join on
+        """
+        def write(do_file: DoFile, export_args: tuple) -> str:
+            filename = f'{do_file.metadata.primary_base}_encoded.csv'
+            path = os.path.join(path_to_dir, filename)
+            # Only the header is needed, not the profile
+            do_file.csv_transform = CsvTransform(*export_args[:2])
+            do_file.csv_transform.write(path)
+            return path
+        os.makedirs(path_to_dir, exist_ok=True)
+        return self._write_exports(data_dir, write)
+
+    def _write_exports(self, data_dir: str,
+                       write: Callable[[DoFile, tuple], str],
+                       parallel: bool = False) -> List[str]:
+        """Apply each do file to the CSV of its primary dataset.
+
+        If a do file merges a repeat into its dataset, the CSVs of both
+        are joined into a temporary CSV, which is profiled, and the do
+        file is applied to that. Do files whose CSVs are not all found
+        are skipped.
+
+        Args:
+            data_dir: The directory with the export CSVs, or a zip file
+                of them
+            write: A function of the do file and the arguments for an
+                ExportPlan that writes the result, and returns its path
+            parallel: If true, profile the CSVs that were not already
+                profiled in a process pool
+
+        Returns:
+            The paths to the files written
+        """
+        export_files = ExportFiles(data_dir)
+        paths = []
+        executor = None
+        if parallel and (os.cpu_count() or 1) > 1:
+            executor = ProcessPoolExecutor()
+        try:
+            for do_file in self.do_files:
+                csv_path = export_files.find(do_file.dataset.primary)
+                if csv_path is None:
+                    continue
+                secondary = do_file.dataset.secondary
+                if secondary is None:
+                    profile = do_file.original_dataset.data_profile
+                    paths.append(write(do_file,
+                                       (do_file, csv_path, profile, executor)))
+                    continue
+                if export_files.find(secondary) is None:
+                    continue
+                merge_append = do_file.settings.get_merge_append()
+                join = RepeatJoin(secondary, data_dir, merge_append)
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    joined_path = os.path.join(temp_dir,
+                                               secondary.get_csv_filename())
+                    join.write_csv(joined_path)
+                    paths.append(write(do_file,
+                                       (do_file, joined_path, None, executor)))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return paths
+
     def write_out_singly(self, path_to_dir: str):
         """Write out the do files in this collection to a directory.
 
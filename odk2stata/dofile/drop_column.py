@@ -11,6 +11,7 @@ class DropColumn(DoFileSection):
         'types_to_drop': ['note'],
         'odk_names_to_drop': [],
         'odk_names_not_to_drop': [],
+        'drop_empty_columns': False,
     }
 
     def __init__(self, dataset: ImportedDataset, settings: dict = None,
@@ -32,6 +33,8 @@ class DropColumn(DoFileSection):
             should_drop = True
         if self.is_dropped_odk_name(var.get_odk_name()):
             should_drop = True
+        if self.drop_empty_columns and self.is_empty_in_data(var):
+            should_drop = True
         if self.is_kept_odk_name(var.get_odk_name()):
             should_drop = False
         if should_drop:
@@ -58,6 +61,12 @@ class DropColumn(DoFileSection):
     def is_kept_odk_name(self, name: str) -> bool:
         return name in self.odk_names_not_to_drop
 
+    @staticmethod
+    def is_empty_in_data(var: StataVar) -> bool:
+        """Return if the profiled data of a variable are all empty."""
+        profile = var.get_profile()
+        return profile is not None and profile.is_empty()
+
     @property
     def types_to_drop(self):
         return self.settings['types_to_drop']
@@ -70,6 +79,11 @@ class DropColumn(DoFileSection):
     def odk_names_not_to_drop(self):
         return self.settings['odk_names_not_to_drop']
 
+    @property
+    def drop_empty_columns(self):
+        """If true, drop variables whose profiled data are all empty."""
+        return self.settings['drop_empty_columns']
+
     def __repr__(self):
         msg = f'<DropColumn, size {len(self.drop)}>'
         return msg
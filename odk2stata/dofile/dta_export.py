@@ -0,0 +1,33 @@
+"""A module to write a Stata dataset from an export CSV.
+
+DtaExport applies the plan of a do file to an export CSV and writes the
+result as a .dta file, so that Stata only needs `use`. Only one row is
+in memory at a time.
+
+Module attributes:
+    DtaExport: A writer of a Stata dataset from an export CSV
+"""
+from .dta_writer import DtaWriter
+from .export_plan import ExportPlan
+
+
+class DtaExport(ExportPlan):
+    """A writer of a Stata dataset from an export CSV.
+
+    See ExportPlan for the plan, and how it differs from Stata.
+    """
+
+    def write(self, path: str) -> int:
+        """Stream the CSV into a Stata dataset.
+
+        Args:
+            path: The path to the .dta file
+
+        Returns:
+            The number of rows written
+        """
+        variables = [column.variable for column in self.columns]
+        with DtaWriter(path, variables, self.value_labels) as writer:
+            for values in self.iter_rows():
+                writer.write_row(values)
+        return writer.rows
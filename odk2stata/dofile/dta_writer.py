@@ -0,0 +1,328 @@
+"""A module to write Stata datasets in the .dta format.
+
+Datasets are written in format 118, or in format 119 if there are more
+variables than format 118 allows. Both are described in Stata's
+"help dta". Rows are written one at a time, so the data never have to
+fit in memory. The values of strL variables go to a temporary file
+until the rows are done, since they are stored after the data.
+
+Module attributes:
+    NUMERIC_TYPES: A dictionary of Stata numeric type to its type code,
+        its struct format, and its system missing value
+    STR_MAXLEN: The longest str# type, in bytes
+    STRL_CODE: The type code of strL
+    MAX_VARIABLES_118: The most variables in a format 118 dataset
+    DtaVariable: The definition of a variable in a dataset
+    DtaWriter: A writer of a .dta file, a row at a time
+"""
+from collections import namedtuple
+import datetime
+import struct
+import tempfile
+from typing import Dict, List, Sequence
+
+from ..error import DoFileError
+
+
+NUMERIC_TYPES = {
+    'byte': (65530, 'b', 101),
+    'int': (65529, 'h', 32741),
+    'long': (65528, 'i', 2147483621),
+    'float': (65527, 'f', struct.unpack('<f', b'\x00\x00\x00\x7f')[0]),
+    'double': (65526, 'd',
+               struct.unpack('<d', b'\x00\x00\x00\x00\x00\x00\xe0\x7f')[0]),
+}
+STR_MAXLEN = 2045
+STRL_CODE = 32768
+MAX_VARIABLES_118 = 32767
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+          'Oct', 'Nov', 'Dec')
+STRL_ASCII = 130
+
+
+DtaVariable = namedtuple(
+    'DtaVariable',
+    ('name', 'stata_type', 'label', 'value_label', 'display_format'),
+    defaults=('', '', None)
+)
+DtaVariable.__doc__ = """The definition of a variable in a dataset.
+
+Args:
+    name: The variable name
+    stata_type: The storage type, e.g. "byte", "double", "str12" or
+        "strL"
+    label: The variable label, or "" for none
+    value_label: The name of the value label to attach, or "" for none
+    display_format: The display format. If None, a default for the
+        storage type is used.
+"""
+
+
+def _fixed(text: str, size: int) -> bytes:
+    """Encode text in UTF-8 in a null-padded field of a fixed size.
+
+    Text that is too long is cut at a whole character, so that the
+    field always ends with a null byte.
+    """
+    encoded = text.encode()[:size - 1].decode(errors='ignore').encode()
+    return encoded.ljust(size, b'\x00')
+
+
+def _get_type_code(stata_type: str) -> int:
+    """Get the type code of a storage type in format 118 and 119."""
+    if stata_type in NUMERIC_TYPES:
+        return NUMERIC_TYPES[stata_type][0]
+    if stata_type == 'strL':
+        return STRL_CODE
+    width = int(stata_type[3:]) if stata_type.startswith('str') else 0
+    if not 1 <= width <= STR_MAXLEN:
+        raise DoFileError(f'Unknown Stata storage type "{stata_type}"')
+    return width
+
+
+def _get_default_format(stata_type: str) -> str:
+    """Get the display format that Stata uses for a new variable."""
+    if stata_type in ('byte', 'int'):
+        return '%8.0g'
+    if stata_type == 'long':
+        return '%12.0g'
+    if stata_type == 'float':
+        return '%9.0g'
+    if stata_type == 'double':
+        return '%10.0g'
+    if stata_type == 'strL':
+        return '%9s'
+    return f'%{max(int(stata_type[3:]), 9)}s'
+
+
+def _value_label_table(labels: Dict[int, str]) -> bytes:
+    """Get a value label table: offsets, values, then the texts."""
+    values = sorted(labels)
+    offsets = []
+    texts = []
+    length = 0
+    for value in values:
+        text = _fixed(labels[value], len(labels[value].encode()) + 1)
+        offsets.append(length)
+        texts.append(text)
+        length += len(text)
+    count = len(values)
+    table = struct.pack(f'<2i{count}i{count}i', count, length, *offsets,
+                        *values)
+    return table + b''.join(texts)
+
+
+class DtaWriter:
+    """A writer of a .dta file, a row at a time.
+
+    Use it as a context manager, or call `close` when the rows are done.
+    Only then are the number of rows, the strLs and the value labels
+    written. Value labels can be changed until then.
+
+    Instance attributes:
+        path: The path to the .dta file
+        variables: The DtaVariable of each variable, in order
+        value_labels: A dictionary of value label name to the labels, a
+            dictionary of value to text
+        release: The format, 118 or 119
+        rows: The number of rows written so far
+    """
+
+    def __init__(self, path: str, variables: Sequence[DtaVariable],
+                 value_labels: Dict[str, Dict[int, str]] = None,
+                 data_label: str = '', timestamp: datetime.datetime = None):
+        """Initialize a DtaWriter, and write up to the data.
+
+        Args:
+            path: The path to the .dta file
+            variables: The DtaVariable of each variable, in order
+            value_labels: A dictionary of value label name to the
+                labels, a dictionary of value to text
+            data_label: The label of the dataset
+            timestamp: The time the dataset was made. If None, this is
+                now.
+
+        Raises:
+            DoFileError: If a storage type is not known
+        """
+        self.path = path
+        self.variables = list(variables)
+        self.value_labels = value_labels if value_labels is not None else {}
+        self.release = 118
+        if len(self.variables) > MAX_VARIABLES_118:
+            self.release = 119
+        self.rows = 0
+        self._type_codes = [_get_type_code(i.stata_type)
+                            for i in self.variables]
+        self._record = struct.Struct('<' + ''.join(
+            self._get_struct_format(i) for i in self.variables
+        ))
+        self._numeric_columns = [
+            (i, NUMERIC_TYPES[variable.stata_type][2])
+            for i, variable in enumerate(self.variables)
+            if variable.stata_type in NUMERIC_TYPES
+        ]
+        self._string_columns = [i for i, variable in enumerate(self.variables)
+                                if variable.stata_type not in NUMERIC_TYPES]
+        self._strl_columns = [i for i, code in enumerate(self._type_codes)
+                              if code == STRL_CODE]
+        self._map = [0] * 14
+        self._file = open(path, 'wb')
+        self._strls = tempfile.TemporaryFile()
+        try:
+            self._write_start(data_label, timestamp)
+        except BaseException:
+            self._file.close()
+            self._strls.close()
+            raise
+
+    @staticmethod
+    def _get_struct_format(variable: DtaVariable) -> str:
+        """Get the struct format of a value of a variable."""
+        if variable.stata_type in NUMERIC_TYPES:
+            return NUMERIC_TYPES[variable.stata_type][1]
+        if variable.stata_type == 'strL':
+            return 'Q'
+        return f'{int(variable.stata_type[3:])}s'
+
+    def _write_start(self, data_label: str,
+                     timestamp: datetime.datetime = None) -> None:
+        """Write everything before the rows of data."""
+        file = self._file
+        count_format = '<H' if self.release == 118 else '<I'
+        timestamp = timestamp or datetime.datetime.now()
+        time_text = (f'{timestamp.day:02d} {MONTHS[timestamp.month - 1]} '
+                     f'{timestamp.year} {timestamp:%H:%M}')
+        label = data_label.encode()[:320].decode(errors='ignore').encode()
+        file.write(b'<stata_dta><header><release>%d</release>'
+                   b'<byteorder>LSF</byteorder><K>' % self.release)
+        file.write(struct.pack(count_format, len(self.variables)))
+        file.write(b'</K><N>')
+        self._rows_position = file.tell()
+        file.write(struct.pack('<Q', 0))
+        file.write(b'</N><label>')
+        file.write(struct.pack('<H', len(label)) + label)
+        file.write(b'</label><timestamp>')
+        file.write(struct.pack('<B', len(time_text)) + time_text.encode())
+        file.write(b'</timestamp></header>')
+        self._map[1] = file.tell()
+        file.write(b'<map>' + bytes(8 * 14) + b'</map>')
+        self._start_section(2, b'variable_types')
+        file.write(struct.pack(f'<{len(self._type_codes)}H',
+                               *self._type_codes))
+        self._end_section(b'variable_types')
+        self._start_section(3, b'varnames')
+        file.write(b''.join(_fixed(i.name, 129) for i in self.variables))
+        self._end_section(b'varnames')
+        self._start_section(4, b'sortlist')
+        sortlist_size = struct.calcsize(count_format)
+        file.write(bytes(sortlist_size * (len(self.variables) + 1)))
+        self._end_section(b'sortlist')
+        self._start_section(5, b'formats')
+        file.write(b''.join(
+            _fixed(i.display_format or _get_default_format(i.stata_type), 57)
+            for i in self.variables
+        ))
+        self._end_section(b'formats')
+        self._start_section(6, b'value_label_names')
+        file.write(b''.join(_fixed(i.value_label, 129)
+                            for i in self.variables))
+        self._end_section(b'value_label_names')
+        self._start_section(7, b'variable_labels')
+        file.write(b''.join(_fixed(i.label, 321) for i in self.variables))
+        self._end_section(b'variable_labels')
+        self._start_section(8, b'characteristics')
+        self._end_section(b'characteristics')
+        self._start_section(9, b'data')
+
+    def _start_section(self, index: int, tag: bytes) -> None:
+        """Write the opening tag of a section, and record where it is."""
+        self._map[index] = self._file.tell()
+        self._file.write(b'<' + tag + b'>')
+
+    def _end_section(self, tag: bytes) -> None:
+        """Write the closing tag of a section."""
+        self._file.write(b'</' + tag + b'>')
+
+    def write_row(self, values: List) -> None:
+        """Write a row of data.
+
+        Args:
+            values: The value of each variable, in order. Numbers are
+                int or float, or None for a missing value. Strings are
+                str, or None for an empty string; one that is too long
+                for its str# type is cut. The list is changed.
+        """
+        self.rows += 1
+        for i, missing in self._numeric_columns:
+            if values[i] is None:
+                values[i] = missing
+        for i in self._string_columns:
+            value = values[i]
+            values[i] = value.encode() if value else b''
+        for i in self._strl_columns:
+            values[i] = self._add_strl(i + 1, values[i])
+        self._file.write(self._record.pack(*values))
+
+    def _add_strl(self, variable: int, value: bytes) -> int:
+        """Store the value of a strL, and get its reference in the row."""
+        if not value:
+            return 0
+        observation = self.rows
+        self._strls.write(b'GSO' + struct.pack('<IQBI', variable, observation,
+                                               STRL_ASCII, len(value) + 1))
+        self._strls.write(value + b'\x00')
+        if self.release == 118:
+            return observation << 16 | variable
+        return observation << 24 | variable
+
+    def close(self) -> None:
+        """Write everything after the rows of data, and close the file."""
+        if self._file.closed:
+            return
+        try:
+            self._write_end()
+        finally:
+            self._file.close()
+            self._strls.close()
+
+    def _write_end(self) -> None:
+        """Write the strLs and value labels, then fill in the map."""
+        file = self._file
+        self._end_section(b'data')
+        self._start_section(10, b'strls')
+        self._strls.seek(0)
+        while True:
+            block = self._strls.read(1 << 20)
+            if not block:
+                break
+            file.write(block)
+        self._end_section(b'strls')
+        self._start_section(11, b'value_labels')
+        for name, labels in self.value_labels.items():
+            table = _value_label_table(labels)
+            lbl_header = struct.pack('<i', len(table)) + _fixed(name, 129)
+            file.write(b'<lbl>' + lbl_header + bytes(3) + table + b'</lbl>')
+        self._end_section(b'value_labels')
+        self._map[12] = file.tell()
+        file.write(b'</stata_dta>')
+        self._map[13] = file.tell()
+        file.seek(self._rows_position)
+        file.write(struct.pack('<Q', self.rows))
+        file.seek(self._map[1] + len(b'<map>'))
+        file.write(struct.pack('<14Q', *self._map))
+
+    def __enter__(self):
+        """Return this writer."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the file."""
+        self.close()
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<DtaWriter "{self.path}", {len(self.variables)} variables, '
+               f'{self.rows} rows>')
+        return msg
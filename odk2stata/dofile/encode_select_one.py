@@ -1,5 +1,5 @@
 from collections import defaultdict, namedtuple
-from typing import List
+from typing import Dict, List, Tuple
 import textwrap
 
 from .do_file_section import DoFileSection
@@ -8,7 +8,9 @@ from .stata_utils import (get_varname_comments, is_valid_stata_varname,
                           make_invalid_varname_comment, safe_stata_string_quote,
                           stata_string_escape)
 from .templates import env
+from ..error import LabelNotFoundError
 from ..odkform.choices import ChoiceList
+from ..odkform.survey import SurveyRow
 
 
 class EncodeSelectOne(DoFileSection):
@@ -42,18 +44,30 @@ class EncodeSelectOne(DoFileSection):
         survey_row = var.column.survey_row
         if survey_row is None:
             return False
-        if not survey_row.is_select_one():
+        if not survey_row.row_type.is_select_one:
             return False
         if var.is_dropped():
             return False
+        return self.should_encode_row(survey_row, var.get_odk_name())
+
+    def should_encode_row(self, survey_row: SurveyRow, odk_name: str) -> bool:
+        """Decide from the settings if a select_one row is encoded.
+
+        Args:
+            survey_row: The select_one survey row
+            odk_name: The ODK name of the variable from the row
+
+        Returns:
+            True if the variable should be encoded
+        """
         should_encode = self.encode_select_ones
-        if survey_row.is_select_external():
+        if survey_row.row_type.is_external:
             should_encode = self.encode_external_select_ones
-        if survey_row.choice_list.name in self.choice_lists_not_to_encode:
+        if survey_row.row_type.list_name in self.choice_lists_not_to_encode:
             should_encode = False
-        if var.get_odk_name() in self.odk_names_to_encode:
+        if odk_name in self.odk_names_to_encode:
             should_encode = True
-        if var.get_odk_name() in self.odk_names_not_to_encode:
+        if odk_name in self.odk_names_not_to_encode:
             should_encode = False
         return should_encode
 
@@ -72,6 +86,25 @@ class EncodeSelectOne(DoFileSection):
         details = self.get_encode_details()
         yield details.get_encode_select_one_do()
 
+    def label_values_do_file_iter(self,
+                                  added_labels: Dict[str, Dict[int, str]]):
+        """Iterate over the do code for select_ones already numbered.
+
+        This is for a CSV rewritten by CsvTransform, where the values
+        of the select_ones are the numbers of their choices. They are
+        destrung and labeled, instead of encoded.
+
+        Args:
+            added_labels: A dictionary of value label name to the
+                values that were numbered but are not choices, a
+                dictionary of number to value
+
+        Yields:
+            The do code
+        """
+        details = self.get_encode_details()
+        yield details.get_label_values_do(added_labels)
+
     @property
     def encode_select_ones(self):
         return self.settings['encode_select_ones']
@@ -169,6 +202,34 @@ class EncodeDetails:
         ))
         return '\n\n'.join([label_define, singletons, foreach, label_replace])
 
+    def get_label_values_do(self,
+                            added_labels: Dict[str, Dict[int, str]]) -> str:
+        """Get the do code to label select_ones already numbered.
+
+        The value labels are defined with the choice labels, and with
+        the values that were numbered but are not choices, added.
+
+        Args:
+            added_labels: A dictionary of value label name to the
+                values that were numbered but are not choices, a
+                dictionary of number to value
+
+        Returns:
+            The do code
+        """
+        label_define = '\n'.join((
+            item.get_label_values_define_do(
+                added_labels.get(item.list_name, {})
+            ) for item in self.encode_choice_lists
+        ))
+        singletons = '\n\n'.join((
+            item.get_label_values_do() for item in self.encode_singleton
+        ))
+        foreach = '\n\n'.join((
+            item.get_label_values_for_do() for item in self.encode_for
+        ))
+        return '\n\n'.join([label_define, singletons, foreach])
+
 
 LabelDefineOption = namedtuple('LabelDefineOption', ['number', 'label'])
 LABEL_DEFINE_UNIT = env.get_template('label_define_unit.do')
@@ -209,6 +270,34 @@ class EncodeChoiceList:
         )
         return full_label_define
 
+    def get_label_values_define_do(self, added: Dict[int, str]) -> str:
+        """Get the do code to define the final value label at once.
+
+        Args:
+            added: A dictionary of number to value, for the values that
+                were numbered but are not choices
+
+        Returns:
+            The do code
+        """
+        full_label_define = LABEL_DEFINE_UNIT.render(
+            varname=self.list_name,
+            options_list=self.get_label_replace_options(),
+            replace=False
+        )
+        if added:
+            options_list = [
+                LabelDefineOption(number, stata_string_escape(value))
+                for number, value in added.items()
+            ]
+            label_add = LABEL_DEFINE_UNIT.render(
+                varname=self.list_name,
+                options_list=options_list,
+                add=True
+            )
+            full_label_define = f'{full_label_define}\n{label_add}'
+        return full_label_define
+
     def get_label_define_options(self):
         result = []
         numbers = self.choice_list_numbers()
@@ -239,31 +328,15 @@ class EncodeChoiceList:
             raise ValueError(msg)
         if self.number_column not in self.choice_list.row_header:
             msg = (f'Unable to find "{self.number_column}" in column headers '
-                   f'for choice list "{choice_list.name}"')
-            raise ValueError(msg)
-        numbers = [row.row_dict[self.number_column] for row in self.choice_list]
-        if any(not isinstance(i, int) for i in numbers):
-            msg = (f'Choice list "{self.choice_list.name}" does not define all '
-                   f'options to have a number in the "{self.number_column}" '
-                   f'column')
+                   f'for choice list "{self.choice_list.name}"')
             raise ValueError(msg)
+        numbers = self.choice_list.get_strict_numbers(self.number_column)
         result = [str(i) for i in numbers]
         return result
 
     def choice_list_numbers_flexible(self):
-        result = []
-        next_number = 1
-        for choice in self.choice_list:
-            name = choice.row_dict['name']
-            number_column = choice.row_dict.get(self.number_column)
-            if isinstance(number_column, int):
-                value = number_column
-            elif isinstance(name, int):
-                value = name
-            else:
-                value = next_number
-            result.append(str(value))
-            next_number = max(next_number, value) + 1
+        numbers = self.choice_list.get_flexible_numbers(self.number_column)
+        result = [str(i) for i in numbers]
         return result
 
     def choice_list_names(self):
@@ -272,32 +345,43 @@ class EncodeChoiceList:
         return result
 
     def choice_list_labels(self):
+        return [stata_string_escape(i) for i in self.choice_list_raw_labels()]
+
+    def choice_list_raw_labels(self) -> List[str]:
+        """Get the labels of the choices, not escaped for Stata."""
         result = []
         for choice in self.choice_list:
-            which_label = self.which_label
-            if which_label == 'first_label':
-                header = choice.row_header
-                first_label = next(i for i in header if i.startswith('label'))
-                label = choice.row_dict[first_label]
-            elif which_label in choice.row_dict:
-                label = choice.row_dict[which_label]
-            else:
+            try:
+                label = choice.get_label(self.which_label, self.extra_label)
+            except LabelNotFoundError:
                 msg = ('Encode select one should specify a value for '
-                       '"label_replace_column" that is either "first_label", '
+                       '"which_label" that is either "first_label", '
                        'or a column header in the choices/external_choices '
                        'tab. Instead, it is set to '
-                       f'"{label_replace_column}".')
+                       f'"{self.which_label}".')
                 raise ValueError(msg)
-            final_label = str(label)
-            extra_label = choice.row_dict.get(self.extra_label, '')
-            if extra_label != '':
-                final_label = str(extra_label)
-            escaped = stata_string_escape(final_label)
-            result.append(escaped)
+            result.append(label)
         return result
 
+    def get_value_label(self) -> Tuple[Dict[str, int], Dict[int, str]]:
+        """Get what encoding with this choice list does to the values.
+
+        This is the result of the "label define" before encoding and the
+        "label define ..., replace" after it.
+
+        Returns:
+            A dictionary of choice name to number, and the final value
+            label, a dictionary of number to choice label
+        """
+        numbers = [int(i) for i in self.choice_list_numbers()]
+        names = (str(choice.row_name) for choice in self.choice_list)
+        codes = dict(zip(names, numbers))
+        labels = dict(zip(numbers, self.choice_list_raw_labels()))
+        return codes, labels
+
 
 ENCODE_SELECT_ONE_UNIT = env.get_template('encode_select_one_unit.do')
+LABEL_VALUES_UNIT = env.get_template('label_values_unit.do')
 
 
 class EncodeSingleton:
@@ -318,8 +402,17 @@ class EncodeSingleton:
         )
         return singleton_do
 
+    def get_label_values_do(self) -> str:
+        """Get the do code to label the select_one already numbered."""
+        label_values_do = LABEL_VALUES_UNIT.render(
+            orig=self.select_one.varname,
+            lab=self.encode_choice_list.list_name,
+        )
+        return label_values_do
+
 
 ENCODE_SELECT_ONE_FOR_UNIT = env.get_template('encode_select_one_for_unit.do')
+LABEL_VALUES_FOR_UNIT = env.get_template('label_values_for_unit.do')
 
 
 class EncodeFor:
@@ -356,3 +449,13 @@ class EncodeFor:
             suffix=suffix,
         )
         return for_do
+
+    def get_label_values_for_do(self, stata_var=STATA_FOR_VAR) -> str:
+        """Get the do code to label the select_ones already numbered."""
+        foreach = self.get_foreach_line(stata_var)
+        label_values_do = LABEL_VALUES_FOR_UNIT.render(
+            foreach=foreach,
+            lab=self.encode_choice_list.list_name,
+            var=stata_var,
+        )
+        return label_values_do
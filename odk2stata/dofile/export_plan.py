@@ -0,0 +1,373 @@
+"""A module to apply the plan of a do file in Python to an export CSV.
+
+A do file has Stata import an export CSV with every column as a string,
+then drop, rename, destring, encode, split and label variables. On
+large exports, that takes Stata a long time. ExportPlan works out the
+same steps from the do file sections, and applies them to each row
+while it streams the CSV. The rows are then written by DtaExport or
+ArrowExport.
+
+The CSV is read twice: once to profile it, which gives the row count,
+the string widths and the numeric types, and once to convert the rows.
+
+A few details differ from Stata. Values of a select_one that are not
+in its choice list are numbered in the order they are first seen, not
+in sorted order. For a do file that merges a repeat into its dataset,
+the CSV is the join of the two export CSVs, see RepeatJoin, and the
+`_merge` variable that Stata's `merge` adds is not made.
+
+Module attributes:
+    SPLIT_CACHE_SIZE: The most values of a select_multiple whose
+        binaries are cached
+    is_applied: Return if a do file section is applied
+    get_vars_by_position: Find the Stata variable of each column in an
+        export CSV
+    get_imported_name: Get the name Stata gives a column that is not in
+        the form
+    ExportColumn: How to make a variable from a column of the CSV
+    ExportPlan: The plan of a do file, applied to an export CSV
+"""
+from collections import namedtuple
+from concurrent.futures import Executor
+import csv
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .do_file import DoFile
+from .dta_writer import DtaVariable, STR_MAXLEN
+from .label_variable import MAX_LABEL_LEN
+from .stata_utils import clean_stata_varname, gen_anonymous_varname
+from ..dataset.export_files import CsvLocation, open_csv
+from ..dataset.header import HeaderReconciliation
+from ..dataset.profile import ColumnProfile, CsvProfile, profile_csv
+
+
+SPLIT_CACHE_SIZE = 4096
+
+ExportColumn = namedtuple('ExportColumn', ('variable', 'source', 'convert'))
+ExportColumn.__doc__ = """How to make a variable from a column of the CSV.
+
+Args:
+    variable: The DtaVariable
+    source: The 0-indexed position of the column in the CSV
+    convert: A function of the value in the CSV to the value in the
+        dataset, or None to keep the string. The binaries of a split
+        select_multiple are all made at once, see `DtaExport.splits`.
+"""
+
+
+def _make_destring(stata_type: str) -> Callable[[str], Optional[float]]:
+    """Get a function to destring a value, empty values being missing."""
+    if stata_type in ('byte', 'int', 'long'):
+        return lambda value: int(float(value)) if value else None
+    return lambda value: float(value) if value else None
+
+
+def _make_encode(codes: Dict[str, int], labels: Dict[int, str]) \
+        -> Callable[[str], Optional[int]]:
+    """Get a function to encode a value with a value label.
+
+    As with Stata's encode, a value that is not in the label is added
+    to it, with the next number after the largest.
+    """
+    def encode(value: str) -> Optional[int]:
+        if not value:
+            return None
+        code = codes.get(value)
+        if code is None:
+            code = max(labels, default=0) + 1
+            codes[value] = code
+            labels[code] = value
+        return code
+    return encode
+
+
+def _make_split(choice_names: List[str]) \
+        -> Callable[[str], Tuple[Optional[int], ...]]:
+    """Get a function to split a select_multiple into binaries.
+
+    A select_multiple has few distinct values in practice, so the
+    binaries of recent values are cached, up to SPLIT_CACHE_SIZE.
+
+    Args:
+        choice_names: The choice name of each binary, in order
+
+    Returns:
+        A function of the value of the select_multiple to the value of
+        each binary: 1 if the choice was selected, 0 if not, and missing
+        if nothing was.
+    """
+    cache = {'': (None,) * len(choice_names)}
+
+    def split(value: str) -> Tuple[Optional[int], ...]:
+        binaries = cache.get(value)
+        if binaries is None:
+            selected = set(value.split(' '))
+            binaries = tuple(int(name in selected) for name in choice_names)
+            if len(cache) >= SPLIT_CACHE_SIZE:
+                cache.clear()
+                cache[''] = (None,) * len(choice_names)
+            cache[value] = binaries
+        return binaries
+    return split
+
+
+def is_applied(section) -> bool:
+    """Return if a do file section is applied."""
+    return not (section.skip or section.omit)
+
+
+def get_vars_by_position(do_file: DoFile, header: List[str]) -> Dict:
+    """Find the Stata variable of each column in an export CSV.
+
+    Args:
+        do_file: The do file
+        header: The header of the CSV
+
+    Returns:
+        A dictionary of 0-indexed position in the CSV to StataVar, for
+        the columns that were predicted from the form
+    """
+    dataset = do_file.dataset
+    predicted = [var.column.column_name for var in dataset.vars]
+    reconciliation = HeaderReconciliation(predicted, header)
+    result = {}
+    for i, var in enumerate(dataset.vars):
+        position = reconciliation.get_position(i)
+        if position is not None:
+            result[position - 1] = var
+    return result
+
+
+def get_imported_name(do_file: DoFile, column_name: str, position: int,
+                      imported_names: set) -> str:
+    """Get the name Stata gives a column that is not in the form.
+
+    Args:
+        do_file: The do file
+        column_name: The name of the column in the header of the CSV
+        position: The 0-indexed position of the column in the CSV
+        imported_names: The names of the variables imported so far. The
+            name is added to it.
+
+    Returns:
+        The variable name
+    """
+    name = clean_stata_varname(column_name)
+    if not do_file.settings.get_case_preserve():
+        name = name.lower()
+    if name in imported_names:
+        name = gen_anonymous_varname(position + 1)
+    imported_names.add(name)
+    return name
+
+
+class ExportPlan:
+    """The plan of a do file, applied to an export CSV.
+
+    The plan is made from the do file sections when this is
+    initialized. Sections that are skipped or omitted are not applied.
+
+    Instance attributes:
+        do_file: The do file whose plan is applied
+        csv_path: The path to the export CSV, or its ZipMember, or the
+            path to the CSV of the join if the do file merges a repeat
+        csv_profile: The profile of the export CSV
+        value_labels: A dictionary of value label name to the labels, a
+            dictionary of value to text. Encoding can add labels while
+            rows are written.
+        value_codes: A dictionary of the value label name of each
+            encoded choice list to its codes, a dictionary of value to
+            number. Encoding can add codes while rows are written.
+        columns: The ExportColumn of each variable in the dataset, in
+            order
+        splits: For each split select_multiple, the index of its first
+            binary in `columns`, the number of binaries, and the
+            function to make them
+    """
+
+    def __init__(self, do_file: DoFile, csv_path: CsvLocation,
+                 csv_profile: CsvProfile = None, executor: Executor = None):
+        """Initialize an ExportPlan.
+
+        Args:
+            do_file: The do file whose plan is applied
+            csv_path: The path to the export CSV, or its ZipMember. If
+                the do file merges a repeat into its dataset, this is
+                the path to the CSV of their join, see
+                `RepeatJoin.write_csv`.
+            csv_profile: The profile of the export CSV. If None, the CSV
+                is profiled.
+            executor: An executor to profile the CSV in parallel, see
+                `profile_csv`
+        """
+        self.do_file = do_file
+        self.csv_path = csv_path
+        if csv_profile is None:
+            csv_profile = profile_csv(csv_path, executor)
+        self.csv_profile = csv_profile
+        self.value_labels: Dict[str, Dict[int, str]] = {}
+        self.value_codes: Dict[str, Dict[str, int]] = {}
+        self.columns: List[ExportColumn] = []
+        self.splits: List[Tuple[int, int, Callable]] = []
+        self._encoders: Dict[str, Callable] = {}
+        self._plan()
+
+    def _plan(self) -> None:
+        """Make the column of each variable from the do file sections."""
+        do_file = self.do_file
+        header = self.csv_profile.header
+        vars_by_position = get_vars_by_position(do_file, header)
+        dropped = set()
+        if is_applied(do_file.drop_column):
+            dropped.update(do_file.drop_column.drop)
+        destring = set()
+        if is_applied(do_file.destring):
+            destring.update(do_file.destring.destring)
+        encode = {}
+        if is_applied(do_file.encode_select_one):
+            encode = self._get_encode_lists()
+        split = {}
+        if is_applied(do_file.split_select_multiple):
+            split = self._get_splits()
+        labeled = set()
+        if is_applied(do_file.label_variable):
+            labeled.update(do_file.label_variable.label_variables)
+        rename = is_applied(do_file.rename)
+        imported_names = set()
+        for position, profile in enumerate(self.csv_profile.columns):
+            var = vars_by_position.get(position)
+            if var is None:
+                name = get_imported_name(do_file, header[position], position,
+                                         imported_names)
+                self._add_string(name, '', position, profile)
+                continue
+            imported_names.add(var.orig_varname)
+            if var in dropped:
+                continue
+            name = var.varname if rename else var.orig_varname
+            label = ''
+            if var in labeled:
+                label = do_file.label_variable.get_cleaned_label(var)
+                label = label[:MAX_LABEL_LEN]
+            # Stata's destring keeps a column that is not all numbers
+            numeric = profile.is_numeric() or profile.is_empty()
+            if var in encode:
+                list_name = encode[var]
+                variable = DtaVariable(name, 'long', label, list_name)
+                column = ExportColumn(variable, position,
+                                      self._encoders[list_name])
+                self.columns.append(column)
+            elif var in destring and numeric:
+                stata_type = profile.get_storage_type()
+                variable = DtaVariable(name, stata_type, label)
+                column = ExportColumn(variable, position,
+                                      _make_destring(stata_type))
+                self.columns.append(column)
+            else:
+                self._add_string(name, label, position, profile)
+            binaries = split.get(var)
+            if binaries:
+                self._add_split(position, binaries)
+
+    def _add_split(self, position: int,
+                   binaries: List[Tuple[str, str, str, str]]) -> None:
+        """Add the binary variables of a split select_multiple."""
+        self.splits.append((len(self.columns), len(binaries),
+                            _make_split([i[1] for i in binaries])))
+        for binary_varname, _, binary_label, value_label in binaries:
+            variable = DtaVariable(binary_varname, 'byte', binary_label,
+                                   value_label)
+            self.columns.append(ExportColumn(variable, position, None))
+
+    def _add_string(self, name: str, label: str, position: int,
+                    profile: ColumnProfile) -> None:
+        """Add a string variable, as wide as its longest value."""
+        width = max(profile.max_length, 1)
+        stata_type = 'strL' if width > STR_MAXLEN else f'str{width}'
+        variable = DtaVariable(name, stata_type, label)
+        self.columns.append(ExportColumn(variable, position, None))
+
+    def _get_encode_lists(self) -> Dict:
+        """Get the value label of each select_one to encode.
+
+        The value labels are added to `value_labels`, with an encoder
+        each.
+
+        Returns:
+            A dictionary of StataVar to the name of its value label
+        """
+        details = self.do_file.encode_select_one.get_encode_details()
+        result = {}
+        for encode_choice_list in details.encode_choice_lists:
+            list_name = encode_choice_list.list_name
+            codes, labels = encode_choice_list.get_value_label()
+            self.value_labels[list_name] = labels
+            self.value_codes[list_name] = codes
+            self._encoders[list_name] = _make_encode(codes, labels)
+        for var in details.select_ones:
+            choice_list = var.get_survey_row().choice_list
+            result[var] = choice_list.name
+        return result
+
+    def _get_splits(self) -> Dict[object, List[Tuple[str, str, str, str]]]:
+        """Get the binary variables of each select_multiple to split.
+
+        The value label of the binaries is added to `value_labels`.
+
+        Returns:
+            A dictionary of StataVar to its binaries: the name, the
+            choice name, the variable label and the value label
+        """
+        ssm_details = self.do_file.split_select_multiple.get_ssm_details()
+        binary_define = ssm_details.binary_define
+        option_label = binary_define.option_label
+        result = {}
+        for ssm_unit in ssm_details.ssm_units:
+            if binary_define.label not in self.value_labels:
+                self.value_labels[binary_define.label] = {
+                    0: option_label.zero,
+                    1: option_label.one,
+                }
+            raw_labels = ssm_unit.gen_raw_labels()
+            result[ssm_unit.select_multiple] = [
+                (gen_binary.binary_varname, gen_binary.choice_name,
+                 raw_label, binary_define.label)
+                for gen_binary, raw_label
+                in zip(ssm_unit.gen_binaries, raw_labels)
+            ]
+        return result
+
+    def iter_rows(self) -> Iterator[List]:
+        """Stream the CSV, and apply the plan to each row.
+
+        Yields:
+            The value of each variable in `columns`, in order, as
+            `DtaWriter.write_row` takes them: numbers or None for
+            missing, and strings
+        """
+        sources = [column.source for column in self.columns]
+        conversions = [(i, column.convert)
+                       for i, column in enumerate(self.columns)
+                       if column.convert is not None]
+        splits = [(first, first + count, split)
+                  for first, count, split in self.splits]
+        width = len(self.csv_profile.header)
+        padding = [''] * width
+        with open_csv(self.csv_path) as file:
+            rows = filter(None, csv.reader(file))
+            next(rows, None)
+            for row in rows:
+                if len(row) < width:
+                    row = row + padding
+                values = [row[i] for i in sources]
+                for i, convert in conversions:
+                    values[i] = convert(values[i])
+                for first, end, split in splits:
+                    values[first:end] = split(values[first])
+                yield values
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = (f'<{self.__class__.__name__} "{self.csv_path}", '
+               f'{len(self.columns)} variables>')
+        return msg
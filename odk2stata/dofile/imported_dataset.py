@@ -1,18 +1,25 @@
+import sys
 from typing import Iterator, List, Optional
 
 from .stata_utils import clean_stata_varname, gen_anonymous_varname
 from ..dataset.dataset import Dataset
 from ..dataset.column import Column
+from ..dataset.profile import ColumnProfile
 from ..odkform.survey import SurveyRow
 
 
 class StataVar:
 
-    def __init__(self, column: Column, varname: str):
+    __slots__ = ('column', 'orig_varname', 'varname', 'dropped', 'profile')
+
+    def __init__(self, column: Column, varname: str,
+                 profile: ColumnProfile = None):
+        varname = sys.intern(varname)
         self.column = column
         self.orig_varname = varname
         self.varname = varname
         self.dropped = False
+        self.profile = profile
 
     def drop(self) -> None:
         self.dropped = True
@@ -54,6 +61,10 @@ class StataVar:
     def is_numeric(self) -> bool:
         return self.column.is_numeric()
 
+    def get_profile(self) -> Optional[ColumnProfile]:
+        """Get the profile of the data, or None if it was not profiled."""
+        return self.profile
+
     def __repr__(self):
         """Get a represenation of this object."""
         return f'StataVar({self.column!r}, {self.orig_varname!r})'
@@ -73,17 +84,9 @@ class ImportedDataset:
     def get_secondary_dataset(self) -> Optional[Dataset]:
         if not self.merge_single_repeat:
             return None
-        to_return = None
-        for column in self.primary:
-            if column.repeat_dataset:
-                if to_return is None:
-                    # Keep the first repeat dataset
-                    to_return = column.repeat_dataset
-                else:
-                    # If there are more datasets, return None
-                    to_return = None
-                    break
-        return to_return
+        if len(self.primary.children) != 1:
+            return None
+        return self.primary.children[0]
 
     def import_vars(self) -> List[StataVar]:
         primary_vars = self.import_dataset(self.primary, self.case_preserve)
@@ -103,9 +106,19 @@ class ImportedDataset:
 
     @staticmethod
     def import_dataset(dataset, case_preserve) -> List[StataVar]:
+        """Make the Stata variables for the columns of a dataset.
+
+        A repeated variable name is replaced by the name Stata gives it,
+        based on the column number. If the header of the real export
+        CSV was reconciled, then the real column number is used. If the
+        export CSV was profiled, then each variable gets the profile of
+        its column.
+        """
         stata_vars = []
         if dataset is None:
             return stata_vars
+        reconciliation = dataset.header_reconciliation
+        data_profile = dataset.data_profile
         column_names = set()
         for i, column in enumerate(dataset, start=1):
             column_name = column.column_name
@@ -114,9 +127,15 @@ class ImportedDataset:
                 stata_cleaned = stata_cleaned.lower()
             stata_varname = stata_cleaned
             if stata_varname in column_names:
-                stata_varname = gen_anonymous_varname(i)
+                column_number = i
+                if reconciliation is not None:
+                    column_number = reconciliation.get_position(i - 1) or i
+                stata_varname = gen_anonymous_varname(column_number)
             column_names.add(stata_varname)
-            this_stata_var = StataVar(column, stata_varname)
+            profile = None
+            if data_profile is not None:
+                profile = data_profile.get(column_name)
+            this_stata_var = StataVar(column, stata_varname, profile)
             stata_vars.append(this_stata_var)
         return stata_vars
 
@@ -124,8 +143,8 @@ class ImportedDataset:
         return self.secondary is not None
 
     def get_odk_source_file(self):
-        """Get the ODK source file."""
-        return self.primary.odkform.path
+        """Get the logical file name of the ODK source file."""
+        return self.primary.odkform.filename
 
     def keep_all(self):
         """Set all variables to be un-dropped."""
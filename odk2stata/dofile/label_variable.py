@@ -32,7 +32,7 @@ class LabelVariable(DoFileSection):
     def should_label(self, var: StataVar):
         if var.is_dropped() or var.column.survey_row is None:
             return False
-        if var.column.survey_row.becomes_column():
+        if var.column.survey_row.row_type.becomes_column:
             return True
         return False
 
@@ -42,9 +42,7 @@ class LabelVariable(DoFileSection):
 
     def label_variable_do(self, var: StataVar):
         varname = var.varname
-        label_raw = var.column.survey_row.get_label(self.which_label,
-                                                    self.extra_label)
-        label_cleaned = self.clean_label(label_raw)
+        label_cleaned = self.get_cleaned_label(var)
         if label_cleaned == '':
             return f'* LABEL SKIPPED: variable "{varname}" has no label.'
         # TODO IMPROVE THIS PART
@@ -57,6 +55,12 @@ class LabelVariable(DoFileSection):
             label_variable = f'{msg}\n{label_variable}'
         return label_variable
 
+    def get_cleaned_label(self, var: StataVar) -> str:
+        """Get the label of a variable, before it is truncated."""
+        label_raw = var.column.survey_row.get_label(self.which_label,
+                                                    self.extra_label)
+        return self.clean_label(label_raw)
+
     def clean_label(self, text: str) -> str:
         new_text = text
         if self.remove_numbering:
@@ -0,0 +1,423 @@
+"""A module to find all problems in a form and its settings at once.
+
+Generating a do file stops at the first problem, e.g. the first
+unmatched "end group" or the first missing choice list. Linting reads
+the form leniently instead, and then checks it together with the
+settings, so that every problem is reported in one run:
+
+- Groups and repeats that are not balanced
+- Choice lists and choice files that are not found
+- Names used more than once in the survey or in a choice list
+- Choice lists that cannot be numbered for encoding, e.g. missing
+  numbers with strict numbering, or the same number twice
+- Label columns from the settings that do not exist
+- Rename rules that cannot be parsed
+- Settings sections, keys and values that are missing or invalid
+
+Module attributes:
+    SECTIONS: The settings sections, and the class that uses each one
+    lint_form: Find all problems in a form and its settings
+"""
+import configparser
+from typing import Dict, List, Optional
+
+import xlrd
+
+from .destring import Destring
+from .do_file_section import DoFileSection
+from .drop_column import DropColumn
+from .encode_select_one import EncodeSelectOne
+from .label_variable import LabelVariable
+from .metadata import Metadata
+from .rename import Rename, RenameRule
+from .settings.settings_manager import (STR_BOOL_FALSE, STR_BOOL_TRUE,
+                                        destringify_value)
+from .split_select_multiple import SplitSelectMultiple
+from .stata_utils import is_valid_stata_varname
+from ..dataset.utils import DatasetSource
+from ..error import (ChoiceListNotFoundError, OdkFormError,
+                     RenameNotSupportedError)
+from ..odkform.choices import ChoiceList
+from ..odkform.diagnostic import Diagnostic, ERROR, WARNING
+from ..odkform.odkform import OdkForm
+from ..odkform.source import FormSource
+from ..odkform.survey import SurveyRow
+
+
+SECTIONS = {
+    'destring': Destring,
+    'drop_column': DropColumn,
+    'encode_select_one': EncodeSelectOne,
+    'label_variable': LabelVariable,
+    'metadata': Metadata,
+    'rename': Rename,
+    'split_select_multiple': SplitSelectMultiple,
+}
+
+
+def lint_form(source: FormSource, settings_path: str = None,
+              filename: str = None) -> List[Diagnostic]:
+    """Find all problems in a form and its settings.
+
+    Args:
+        source: The path to the form, or the form in memory. See
+            OdkForm.
+        settings_path: The path to the settings file. If None, the
+            default settings are used.
+        filename: The logical file name of a form in memory
+
+    Returns:
+        The problems found, as Diagnostic objects. Problems in the form
+        come first, in the order they were found, then problems in the
+        settings. The list is empty if there are no problems.
+    """
+    settings_problems: List[Diagnostic] = []
+    settings = _lint_settings(settings_path, settings_problems)
+    diagnostics: List[Diagnostic] = []
+    try:
+        odkform = OdkForm(source, filename=filename, lenient=True)
+    except (OdkFormError, xlrd.XLRDError, KeyError, OSError,
+            ValueError) as err:
+        msg = f'Unable to read the form: {err}'
+        diagnostics.append(Diagnostic(ERROR, 'unreadable-form', msg))
+        return diagnostics + settings_problems
+    diagnostics.extend(odkform.problems)
+    choice_lists = _resolve_choice_lists(odkform, diagnostics)
+    _lint_duplicate_names(odkform, diagnostics)
+    _lint_duplicate_choice_names(choice_lists, diagnostics)
+    encoded = _get_encoded_choice_lists(choice_lists,
+                                        settings['encode_select_one'])
+    _lint_numbering(encoded, settings['encode_select_one'], settings_path,
+                    diagnostics)
+    _lint_labels(odkform, choice_lists, encoded, settings, settings_path,
+                 diagnostics)
+    _lint_rename_rules(settings['rename'], settings_path, diagnostics)
+    return diagnostics + settings_problems
+
+
+def _lint_settings(path: Optional[str], diagnostics: List[Diagnostic]) \
+        -> Dict[str, dict]:
+    """Read the settings, and check each section, key and value.
+
+    Unlike SettingsManager, this does not stop at a missing section or
+    a bad value. The default is used for anything that is not valid.
+
+    Args:
+        path: The path to the settings file, or None for the defaults
+        diagnostics: The list to add problems to
+
+    Returns:
+        A dictionary of section name to settings, filled in with the
+        defaults
+    """
+    settings = {}
+    for name, section_class in SECTIONS.items():
+        defaults = dict(DoFileSection.BASE_DEFAULT_SETTINGS)
+        defaults.update(section_class.DEFAULT_SETTINGS)
+        settings[name] = defaults
+    if path is None:
+        return settings
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(path, encoding='utf-8') as file:
+            config.read_file(file)
+    except (OSError, UnicodeDecodeError, configparser.Error) as err:
+        msg = f'Unable to read the settings: {err}'
+        diagnostics.append(Diagnostic(ERROR, 'unreadable-settings', msg,
+                                      path=path))
+        return settings
+    defaults = config.defaults()
+    for key, value in defaults.items():
+        problem = _check_setting(key, value,
+                                 DoFileSection.BASE_DEFAULT_SETTINGS)
+        if problem is not None:
+            diagnostics.append(problem._replace(sheet=config.default_section,
+                                                path=path))
+    for name in config.sections():
+        if name not in SECTIONS:
+            msg = f'Settings section [{name}] is not used'
+            diagnostics.append(Diagnostic(WARNING, 'unknown-setting', msg,
+                                          name, path=path))
+    for name, section_settings in settings.items():
+        if not config.has_section(name):
+            msg = f'Settings section [{name}] is missing'
+            diagnostics.append(Diagnostic(ERROR, 'missing-settings-section',
+                                          msg, name, path=path))
+            continue
+        for key, value in config[name].items():
+            problem = _check_setting(key, value, section_settings)
+            if problem is not None:
+                # A problem with a default is reported once, above
+                if defaults.get(key) != value:
+                    diagnostics.append(problem._replace(sheet=name,
+                                                        path=path))
+            else:
+                pattern = section_settings[key]
+                section_settings[key] = destringify_value(value, pattern)
+    return settings
+
+
+def _check_setting(key: str, value: str, defaults: dict) \
+        -> Optional[Diagnostic]:
+    """Check a single setting against its default.
+
+    Args:
+        key: The name of the setting
+        value: The value of the setting, as text
+        defaults: The default settings of its section
+
+    Returns:
+        None if the setting is valid and used, otherwise the problem,
+        without its section or path
+    """
+    if key not in defaults:
+        msg = f'Setting "{key}" is not used'
+        return Diagnostic(WARNING, 'unknown-setting', msg, name=key)
+    pattern = defaults[key]
+    msg = None
+    if isinstance(pattern, bool):
+        if value.lower() not in STR_BOOL_TRUE + STR_BOOL_FALSE:
+            msg = f'Value "{value}" for "{key}" is not true or false'
+    elif isinstance(pattern, DatasetSource):
+        try:
+            DatasetSource.from_string(value)
+        except ValueError:
+            msg = f'Value "{value}" for "{key}" is not a dataset source'
+    if msg is None:
+        return None
+    return Diagnostic(ERROR, 'invalid-setting', msg, name=key)
+
+
+def _resolve_choice_lists(odkform: OdkForm, diagnostics: List[Diagnostic]) \
+        -> Dict[SurveyRow, ChoiceList]:
+    """Look up the choice list of every select row.
+
+    Deferred lists, from external choices or choice files, are looked up
+    here too, so that missing ones are found.
+
+    Args:
+        odkform: The lenient OdkForm
+        diagnostics: The list to add problems to
+
+    Returns:
+        A dictionary of select survey row to its choice list, without
+        the rows whose list is missing
+    """
+    choice_lists = {}
+    for row in odkform.survey:
+        if not row.row_type.is_select:
+            continue
+        try:
+            choice_list = row.choice_list
+        except ChoiceListNotFoundError as err:
+            diagnostics.append(Diagnostic(ERROR, 'missing-choice-list',
+                                          str(err), 'survey', row.rowx + 1,
+                                          row.row_name))
+            continue
+        except (OSError, UnicodeDecodeError, ValueError) as err:
+            msg = f'Unable to read choice file "{row.row_type.list_name}": ' \
+                  f'{err}'
+            diagnostics.append(Diagnostic(ERROR, 'unreadable-choice-file',
+                                          msg, 'survey', row.rowx + 1,
+                                          row.row_name))
+            continue
+        if choice_list is not None:
+            choice_lists[row] = choice_list
+    return choice_lists
+
+
+def _lint_duplicate_names(odkform: OdkForm,
+                          diagnostics: List[Diagnostic]) -> None:
+    """Find names that are used for more than one survey row.
+
+    The same name under the same groups is an error. Under different
+    groups, it is allowed, but the names clash in Stata, so it is a
+    warning.
+
+    Args:
+        odkform: The OdkForm
+        diagnostics: The list to add problems to
+    """
+    for name, rows in odkform.rows_by_name.items():
+        first = rows[0]
+        for row in rows[1:]:
+            if row.ancestors == first.ancestors:
+                severity = ERROR
+                msg = (f'Name "{name}" is used again in the same group, '
+                       f'first at row {first.rowx + 1}')
+            else:
+                severity = WARNING
+                msg = (f'Name "{name}" is also used at row {first.rowx + 1}, '
+                       f'so the variable names clash in Stata')
+            diagnostics.append(Diagnostic(severity, 'duplicate-name', msg,
+                                          'survey', row.rowx + 1, name))
+
+
+def _lint_duplicate_choice_names(choice_lists: Dict[SurveyRow, ChoiceList],
+                                 diagnostics: List[Diagnostic]) -> None:
+    """Find choice names that are used more than once in a list.
+
+    Args:
+        choice_lists: The choice list of each select survey row
+        diagnostics: The list to add problems to
+    """
+    for choice_list in dict.fromkeys(choice_lists.values()):
+        seen = set()
+        for choice in choice_list:
+            name = choice.row_name
+            if name in seen:
+                msg = (f'Choice name "{name}" is used more than once in '
+                       f'choice list "{choice_list.name}"')
+                diagnostics.append(Diagnostic(WARNING,
+                                              'duplicate-choice-name', msg,
+                                              choice_list.sheet_name,
+                                              choice.rowx + 1, str(name)))
+            seen.add(name)
+
+
+def _get_encoded_choice_lists(choice_lists: Dict[SurveyRow, ChoiceList],
+                              settings: dict) -> List[ChoiceList]:
+    """Get the choice lists that are encoded with these settings.
+
+    Args:
+        choice_lists: The choice list of each select survey row
+        settings: The encode_select_one settings
+
+    Returns:
+        The choice lists of the select_one rows that are encoded, in
+        order of first use
+    """
+    encode = EncodeSelectOne(None, settings)
+    encoded = {}
+    for row, choice_list in choice_lists.items():
+        if row.row_type.is_select_one and \
+                encode.should_encode_row(row, row.row_name):
+            encoded[choice_list] = None
+    return list(encoded)
+
+
+def _lint_numbering(encoded: List[ChoiceList], settings: dict,
+                    settings_path: Optional[str],
+                    diagnostics: List[Diagnostic]) -> None:
+    """Check that the encoded choice lists can be numbered.
+
+    This uses the same numbering as EncodeChoiceList.
+
+    Args:
+        encoded: The choice lists that are encoded
+        settings: The encode_select_one settings
+        settings_path: The path to the settings file, or None
+        diagnostics: The list to add problems to
+    """
+    number_column = settings['number_column']
+    strict = settings['strict_numbering']
+    if strict and not number_column:
+        msg = ('With strict choice numbering, a "number_column" must be '
+               'specified in settings')
+        diagnostics.append(Diagnostic(ERROR, 'strict-numbering', msg,
+                                      'encode_select_one',
+                                      name='number_column',
+                                      path=settings_path))
+        return
+    for choice_list in encoded:
+        if not strict:
+            numbers = choice_list.get_flexible_numbers(number_column)
+        elif number_column not in choice_list.row_header:
+            msg = (f'Unable to find "{number_column}" in column headers '
+                   f'for choice list "{choice_list.name}"')
+            diagnostics.append(Diagnostic(ERROR, 'strict-numbering', msg,
+                                          choice_list.sheet_name,
+                                          name=choice_list.name))
+            continue
+        else:
+            numbers = choice_list.get_column_values(number_column)
+        seen = {}
+        for choice, number in zip(choice_list, numbers):
+            if not isinstance(number, int):
+                msg = (f'Choice "{choice.row_name}" in choice list '
+                       f'"{choice_list.name}" does not have a number in the '
+                       f'"{number_column}" column')
+                diagnostics.append(Diagnostic(ERROR, 'strict-numbering', msg,
+                                              choice_list.sheet_name,
+                                              choice.rowx + 1,
+                                              str(choice.row_name)))
+                continue
+            if number in seen:
+                msg = (f'Choice "{choice.row_name}" in choice list '
+                       f'"{choice_list.name}" has the same number {number} '
+                       f'as choice "{seen[number]}"')
+                diagnostics.append(Diagnostic(ERROR,
+                                              'duplicate-choice-number', msg,
+                                              choice_list.sheet_name,
+                                              choice.rowx + 1,
+                                              str(choice.row_name)))
+                continue
+            seen[number] = choice.row_name
+
+
+def _lint_labels(odkform: OdkForm, choice_lists: Dict[SurveyRow, ChoiceList],
+                 encoded: List[ChoiceList], settings: Dict[str, dict],
+                 settings_path: Optional[str],
+                 diagnostics: List[Diagnostic]) -> None:
+    """Check that the label columns in the settings exist.
+
+    Args:
+        odkform: The OdkForm
+        choice_lists: The choice list of each select survey row
+        encoded: The choice lists that are encoded
+        settings: The settings for each section
+        settings_path: The path to the settings file, or None
+        diagnostics: The list to add problems to
+    """
+    split = [choice_list for row, choice_list in choice_lists.items()
+             if row.row_type.is_select_multiple]
+    checks = (
+        ('label_variable', odkform.survey.table, 'survey'),
+        *(('encode_select_one', choice_list.table, choice_list.sheet_name)
+          for choice_list in encoded),
+        *(('split_select_multiple', choice_list.table, choice_list.sheet_name)
+          for choice_list in dict.fromkeys(split)),
+    )
+    reported = set()
+    for section, table, sheet_name in checks:
+        which_label = settings[section]['which_label']
+        if (section, sheet_name) in reported or \
+                table.get_label_colx(which_label) is not None:
+            continue
+        reported.add((section, sheet_name))
+        msg = (f'Unable to find the "{which_label}" label column in '
+               f'"{sheet_name}"')
+        diagnostics.append(Diagnostic(ERROR, 'invalid-setting', msg, section,
+                                      name='which_label', path=settings_path))
+
+
+def _lint_rename_rules(settings: dict, settings_path: Optional[str],
+                       diagnostics: List[Diagnostic]) -> None:
+    """Check that every direct rename rule can be parsed.
+
+    Args:
+        settings: The rename settings
+        settings_path: The path to the settings file, or None
+        diagnostics: The list to add problems to
+    """
+    for line in settings['direct_rename']:
+        msg = None
+        split = line.split(maxsplit=1)
+        if len(split) < 2:
+            msg = f'Rename rule "{line}" does not have an old and a new name'
+        else:
+            old, new = split
+            try:
+                RenameRule(old, new)
+            except RenameNotSupportedError as err:
+                msg = (f'Rename rule "{line}" has unsupported character '
+                       f'"{err}"')
+            else:
+                if not RenameRule.has_special_char(new) and \
+                        not is_valid_stata_varname(new):
+                    msg = (f'Rename rule "{line}" has new name "{new}", '
+                           f'which is not a valid Stata variable name')
+        if msg is not None:
+            diagnostics.append(Diagnostic(ERROR, 'invalid-rename', msg,
+                                          'rename', name='direct_rename',
+                                          path=settings_path))
@@ -35,7 +35,8 @@ class Metadata:
         if settings:
             self.settings.update(settings)
         self.odk2stata_version = __version__
-        self.odk_source_file = self.dataset.get_odk_source_file()
+        # A form read from memory may not have a file name
+        self.odk_source_file = self.dataset.get_odk_source_file() or ''
         self.primary_base = self.get_primary_base()
         self.primary_csv = self.get_primary_csv()
         self.primary_dta = self.get_primary_dta()
@@ -60,12 +61,12 @@ class Metadata:
         return source_file
 
     def get_primary_base(self):
-        filename = self.dataset.primary.dataset_filename
+        filename = self.dataset.primary.get_csv_filename()
         base, _ = os.path.splitext(filename)
         return base
 
     def get_primary_csv(self):
-        return self.dataset.primary.dataset_filename
+        return self.dataset.primary.get_csv_filename()
 
     def get_primary_dta(self):
         base = self.get_primary_base()
@@ -75,12 +76,12 @@ class Metadata:
     def get_secondary_csv(self):
         if not self.dataset.secondary:
             return None
-        return self.dataset.secondary.dataset_filename
+        return self.dataset.secondary.get_csv_filename()
 
     def get_secondary_dta(self):
         if not self.dataset.secondary:
             return None
-        csv_filename = self.dataset.secondary.dataset_filename
+        csv_filename = self.dataset.secondary.get_csv_filename()
         path, _ = os.path.splitext(csv_filename)
         filename_dta = f'{path}.dta'
         return filename_dta
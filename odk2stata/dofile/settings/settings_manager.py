@@ -52,6 +52,7 @@ def dataset_source_to_str(value: DatasetSource) -> str:
 
 
 STR_BOOL_TRUE = ['true', 'yes', 't', 'y', '1']
+STR_BOOL_FALSE = ['false', 'no', 'f', 'n', '0', '']
 
 
 def destringify_value(value: str, pattern):
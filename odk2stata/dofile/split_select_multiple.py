@@ -149,6 +149,10 @@ class SsmUnit:
         return [clean_stata_varname(item.name) for item in self.choices]
 
     def gen_labels(self) -> List[str]:
+        return [stata_string_escape(i) for i in self.gen_raw_labels()]
+
+    def gen_raw_labels(self) -> List[str]:
+        """Get the labels of the binaries, not escaped for Stata."""
         gen_labels = []
         uncut_stem = self.select_multiple_label
         for choice in self.choices:
@@ -157,7 +161,7 @@ class SsmUnit:
             stem_len = LABEL_MAX_LEN - (len(suffix) + 3)
             stem = uncut_stem[:stem_len]
             gen_label = ' : '.join((stem, suffix))
-            gen_labels.append(stata_string_escape(gen_label))
+            gen_labels.append(gen_label)
         return gen_labels
 
     def render(self) -> str:
@@ -300,12 +304,12 @@ class SplitSelectMultiple(DoFileSection):
         row = var.get_survey_row()
         if row is None:
             return False
-        elif not row.is_select_multiple():
+        elif not row.row_type.is_select_multiple:
             return False
         should_split = True
         if self.default_split_method == self.METHOD_NONE:
             should_split = False
-        choice_list = row.choice_list.name
+        choice_list = row.row_type.list_name
         if choice_list in self.choice_lists_to_split:
             should_split = True
         if choice_list in self.choice_lists_not_to_split:
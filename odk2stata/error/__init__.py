@@ -16,6 +16,17 @@ class LabelNotFoundError(OdkFormError):
     """An excpetion for determining the label for an XlsFormRow."""
 
 
+class ChoiceListNotFoundError(OdkFormError, KeyError):
+    """An exception when a choice list used by the form is not found.
+
+    This is a KeyError too, which is what was raised before.
+    """
+
+    def __str__(self):
+        """Get the message, without the quotes added by KeyError."""
+        return str(self.args[0]) if self.args else ''
+
+
 class DatasetError(Exception):
     """The base exception class for the dataset subpackage."""
 
@@ -4,6 +4,7 @@ import threading
 import wx
 
 from ..dofile.do_file_collection import DoFileCollection
+from ..odkform.cache import FormCache
 
 
 EVT_COMPLETE_ID = wx.NewId()
@@ -36,7 +37,8 @@ class Worker(threading.Thread):
 
     def run(self):
         do_files = DoFileCollection.from_file(self.xlsform_path,
-                                              settings_path=self.settings_path)
+                                              settings_path=self.settings_path,
+                                              cache=FormCache())
         do_files.write_out(self.output_path)
         message = f'Do file saved to "{self.output_path}"\n'
         wx.PostEvent(self.panel, CompleteEvent(message, True))
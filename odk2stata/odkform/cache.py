@@ -0,0 +1,257 @@
+"""A module to cache parsed ODK forms on disk.
+
+Parsing an XlsForm is the slowest part of generating a do file. When
+the same form is used again, for example after changing only the
+settings, the parsed OdkForm is loaded from the cache instead.
+
+Module attributes:
+    FormCache: A class to store and retrieve parsed OdkForm objects
+"""
+import hashlib
+import os
+import os.path
+import pickle
+import tempfile
+import time
+from typing import Optional
+
+from .odkform import OdkForm
+from .source import normalize_path
+from .textform import CSV_EXTENSION
+from ..__version__ import __version__
+
+
+class FormCache:
+    """A class to cache parsed OdkForm objects on disk.
+
+    Entries are keyed by a SHA-256 of the XlsForm bytes, the XlsForm
+    filename (it can be used as the form title), the OdkForm options
+    that change the parsed form, the odk2stata version and the cache
+    format. Entries are evicted when older than `max_age` and, oldest
+    first, when the cache grows larger than `max_bytes`.
+
+    Only forms read from a path are cached. Choice files in the form's
+    media are not part of an entry: they are read when they are first
+    needed, from the files as they are then.
+
+    Class attributes:
+        DEFAULT_MAX_BYTES: The default size limit of the cache
+        DEFAULT_MAX_AGE: The default age limit, in seconds, of entries
+        SUFFIX: The file extension of cache entries
+        FORMAT: The version of the cached objects' layout. Increment it
+            whenever pickled odkform classes change.
+        KEY_OPTIONS: The OdkForm keyword arguments that change the
+            parsed form, and their defaults
+
+    Instance attributes:
+        cache_dir: The directory where cache entries are stored
+        max_bytes: The size limit of the cache
+        max_age: The age limit, in seconds, of cache entries
+    """
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+    SUFFIX = '.pickle'
+    FORMAT = 7
+    KEY_OPTIONS = {'lenient': False, 'spill_rows': None}
+
+    def __init__(self, cache_dir: str = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        """Initialize a FormCache.
+
+        Args:
+            cache_dir: The directory where cache entries are stored. If
+                None, then use the default cache directory.
+            max_bytes: The size limit of the cache
+            max_age: The age limit, in seconds, of cache entries
+        """
+        self.cache_dir = cache_dir if cache_dir else self.default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def default_cache_dir() -> str:
+        """Get the default cache directory.
+
+        This respects XDG_CACHE_HOME and defaults to ~/.cache/odk2stata.
+        """
+        base = os.environ.get('XDG_CACHE_HOME')
+        if not base:
+            base = os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base, 'odk2stata')
+
+    @classmethod
+    def get_key(cls, path: str, filename: str = None, **options) -> str:
+        """Get the cache key for an XlsForm file.
+
+        A form saved as a directory of CSV files is keyed by the names
+        and contents of its CSV files.
+
+        Args:
+            path: The path to the XlsForm
+            filename: The logical file name of the XlsForm, if it is
+                not the path
+            **options: The OdkForm keyword arguments in KEY_OPTIONS.
+                Others are ignored.
+
+        Returns:
+            A hex digest based on the file contents, file name, options,
+            the odk2stata version and the cache format.
+        """
+        path = normalize_path(path)
+        sha256 = hashlib.sha256()
+        prefix = f'odk2stata {__version__} {cls.FORMAT}\0'
+        sha256.update(prefix.encode('utf-8'))
+        basename = os.path.basename(filename if filename else path)
+        sha256.update(f'{basename}\0'.encode('utf-8'))
+        for name, default in cls.KEY_OPTIONS.items():
+            value = options.get(name, default)
+            sha256.update(f'{name}={value!r}\0'.encode('utf-8'))
+        if os.path.isdir(path):
+            for entry in sorted(os.listdir(path)):
+                if entry.lower().endswith(CSV_EXTENSION):
+                    sha256.update(f'{entry}\0'.encode('utf-8'))
+                    cls.update_hash(sha256, os.path.join(path, entry))
+        else:
+            cls.update_hash(sha256, path)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def update_hash(sha256, path: str) -> None:
+        """Add the contents of a file to a hash."""
+        with open(path, mode='rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+
+    def get_entry_path(self, key: str) -> str:
+        """Get the path to the cache entry for a key."""
+        return os.path.join(self.cache_dir, f'{key}{self.SUFFIX}')
+
+    def get_odkform(self, path: str, **kwargs) -> OdkForm:
+        """Get the OdkForm for an XlsForm, parsing it only if needed.
+
+        Args:
+            path: The path to the XlsForm
+            **kwargs: Keyword arguments for OdkForm, if it is parsed.
+                Those in KEY_OPTIONS are part of the cache key.
+
+        Returns:
+            The OdkForm, either from the cache or freshly parsed
+
+        Raises:
+            ValueError: If a workbook is given, since the form parsed
+                from it might not be the one at the path
+        """
+        if kwargs.get('workbook') is not None:
+            raise ValueError('A form parsed from an open workbook cannot '
+                             'be cached')
+        path = normalize_path(path)
+        filename = kwargs.get('filename')
+        key = self.get_key(path, **kwargs)
+        odkform = self.load(key)
+        if odkform is None:
+            odkform = OdkForm(path, **kwargs)
+            self.store(key, odkform)
+        else:
+            odkform.path = path
+            odkform.filename = filename if filename is not None else path
+            odkform.choices.path = path
+            odkform.settings.path = path
+            odkform.settings.filename = filename
+        return odkform
+
+    def load(self, key: str) -> Optional[OdkForm]:
+        """Load a cached OdkForm.
+
+        A cache entry that cannot be read is treated as missing.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached OdkForm, or None if not found
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(entry_path, mode='rb') as file:
+                odkform = pickle.load(file)
+            # Mark as recently used for eviction
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError,
+                ImportError):
+            self.remove(entry_path)
+            return None
+        return odkform
+
+    def store(self, key: str, odkform: OdkForm) -> None:
+        """Store an OdkForm in the cache and evict old entries.
+
+        Failing to write the cache is not an error. A partly written
+        entry is removed.
+
+        Args:
+            key: The cache key
+            odkform: The parsed OdkForm
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, mode='wb') as file:
+                pickle.dump(odkform, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.get_entry_path(key))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            self.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove entries that are too old or over the size limit.
+
+        Entries are removed least recently used first.
+        """
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as scanner:
+                for entry in scanner:
+                    if entry.name.endswith(self.SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size,
+                                        entry.path))
+        except OSError:
+            return
+        entries.sort(reverse=True)
+        now = time.time()
+        total = 0
+        for mtime, size, entry_path in entries:
+            total += size
+            if now - mtime > self.max_age or total > self.max_bytes:
+                self.remove(entry_path)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        try:
+            with os.scandir(self.cache_dir) as scanner:
+                for entry in scanner:
+                    if entry.name.endswith(self.SUFFIX):
+                        self.remove(entry.path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def remove(entry_path: str) -> None:
+        """Remove a single cache entry, if possible."""
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'FormCache("{self.cache_dir}")'
+        return msg
@@ -0,0 +1,254 @@
+"""A module to read choices from files that accompany a form.
+
+Besides the choices and external_choices sheets, choices can come from
+files in the form's media:
+
+- A "select_one_from_file villages.csv" question takes its choices
+  from villages.csv, or from an XML file with the same format as an
+  external secondary instance. Such a file has one list, so it does
+  not have a list_name column.
+- A form with external selects can come with an itemsets.csv instead
+  of an external_choices sheet. It has a list_name column, like the
+  sheet it was generated from.
+
+Choice files are streamed into a ChoiceListTab, a block of rows at a
+time, in the same way as a sheet. As in a CSV form, text that looks
+like a plain number is read as a number.
+
+Files are often shared by many forms, e.g. a list of villages used by
+every form in a project. Parsed files are therefore cached by path,
+modification time and size, so that a batch of forms reads each file
+once. The cached ChoiceListTab is shared, so it must not be changed.
+
+Module attributes:
+    XML_EXTENSION: The file extension of XML choice files
+    CACHE_SIZE: The number of parsed choice files that are cached
+    ChoiceFileSheet: A base class for a choice file read as a sheet
+    CsvChoiceSheet: A choice file in CSV format
+    XmlChoiceSheet: A choice file in XML format
+    load_choice_file: Parse a choice file, or get it from the cache
+"""
+from array import array
+import csv
+from functools import lru_cache
+from itertools import islice
+import os
+import os.path
+from typing import Dict, Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ElementTree
+
+import xlrd.sheet
+
+from .choices import ChoiceListTab
+from .textform import TableSheet
+from .workbook import local_name
+
+
+XML_EXTENSION = '.xml'
+CACHE_SIZE = 32
+
+
+class ChoiceFileSheet:
+    """A base class for a choice file that is read like a sheet.
+
+    This class mimics the part of the xlrd Sheet interface that
+    ChoiceListTab uses. The file is read again for each request, so
+    only one block of rows is in memory at a time.
+
+    Instance attributes:
+        path: The path to the choice file
+        name: The file name, used as the sheet name
+        list_name: If not None, a list_name column with this value is
+            added in front, for files with a single list
+    """
+
+    def __init__(self, path: str, list_name: str = None):
+        """Initialize a ChoiceFileSheet.
+
+        Args:
+            path: The path to the choice file
+            list_name: If not None, the list name for all rows
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        self.list_name = list_name
+
+    def read_rows(self) -> Iterator[List[Optional[str]]]:
+        """Read the rows of text in the file, header first."""
+        raise NotImplementedError
+
+    def get_rows(self) -> Iterator[List[Optional[str]]]:
+        """Get the rows of text, with the list_name column if needed."""
+        rows = self.read_rows()
+        if self.list_name is None:
+            return rows
+        header = next(rows, None)
+        if header is None:
+            return iter(())
+        return self._with_list_name(header, rows)
+
+    def _with_list_name(self, header: List[Optional[str]],
+                        rows: Iterator[List[Optional[str]]]) \
+            -> Iterator[List[Optional[str]]]:
+        """Add the list_name column to the header and all rows."""
+        yield ['list_name', *header]
+        for row in rows:
+            yield [self.list_name, *row]
+
+    def row(self, rowx: int) -> List[xlrd.sheet.Cell]:
+        """Get a single row of xlrd cells.
+
+        Raises:
+            IndexError: If the file does not have that row. This is
+                the same behavior as xlrd.
+        """
+        row = next(islice(self.get_rows(), rowx, None), None)
+        if row is None:
+            raise IndexError(rowx)
+        return [xlrd.sheet.Cell(*TableSheet.text_to_cell(text))
+                for text in row]
+
+    def iter_column_blocks(self, ncols: int, start_rowx: int = 0,
+                           block_size: int = 1024) \
+            -> Iterator[Tuple[int, List[array], List[list]]]:
+        """Iterate over blocks of rows, with cells grouped by column.
+
+        See XlsxSheet.iter_column_blocks.
+        """
+        text_to_cell = TableSheet.text_to_cell
+        rows = islice(self.get_rows(), start_rowx, None)
+        first_rowx = start_rowx
+        while True:
+            block = list(islice(rows, block_size))
+            if not block:
+                return
+            types = []
+            values = []
+            for colx in range(ncols):
+                col_types = array('b')
+                col_values = []
+                for row in block:
+                    text = row[colx] if colx < len(row) else None
+                    ctype, value = text_to_cell(text)
+                    col_types.append(ctype)
+                    col_values.append(value)
+                types.append(col_types)
+                values.append(col_values)
+            yield first_rowx, types, values
+            first_rowx += len(block)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'{type(self).__name__}("{self.path}")'
+        return msg
+
+
+class CsvChoiceSheet(ChoiceFileSheet):
+    """A choice file in CSV format, read as UTF-8."""
+
+    def read_rows(self) -> Iterator[List[Optional[str]]]:
+        """Read the rows of text in the file, header first."""
+        with open(self.path, encoding='utf-8-sig', newline='') as file:
+            yield from csv.reader(file)
+
+
+class XmlChoiceSheet(ChoiceFileSheet):
+    """A choice file in XML format.
+
+    The file has the format of an external secondary instance: a root
+    element with an element per item, and an element per column under
+    each item, e.g. <root><item><name>a</name><label>A</label></item>
+    </root>. The header is every column found in the file, in order of
+    first appearance, so the file is read twice.
+    """
+
+    def __init__(self, path: str, list_name: str = None):
+        """Initialize an XmlChoiceSheet.
+
+        Args:
+            path: The path to the choice file
+            list_name: If not None, the list name for all rows
+        """
+        super().__init__(path, list_name)
+        self._header: Optional[List[str]] = None
+
+    def read_rows(self) -> Iterator[List[Optional[str]]]:
+        """Read the rows of text in the file, header first."""
+        if self._header is None:
+            header: Dict[str, None] = {}
+            for item in self.iter_items():
+                header.update(dict.fromkeys(item))
+            self._header = list(header)
+        yield self._header
+        for item in self.iter_items():
+            yield [item.get(key) for key in self._header]
+
+    def iter_items(self) -> Iterator[Dict[str, str]]:
+        """Iterate over the items in the file, each as a dictionary."""
+        depth = 0
+        root = None
+        for event, elem in ElementTree.iterparse(self.path,
+                                                 events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                yield {local_name(child.tag): (child.text or '').strip()
+                       for child in elem}
+                root.clear()
+
+
+def load_choice_file(path: str, list_name: str = None,
+                     spill_rows: int = None) -> ChoiceListTab:
+    """Parse a choice file, or get it from the cache.
+
+    The cache is keyed by the real path of the file, and by its
+    modification time and size, so a changed file is parsed again.
+
+    Args:
+        path: The path to the choice file, CSV or XML
+        list_name: If not None, the list name for all rows, for a file
+            without a list_name column
+        spill_rows: The number of rows at which the choices are
+            spilled to memory-mapped files. If None, never spill.
+
+    Returns:
+        The ChoiceListTab for the file
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    return _load_choice_file(real_path, stat.st_mtime_ns, stat.st_size,
+                             list_name, spill_rows)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _load_choice_file(path: str, _mtime_ns: int, _size: int,
+                      list_name: Optional[str],
+                      spill_rows: Optional[int]) -> ChoiceListTab:
+    """Parse a choice file, caching the result.
+
+    Args:
+        path: The real path to the choice file
+        _mtime_ns: The modification time of the file, in nanoseconds.
+            It is not used, but is part of the cache key, so that a
+            changed file is parsed again.
+        _size: The size of the file in bytes. It is not used, but is
+            part of the cache key, for the same reason.
+        list_name: The list name of the choices
+        spill_rows: The number of rows at which the choices are
+            spilled to memory-mapped files. If None, never spill.
+
+    Returns:
+        The ChoiceListTab for the file
+    """
+    if path.lower().endswith(XML_EXTENSION):
+        sheet = XmlChoiceSheet(path, list_name)
+    else:
+        sheet = CsvChoiceSheet(path, list_name)
+    return ChoiceListTab(sheet, 0, spill_rows)
@@ -3,74 +3,167 @@
 Module attributes:
     NumberNameChoice: A namedtuple to encapsulate the returned data for
         choice numberings.
+    NumberedChoices: A sequence of NumberNameChoice backed by an array
     Choices: A class to handle all choices together. Choices can come
         from disparate source data
     ChoiceListTab: A class to represent the choices sheet, be it
         "choices" or "external_choices"
     ChoiceList: A single choice list found at a choices source data
 """
+from array import array
 from collections import defaultdict, namedtuple
-from typing import List, Dict, Tuple
+import collections.abc
+import os.path
+from typing import List, Dict, Optional, Sequence, Tuple
 
 import xlrd
 
+from .components import SheetTable
 from .components import XlsFormRow
 from .components import Worksheet
+from .workbook import open_workbook
+from ..error import ChoiceListNotFoundError
 
 
 NumberNameChoice = namedtuple('NumberNameChoice', ('number', 'name', 'choice'))
 
 
+class NumberedChoices(collections.abc.Sequence):
+    """A read-only sequence of numbered choice options.
+
+    The numbers are stored in an array, and each NumberNameChoice is
+    only built when it is accessed.
+
+    Instance attributes:
+        choice_list: The ChoiceList that is numbered
+        numbers: The number for each choice option
+    """
+
+    def __init__(self, choice_list: 'ChoiceList', numbers: array):
+        """Initialize a NumberedChoices.
+
+        Args:
+            choice_list: The ChoiceList that is numbered
+            numbers: The number for each choice option
+        """
+        self.choice_list = choice_list
+        self.numbers = numbers
+
+    def __getitem__(self, item):
+        """Get a NumberNameChoice, or a list of them for a slice."""
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        choice = self.choice_list.get_choice_at(item)
+        return NumberNameChoice(self.numbers[item], str(choice.row_name),
+                                choice)
+
+    def __len__(self):
+        """Return the number of choice options."""
+        return len(self.numbers)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<NumberedChoices for {self.choice_list!r}>'
+        return msg
+
+
 class ChoiceList:
     """A class to represent a single choice list.
 
-    This class is meant to be read-only after initialization.
+    This class is meant to be read-only after initialization. Only the
+    positions of the choice rows in the table are stored. The
+    XlsFormRow views for the choices are created when needed, and a
+    lookup from choice name to position is built on first use.
 
     Instance attributes:
         name: The name of the choice list
-        choices: The list of choices
+        table: The SheetTable of the sheet that stores the choices
+        positions: The positions in the table of this list's rows
         sheet_name: The sheet name where these choices came from
-        row_header: Calculated from the first row of the choices.
+        row_header: The header of the table
     """
 
-    def __init__(self, name: str, choices: List[XlsFormRow], sheet_name: str):
+    def __init__(self, name: str, table: SheetTable, positions: Sequence[int],
+                 sheet_name: str):
         """Initialize a ChoiceList.
 
-        Also stores the row_header for the choices as determined by
-        the first choice row.
-
         Args:
             name: The name of the choice list
-            choices: The list of choices
+            table: The SheetTable of the sheet that stores the choices
+            positions: The positions in the table of this list's rows
             sheet_name: The sheet name where these choices came from
         """
         self.name = name
-        self.choices = choices
+        self.table = table
+        self.positions = array('l', positions)
         self.sheet_name = sheet_name
-        self.row_header = self.choices[0].row_header
+        self.row_header = table.header
+        self._name_index: Optional[Dict[object, int]] = None
+
+    @property
+    def choices(self) -> List[XlsFormRow]:
+        """Get the list of choices, as views into the table."""
+        return list(self)
+
+    def get_choice_at(self, index: int) -> XlsFormRow:
+        """Get the choice at an index in this list."""
+        return XlsFormRow(self.table, self.positions[index])
+
+    def get_choice(self, name) -> XlsFormRow:
+        """Get a choice by its name.
+
+        If a name is repeated in the list, then the first one is used.
+
+        Args:
+            name: The name of the choice option
+
+        Returns:
+            The XlsFormRow for the choice
+
+        Raises:
+            KeyError: If there is no choice with that name
+        """
+        if self._name_index is None:
+            names = self.table.get_column('name')
+            index = {}
+            for position in self.positions:
+                index.setdefault(names[position], position)
+            self._name_index = index
+        return XlsFormRow(self.table, self._name_index[name])
+
+    def get_column_values(self, key: str) -> list:
+        """Get the values of this list's rows in a column.
+
+        Raises:
+            KeyError: If the header is not found
+        """
+        column = self.table.get_column(key)
+        return [column[i] for i in self.positions]
 
     def are_choice_names_all_integer(self) -> bool:
         """Determine if all choice options have an integer ODK name."""
-        return all(isinstance(i.row_name, int) for i in self)
+        return all(isinstance(i, int) for i in self.get_column_values('name'))
 
-    def get_choices_flexibly_numbered(self, extra_number: str = None) \
-            -> List[NumberNameChoice]:
-        """Get the choice list with flexible option numbers.
+    def get_flexible_numbers(self, extra_number: str = None) -> array:
+        """Get flexible option numbers for this list.
 
         Args:
             extra_number: A column where to look for a number. A number
                 found here takes precedence.
 
         Returns:
-            A list of tuples. Each tuple corresponds to a choice option
-            and has the assigned choice option number, the choice name,
-            and the XlsFormRow representing the choice row.
+            An array with the number of each choice option. A choice
+            gets the number in `extra_number`, else its name if that
+            is an integer, else one more than the largest number so far.
         """
-        result = []
+        names = self.get_column_values('name')
+        if extra_number in self.table.index:
+            extras = self.get_column_values(extra_number)
+        else:
+            extras = [None] * len(names)
+        numbers = array('q')
         next_number = 1
-        for choice in self.choices:
-            name = choice.row_name
-            extra_found = choice.row_dict.get(extra_number)
+        for name, extra_found in zip(names, extras):
             if isinstance(extra_found, int):
                 value = extra_found
             elif isinstance(name, int):
@@ -78,20 +171,17 @@ class ChoiceList:
             else:
                 value = next_number
             next_number = max(next_number, value) + 1
-            result.append(NumberNameChoice(value, str(name), choice))
-        return result
+            numbers.append(value)
+        return numbers
 
-    def get_choices_strictly_numbered(self, number_column: str ='name') \
-            -> List[NumberNameChoice]:
-        """Get the choice list with strict option numbers.
+    def get_strict_numbers(self, number_column: str = 'name') -> array:
+        """Get strict option numbers for this list.
 
         Args:
             number_column: A column where to look for a number.
 
         Returns:
-            A list of tuples. Each tuple corresponds to a choice option
-            and has the assigned choice option number, the choice name,
-            and the XlsFormRow representing the choice row.
+            An array with the number of each choice option
 
         Raises:
             KeyError if the supplied number_column is not in the
@@ -101,18 +191,54 @@ class ChoiceList:
             msg = (f'Unable to find "{number_column}" in column headers '
                    f'for choice list "{self.name}"')
             raise KeyError(msg)
-        numbers = [row.row_dict[number_column] for row in self.choices]
+        numbers = self.get_column_values(number_column)
         if any(not isinstance(i, int) for i in numbers):
             msg = (f'Choice list "{self.name}" does not define all '
                    f'options to have a number in the "{number_column}" '
                    f'column')
             raise ValueError(msg)
-        result = []
-        for number, choice in zip(numbers, self.choices):
-            result.append(
-                NumberNameChoice(number, str(choice.row_name), choice)
-            )
-        return result
+        return array('q', numbers)
+
+    def get_choices_flexibly_numbered(self, extra_number: str = None) \
+            -> Sequence[NumberNameChoice]:
+        """Get the choice list with flexible option numbers.
+
+        Args:
+            extra_number: A column where to look for a number. A number
+                found here takes precedence.
+
+        Returns:
+            A sequence of tuples. Each tuple corresponds to a choice
+            option and has the assigned choice option number, the
+            choice name, and the XlsFormRow representing the choice
+            row.
+        """
+        return NumberedChoices(self, self.get_flexible_numbers(extra_number))
+
+    def get_choices_strictly_numbered(self, number_column: str ='name') \
+            -> Sequence[NumberNameChoice]:
+        """Get the choice list with strict option numbers.
+
+        Args:
+            number_column: A column where to look for a number.
+
+        Returns:
+            A sequence of tuples. Each tuple corresponds to a choice
+            option and has the assigned choice option number, the
+            choice name, and the XlsFormRow representing the choice
+            row.
+
+        Raises:
+            KeyError if the supplied number_column is not in the
+            header, or ValueError if not all entries are integer.
+        """
+        return NumberedChoices(self, self.get_strict_numbers(number_column))
+
+    def __getstate__(self):
+        """Get the state for pickling, without the name lookup."""
+        state = dict(self.__dict__)
+        state['_name_index'] = None
+        return state
 
     def __hash__(self):
         """Make a hash based on the sheet name and the list name."""
@@ -120,7 +246,12 @@ class ChoiceList:
 
     def __iter__(self):
         """Return an iterator over individual choices in this list."""
-        return iter(self.choices)
+        table = self.table
+        return (XlsFormRow(table, i) for i in self.positions)
+
+    def __len__(self):
+        """Return the number of choices in this list."""
+        return len(self.positions)
 
     def __repr__(self):
         """Get a representation of this object."""
@@ -131,21 +262,43 @@ class ChoiceList:
 class ChoiceListTab(Worksheet):
     """A class to represent a sheet of choices or external choices.
 
+    Text values are interned, since values such as list names and
+    filter columns repeat down the sheet. If the sheet has at least
+    `spill_rows` choice rows, its values are moved to memory-mapped
+    files after parsing.
+
     Instance attributes:
         header: The header for the tab
+        table: The SheetTable with the values of all choice rows
         choices: A dictionary of choice names and ChoiceLists
     """
 
-    def __init__(self, sheet: xlrd.sheet.Sheet, datemode: int):
+    def __init__(self, sheet: xlrd.sheet.Sheet, datemode: int,
+                 spill_rows: int = None):
         """Initialize a ChoiceListTab object.
 
         Args:
             sheet: The xlrd sheet object for this sheet
             datemode: The xlrd datemode for the workbook
+            spill_rows: The number of choice rows at which to spill
+                the values to disk. If None, never spill.
         """
         self.header: Tuple[str] = None
+        self.table: SheetTable = None
         self.choices: Dict[str, ChoiceList] = {}
         self.build_choices(sheet, datemode)
+        self.spill(spill_rows)
+
+    def spill(self, spill_rows: int = None) -> None:
+        """Spill the values to disk if there are enough choice rows.
+
+        Args:
+            spill_rows: The number of choice rows at which to spill the
+                values to disk. If None, never spill.
+        """
+        if spill_rows is not None and self.table is not None \
+                and len(self.table) >= spill_rows:
+            self.table.spill()
 
     def build_choices(self, sheet: xlrd.sheet.Sheet, datemode: int) -> None:
         """Parse the tab of ODK choices.
@@ -158,27 +311,32 @@ class ChoiceListTab(Worksheet):
             sheet: The xlrd sheet object for this sheet
             datemode: The xlrd datemode for the workbook
         """
-        _choices_dict = defaultdict(list)
+        _choices_dict = defaultdict(lambda: array('l'))
         if sheet is not None:
             try:
                 self.header = self.get_header(sheet, datemode)
-                for i, row in enumerate(sheet.get_rows()):
-                    if i == 0:
-                        continue
-                    row_values = [self.cell_to_value(cell, datemode) for cell in
-                                  row]
-                    row_dict = {k: v for k, v in zip(self.header, row_values)}
-                    row_list_name = row_dict['list_name']
-                    row_name = row_dict['name']
-                    if str(row_list_name) and str(row_name):
-                        choice_row = XlsFormRow(i, row_name, self.header,
-                                                row_values, row_dict)
-                        _choices_dict[row_list_name].append(choice_row)
+                self.table = SheetTable(self.header, intern_strings=True)
+                list_name_colx = self.table.index['list_name']
+                name_colx = self.table.index['name']
+                blocks = self.get_column_blocks(sheet, len(self.header),
+                                                datemode)
+                for first_rowx, columns in blocks:
+                    keep = []
+                    position = len(self.table)
+                    list_names = columns[list_name_colx]
+                    names = columns[name_colx]
+                    for k, (row_list_name, row_name) in \
+                            enumerate(zip(list_names, names)):
+                        if str(row_list_name) and str(row_name):
+                            keep.append(k)
+                            _choices_dict[row_list_name].append(position)
+                            position += 1
+                    self.table.extend(first_rowx, columns, keep)
             except IndexError:
                 # No header row found. Then no choices.
                 pass
-        for name, choices in _choices_dict.items():
-            choice_list = ChoiceList(name, choices, sheet.name)
+        for name, positions in _choices_dict.items():
+            choice_list = ChoiceList(name, self.table, positions, sheet.name)
             self.choices[name] = choice_list
 
     def __len__(self):
@@ -206,29 +364,197 @@ class Choices(Worksheet):
     """A class to handle all choices together for the OdkForm.
 
     This class is the container for all choices used by the OdkForm.
+    Choice tabs are parsed on demand: a tab is parsed the first time a
+    choice list from it is needed. Forms with a large external_choices
+    tab therefore do not pay for it unless it is used.
+
+    Choice files in the form's media, for select_one_from_file and for
+    an itemsets.csv, are loaded on demand in the same way. They are
+    looked for next to the form and in its "-media" directory. See the
+    choice_file module.
+
+    Class attributes:
+        CHOICES: The name of the choices sheet
+        EXTERNAL_CHOICES: The name of the external choices sheet
+        ITEMSETS: The file name of external choices generated with a
+            form
 
     Instance attributes:
-        choices: A tab with choice lists
-        external_choices: A tab with external choice lists
+        workbook: The workbook from which to parse choice tabs. This is
+            not pickled, and it is reopened from `path` when needed.
+        path: The path to where the XlsForm is stored, or None if the
+            form was read from memory. Media files are looked for
+            relative to it.
+        spill_rows: The number of rows at which a choice tab is spilled
+            to memory-mapped files, or None to never spill
     """
 
-    def __init__(self, workbook: xlrd.Book):
+    CHOICES = 'choices'
+    EXTERNAL_CHOICES = 'external_choices'
+    ITEMSETS = 'itemsets.csv'
+
+    def __init__(self, workbook: xlrd.Book, path: str = None,
+                 spill_rows: int = None):
         """Initialize the choices object.
 
+        No sheets are parsed here.
+
         Args:
             workbook: The xlrd book object
+            path: The path to where the XlsForm is stored
+            spill_rows: The number of rows at which a choice tab is
+                spilled to memory-mapped files. If None, never spill.
+        """
+        self.workbook = workbook
+        self.path = path
+        self.spill_rows = spill_rows
+        self._tabs: Dict[str, ChoiceListTab] = {}
+
+    @property
+    def choices(self) -> ChoiceListTab:
+        """Get the tab with choice lists, parsing it if necessary."""
+        return self.get_tab(self.CHOICES)
+
+    @property
+    def external_choices(self) -> ChoiceListTab:
+        """Get the tab with external choice lists, parsing if necessary."""
+        return self.get_tab(self.EXTERNAL_CHOICES)
+
+    def get_tab(self, sheet_name: str) -> ChoiceListTab:
+        """Get a choice tab, parsing it the first time it is requested.
+
+        Args:
+            sheet_name: The sheet name to parse as a choice sheet
+
+        Returns:
+            A ChoiceListTab representing the specified sheet
+        """
+        tab = self._tabs.get(sheet_name)
+        if tab is None:
+            if self.workbook is None:
+                self.workbook = open_workbook(self.path)
+            tab = self.parse_choices_from_sheet(self.workbook, sheet_name,
+                                                self.spill_rows)
+            self._tabs[sheet_name] = tab
+        return tab
+
+    def add_tab(self, sheet_name: str, tab: ChoiceListTab) -> None:
+        """Add a choice tab that was parsed elsewhere.
+
+        The tab is spilled to disk according to `spill_rows`.
+
+        Args:
+            sheet_name: The sheet name of the choice tab
+            tab: The parsed choice tab
         """
-        self.choices = self.parse_choices_from_sheet(workbook, 'choices')
-        self.external_choices = \
-            self.parse_choices_from_sheet(workbook, 'external_choices')
+        tab.spill(self.spill_rows)
+        self._tabs[sheet_name] = tab
+
+    def is_loaded(self, sheet_name: str) -> bool:
+        """Return if the given choice tab has been parsed."""
+        return sheet_name in self._tabs
+
+    def get_file_tab(self, file_name: str, single_list: bool = False) \
+            -> ChoiceListTab:
+        """Get the choices in a media file, loading them if necessary.
+
+        Args:
+            file_name: The file name of the choice file
+            single_list: If true, the file has a single list without a
+                list_name column. The list is named after the file,
+                without the extension.
+
+        Returns:
+            A ChoiceListTab representing the file
+
+        Raises:
+            ChoiceListNotFoundError: If the file is not found. This is
+                also a KeyError.
+        """
+        # Imported here, since the choice_file module uses this one
+        from .choice_file import load_choice_file
+        tab = self._tabs.get(file_name)
+        if tab is None:
+            path = self.find_media_file(file_name)
+            if path is None:
+                msg = f'Unable to find choice file "{file_name}" for the form'
+                raise ChoiceListNotFoundError(msg)
+            list_name = None
+            if single_list:
+                list_name = os.path.splitext(file_name)[0]
+            tab = load_choice_file(path, list_name, self.spill_rows)
+            self._tabs[file_name] = tab
+        return tab
+
+    def find_media_file(self, file_name: str) -> Optional[str]:
+        """Find a media file of the form.
+
+        Args:
+            file_name: The file name of the media file
+
+        Returns:
+            The path to the file, next to the form or in the form's
+            "-media" directory, or None if it is not found.
+        """
+        if self.path is None:
+            return None
+        if os.path.isdir(self.path):
+            form_dir = self.path
+        else:
+            form_dir = os.path.dirname(self.path)
+        media_dir = os.path.splitext(self.path)[0] + '-media'
+        for directory in (form_dir, media_dir):
+            path = os.path.join(directory, file_name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def get_choice_list(self, list_name: str, external: bool = False,
+                        from_file: bool = False) -> ChoiceList:
+        """Get a choice list by name.
+
+        External lists that are not in external_choices are looked for
+        in an itemsets.csv.
+
+        Args:
+            list_name: The name of the choice list
+            external: If true, look in external_choices. Otherwise,
+                look in choices.
+            from_file: If true, the list name is the file name of a
+                choice file with a single list. This takes precedence.
+
+        Returns:
+            The requested ChoiceList
+
+        Raises:
+            ChoiceListNotFoundError: If the choice list is not found.
+                This is also a KeyError.
+        """
+        if from_file:
+            tab = self.get_file_tab(list_name, single_list=True)
+            return tab[os.path.splitext(list_name)[0]]
+        sheet_name = self.EXTERNAL_CHOICES if external else self.CHOICES
+        tab = self.get_tab(sheet_name)
+        if external and list_name not in tab.choices and \
+                self.find_media_file(self.ITEMSETS) is not None:
+            tab = self.get_file_tab(self.ITEMSETS)
+            sheet_name = self.ITEMSETS
+        try:
+            return tab[list_name]
+        except KeyError as exc:
+            msg = f'Unable to find choice list "{list_name}" in "{sheet_name}"'
+            raise ChoiceListNotFoundError(msg) from exc
 
     @staticmethod
-    def parse_choices_from_sheet(workbook: xlrd.Book, sheet_name: str) -> ChoiceListTab:
+    def parse_choices_from_sheet(workbook: xlrd.Book, sheet_name: str,
+                                 spill_rows: int = None) -> ChoiceListTab:
         """Parse choices from a choice sheet.
 
         Args:
             workbook: The xlrd book object
             sheet_name: The sheet name to parse as a choice sheet
+            spill_rows: The number of rows at which to spill the tab to
+                memory-mapped files. If None, never spill.
 
         Returns:
             A ChoiceListTab representing the specified sheet
@@ -238,10 +564,26 @@ class Choices(Worksheet):
             sheet = workbook.sheet_by_name(sheet_name)
         except xlrd.biffh.XLRDError:
             pass
-        return ChoiceListTab(sheet, workbook.datemode)
+        return ChoiceListTab(sheet, workbook.datemode, spill_rows)
+
+    def __getstate__(self):
+        """Get the state for pickling, without the open workbook."""
+        state = dict(self.__dict__)
+        state['workbook'] = None
+        return state
 
     def __repr__(self):
-        """Get a representation of this object."""
-        msg = (f'<Choices with {len(self.choices)} choice lists, '
-               f'{len(self.external_choices)} external choice lists>')
+        """Get a representation of this object.
+
+        Tabs that have not been parsed yet are not parsed for this.
+        """
+        counts = []
+        for sheet_name in (self.CHOICES, self.EXTERNAL_CHOICES):
+            if self.is_loaded(sheet_name):
+                count = str(len(self._tabs[sheet_name]))
+            else:
+                count = 'unloaded'
+            counts.append(count)
+        msg = (f'<Choices with {counts[0]} choice lists, '
+               f'{counts[1]} external choice lists>')
         return msg
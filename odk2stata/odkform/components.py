@@ -2,10 +2,20 @@
 
 Module attributes:
     Worksheet: A class to describe a generic worksheet
+    MappedColumn: A read-only column of values in a memory-mapped file
+    SheetTable: A class to store the rows of a worksheet by column
+    RowDict: A class to look up values in a single row by header
     XlsFormRow: A class to describe a row in the XlsForm
 """
+from array import array
+from collections.abc import Mapping
+import collections.abc
 import datetime
-from typing import Tuple
+import mmap
+import pickle
+import sys
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import xlrd
 
@@ -20,9 +30,12 @@ class Worksheet:
 
     Class attributes:
         DEFAULT_DATEMODE: the default date mode for xlrd.
+        DEFAULT_BLOCK_SIZE: the default number of rows to convert at
+            once when converting by column.
     """
 
     DEFAULT_DATEMODE=1
+    DEFAULT_BLOCK_SIZE = 4096
 
     @staticmethod
     def get_header(sheet: xlrd.sheet.Sheet,
@@ -57,35 +70,470 @@ class Worksheet:
             string and returned. Otherwise, a cell can be one of str,
             bool, int, or float.
         """
-        if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return Worksheet.convert_value(cell.ctype, cell.value, datemode)
+
+    @staticmethod
+    def convert_value(ctype: int, value, datemode: int):
+        """Get the value of a single cell from its type and raw value.
+
+        See `cell_to_value` for the return values.
+        """
+        if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
             return ''
-        elif cell.ctype == xlrd.XL_CELL_TEXT:
-            return cell.value.strip()
-        elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
-            return bool(cell.value)
-        elif cell.ctype == xlrd.XL_CELL_NUMBER:
-            int_value = int(cell.value)
-            if int_value == cell.value:
+        elif ctype == xlrd.XL_CELL_TEXT:
+            return value.strip()
+        elif ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(value)
+        elif ctype == xlrd.XL_CELL_NUMBER:
+            int_value = int(value)
+            if int_value == value:
                 return int_value
-            return cell.value
-        elif cell.ctype == xlrd.XL_CELL_DATE:
-            datetime_or_time_only = xlrd.xldate_as_tuple(cell.value, datemode)
+            return value
+        elif ctype == xlrd.XL_CELL_DATE:
+            datetime_or_time_only = xlrd.xldate_as_tuple(value, datemode)
             if datetime_or_time_only[:3] == (0, 0, 0):
                 return str(datetime.time(*datetime_or_time_only[3:]))
             return str(datetime.datetime(*datetime_or_time_only))
-        elif cell.ctype == xlrd.XL_CELL_ERROR:
-            return f'#ERROR({cell.value})'
+        elif ctype == xlrd.XL_CELL_ERROR:
+            return f'#ERROR({value})'
+        else:
+            return str(value)
+
+    @staticmethod
+    def convert_column(types: Sequence[int], values: Sequence,
+                       datemode: int = DEFAULT_DATEMODE) -> list:
+        """Convert a column of cells with the same result as cell_to_value.
+
+        Most XlsForm columns hold only text or only numbers, with some
+        empty cells. Those columns are converted with a specialized
+        loop. Other columns fall back to converting cell by cell.
+
+        Args:
+            types: The xlrd cell type of each cell in the column
+            values: The raw value of each cell in the column
+            datemode: The datemode for the workbook
+
+        Returns:
+            A list of converted values
+        """
+        kinds = set(types)
+        if kinds <= TEXT_OR_EMPTY_TYPES:
+            # Empty and blank cells have the value ''
+            if kinds <= EMPTY_TYPES:
+                return [''] * len(values)
+            return [value.strip() for value in values]
+        if kinds <= NUMBER_OR_EMPTY_TYPES:
+            return [
+                value if value == '' or value != int(value) else int(value)
+                for value in values
+            ]
+        convert_value = Worksheet.convert_value
+        return [convert_value(ctype, value, datemode)
+                for ctype, value in zip(types, values)]
+
+    @staticmethod
+    def get_column_blocks(sheet: xlrd.sheet.Sheet, ncols: int,
+                          datemode: int = DEFAULT_DATEMODE,
+                          start_rowx: int = 1,
+                          block_size: int = DEFAULT_BLOCK_SIZE) \
+            -> Iterator[Tuple[int, List[list]]]:
+        """Iterate over converted values in blocks of rows, by column.
+
+        Cell types and values are fetched a column at a time, with
+        xlrd `col_types` and `col_values` or with the streaming
+        equivalent, and each column is converted with
+        `convert_column`.
+
+        Args:
+            sheet: The sheet to read
+            ncols: How many columns to read, usually the header width
+            datemode: The datemode for the workbook
+            start_rowx: The first row to read. Default is to skip the
+                header.
+            block_size: The maximum number of rows in a block
+
+        Yields:
+            The first row number of the block and a list of converted
+            values for each column.
+        """
+        convert_column = Worksheet.convert_column
+        if hasattr(sheet, 'iter_column_blocks'):
+            blocks = sheet.iter_column_blocks(ncols, start_rowx, block_size)
+            for first_rowx, types, values in blocks:
+                columns = [convert_column(col_types, col_values, datemode)
+                           for col_types, col_values in zip(types, values)]
+                yield first_rowx, columns
+            return
+        nrows = sheet.nrows
+        width = min(ncols, sheet.ncols)
+        for first_rowx in range(start_rowx, nrows, block_size):
+            end_rowx = min(first_rowx + block_size, nrows)
+            columns = []
+            for colx in range(width):
+                col_types = sheet.col_types(colx, first_rowx, end_rowx)
+                col_values = sheet.col_values(colx, first_rowx, end_rowx)
+                columns.append(convert_column(col_types, col_values, datemode))
+            for _ in range(width, ncols):
+                columns.append([''] * (end_rowx - first_rowx))
+            yield first_rowx, columns
+
+
+EMPTY_TYPES = frozenset((xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK))
+TEXT_OR_EMPTY_TYPES = EMPTY_TYPES | {xlrd.XL_CELL_TEXT}
+NUMBER_OR_EMPTY_TYPES = EMPTY_TYPES | {xlrd.XL_CELL_NUMBER}
+
+
+class MappedColumn(collections.abc.Sequence):
+    """A read-only column of cell values stored in a memory-mapped file.
+
+    Very large sheets can be spilled to disk this way. Each value is
+    stored as bytes in an anonymous temporary file, and is decoded
+    again when it is looked up. Only the offsets and the kind of each
+    value are kept in memory.
+
+    When pickled, the values are pickled as a list, and they are
+    spilled again when unpickled.
+
+    Class attributes:
+        EMPTY, TEXT, INT, FLOAT, OTHER: The kinds of stored values
+        BUFFER_SIZE: How many bytes to collect before writing to file
+    """
+
+    EMPTY, TEXT, INT, FLOAT, OTHER = range(5)
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, values: Iterable):
+        """Initialize a MappedColumn by writing values to a file.
+
+        Args:
+            values: The cell values for the column
+        """
+        self._kinds = array('b')
+        self._offsets = array('q', [0])
+        self._file = tempfile.TemporaryFile()
+        buffer = bytearray()
+        end = 0
+        for value in values:
+            kind, data = self.encode(value)
+            self._kinds.append(kind)
+            buffer += data
+            end += len(data)
+            self._offsets.append(end)
+            if len(buffer) >= self.BUFFER_SIZE:
+                self._file.write(buffer)
+                buffer.clear()
+        self._file.write(buffer)
+        self._file.flush()
+        if end:
+            self._map = mmap.mmap(self._file.fileno(), end,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+
+    @classmethod
+    def encode(cls, value) -> Tuple[int, bytes]:
+        """Encode a cell value as a kind and bytes."""
+        value_type = type(value)
+        if value_type is str:
+            if not value:
+                return cls.EMPTY, b''
+            return cls.TEXT, value.encode('utf-8')
+        elif value_type is int:
+            return cls.INT, str(value).encode('ascii')
+        elif value_type is float:
+            return cls.FLOAT, repr(value).encode('ascii')
+        return cls.OTHER, pickle.dumps(value)
+
+    def __getitem__(self, item):
+        """Get a value, or a list of values for a slice."""
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        kind = self._kinds[item]
+        if kind == self.EMPTY:
+            return ''
+        if item < 0:
+            item += len(self._kinds)
+        data = self._map[self._offsets[item]:self._offsets[item + 1]]
+        if kind == self.TEXT:
+            return data.decode('utf-8')
+        elif kind == self.INT:
+            return int(data)
+        elif kind == self.FLOAT:
+            return float(data)
+        return pickle.loads(data)
+
+    def __len__(self):
+        """Return the number of values in this column."""
+        return len(self._kinds)
+
+    def __reduce__(self):
+        """Pickle the values, to be spilled again when unpickled."""
+        return self.__class__, (list(self),)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<MappedColumn {len(self)} values>'
+        return msg
+
+
+class SheetTable:
+    """A class to store the rows kept from a worksheet by column.
+
+    A table has one header-to-index map for the whole sheet and one
+    list of values per column. Rows are XlsFormRow views into the
+    table, so the header is not repeated for every row.
+
+    Labels are looked up often and by several do file sections, so the
+    column for a label setting is resolved once per table, and each
+    label is computed once per row and label settings.
+
+    For very large sheets, text values can be interned, so that values
+    repeated down a column are stored once. Interning can also be
+    limited to some columns. Once all rows are added, the
+    columns can also be spilled to memory-mapped files.
+
+    Class attributes:
+        FIRST_LABEL: The special label setting for the first column
+            whose header starts with "label"
+
+    Instance attributes:
+        header: The header row for the sheet
+        index: A lookup from header to column index. If a header is
+            repeated, then the last one is used, as with a dict.
+        columns: A list of values for each column in the header
+        rowxs: The 0-indexed sheet row for each row in the table
+        intern_strings: If true, text values are interned as they are
+            added
+        intern_colxs: The indexes of the columns whose text values are
+            interned, even if `intern_strings` is false
+    """
+
+    FIRST_LABEL = 'first_label'
+
+    def __init__(self, header: Sequence[str], intern_strings: bool = False,
+                 intern_columns: Sequence[str] = ()):
+        """Initialize an empty SheetTable.
+
+        Args:
+            header: The header row for the sheet
+            intern_strings: If true, intern text values as they are
+                added
+            intern_columns: The headers of the columns whose text values
+                are interned as they are added
+        """
+        self.header: Tuple[str] = tuple(header)
+        self.index = {key: i for i, key in enumerate(self.header)}
+        self.columns: List[Sequence] = [[] for _ in self.header]
+        self.intern_strings = intern_strings
+        self.intern_colxs = frozenset(self.index[i] for i in intern_columns
+                                      if i in self.index)
+        self.rowxs = array('l')
+        self._label_colxs: Dict[str, Optional[int]] = {}
+        self._labels: Dict[Tuple[int, str, str], str] = {}
+
+    def append(self, rowx: int, row_values: Sequence) -> int:
+        """Add a row to the table.
+
+        Values beyond the header are dropped. Missing values are set to
+        the empty string, the value of an empty cell.
+
+        Args:
+            rowx: The 0-indexed row in the sheet
+            row_values: The values of each cell in the row
+
+        Returns:
+            The position of the new row in this table
+        """
+        position = len(self.rowxs)
+        self.rowxs.append(rowx)
+        width = len(row_values)
+        for i, column in enumerate(self.columns):
+            value = row_values[i] if i < width else ''
+            interned = self.intern_strings or i in self.intern_colxs
+            if interned and isinstance(value, str):
+                value = sys.intern(value)
+            column.append(value)
+        return position
+
+    def extend(self, first_rowx: int, columns: Sequence[list],
+               keep: Sequence[int]) -> None:
+        """Add some rows of a block of columns to the table.
+
+        Args:
+            first_rowx: The 0-indexed sheet row of the start of the block
+            columns: A list of values for each column in the header
+            keep: Which rows of the block, 0-indexed, to add
+        """
+        self.rowxs.extend(first_rowx + k for k in keep)
+        intern = sys.intern
+        for colx, (column, block_column) in enumerate(zip(self.columns,
+                                                          columns)):
+            values = [block_column[k] for k in keep]
+            if self.intern_strings or colx in self.intern_colxs:
+                values = [intern(i) if isinstance(i, str) else i
+                          for i in values]
+            column.extend(values)
+
+    def spill(self) -> None:
+        """Move the values of every column to memory-mapped files.
+
+        After this, no more rows should be added to the table.
+        """
+        self.columns = [
+            i if isinstance(i, MappedColumn) else MappedColumn(i)
+            for i in self.columns
+        ]
+
+    def get_column(self, key: str) -> Sequence:
+        """Get the values in a column by header.
+
+        Raises:
+            KeyError: If the header is not found
+        """
+        return self.columns[self.index[key]]
+
+    def get_value(self, position: int, key: str, default=None):
+        """Get the value under a header in a row.
+
+        Args:
+            position: The position of the row in this table
+            key: The header
+            default: What to return if the header is not found
+
+        Returns:
+            The value found, or the default.
+        """
+        colx = self.index.get(key)
+        if colx is None:
+            return default
+        return self.columns[colx][position]
+
+    def get_row_values(self, position: int) -> list:
+        """Get the values of each cell in a row."""
+        return [column[position] for column in self.columns]
+
+    def get_label_colx(self, which_label: str) -> Optional[int]:
+        """Get the column index for a label setting.
+
+        The result is computed once per setting.
+
+        Args:
+            which_label: A column header, or the special value
+                "first_label" to indicate the first column that starts
+                with "label".
+
+        Returns:
+            The column index, or None if there is no such column.
+        """
+        try:
+            return self._label_colxs[which_label]
+        except KeyError:
+            pass
+        if which_label == self.FIRST_LABEL:
+            first_label = next((i for i in self.header
+                                if i.startswith('label')), None)
+            colx = self.index.get(first_label)
         else:
-            return str(cell.value)
+            colx = self.index.get(which_label)
+        self._label_colxs[which_label] = colx
+        return colx
+
+    def get_label(self, position: int, which_label: str,
+                  extra_label: str) -> str:
+        """Get the label for a row.
+
+        See XlsFormRow.get_label for details. Labels are memoized by
+        row position, which_label and extra_label.
+
+        Raises:
+            LabelNotFoundError: If no column is found in which to find
+                a label.
+        """
+        key = (position, which_label, extra_label)
+        try:
+            return self._labels[key]
+        except KeyError:
+            pass
+        result = None
+        extra_colx = self.get_label_colx(extra_label)
+        if extra_colx is not None:
+            result = self.columns[extra_colx][position]
+        if not result:
+            colx = self.get_label_colx(which_label)
+            if colx is None:
+                raise LabelNotFoundError()
+            result = self.columns[colx][position]
+        str_result = str(result)
+        self._labels[key] = str_result
+        return str_result
+
+    def __getstate__(self):
+        """Get the state for pickling, without memoized lookups."""
+        state = dict(self.__dict__)
+        state['_label_colxs'] = {}
+        state['_labels'] = {}
+        return state
+
+    def __len__(self):
+        """Return the number of rows in this table."""
+        return len(self.rowxs)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<SheetTable {len(self)} rows, {len(self.header)} columns>'
+        return msg
+
+
+class RowDict(Mapping):
+    """A read-only mapping view of a single row in a SheetTable.
+
+    This gives the same lookups as a dict of header to value for the
+    row, without building that dict.
+    """
+
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table: SheetTable, position: int):
+        """Initialize a RowDict.
+
+        Args:
+            table: The table that stores the row
+            position: The position of the row in the table
+        """
+        self.table = table
+        self.position = position
+
+    def __getitem__(self, key):
+        """Get the value under a header."""
+        return self.table.columns[self.table.index[key]][self.position]
+
+    def __contains__(self, key):
+        """Return if the header exists."""
+        return key in self.table.index
+
+    def __iter__(self) -> Iterator[str]:
+        """Return an iterator over the headers."""
+        return iter(self.table.index)
+
+    def __len__(self):
+        """Return the number of distinct headers."""
+        return len(self.table.index)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        return repr(dict(self))
 
 
 class XlsFormRow:
     """A class to represent a row in the survey or choices tab.
 
-    XlsFormRow is a base class for other ODK form building blocks. The
-    attributes here are meant to be read-only.
+    XlsFormRow is a base class for other ODK form building blocks. It
+    is a view into a row of a SheetTable. The attributes here are meant
+    to be read-only.
 
     Instance attributes:
+        table: The SheetTable that stores this row
+        position: The position of this row in the table
         rowx: The 0-indexed row in the sheet
         row_name: The value for the name column of this row
         row_header: The headers
@@ -93,22 +541,42 @@ class XlsFormRow:
         row_dict: An easy lookup to get the value under a header
     """
 
-    def __init__(self, rowx: int, row_name: str, row_header: Tuple[str],
-                 row_values: list, row_dict: dict):
+    __slots__ = ('table', 'position')
+
+    def __init__(self, table: SheetTable, position: int):
         """Initialize an XlsFormRow.
 
         Args:
-            rowx: The 0-indexed row in the sheet
-            row_name: The value for the name column of this row
-            row_header: The headers
-            row_values: The values of each cell in this row
-            row_dict: An easy lookup to get the value under a header
+            table: The SheetTable that stores this row
+            position: The position of this row in the table
         """
-        self.rowx = rowx
-        self.row_name = row_name
-        self.row_header = row_header
-        self.row_values = row_values
-        self.row_dict = row_dict
+        self.table = table
+        self.position = position
+
+    @property
+    def rowx(self) -> int:
+        """Get the 0-indexed row in the sheet."""
+        return self.table.rowxs[self.position]
+
+    @property
+    def row_name(self):
+        """Get the value for the name column of this row."""
+        return self.table.get_value(self.position, 'name')
+
+    @property
+    def row_header(self) -> Tuple[str]:
+        """Get the headers."""
+        return self.table.header
+
+    @property
+    def row_values(self) -> list:
+        """Get the values of each cell in this row."""
+        return self.table.get_row_values(self.position)
+
+    @property
+    def row_dict(self) -> RowDict:
+        """Get an easy lookup to get the value under a header."""
+        return RowDict(self.table, self.position)
 
     def get_label(self, which_label: str, extra_label: str) -> str:
         """Get the label for this row.
@@ -129,23 +597,7 @@ class XlsFormRow:
             LabelNotFoundError: If no column is found in which to find
                 a label.
         """
-        result = self.row_dict.get(extra_label)
-        if result:
-            # We will use this label
-            pass
-        elif which_label == 'first_label':
-            header = self.row_header
-            first_label = next((i for i in header if i.startswith('label')),
-                               None)
-            if first_label is None:
-                raise LabelNotFoundError()
-            result = self.row_dict[first_label]
-        elif which_label in self.row_dict:
-            result = self.row_dict[which_label]
-        else:
-            raise LabelNotFoundError()
-        str_result = str(result)
-        return str_result
+        return self.table.get_label(self.position, which_label, extra_label)
 
     def __hash__(self):
         """Make a hash based on row number and row name."""
@@ -0,0 +1,61 @@
+"""A module for diagnostics, the problems found in a form or settings.
+
+Normally, the first problem found raises an exception. In lint mode,
+problems are collected as diagnostics instead, so that all of them can
+be reported at once.
+
+Module attributes:
+    ERROR: The severity of a problem that stops a do file from being
+        generated, or that makes it fail in Stata
+    WARNING: The severity of a problem that may give unexpected results
+    Diagnostic: A namedtuple to describe a single problem
+    format_diagnostic: Format a diagnostic as a line of text
+"""
+from collections import namedtuple
+
+
+ERROR = 'error'
+WARNING = 'warning'
+
+Diagnostic = namedtuple(
+    'Diagnostic',
+    ('severity', 'code', 'message', 'sheet', 'row', 'name', 'path'),
+    defaults=(None, None, None, None)
+)
+Diagnostic.__doc__ = """A single problem found in a form or settings.
+
+Fields:
+    severity: ERROR or WARNING
+    code: A short, stable identifier for the kind of problem, e.g.
+        "missing-choice-list"
+    message: A description of the problem
+    sheet: The sheet, choice file or settings section with the problem,
+        or None
+    row: The 1-indexed row in the sheet, or None
+    name: The name of the survey row, choice, or setting, or None
+    path: The file with the problem, if it is not the form, e.g. the
+        settings file. None for the form.
+"""
+
+
+def format_diagnostic(diagnostic: Diagnostic, filename: str = None) -> str:
+    """Format a diagnostic as a line of text.
+
+    The format is "filename:sheet:row: severity: message [code]", with
+    missing parts left out, as is common for compilers and linters.
+
+    Args:
+        diagnostic: The diagnostic to format
+        filename: The file name of the form, or None. This is used
+            unless the diagnostic has its own path.
+
+    Returns:
+        The formatted diagnostic
+    """
+    if diagnostic.path is not None:
+        filename = diagnostic.path
+    location = [str(i) for i in (filename, diagnostic.sheet, diagnostic.row)
+                if i is not None]
+    prefix = ':'.join(location) + ': ' if location else ''
+    return (f'{prefix}{diagnostic.severity}: {diagnostic.message} '
+            f'[{diagnostic.code}]')
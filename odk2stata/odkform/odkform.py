@@ -1,74 +1,206 @@
 """Module defining OdkForm."""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+from typing import Dict, List, Union
+
 import xlrd
 
-from .choices import Choices
+from .choices import Choices, ChoiceListTab
+from .diagnostic import Diagnostic, ERROR
 from .settings import Settings
-from .survey import Survey
-from ..error import OdkFormError
+from .source import FormSource, as_buffer, is_path, normalize_path
+from .survey import Survey, SurveyRow
+from .workbook import open_workbook
+from .xform import XFormWorkbook, XFORM_EXTENSION
+from ..error import ChoiceListNotFoundError, OdkFormError
 
 
 class OdkForm:
     """Define the OdkForm class.
 
+    Lookup indexes over the survey are built once, after parsing. Use
+    them, or the `get_...` methods based on them, instead of scanning
+    the survey rows.
+
     Instance attributes:
-        path: The path to where the XlsForm is stored
+        path: The path to where the XlsForm is stored, or None if the
+            form was read from memory
+        filename: The logical file name of the form. By default, this
+            is the path.
         survey: The survey component
         choices: The choices component
         settings: The settings component
+        rows_by_name: A dictionary of row name to the survey rows with
+            that name, in order
+        rows_by_list_name: A dictionary of choice list name to the
+            select survey rows that use that list, in order
+        repeat_descendants: A dictionary of each "begin repeat" survey
+            row to the survey rows nested under it at any depth, in
+            order
+        problems: The problems found while building a lenient OdkForm,
+            as Diagnostic objects. Always empty otherwise.
     """
 
-    def __init__(self, path: str):
+    def __init__(self, source: FormSource, spill_rows: int = None,
+                 parallel: bool = False, workbook=None, filename: str = None,
+                 lenient: bool = False):
         """Initialize an OdkForm.
 
         The survey, choices, and settings are initialized separately.
         Lastly, the survey rows are associated with their choice lists.
 
         Args:
-            path: The path to where the XlsForm is stored
+            source: The path to where the XlsForm is stored, or the
+                form in memory as bytes, a bytearray, a memoryview, an
+                mmap, or a binary file-like object. A form in memory is
+                not copied if it can be avoided, see the source module.
+            spill_rows: The number of rows at which a choice tab is
+                spilled to memory-mapped files. If None, never spill.
+            parallel: If true, parse the sheets at the same time. See
+                `_parse_in_parallel`. This is ignored with only one CPU,
+                for an XForm, for a form in memory, or if a workbook is
+                given.
+            workbook: The already opened workbook for the form. If None,
+                the workbook is opened from the source with
+                `open_workbook`.
+            filename: The logical file name of the form, used for the
+                default form title and in do file metadata. If None,
+                this is the path. For a form in memory, its extension
+                also tells how to read the form.
+            lenient: If true, collect unbalanced groups and repeats,
+                and choice lists not found in the choices sheet, in
+                `problems` instead of raising an exception. Rows with
+                a missing choice list have None for their choice list.
+        """
+        self.path = None
+        if is_path(source):
+            source = normalize_path(source)
+            self.path = source
+        self.filename = filename if filename is not None else self.path
+        # An XForm is read all at once, so it is never read in parallel
+        if parallel and workbook is None and (os.cpu_count() or 1) > 1 \
+                and self.path is not None \
+                and not self.path.lower().endswith(XFORM_EXTENSION):
+            self._parse_in_parallel(spill_rows, lenient)
+        else:
+            if workbook is None:
+                workbook = open_workbook(source, filename)
+            self.survey = self.parse_survey(workbook, lenient)
+            self.choices = self._parse_choices(self.path, workbook,
+                                               spill_rows)
+            self.settings = self.parse_settings(self.path, workbook,
+                                                self.filename)
+        self.problems: List[Diagnostic] = list(self.survey.problems)
+        self._associate_choice_lists(lenient)
+        self.rows_by_name: Dict[str, List[SurveyRow]] = {}
+        self.rows_by_list_name: Dict[str, List[SurveyRow]] = {}
+        self.repeat_descendants: Dict[SurveyRow, List[SurveyRow]] = {}
+        self._build_indexes()
+
+    @classmethod
+    def from_xform(cls, source: FormSource, **kwargs) -> 'OdkForm':
+        """Build an OdkForm from a compiled XForm instead of an XlsForm.
+
+        The XForm is read in a single streaming pass. Its survey,
+        choices and settings are rebuilt as in an XlsForm, so the
+        result works with DatasetCollection and DoFileCollection.
+
+        Args:
+            source: The path to the XForm XML file, or the XForm in
+                memory
+            **kwargs: Other keyword arguments for OdkForm
+
+        Returns:
+            The OdkForm for the XForm
+
+        Raises:
+            OdkFormError: If the XForm cannot be read
         """
-        self.path = path
-        workbook = xlrd.open_workbook(self.path)
-        self.survey = self._parse_survey(workbook)
-        self.choices = self._parse_choices(workbook)
-        self.settings = self._parse_settings(self.path, workbook)
-        self._associate_choice_lists()
+        if not is_path(source):
+            source = as_buffer(source)
+        try:
+            workbook = XFormWorkbook(source)
+        except xlrd.XLRDError as err:
+            raise OdkFormError(str(err)) from err
+        return cls(source, workbook=workbook, **kwargs)
+
+    def _parse_in_parallel(self, spill_rows: int = None,
+                           lenient: bool = False) -> None:
+        """Parse the survey, choices and settings at the same time.
+
+        The survey, choices and external_choices sheets are converted
+        in separate processes, since that work is CPU-bound. The small
+        settings sheet is read in a thread meanwhile. Unlike a
+        sequential parse, the external_choices sheet is always parsed.
+
+        This pays off for forms with large choice sheets. For small
+        forms, starting the processes costs more than it saves.
+
+        Args:
+            spill_rows: The number of rows at which a choice tab is
+                spilled to memory-mapped files. If None, never spill.
+            lenient: If true, parse the survey in lenient mode
+        """
+        sheet_names = (Choices.CHOICES, Choices.EXTERNAL_CHOICES)
+        with ProcessPoolExecutor(max_workers=3) as processes, \
+                ThreadPoolExecutor(max_workers=1) as threads:
+            survey = processes.submit(_parse_survey_file, self.path,
+                                      lenient)
+            tabs = [
+                processes.submit(_parse_choice_tab_file, self.path, name)
+                for name in sheet_names
+            ]
+            settings = threads.submit(_parse_settings_file, self.path,
+                                      self.filename)
+            self.choices = Choices(None, self.path, spill_rows)
+            for sheet_name, tab in zip(sheet_names, tabs):
+                self.choices.add_tab(sheet_name, tab.result())
+            self.survey = survey.result()
+            self.settings = settings.result()
 
     @staticmethod
-    def _parse_survey(workbook: xlrd.Book) -> Survey:
+    def parse_survey(workbook: xlrd.Book, lenient: bool = False) -> Survey:
         """Parse the survey for the ODK form.
 
         Args:
             workbook: The xlrd book object
+            lenient: If true, parse the survey in lenient mode
 
         Returns:
             A Survey object
         """
         try:
             sheet = workbook.sheet_by_name('survey')
-            return Survey(sheet, workbook.datemode)
+            return Survey(sheet, workbook.datemode, lenient)
         except xlrd.biffh.XLRDError:
             msg = 'XlsForm file does not have required "survey" tab!'
             raise OdkFormError(msg)
 
     @staticmethod
-    def _parse_choices(workbook: xlrd.Book) -> Choices:
+    def _parse_choices(path: str, workbook: xlrd.Book,
+                       spill_rows: int = None) -> Choices:
         """Parse the choices for the ODK form.
 
         Args:
+            path: The path to where the XlsForm is stored
             workbook: The xlrd book object
+            spill_rows: The number of rows at which a choice tab is
+                spilled to memory-mapped files
 
         Returns:
             A Choices object
         """
-        return Choices(workbook)
+        return Choices(workbook, path, spill_rows)
 
     @staticmethod
-    def _parse_settings(path: str, workbook: xlrd.Book) -> Settings:
+    def parse_settings(path: str, workbook: xlrd.Book,
+                       filename: str = None) -> Settings:
         """Parse the settings for the ODK form.
 
         Args:
             path: The path to where the XlsForm is stored
             workbook: The xlrd book object
+            filename: The logical file name of the form
 
         Returns:
             A Settings object
@@ -78,21 +210,122 @@ class OdkForm:
             sheet = workbook.sheet_by_name('settings')
         except xlrd.biffh.XLRDError:
             pass
-        return Settings(path, sheet, workbook.datemode)
+        return Settings(path, sheet, workbook.datemode, filename)
+
+    def _associate_choice_lists(self, lenient: bool = False) -> None:
+        """Associate survey rows with their choice lists.
+
+        Rows using the choices tab are associated right away, which
+        parses that tab. Rows using external choices or a choice file
+        are deferred, so the (possibly very large) external_choices tab
+        or file is only read when one of its lists is actually needed.
 
-    def _associate_choice_lists(self) -> None:
-        """Associate survey rows with their choice lists."""
+        Args:
+            lenient: If true, add a problem for each choice list that is
+                not found, instead of raising an exception
+
+        Raises:
+            ChoiceListNotFoundError: If a choice list is not found, and
+                not in lenient mode
+        """
         for row in self.survey:
-            if row.is_select_type():
-                list_name = row.get_select_list_name()
-                # Future: how we get the list may change
-                if row.is_select_external():
-                    choice_list = self.choices.external_choices[list_name]
-                else:
-                    choice_list = self.choices.choices[list_name]
-                row.choice_list = choice_list
+            if row.row_type.is_select:
+                list_name = row.row_type.list_name
+                if row.row_type.is_external or row.row_type.is_from_file:
+                    row.defer_choice_list(self.choices)
+                    continue
+                try:
+                    row.choice_list = self.choices.get_choice_list(list_name)
+                except ChoiceListNotFoundError as err:
+                    if not lenient:
+                        raise
+                    problem = Diagnostic(ERROR, 'missing-choice-list',
+                                         str(err), 'survey', row.rowx + 1,
+                                         row.row_name)
+                    self.problems.append(problem)
+
+    def _build_indexes(self) -> None:
+        """Build the lookup indexes over the survey rows."""
+        for row in self.survey:
+            self.rows_by_name.setdefault(row.row_name, []).append(row)
+            list_name = row.row_type.list_name
+            if list_name is not None:
+                self.rows_by_list_name.setdefault(list_name, []).append(row)
+            if row.row_type.is_begin_repeat:
+                self.repeat_descendants[row] = []
+            for ancestor in row.ancestors:
+                if ancestor.row_type.is_begin_repeat:
+                    self.repeat_descendants[ancestor].append(row)
+
+    def get_row(self, name: str) -> SurveyRow:
+        """Get a survey row by name.
+
+        Args:
+            name: The name of the survey row
+
+        Returns:
+            The first survey row with that name
+
+        Raises:
+            KeyError: If no survey row has that name
+        """
+        try:
+            return self.rows_by_name[name][0]
+        except KeyError:
+            msg = f'No survey row named "{name}"'
+            raise KeyError(msg) from None
+
+    def get_rows_using_list(self, list_name: str) -> List[SurveyRow]:
+        """Get the select survey rows that use a choice list.
+
+        Args:
+            list_name: The name of the choice list
+
+        Returns:
+            The survey rows, in order. This is empty if no row uses
+            the list.
+        """
+        return self.rows_by_list_name.get(list_name, [])
+
+    def get_repeat_descendants(self, repeat: Union[SurveyRow, str]) \
+            -> List[SurveyRow]:
+        """Get the survey rows nested under a repeat, at any depth.
+
+        Args:
+            repeat: The "begin repeat" survey row, or its name
+
+        Returns:
+            The survey rows, in order, including rows in nested groups
+            and repeats
+
+        Raises:
+            KeyError: If the argument is not a repeat in this form
+        """
+        if isinstance(repeat, str):
+            repeat = self.get_row(repeat)
+        try:
+            return self.repeat_descendants[repeat]
+        except KeyError:
+            msg = f'{repeat!r} is not a repeat in this form'
+            raise KeyError(msg) from None
 
     def __repr__(self):
         """Get a representation of this object."""
-        msg = f'OdkForm("{self.path}")'
+        name = self.filename if self.filename is not None else '<memory>'
+        msg = f'OdkForm("{name}")'
         return msg
+
+
+def _parse_survey_file(path: str, lenient: bool = False) -> Survey:
+    """Parse the survey of an XlsForm, for use in another process."""
+    return OdkForm.parse_survey(open_workbook(path), lenient)
+
+
+def _parse_choice_tab_file(path: str, sheet_name: str) -> ChoiceListTab:
+    """Parse a choice sheet of an XlsForm, for use in another process."""
+    return Choices.parse_choices_from_sheet(open_workbook(path), sheet_name)
+
+
+def _parse_settings_file(path: str, filename: str = None) -> Settings:
+    """Parse the settings of an XlsForm, for use in another thread."""
+    return OdkForm.parse_settings(path, open_workbook(path), filename)
@@ -0,0 +1,146 @@
+"""Module to classify the type of a survey row.
+
+The type column of a survey row is parsed once, when the row is read,
+into a RowType. Other subsystems then check attributes of the RowType
+instead of re-parsing the type string.
+
+To support a new type, add it to the appropriate collection below.
+
+Module attributes:
+    SELECT_TYPES: Select base types mapped to (is select one, is
+        select multiple, is external)
+    FROM_FILE_TYPES: Select base types whose list name is the file name
+        of a choice file
+    GPS_TYPES: Types that become four GPS columns in the dataset
+    NUMERIC_TYPES: Types that are numeric in the dataset
+    NON_COLUMN_TYPES: Types that do not become a column in the dataset
+    RowType: A class to describe the type of a survey row
+    parse_row_type: Parse a survey row type string into a RowType
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+SELECT_TYPES = {
+    'select_one': (True, False, False),
+    'select_one_external': (True, False, True),
+    'select_multiple': (False, True, False),
+    'select_multiple_external': (False, True, True),
+    'select_one_from_file': (True, False, False),
+    'select_multiple_from_file': (False, True, False),
+}
+
+FROM_FILE_TYPES = frozenset((
+    'select_one_from_file',
+    'select_multiple_from_file',
+))
+
+GPS_TYPES = frozenset((
+    'hidden geopoint',
+    'geopoint',
+))
+
+NUMERIC_TYPES = frozenset((
+    'hidden decimal',
+    'decimal',
+    'hidden integer',
+    'integer',
+    'int',
+    'range',
+))
+
+# Note: "begin repeat" does become a column
+NON_COLUMN_TYPES = frozenset((
+    'begin group',
+    'end group',
+    'end repeat',
+))
+
+
+@dataclass(frozen=True)
+class RowType:
+    """The parsed type of a survey row.
+
+    Instances are shared between all rows with the same type string.
+
+    Instance attributes:
+        type_string: The type string, as in the survey
+        base_type: The type without its list name, e.g. "select_one"
+        list_name: The name of the choice list of a select, else None
+        is_select: True if the type starts with "select"
+        is_select_one: True for a select_one
+        is_select_multiple: True for a select_multiple
+        is_external: True for a select from the external_choices tab
+        is_from_file: True for a select from a CSV or XML file
+        is_gps: True for a geopoint, which becomes four columns
+        is_numeric: True for a type whose data are numbers
+        is_begin_repeat: True for a "begin repeat"
+        is_end_repeat: True for an "end repeat"
+        becomes_column: True if the row becomes a column of a dataset
+    """
+
+    type_string: str
+    base_type: str
+    list_name: Optional[str]
+    is_select: bool
+    is_select_one: bool
+    is_select_multiple: bool
+    is_external: bool
+    is_from_file: bool
+    is_gps: bool
+    is_numeric: bool
+    is_begin_repeat: bool
+    is_end_repeat: bool
+    becomes_column: bool
+
+    @property
+    def becomes_single_column(self) -> bool:
+        """Return if this type becomes a single column."""
+        return self.becomes_column and not self.is_gps
+
+
+@lru_cache(maxsize=None)
+def parse_row_type(type_string: str) -> RowType:
+    """Parse a survey row type string into a RowType.
+
+    For select types, the base type is the first word and the list name
+    is the last word, e.g. "select_one yes_no". For types that select
+    from a file, the list name is the file name, e.g.
+    "select_one_from_file villages.csv". For all other types, the base
+    type is the whole type string.
+
+    Args:
+        type_string: The value in the type column of the survey
+
+    Returns:
+        The RowType for the string
+    """
+    base_type = type_string
+    list_name = None
+    is_select = type_string.startswith('select')
+    if is_select:
+        words = type_string.split()
+        base_type = words[0]
+        if len(words) > 1:
+            list_name = words[-1]
+    is_select_one, is_select_multiple, is_external = SELECT_TYPES.get(
+        base_type, (False, False, False)
+    )
+    if list_name is None:
+        is_select_one = is_select_multiple = is_external = False
+    return RowType(
+        type_string=type_string,
+        base_type=base_type,
+        list_name=list_name,
+        is_select=is_select,
+        is_select_one=is_select_one,
+        is_select_multiple=is_select_multiple,
+        is_external=is_external,
+        is_from_file=list_name is not None and base_type in FROM_FILE_TYPES,
+        is_gps=type_string in GPS_TYPES,
+        is_numeric=type_string in NUMERIC_TYPES,
+        is_begin_repeat=type_string == 'begin repeat',
+        is_end_repeat=type_string == 'end repeat',
+        becomes_column=type_string not in NON_COLUMN_TYPES,
+    )
@@ -1,5 +1,6 @@
 """A module to define the Settings class."""
 import os.path
+from typing import Optional
 
 import xlrd.sheet
 
@@ -9,24 +10,38 @@ from .components import Worksheet
 class Settings(Worksheet):
     """A class to represent the settings of an XlsForm.
 
+    Class attributes:
+        DEFAULT_FORM_TITLE: The form title if it is not in settings and
+            there is no file name
+
     Instance attributes:
-        path: The path to where the XlsForm is stored
+        path: The path to where the XlsForm is stored, or None if the
+            form was read from memory
+        filename: The logical file name of the form, or None to use
+            the path
         settings: A dictionary of settings properties and values
     """
 
-    def __init__(self, path: str, sheet: xlrd.sheet.Sheet,
-                 datemode: int = Worksheet.DEFAULT_DATEMODE):
+    DEFAULT_FORM_TITLE = 'form'
+
+    def __init__(self, path: Optional[str], sheet: xlrd.sheet.Sheet,
+                 datemode: int = Worksheet.DEFAULT_DATEMODE,
+                 filename: str = None):
         """Initialize the Settings object.
 
         If settings does not define form_title or form_id, they are
-        computed using the path to the XlsForm file.
+        computed using the file name, or else the path, of the XlsForm.
 
         Args:
-            path: The path to where the XlsForm is stored
+            path: The path to where the XlsForm is stored, or None if
+                the form was read from memory
             sheet: The xlrd sheet that stores the settings
             datemode: The datemode for the workbook
+            filename: The logical file name of the form. If None, the
+                path is used.
         """
         self.path = path
+        self.filename = filename
         self.settings = {}
         if sheet is not None:
             self._parse_settings(sheet, datemode)
@@ -38,7 +53,10 @@ class Settings(Worksheet):
         """Get the settings form_title."""
         form_title = self.settings.get('form_title')
         if not form_title:
-            _, full_filename = os.path.split(self.path)
+            path = self.filename if self.filename is not None else self.path
+            if path is None:
+                return self.DEFAULT_FORM_TITLE
+            _, full_filename = os.path.split(path)
             filename, _ = os.path.splitext(full_filename)
             form_title = filename
         return form_title
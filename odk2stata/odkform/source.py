@@ -0,0 +1,157 @@
+"""A module to handle the sources that a form is read from.
+
+A form is usually read from a path. It can also be read from memory,
+e.g. from an upload that was never saved to disk: bytes, a bytearray,
+a memoryview, an mmap, or a binary file-like object. These are read
+without copying the whole form:
+
+- bytes-like objects and mmaps are used as they are, through
+  MemoryFile, a seekable file over the buffer.
+- A file-like object backed by a real file is memory-mapped.
+- A BytesIO is used through its buffer.
+- Any other file-like object is read once into bytes.
+
+A form read from memory has no file name, so its logical file name can
+be given separately. It is used for the default form title and in do
+file metadata.
+
+Module attributes:
+    FormSource: The type of a source for a form
+    MemoryFile: A read-only, seekable binary file over a buffer
+    is_path: Check if a source is a path
+    normalize_path: Normalize the path to a form
+    as_buffer: Get a buffer for a source that is not a path
+    sniff_extension: Guess the file extension of a form in a buffer
+"""
+import io
+import mmap
+import os
+from typing import BinaryIO, Union
+
+
+FormSource = Union[str, os.PathLike, bytes, bytearray, memoryview,
+                   mmap.mmap, BinaryIO]
+
+
+class MemoryFile(io.RawIOBase):
+    """A read-only, seekable binary file over a buffer.
+
+    The buffer is not copied. Reads copy only the requested bytes.
+
+    Instance attributes:
+        view: A memoryview of the buffer, in bytes
+    """
+
+    def __init__(self, buffer):
+        """Initialize a MemoryFile.
+
+        Args:
+            buffer: Any object with the buffer protocol, e.g. bytes or
+                an mmap
+        """
+        super().__init__()
+        self.view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        """Return that this file is readable."""
+        return True
+
+    def seekable(self) -> bool:
+        """Return that this file is seekable."""
+        return True
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into a buffer, and return how many were read."""
+        start = self._position
+        end = min(start + len(buffer), len(self.view))
+        size = max(end - start, 0)
+        buffer[:size] = self.view[start:start + size]
+        self._position += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Change the position, and return the new position."""
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        if offset < 0:
+            raise OSError(f'Negative seek position {offset}')
+        self._position = offset
+        return offset
+
+    def tell(self) -> int:
+        """Return the current position."""
+        return self._position
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<MemoryFile of {len(self.view)} bytes>'
+        return msg
+
+
+def is_path(source: FormSource) -> bool:
+    """Check if a source is a path, rather than a form in memory."""
+    return isinstance(source, (str, os.PathLike))
+
+
+def normalize_path(path: Union[str, os.PathLike]) -> str:
+    """Normalize the path to a form.
+
+    A trailing separator, as shell completion adds to a directory of
+    CSV files, is removed, so that the base name of the path is the
+    name of the form.
+
+    Args:
+        path: The path to the form
+
+    Returns:
+        The normalized path, as a str
+    """
+    return os.path.normpath(os.fspath(path))
+
+
+def as_buffer(source: FormSource):
+    """Get a buffer for a source that is not a path.
+
+    Args:
+        source: bytes, bytearray, memoryview, mmap, or a binary file-like
+            object
+
+    Returns:
+        An object with the buffer protocol. It is the source itself, a
+        memory map or buffer of the file-like object, or as a last
+        resort, the bytes read from the file-like object.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return source
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer()
+    try:
+        return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # Not a real file, or an empty one, which cannot be mapped
+        pass
+    return source.read()
+
+
+def sniff_extension(buffer) -> str:
+    """Guess the file extension of a form in a buffer from its content.
+
+    Args:
+        buffer: The buffer with the form
+
+    Returns:
+        ".xlsx" for a zip archive, ".json" for text that starts with
+        "{", ".xml" for text that starts with "<", otherwise ".xls".
+    """
+    head = bytes(memoryview(buffer)[:512])
+    if head.startswith(b'PK\x03\x04'):
+        return '.xlsx'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if text.startswith(b'{'):
+        return '.json'
+    if text.startswith(b'<'):
+        return '.xml'
+    return '.xls'
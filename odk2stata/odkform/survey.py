@@ -1,19 +1,107 @@
 """Module defining survey building blocks.
 
 Module attributes:
+    AncestorPath: The names of the groups and repeats a row is nested
+        under
     SurveyRow: Subclassing XlsFormRow, this represents a row in survey
     Survey: The class to define the XlsForm survey
 """
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import xlrd.sheet
 
-from .choices import ChoiceList
+from .choices import ChoiceList, Choices
+from .components import SheetTable
 from .components import XlsFormRow
 from .components import Worksheet
+from .diagnostic import Diagnostic, ERROR
+from .row_type import RowType, parse_row_type
 from ..error import MismatchedGroupOrRepeatError
 
 
+class AncestorPath:
+    """The names of the groups and repeats a survey row is nested under.
+
+    Rows nested under the same groups share one AncestorPath, like they
+    share the ancestors tuple. A path is built once, while parsing, by
+    extending the path of the enclosing "begin ..." row, so no row has
+    to walk its ancestors.
+
+    Instance attributes:
+        names: The tuple of ancestor names, outermost first
+        repeat_start: The index in `names` after the innermost repeat,
+            where the names inside that repeat start. It is 0 if the
+            row is not in a repeat.
+        prefixes: A memo of column name prefixes built from this path,
+            see `get_prefix`
+    """
+
+    __slots__ = ('names', 'repeat_start', 'prefixes')
+
+    def __init__(self, names: Tuple[str, ...] = (), repeat_start: int = 0):
+        """Initialize an AncestorPath.
+
+        Args:
+            names: The tuple of ancestor names, outermost first
+            repeat_start: The index in `names` after the innermost
+                repeat
+        """
+        self.names = names
+        self.repeat_start = repeat_start
+        self.prefixes: Dict[tuple, str] = {}
+
+    def child(self, name: str, is_repeat: bool) -> 'AncestorPath':
+        """Get the path for rows nested under a group or repeat.
+
+        Args:
+            name: The name of the group or repeat, nested under this path
+            is_repeat: If true, it is a repeat
+
+        Returns:
+            The new path
+        """
+        names = (*self.names, name)
+        repeat_start = len(names) if is_repeat else self.repeat_start
+        return AncestorPath(names, repeat_start)
+
+    def get_prefix(self, start: int, separator: Optional[str]) -> str:
+        """Get the prefix of a column name from these ancestors.
+
+        The prefix is memoized, and the path is shared by all rows
+        nested under the same groups. So each prefix is joined once per
+        path, start and separator, not once per row.
+
+        Args:
+            start: The index of the first ancestor name to use, e.g. the
+                start of the names inside a repeat
+            separator: What follows each ancestor name, or None if
+                column names have no ancestor names
+
+        Returns:
+            The prefix, such that the column name is the prefix followed
+            by the row name
+        """
+        key = (start, separator)
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            if separator is None:
+                prefix = ''
+            else:
+                prefix = ''.join(f'{name}{separator}'
+                                 for name in self.names[start:])
+            self.prefixes[key] = prefix
+        return prefix
+
+    def __len__(self):
+        """Return the number of ancestors."""
+        return len(self.names)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'AncestorPath({self.names!r}, {self.repeat_start})'
+        return msg
+
+
 class SurveyRow(XlsFormRow):
     """A class to represent a row in the survey tab of an XlsForm.
 
@@ -21,118 +109,128 @@ class SurveyRow(XlsFormRow):
     documented there.
 
     This class has many convenience functions used in other subsystems
-    for determining different qualities of the SurveyRow instance.
+    for determining different qualities of the SurveyRow instance. They
+    are answered from `row_type`, which is parsed once.
 
     Instance attributes:
-        ancestors: The list of SurveyRow objects for the groups and
-            repeats this row is nested under
+        row_type: The RowType parsed from the type column
+        ancestors: The tuple of SurveyRow objects for the groups and
+            repeats this row is nested under. Rows nested under the
+            same groups share the same tuple.
+        ancestor_path: The AncestorPath with the names of the ancestors.
+            It is shared in the same way.
         choice_list: The choice_list if this is a choice type question.
-            This attribute is set after initialization by OdkForm.
+            This attribute is set after initialization by OdkForm,
+            either directly or deferred until first access.
     """
 
-    def __init__(self, rowx: int, row_name: str, row_header: Tuple[str],
-                 row_values: list, row_dict: dict,
-                 ancestors: list):
+    __slots__ = ('row_type', 'ancestors', 'ancestor_path', '_choice_list',
+                 '_deferred_choices')
+
+    def __init__(self, table: SheetTable, position: int,
+                 ancestors: Tuple['SurveyRow', ...], row_type: RowType,
+                 ancestor_path: AncestorPath = None):
         """Initialize a SurveyRow.
 
         Args:
-            rowx: The 0-indexed row in the sheet
-            row_name: The value for the name column of this row
-            row_header: The headers
-            row_values: The values of each cell in this row
-            row_dict: An easy lookup to get the value under a header
-            ancestors: The list of SurveyRow objects for the groups and
-                repeats this row is nested under
+            table: The SheetTable that stores this row
+            position: The position of this row in the table
+            ancestors: The tuple of SurveyRow objects for the groups
+                and repeats this row is nested under
+            row_type: The RowType parsed from the type column
+            ancestor_path: The AncestorPath for the ancestors. If None,
+                it is built from the ancestors.
+        """
+        super().__init__(table, position)
+        self.row_type = row_type
+        self.ancestors = ancestors
+        if ancestor_path is None:
+            ancestor_path = AncestorPath()
+            for ancestor in ancestors:
+                ancestor_path = ancestor_path.child(
+                    ancestor.row_name, ancestor.row_type.is_begin_repeat
+                )
+        self.ancestor_path = ancestor_path
+        self._choice_list: Optional[ChoiceList] = None
+        self._deferred_choices: Optional[Choices] = None
+
+    @property
+    def choice_list(self) -> Optional[ChoiceList]:
+        """Get the choice list if this is a choice type question.
+
+        If the choice list was deferred, it is looked up the first time
+        it is needed. That may parse its choices sheet.
+        """
+        if self._choice_list is None and self._deferred_choices is not None:
+            self._choice_list = self._deferred_choices.get_choice_list(
+                self.row_type.list_name, self.row_type.is_external,
+                self.row_type.is_from_file
+            )
+            self._deferred_choices = None
+        return self._choice_list
+
+    @choice_list.setter
+    def choice_list(self, choice_list: ChoiceList) -> None:
+        """Set the choice list for this row."""
+        self._choice_list = choice_list
+        self._deferred_choices = None
+
+    def defer_choice_list(self, choices: Choices) -> None:
+        """Look up the choice list in `choices` only when needed.
+
+        Args:
+            choices: The Choices object that has this row's list
         """
-        super().__init__(rowx, row_name, row_header, row_values, row_dict)
-        self.ancestors = list(ancestors)
-        self.choice_list: Optional[ChoiceList] = None
+        self._choice_list = None
+        self._deferred_choices = choices
 
     def get_type(self) -> str:
         """Return the survey row type."""
-        return self.row_dict['type']
+        return self.row_type.type_string
 
     def is_select_type(self) -> bool:
         """Return is this survey row is a select type with choices."""
-        row_type = self.get_type()
-        return row_type.startswith('select')
+        return self.row_type.is_select
 
     def is_select_one(self) -> bool:
         """Return is this a (external) select one type."""
-        select_one_starts = (
-            'select_one ',
-            'select_one_external ',
-        )
-        row_type = self.get_type()
-        return any(row_type.startswith(item) for item in select_one_starts)
+        return self.row_type.is_select_one
 
     def is_select_multiple(self) -> bool:
         """Return is this a (external) select multiple type."""
-        select_multiple_starts = (
-            'select_multiple ',
-            'select_multiple_external ',
-        )
-        row_type = self.get_type()
-        return any(row_type.startswith(item) for item in select_multiple_starts)
+        return self.row_type.is_select_multiple
 
     def is_select_external(self) -> bool:
         """Return is this a select external (single or multiple) type."""
-        external_starts = (
-            'select_one_external ',
-            'select_multiple_external ',
-        )
-        row_type = self.get_type()
-        return any(row_type.startswith(item) for item in external_starts)
+        return self.row_type.is_external
 
     def get_select_list_name(self):
         """Get the list name of the associated choice list."""
-        if self.is_select_type():
-            row_type = self.get_type()
-            _, choice_list = row_type.rsplit(maxsplit=1)
-            return choice_list
-        return None
+        return self.row_type.list_name
 
     def is_begin_repeat(self):
         """Return is this a begin repeat type."""
-        row_type = self.get_type()
-        is_begin_repeat = row_type == 'begin repeat'
-        return is_begin_repeat
+        return self.row_type.is_begin_repeat
 
     def is_end_repeat(self):
         """Return is this an end repeat type."""
-        row_type = self.get_type()
-        is_end_repeat = row_type == 'end repeat'
-        return is_end_repeat
+        return self.row_type.is_end_repeat
 
     def is_gps(self):
         """Return is this a geopoint type."""
-        row_type = self.get_type()
-        is_gps = row_type in ('hidden geopoint', 'geopoint')
-        return is_gps
+        return self.row_type.is_gps
 
     def is_numeric_type(self):
         """Return is this a numeric type."""
-        row_type = self.get_type()
-        is_numeric = row_type in (
-            'hidden decimal',
-            'decimal',
-            'hidden integer',
-            'integer',
-            'int',
-            'range',
-        )
-        return is_numeric
+        return self.row_type.is_numeric
 
     def becomes_column(self):
         """Return if this survey row becomes a column in the dataset."""
-        row_type = self.get_type()
-        # Note: "begin repeat" does become a column
-        non_columns = ('begin group', 'end group', 'end repeat')
-        return row_type not in non_columns
+        return self.row_type.becomes_column
 
     def becomes_single_column(self):
         """Return if this survey row becomes a single column."""
-        return self.becomes_column() and not self.is_gps()
+        return self.row_type.becomes_single_column
 
     def __hash__(self):
         """Make a hash based on the row number and the row name."""
@@ -147,58 +245,128 @@ class SurveyRow(XlsFormRow):
 class Survey(Worksheet):
     """A class to represent survey in XlsForm.
 
+    The values in the type and name columns are interned, since types
+    repeat down the sheet and names are used as keys everywhere.
+
+    Class attributes:
+        INTERN_COLUMNS: The columns whose text values are interned
+
     Instance attributes:
         header: The header row for the survey tab
+        table: The SheetTable with the values of the survey rows
         rows: The survey rows in the survey tab
+        problems: The problems with groups and repeats found while
+            parsing in lenient mode, as Diagnostic objects
     """
 
-    def __init__(self, sheet: xlrd.sheet.Sheet, datemode: int):
+    INTERN_COLUMNS = ('type', 'name')
+
+    def __init__(self, sheet: xlrd.sheet.Sheet, datemode: int,
+                 lenient: bool = False):
         """Initialize a Survey.
 
         Args:
             sheet: The xlrd sheet that stores the survey
             datemode: The datemode for the workbook
+            lenient: If true, collect problems with groups and repeats
+                in `problems` instead of raising an exception
         """
         self.header: Tuple[str] = self.get_header(sheet, datemode)
+        self.table = SheetTable(self.header,
+                                intern_columns=self.INTERN_COLUMNS)
         self.rows: List[SurveyRow] = []
-        self._parse_survey(sheet, datemode)
+        self.problems: List[Diagnostic] = []
+        self._parse_survey(sheet, datemode, lenient)
 
-    def _parse_survey(self, sheet: xlrd.sheet.Sheet, datemode: int) -> None:
+    def _parse_survey(self, sheet: xlrd.sheet.Sheet, datemode: int,
+                      lenient: bool = False) -> None:
         """Parse the survey tab.
 
         This method goes through each row in the survey tab. If a row
         has a type and a name, then a SurveyRow is created for it.
         Nesting under groups and repeats is accounted for.
 
+        In lenient mode, an unmatched "end ..." is skipped, and an
+        "end ..." that closes the other kind of "begin ..." is reported
+        too.
+
         Args:
             sheet: The xlrd sheet that stores the survey
             datemode: The datemode for the workbook
+            lenient: If true, collect problems instead of raising
+
+        Raises:
+            MismatchedGroupOrRepeatError: If groups and repeats are not
+                balanced, and not in lenient mode
         """
-        ancestors = []
-        for i, row in enumerate(sheet.get_rows()):
-            if i == 0:
-                continue
-            row_values = [self.cell_to_value(cell, datemode) for cell in row]
-            row_dict = {k: v for k, v in zip(self.header, row_values)}
-            row_type = row_dict['type']
-            row_name = row_dict['name']
-            if row_type in ('end group', 'end repeat'):
-                if not ancestors:
-                    msg = (f'Found "{row_type}" without matching "begin ..." '
-                           f'at row {i+1}')
-                    raise MismatchedGroupOrRepeatError(msg)
-                ancestors.pop()
-            if row_type and row_name:
-                survey_row = SurveyRow(i, row_name, self.header, row_values,
-                                       row_dict, ancestors)
-                self.rows.append(survey_row)
-                if row_type in ('begin group', 'begin repeat'):
-                    ancestors.append(survey_row)
-        if ancestors:
+        type_colx = self.table.index['type']
+        name_colx = self.table.index['name']
+        ancestors = ()
+        # The names of the ancestors are kept in the path, since rows in
+        # the current block are not in the table yet
+        path = AncestorPath()
+        blocks = self.get_column_blocks(sheet, len(self.header), datemode)
+        for first_rowx, columns in blocks:
+            keep = []
+            position = len(self.table)
+            types = columns[type_colx]
+            names = columns[name_colx]
+            for k, (row_type, row_name) in enumerate(zip(types, names)):
+                if row_type in ('end group', 'end repeat'):
+                    rownumber = first_rowx + k + 1
+                    if not ancestors:
+                        msg = (f'Found "{row_type}" without matching '
+                               f'"begin ..." at row {rownumber}')
+                        if not lenient:
+                            raise MismatchedGroupOrRepeatError(msg)
+                        self._add_problem('unmatched-end', msg, rownumber,
+                                          row_name)
+                        continue
+                    begin_repeat = ancestors[-1].row_type.is_begin_repeat
+                    if lenient and begin_repeat != (row_type == 'end repeat'):
+                        msg = (f'Found "{row_type}" at row {rownumber} to '
+                               f'match "{ancestors[-1].get_type()}" with '
+                               f'name "{path.names[-1]}"')
+                        self._add_problem('mismatched-end', msg, rownumber,
+                                          row_name)
+                    path = ancestors[-1].ancestor_path
+                    ancestors = ancestors[:-1]
+                if row_type and row_name:
+                    keep.append(k)
+                    survey_row = SurveyRow(self.table, position, ancestors,
+                                           parse_row_type(str(row_type)),
+                                           path)
+                    position += 1
+                    self.rows.append(survey_row)
+                    if row_type in ('begin group', 'begin repeat'):
+                        ancestors = (*ancestors, survey_row)
+                        path = path.child(row_name,
+                                          row_type == 'begin repeat')
+            self.table.extend(first_rowx, columns, keep)
+        if ancestors and not lenient:
             first_ancestor = ancestors[-1]
             msg = (f'No "end ..." at end of XlsForm to match "begin ..." with '
                    f'name "{first_ancestor}"')
             raise MismatchedGroupOrRepeatError(msg)
+        for ancestor in ancestors:
+            msg = (f'No "end ..." at end of XlsForm to match '
+                   f'"{ancestor.get_type()}" with name "{ancestor.row_name}"')
+            self._add_problem('unclosed-begin', msg, ancestor.rowx + 1,
+                              ancestor.row_name)
+
+    def _add_problem(self, code: str, message: str, rownumber: int,
+                     name: str = None) -> None:
+        """Add a problem found in the survey tab.
+
+        Args:
+            code: The code for the kind of problem
+            message: The description of the problem
+            rownumber: The 1-indexed row number in the survey tab
+            name: The name in that row, if any
+        """
+        problem = Diagnostic(ERROR, code, message, 'survey', rownumber,
+                             name or None)
+        self.problems.append(problem)
 
     def __getitem__(self, item) -> SurveyRow:
         """Get the survey row specified by the argument."""
@@ -0,0 +1,336 @@
+"""A module to read XlsForms saved as CSV files or as JSON.
+
+Forms generated by other tools are often saved as text instead of as
+spreadsheets. A directory with one CSV file per sheet (survey.csv,
+choices.csv, settings.csv, ...) or a single JSON document is read into
+a TableWorkbook. Its sheets produce the same cell types and values as
+xlrd, so the Survey, Choices and Settings built from it follow the
+`Worksheet.cell_to_value` semantics. No spreadsheet is decoded.
+
+In CSV files every cell is text. A cell that looks like a plain
+decimal number, e.g. "12" or "-0.5", is read as a number, the same as
+if it were typed into a spreadsheet. Numbers with leading zeros, such
+as "007", stay text.
+
+A JSON document is an object with a key for each sheet. A sheet is
+either a list of objects, one per row, with keys as headers; a list of
+lists, where the first list is the header; or a single object, read as
+a header row and one row of values. This last form suits settings.
+
+Module attributes:
+    CSV_EXTENSION: The file extension of CSV sheets
+    JSON_EXTENSION: The file extension of JSON documents
+    NUMBER_REGEX: A regex for CSV text that is read as a number
+    TableSheet: A sheet of cells held in memory
+    TableWorkbook: A workbook of TableSheets
+    CsvWorkbook: A workbook read from a directory of CSV files
+    JsonWorkbook: A workbook read from a JSON document
+"""
+from array import array
+import csv
+import json
+import os
+import os.path
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import xlrd
+import xlrd.sheet
+
+from .source import is_path
+
+
+CSV_EXTENSION = '.csv'
+JSON_EXTENSION = '.json'
+NUMBER_REGEX = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?')
+
+
+class TableSheet:
+    """A class for a sheet whose cells are held in memory, by column.
+
+    This class mimics the part of the xlrd Sheet interface that
+    odk2stata uses, like XlsxSheet does.
+
+    Instance attributes:
+        name: The name of this sheet
+        nrows: The number of rows
+        ncols: The number of columns
+    """
+
+    def __init__(self, name: str, types: List[Sequence[int]],
+                 values: List[list]):
+        """Initialize a TableSheet.
+
+        Args:
+            name: The name of this sheet
+            types: The xlrd cell types of each column
+            values: The xlrd cell values of each column. All columns
+                have the same length.
+        """
+        self.name = name
+        self._types = types
+        self._values = values
+        self.nrows = len(values[0]) if values else 0
+        self.ncols = len(values)
+
+    @classmethod
+    def from_text_columns(cls, name: str,
+                          columns: Iterable[Sequence[Optional[str]]]) \
+            -> 'TableSheet':
+        """Make a sheet from columns of text.
+
+        Args:
+            name: The name of the sheet
+            columns: The text of each cell in each column. None is an
+                empty cell. All columns have the same length.
+
+        Returns:
+            A TableSheet with cells converted by `text_to_cell`
+        """
+        text_to_cell = cls.text_to_cell
+        types = []
+        values = []
+        for column in columns:
+            column_types = array('b')
+            column_values = []
+            for text in column:
+                ctype, value = text_to_cell(text)
+                column_types.append(ctype)
+                column_values.append(value)
+            types.append(column_types)
+            values.append(column_values)
+        return cls(name, types, values)
+
+    @classmethod
+    def from_text_rows(cls, name: str, rows: Iterable[Sequence[str]]) \
+            -> 'TableSheet':
+        """Make a sheet from rows of text, as read from a CSV file.
+
+        Rows shorter than the widest row are padded with empty cells.
+
+        Args:
+            name: The name of the sheet
+            rows: The text of each cell in each row. None is an empty
+                cell.
+
+        Returns:
+            A TableSheet with cells converted by `text_to_cell`
+        """
+        rows = list(rows)
+        width = max((len(row) for row in rows), default=0)
+        columns = (
+            [row[colx] if colx < len(row) else None for row in rows]
+            for colx in range(width)
+        )
+        return cls.from_text_columns(name, columns)
+
+    @staticmethod
+    def text_to_cell(text: Optional[str]) -> Tuple[int, object]:
+        """Get the xlrd cell type and value for text in a cell."""
+        if not text:
+            return xlrd.XL_CELL_EMPTY, ''
+        if NUMBER_REGEX.fullmatch(text.strip()):
+            return xlrd.XL_CELL_NUMBER, float(text)
+        return xlrd.XL_CELL_TEXT, text
+
+    def row(self, rowx: int) -> List[xlrd.sheet.Cell]:
+        """Get a single row of xlrd cells.
+
+        Raises:
+            IndexError: If the sheet does not have that row. This is
+                the same behavior as xlrd.
+        """
+        if not 0 <= rowx < self.nrows:
+            raise IndexError(rowx)
+        return [xlrd.sheet.Cell(types[rowx], values[rowx])
+                for types, values in zip(self._types, self._values)]
+
+    def get_rows(self) -> Iterator[List[xlrd.sheet.Cell]]:
+        """Iterate over the rows of xlrd cells in this sheet."""
+        return (self.row(rowx) for rowx in range(self.nrows))
+
+    def iter_column_blocks(self, ncols: int, start_rowx: int = 0,
+                           block_size: int = 1024) \
+            -> Iterator[Tuple[int, List[list], List[list]]]:
+        """Iterate over blocks of rows, with cells grouped by column.
+
+        See XlsxSheet.iter_column_blocks.
+        """
+        for first_rowx in range(start_rowx, self.nrows, block_size):
+            end_rowx = min(first_rowx + block_size, self.nrows)
+            size = end_rowx - first_rowx
+            types = []
+            values = []
+            for colx in range(ncols):
+                if colx < self.ncols:
+                    types.append(self._types[colx][first_rowx:end_rowx])
+                    values.append(self._values[colx][first_rowx:end_rowx])
+                else:
+                    types.append([xlrd.XL_CELL_EMPTY] * size)
+                    values.append([''] * size)
+            yield first_rowx, types, values
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<TableSheet "{self.name}">'
+        return msg
+
+
+class TableWorkbook:
+    """A base class for a workbook of sheets held in memory.
+
+    Subclasses load a sheet each time it is requested. The sheet is not
+    kept by the workbook, so it is freed once it has been parsed.
+
+    Instance attributes:
+        path: The path to the form, or None if it is in memory
+        datemode: The xlrd datemode. No cells are dates, so this is 0.
+    """
+
+    def __init__(self, path: Optional[str]):
+        """Initialize a TableWorkbook.
+
+        Args:
+            path: The path to the form, or None if it is in memory
+        """
+        self.path = path
+        self.datemode = 0
+
+    def sheet_names(self) -> List[str]:
+        """Get the names of the sheets in this workbook."""
+        raise NotImplementedError
+
+    def load_sheet(self, sheet_name: str) -> TableSheet:
+        """Load a sheet that is known to exist."""
+        raise NotImplementedError
+
+    def sheet_by_name(self, sheet_name: str) -> TableSheet:
+        """Get a sheet by its name.
+
+        Raises:
+            xlrd.XLRDError: If there is no sheet with the given name.
+                This is the same behavior as xlrd.
+        """
+        if sheet_name not in self.sheet_names():
+            raise xlrd.XLRDError(f'No sheet named <{sheet_name!r}>')
+        return self.load_sheet(sheet_name)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        name = self.path if self.path is not None else '<memory>'
+        msg = f'{type(self).__name__}("{name}")'
+        return msg
+
+
+class CsvWorkbook(TableWorkbook):
+    """A workbook read from a directory with a CSV file per sheet.
+
+    The sheet name is the file name without ".csv", e.g. survey.csv
+    holds the survey sheet. Files are read as UTF-8, with or without a
+    byte order mark.
+    """
+
+    def sheet_names(self) -> List[str]:
+        """Get the names of the sheets in this workbook."""
+        names = []
+        for filename in sorted(os.listdir(self.path)):
+            name, extension = os.path.splitext(filename)
+            if extension.lower() == CSV_EXTENSION:
+                names.append(name)
+        return names
+
+    def load_sheet(self, sheet_name: str) -> TableSheet:
+        """Read a sheet from its CSV file."""
+        sheet_path = os.path.join(self.path, sheet_name + CSV_EXTENSION)
+        if not os.path.exists(sheet_path):
+            sheet_path = next(
+                os.path.join(self.path, filename)
+                for filename in os.listdir(self.path)
+                if filename.lower() == (sheet_name + CSV_EXTENSION).lower()
+            )
+        with open(sheet_path, encoding='utf-8-sig', newline='') as file:
+            return TableSheet.from_text_rows(sheet_name, csv.reader(file))
+
+
+class JsonWorkbook(TableWorkbook):
+    """A workbook read from a JSON document.
+
+    JSON strings are text cells, numbers are number cells, true and
+    false are boolean cells, and null is an empty cell. Nested arrays
+    and objects are kept as JSON text.
+    """
+
+    def __init__(self, source):
+        """Initialize a JsonWorkbook, reading the JSON document.
+
+        Args:
+            source: The path to the JSON document, or a buffer with its
+                bytes
+
+        Raises:
+            xlrd.XLRDError: If the document is not a JSON object
+        """
+        if is_path(source):
+            super().__init__(os.fspath(source))
+            with open(self.path, encoding='utf-8-sig') as file:
+                self._document = json.load(file)
+        else:
+            super().__init__(None)
+            self._document = json.loads(str(source, encoding='utf-8-sig'))
+        if not isinstance(self._document, dict):
+            msg = f'Expected a JSON object with a key per sheet in {self!r}'
+            raise xlrd.XLRDError(msg)
+
+    def sheet_names(self) -> List[str]:
+        """Get the names of the sheets in this workbook."""
+        return list(self._document)
+
+    def load_sheet(self, sheet_name: str) -> TableSheet:
+        """Build a sheet from its part of the JSON document."""
+        rows = self.get_sheet_rows(self._document[sheet_name])
+        width = max((len(row) for row in rows), default=0)
+        types = [array('b') for _ in range(width)]
+        values = [[] for _ in range(width)]
+        for row in rows:
+            for colx in range(width):
+                item = row[colx] if colx < len(row) else None
+                ctype, value = self.json_to_cell(item)
+                types[colx].append(ctype)
+                values[colx].append(value)
+        return TableSheet(sheet_name, types, values)
+
+    @staticmethod
+    def get_sheet_rows(sheet) -> List[Sequence]:
+        """Get the rows, header first, for a sheet in the JSON document.
+
+        Raises:
+            xlrd.XLRDError: If the sheet is not in a supported form
+        """
+        if isinstance(sheet, dict):
+            return [list(sheet), list(sheet.values())]
+        if not isinstance(sheet, list):
+            raise xlrd.XLRDError('Expected a JSON list or object for a sheet')
+        if all(isinstance(row, list) for row in sheet):
+            return sheet
+        if not all(isinstance(row, dict) for row in sheet):
+            msg = 'Expected a sheet to be all JSON lists or all JSON objects'
+            raise xlrd.XLRDError(msg)
+        header = {}
+        for row in sheet:
+            header.update(dict.fromkeys(row))
+        rows = [list(header)]
+        rows.extend([row.get(key) for key in header] for row in sheet)
+        return rows
+
+    @staticmethod
+    def json_to_cell(item) -> Tuple[int, object]:
+        """Get the xlrd cell type and value for a JSON value."""
+        if item is None or item == '':
+            return xlrd.XL_CELL_EMPTY, ''
+        elif isinstance(item, bool):
+            return xlrd.XL_CELL_BOOLEAN, int(item)
+        elif isinstance(item, (int, float)):
+            return xlrd.XL_CELL_NUMBER, float(item)
+        elif isinstance(item, str):
+            return xlrd.XL_CELL_TEXT, item
+        return xlrd.XL_CELL_TEXT, json.dumps(item)
@@ -0,0 +1,534 @@
+"""A module to open XlsForm workbooks.
+
+The xlrd package reads .xls workbooks, but since xlrd 2.0 it no longer
+reads .xlsx workbooks. This module provides a streaming .xlsx reader
+that reads the zip archive and the sheet XML row by row. Its sheets
+produce xlrd cells, so everything downstream goes through the same
+`Worksheet.cell_to_value` semantics no matter the file format.
+
+Forms saved as a directory of CSV files or as JSON are read by the
+workbooks in the textform module instead, and XForms by the workbook
+in the xform module.
+
+Besides a path, every workbook except a directory of CSV files can be
+read from a form in memory. See the source module.
+
+Module attributes:
+    open_workbook: Open an XlsForm workbook, .xls or .xlsx, or a form
+        saved as CSV files, JSON or an XForm
+    XlsxWorkbook: A streaming, read-only .xlsx workbook
+    XlsxSheet: A single sheet in an XlsxWorkbook
+"""
+import datetime
+import os.path
+import posixpath
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+import xlrd
+import xlrd.biffh
+import xlrd.sheet
+
+from .source import FormSource, MemoryFile, as_buffer, is_path
+from .source import sniff_extension
+from .textform import CsvWorkbook, JsonWorkbook, JSON_EXTENSION
+
+
+def open_workbook(source: FormSource, filename: str = None):
+    """Open an XlsForm workbook.
+
+    Args:
+        source: The path to the XlsForm file, or to a directory of CSV
+            files, or to a JSON document, or to an XForm. Otherwise,
+            one of these files in memory, see the source module.
+        filename: The logical file name of a form in memory. Its
+            extension decides how the form is read. If None, that is
+            guessed from the content.
+
+    Returns:
+        A CsvWorkbook if the path is a directory, a JsonWorkbook if the
+        file ends with ".json", an XFormWorkbook if the file ends with
+        ".xml", an XlsxWorkbook if the file is a zip archive (.xlsx),
+        otherwise an xlrd Book. Sheets are loaded on demand, except
+        for XForms, which are read all at once.
+    """
+    # Imported here, since the xform module uses helpers from this one
+    from .xform import XFormWorkbook, XFORM_EXTENSION
+    if not is_path(source):
+        buffer = as_buffer(source)
+        if not len(memoryview(buffer)):
+            raise xlrd.XLRDError('The form in memory is empty')
+        extension = sniff_extension(buffer)
+        if filename:
+            extension = os.path.splitext(filename)[1].lower() or extension
+        if extension == JSON_EXTENSION:
+            return JsonWorkbook(buffer)
+        if extension == XFORM_EXTENSION:
+            return XFormWorkbook(buffer)
+        if zipfile.is_zipfile(MemoryFile(buffer)):
+            return XlsxWorkbook(buffer)
+        if isinstance(buffer, memoryview):
+            # xlrd decodes slices of the contents, so it needs bytes
+            buffer = buffer.tobytes()
+        return xlrd.open_workbook(file_contents=buffer, on_demand=True)
+    path = os.fspath(source)
+    if os.path.isdir(path):
+        return CsvWorkbook(path)
+    if path.lower().endswith(JSON_EXTENSION):
+        return JsonWorkbook(path)
+    if path.lower().endswith(XFORM_EXTENSION):
+        return XFormWorkbook(path)
+    if zipfile.is_zipfile(path):
+        return XlsxWorkbook(path)
+    return xlrd.open_workbook(path, on_demand=True)
+
+
+# Relationship types to find parts of the workbook
+REL_SHARED_STRINGS = 'sharedStrings'
+REL_STYLES = 'styles'
+
+# Built-in number format IDs that are dates. Same ranges as in xlrd.
+DATE_FORMAT_IDS = frozenset((
+    *range(14, 23),
+    *range(27, 37),
+    *range(45, 48),
+    *range(50, 59),
+    *range(71, 82),
+))
+
+NON_DATE_FORMATS = frozenset(('0.00E+00', '##0.0E+0', 'General', 'GENERAL',
+                              'general', '@'))
+
+CELL_REFERENCE_REGEX = re.compile(r'([A-Z]+)(\d*)')
+
+ERROR_CODE_FROM_TEXT = {
+    text: code for code, text in xlrd.biffh.error_text_from_code.items()
+}
+
+
+def local_name(tag: str) -> str:
+    """Strip the XML namespace from a tag."""
+    return tag.rsplit('}', maxsplit=1)[-1]
+
+
+def column_index(reference: str) -> int:
+    """Convert a cell reference like "AB12" to a 0-indexed column."""
+    letters = CELL_REFERENCE_REGEX.match(reference).group(1)
+    result = 0
+    for letter in letters:
+        result = result * 26 + ord(letter) - ord('A') + 1
+    return result - 1
+
+
+def is_date_format_string(fmt: str) -> bool:
+    """Determine if an Excel number format displays a date.
+
+    This is the same heuristic as xlrd uses. Ignore quoted text,
+    escaped characters and [bracketed] sections, then count date
+    characters (ymdhs) against number characters (0#?).
+
+    Args:
+        fmt: The format code
+
+    Returns:
+        True if and only if the format is a date format
+    """
+    reduced = []
+    state = 0
+    for char in fmt:
+        if state == 0:
+            if char == '"':
+                state = 1
+            elif char in '\\_*':
+                state = 2
+            elif char not in '$-+/(): ':
+                reduced.append(char)
+        elif state == 1:
+            if char == '"':
+                state = 0
+        else:
+            state = 0
+    reduced = re.sub(r'\[[^]]*\]', '', ''.join(reduced))
+    if reduced in NON_DATE_FORMATS:
+        return False
+    date_count = sum(1 for char in reduced if char in 'ymdhsYMDHS')
+    num_count = sum(1 for char in reduced if char in '0#?')
+    return date_count > num_count
+
+
+class XlsxWorkbook:
+    """A class to read an .xlsx workbook without loading it all.
+
+    This class mimics the small part of the xlrd Book interface that
+    odk2stata uses. Only the workbook index is read on initialization.
+    Shared strings and styles are read the first time a sheet is read.
+    Sheets are streamed from the zip archive each time they are
+    iterated.
+
+    Instance attributes:
+        source: The path to the .xlsx file, or a buffer with its bytes
+        path: The path to the .xlsx file, or None if it is in memory
+        datemode: The xlrd datemode for the workbook
+    """
+
+    def __init__(self, source: FormSource):
+        """Initialize an XlsxWorkbook.
+
+        Args:
+            source: The path to the .xlsx file, or a buffer with its
+                bytes
+        """
+        self.source = source
+        self.path = os.fspath(source) if is_path(source) else None
+        self.datemode = 0
+        self._sheet_parts: Dict[str, str] = {}
+        self._other_parts: Dict[str, str] = {}
+        self._shared_strings: Optional[List[str]] = None
+        self._date_styles: Optional[List[bool]] = None
+        with self.open_archive() as archive:
+            self._read_workbook_index(archive)
+
+    def open_archive(self) -> zipfile.ZipFile:
+        """Open the zip archive of the workbook."""
+        if self.path is not None:
+            return zipfile.ZipFile(self.path)
+        return zipfile.ZipFile(MemoryFile(self.source))
+
+    def _read_workbook_index(self, archive: zipfile.ZipFile) -> None:
+        """Read sheet names, part locations and the date mode."""
+        rels = {}
+        rels_part = 'xl/_rels/workbook.xml.rels'
+        if rels_part in archive.namelist():
+            with archive.open(rels_part) as file:
+                for elem in ElementTree.parse(file).getroot():
+                    target = elem.get('Target')
+                    if target.startswith('/'):
+                        target = target[1:]
+                    else:
+                        target = posixpath.normpath(f'xl/{target}')
+                    rel_type = elem.get('Type').rsplit('/', maxsplit=1)[-1]
+                    rels[elem.get('Id')] = target
+                    self._other_parts.setdefault(rel_type, target)
+        with archive.open('xl/workbook.xml') as file:
+            root = ElementTree.parse(file).getroot()
+        for elem in root.iter():
+            name = local_name(elem.tag)
+            if name == 'workbookPr':
+                date1904 = elem.get('date1904', 'false').lower()
+                self.datemode = 1 if date1904 in ('1', 'true') else 0
+            elif name == 'sheet':
+                rel_id = next(v for k, v in elem.attrib.items()
+                              if local_name(k) == 'id')
+                self._sheet_parts[elem.get('name')] = rels[rel_id]
+
+    def _read_shared_strings(self) -> List[str]:
+        """Read the shared strings table, if there is one."""
+        shared_strings = []
+        part = self._other_parts.get(REL_SHARED_STRINGS)
+        if part is None:
+            return shared_strings
+        with self.open_archive() as archive, archive.open(part) as file:
+            for _, elem in ElementTree.iterparse(file):
+                if local_name(elem.tag) == 'si':
+                    shared_strings.append(self.get_text(elem))
+                    elem.clear()
+        return shared_strings
+
+    def _read_date_styles(self) -> List[bool]:
+        """Read which cell styles (by index) have a date format."""
+        date_styles = []
+        part = self._other_parts.get(REL_STYLES)
+        if part is None:
+            return date_styles
+        with self.open_archive() as archive, archive.open(part) as file:
+            root = ElementTree.parse(file).getroot()
+        custom_formats = {}
+        for elem in root.iter():
+            if local_name(elem.tag) == 'numFmt':
+                fmt_id = int(elem.get('numFmtId'))
+                custom_formats[fmt_id] = elem.get('formatCode', '')
+        for elem in root:
+            if local_name(elem.tag) != 'cellXfs':
+                continue
+            for xf in elem:
+                fmt_id = int(xf.get('numFmtId', 0))
+                if fmt_id in custom_formats:
+                    is_date = is_date_format_string(custom_formats[fmt_id])
+                else:
+                    is_date = fmt_id in DATE_FORMAT_IDS
+                date_styles.append(is_date)
+        return date_styles
+
+    @property
+    def shared_strings(self) -> List[str]:
+        """Get the shared strings table, reading it if necessary."""
+        if self._shared_strings is None:
+            self._shared_strings = self._read_shared_strings()
+        return self._shared_strings
+
+    @property
+    def date_styles(self) -> List[bool]:
+        """Get the date flag for each cell style, reading if necessary."""
+        if self._date_styles is None:
+            self._date_styles = self._read_date_styles()
+        return self._date_styles
+
+    @staticmethod
+    def get_text(elem: ElementTree.Element) -> str:
+        """Get the text of a shared string or an inline string.
+
+        Phonetic runs (<rPh>) are not part of the text.
+        """
+        chunks = []
+        for child in elem.iter():
+            name = local_name(child.tag)
+            if name == 't' and child.text:
+                chunks.append(child.text)
+            elif name == 'rPh':
+                # Skip the <t> nested in the phonetic run
+                for phonetic in child.iter():
+                    phonetic.text = None
+        return ''.join(chunks)
+
+    def sheet_names(self) -> List[str]:
+        """Get the names of the sheets in this workbook."""
+        return list(self._sheet_parts)
+
+    def sheet_by_name(self, sheet_name: str) -> 'XlsxSheet':
+        """Get a sheet by its name.
+
+        Raises:
+            xlrd.XLRDError: If there is no sheet with the given name.
+                This is the same behavior as xlrd.
+        """
+        part = self._sheet_parts.get(sheet_name)
+        if part is None:
+            raise xlrd.XLRDError(f'No sheet named <{sheet_name!r}>')
+        return XlsxSheet(self, sheet_name, part)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        name = self.path if self.path is not None else '<memory>'
+        msg = f'XlsxWorkbook("{name}")'
+        return msg
+
+
+class XlsxSheet:
+    """A class to stream rows from a sheet of an .xlsx workbook.
+
+    This class mimics the part of the xlrd Sheet interface that
+    odk2stata uses. Rows are produced as lists of xlrd cells. Each row
+    is at least as wide as the sheet dimension, if the sheet has one,
+    or else as wide as the widest row so far.
+
+    Instance attributes:
+        book: The XlsxWorkbook this sheet belongs to
+        name: The name of this sheet
+        part: The name of the sheet XML inside the zip archive
+        ncols: The number of columns seen so far while reading
+    """
+
+    def __init__(self, book: XlsxWorkbook, name: str, part: str):
+        """Initialize an XlsxSheet.
+
+        Args:
+            book: The XlsxWorkbook this sheet belongs to
+            name: The name of this sheet
+            part: The name of the sheet XML inside the zip archive
+        """
+        self.book = book
+        self.name = name
+        self.part = part
+        self.ncols = 0
+
+    def _iter_row_elems(self) -> Iterator[Tuple[int, ElementTree.Element]]:
+        """Iterate over the <row> elements of this sheet.
+
+        The sheet XML is parsed incrementally and each row element is
+        discarded once the caller is done with it, so memory use does
+        not grow with the size of the sheet. The attribute `ncols` is
+        updated from the <dimension> element if there is one.
+
+        Yields:
+            The 0-indexed row number and the <row> element
+        """
+        next_rowx = 0
+        with self.book.open_archive() as archive, \
+                archive.open(self.part) as file:
+            parent = None
+            for event, elem in ElementTree.iterparse(file, ('start', 'end')):
+                name = local_name(elem.tag)
+                if event == 'start':
+                    if name == 'sheetData':
+                        parent = elem
+                    continue
+                if name == 'dimension':
+                    last_cell = elem.get('ref', 'A1').split(':')[-1]
+                    self.ncols = max(self.ncols, column_index(last_cell) + 1)
+                elif name == 'row':
+                    rowx = int(elem.get('r', next_rowx + 1)) - 1
+                    yield rowx, elem
+                    if parent is not None:
+                        parent.remove(elem)
+                    next_rowx = rowx + 1
+
+    def get_rows(self) -> Iterator[List[xlrd.sheet.Cell]]:
+        """Iterate over the rows of this sheet.
+
+        Yields:
+            A list of xlrd cells for each row, including empty rows.
+        """
+        next_rowx = 0
+        for rowx, row_elem in self._iter_row_elems():
+            row = []
+            for colx, ctype, value in self._iter_cells(row_elem):
+                row.extend(self._empty_row(colx - len(row)))
+                row.append(xlrd.sheet.Cell(ctype, value))
+            self.ncols = max(self.ncols, len(row))
+            while next_rowx < rowx:
+                yield self._empty_row(self.ncols)
+                next_rowx += 1
+            row.extend(self._empty_row(self.ncols - len(row)))
+            yield row
+            next_rowx += 1
+
+    def iter_column_blocks(self, ncols: int, start_rowx: int = 0,
+                           block_size: int = 1024) \
+            -> Iterator[Tuple[int, List[list], List[list]]]:
+        """Iterate over blocks of rows, with cells grouped by column.
+
+        This is the streaming equivalent of xlrd `col_types` and
+        `col_values`. Cells are not made into xlrd Cell objects.
+
+        Args:
+            ncols: How many columns to read. Cells to the right of this
+                are ignored, and missing cells are empty.
+            start_rowx: The first row to read
+            block_size: The maximum number of rows in a block
+
+        Yields:
+            The first row number of the block, a list of cell types for
+            each column, and a list of cell values for each column.
+        """
+        def new_block():
+            return [[] for _ in range(ncols)], [[] for _ in range(ncols)]
+        empty = xlrd.XL_CELL_EMPTY
+        first_rowx = start_rowx
+        next_rowx = start_rowx
+        types, values = new_block()
+        for rowx, row_elem in self._iter_row_elems():
+            if rowx < start_rowx:
+                continue
+            while next_rowx <= rowx:
+                if next_rowx - first_rowx == block_size:
+                    yield first_rowx, types, values
+                    first_rowx = next_rowx
+                    types, values = new_block()
+                filled = 0
+                if next_rowx == rowx:
+                    for colx, ctype, value in self._iter_cells(row_elem):
+                        if colx >= ncols:
+                            break
+                        for i in range(filled, colx):
+                            types[i].append(empty)
+                            values[i].append('')
+                        types[colx].append(ctype)
+                        values[colx].append(value)
+                        filled = colx + 1
+                for i in range(filled, ncols):
+                    types[i].append(empty)
+                    values[i].append('')
+                next_rowx += 1
+        if next_rowx > first_rowx:
+            yield first_rowx, types, values
+
+    def _iter_cells(self, row_elem: ElementTree.Element) \
+            -> Iterator[Tuple[int, int, object]]:
+        """Iterate over the cells in a <row> element.
+
+        Yields:
+            The 0-indexed column, the xlrd cell type and the cell value
+        """
+        colx = 0
+        for cell_elem in row_elem:
+            if local_name(cell_elem.tag) != 'c':
+                continue
+            reference = cell_elem.get('r')
+            if reference:
+                colx = column_index(reference)
+            ctype, value = self._read_cell(cell_elem)
+            yield colx, ctype, value
+            colx += 1
+
+    def _read_cell(self, cell_elem: ElementTree.Element) -> Tuple[int, object]:
+        """Read a <c> element as an xlrd cell type and value."""
+        cell_type = cell_elem.get('t', 'n')
+        text = None
+        for child in cell_elem:
+            name = local_name(child.tag)
+            if name == 'v':
+                text = child.text
+            elif name == 'is':
+                text = self.book.get_text(child)
+        if cell_type == 'inlineStr' or cell_type == 'str':
+            if not text:
+                return xlrd.XL_CELL_EMPTY, ''
+            return xlrd.XL_CELL_TEXT, text
+        if text is None:
+            return xlrd.XL_CELL_EMPTY, ''
+        if cell_type == 's':
+            return xlrd.XL_CELL_TEXT, self.book.shared_strings[int(text)]
+        if cell_type == 'n':
+            value = float(text)
+            style = int(cell_elem.get('s', 0))
+            date_styles = self.book.date_styles
+            if style < len(date_styles) and date_styles[style]:
+                return xlrd.XL_CELL_DATE, value
+            return xlrd.XL_CELL_NUMBER, value
+        if cell_type == 'b':
+            return xlrd.XL_CELL_BOOLEAN, int(text)
+        if cell_type == 'e':
+            return xlrd.XL_CELL_ERROR, ERROR_CODE_FROM_TEXT.get(text, text)
+        if cell_type == 'd':
+            return self._read_iso_date(text)
+        return xlrd.XL_CELL_TEXT, text
+
+    def _read_iso_date(self, text: str) -> Tuple[int, object]:
+        """Read an ISO 8601 date cell as an xlrd date cell."""
+        try:
+            value = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            return xlrd.XL_CELL_TEXT, text
+        epoch = datetime.datetime(1904, 1, 1) if self.book.datemode else \
+            datetime.datetime(1899, 12, 30)
+        delta = value - epoch
+        serial = delta.days + delta.seconds / 86400
+        return xlrd.XL_CELL_DATE, serial
+
+    @staticmethod
+    def _empty_row(ncols: int) -> List[xlrd.sheet.Cell]:
+        """Make a list of empty cells."""
+        return [xlrd.sheet.Cell(xlrd.XL_CELL_EMPTY, '') for _ in range(ncols)]
+
+    def row(self, rowx: int) -> List[xlrd.sheet.Cell]:
+        """Get a single row, reading only as far as needed.
+
+        Raises:
+            IndexError: If the sheet does not have that row. This is
+                the same behavior as xlrd.
+        """
+        rows = self.get_rows()
+        try:
+            for i, row in enumerate(rows):
+                if i == rowx:
+                    return row
+        finally:
+            rows.close()
+        raise IndexError(rowx)
+
+    def __repr__(self):
+        """Get a representation of this object."""
+        msg = f'<XlsxSheet "{self.name}">'
+        return msg
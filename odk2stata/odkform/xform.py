@@ -0,0 +1,578 @@
+"""A module to read a form from its compiled XForm XML.
+
+Often only the XForm is at hand, e.g. on a server, and not the XlsForm
+it was compiled from. An XFormWorkbook reads the XForm and rebuilds
+the survey, choices and settings sheets of an XlsForm, so everything
+downstream of OdkForm works the same.
+
+The XML is read with `iterparse` in a single pass. Each bind, text,
+body control and choice item is converted when its end tag is read and
+is then removed from the tree, so the memory used for the XML does not
+grow with the size of the form, even with very large inline itemsets.
+
+What is rebuilt:
+
+- survey: one row per node of the primary instance, in order. Nodes
+  with children become groups, or repeats if they have a jr:template
+  attribute. Types come from the body control and the bind, e.g. a
+  <select1> is "select_one", and an <input> with a bind type of "int"
+  is "integer". Labels and hints come from the body, using itext
+  translations if there are any. The "meta" group that pyxform adds
+  is skipped, as it is not part of the XlsForm survey.
+- choices: one list per secondary instance with items (the itemsets
+  of newer XForms), named by the instance id, and one list per
+  <select1> or <select> with inline items, named by the question.
+- settings: form_title from the title, and form_id and version from
+  the primary instance.
+
+Module attributes:
+    XFORM_EXTENSION: The file extension of XForms
+    SHEET_NAMES: The names of the rebuilt sheets
+    SURVEY_COLUMNS: The non-label columns of the rebuilt survey
+    CONTROL_TAGS: The body elements that are questions
+    BIND_TYPES: XlsForm types for XForm bind types of input controls
+    PRELOAD_TYPES: XlsForm types for XForm preloads
+    MEDIA_TYPES: XlsForm types for upload media types
+    XFormWorkbook: A workbook rebuilt from an XForm
+"""
+from collections import defaultdict
+import os
+import re
+from typing import Dict, List, Tuple
+import xml.etree.ElementTree as ElementTree
+
+import xlrd
+
+from .source import FormSource, MemoryFile, is_path
+from .textform import TableSheet, TableWorkbook
+from .workbook import local_name
+
+
+XFORM_EXTENSION = '.xml'
+SHEET_NAMES = ('survey', 'choices', 'settings')
+
+SURVEY_COLUMNS = ('type', 'name')
+EXTRA_SURVEY_COLUMNS = ('required', 'relevant', 'constraint', 'calculation',
+                        'appearance')
+
+CONTROL_TAGS = frozenset((
+    'input', 'select1', 'select', 'range', 'trigger', 'upload', 'rank',
+))
+
+BIND_TYPES = {
+    'string': 'text',
+    'int': 'integer',
+    'decimal': 'decimal',
+    'date': 'date',
+    'time': 'time',
+    'dateTime': 'dateTime',
+    'geopoint': 'geopoint',
+    'geotrace': 'geotrace',
+    'geoshape': 'geoshape',
+    'barcode': 'barcode',
+}
+
+PRELOAD_TYPES = {
+    ('timestamp', 'start'): 'start',
+    ('timestamp', 'end'): 'end',
+    ('date', 'today'): 'today',
+    ('property', 'deviceid'): 'deviceid',
+    ('property', 'subscriberid'): 'subscriberid',
+    ('property', 'simserial'): 'simserial',
+    ('property', 'phonenumber'): 'phonenumber',
+    ('property', 'username'): 'username',
+    ('property', 'email'): 'email',
+}
+
+MEDIA_TYPES = {
+    'image': 'image',
+    'audio': 'audio',
+    'video': 'video',
+}
+
+ITEXT_REGEX = re.compile(r"jr:itext\(\s*'([^']*)'\s*\)")
+INSTANCE_REGEX = re.compile(r"instance\(\s*'([^']*)'\s*\)")
+TRUE_REGEX = re.compile(r'\s*true\(\)\s*')
+
+
+class XFormWorkbook(TableWorkbook):
+    """A workbook with XlsForm sheets rebuilt from an XForm.
+
+    The XForm is read when the workbook is initialized. See the module
+    documentation for how the sheets are rebuilt.
+
+    Class attributes:
+        DEFAULT_LANGUAGE: The itext language that is used for the plain
+            "label" and "hint" columns
+
+    Instance attributes:
+        source: The path to the XForm, or a buffer with its bytes
+        title: The title of the form
+        instance_attrib: The attributes of the primary instance root,
+            e.g. id and version
+    """
+
+    DEFAULT_LANGUAGE = 'default'
+
+    def __init__(self, source: FormSource):
+        """Initialize an XFormWorkbook, reading the XForm.
+
+        Args:
+            source: The path to the XForm, or a buffer with its bytes
+
+        Raises:
+            xlrd.XLRDError: If the file is not an XForm
+        """
+        if is_path(source):
+            super().__init__(os.fspath(source))
+        else:
+            super().__init__(None)
+        self.source = source
+        self.title = ''
+        self.instance_attrib: Dict[str, str] = {}
+        # Primary instance nodes: path, depth, is repeat, has children
+        self._nodes: List[list] = []
+        self._binds: Dict[str, Dict[str, str]] = {}
+        self._controls: Dict[str, dict] = {}
+        self._groups: Dict[str, dict] = {}
+        self._itext: Dict[Tuple[str, str], str] = {}
+        self._languages: List[str] = []
+        # Secondary instance items, by instance id, then by column
+        self._items: Dict[str, Dict[str, list]] = defaultdict(dict)
+        self._item_counts: Dict[str, int] = defaultdict(int)
+        self._item_keys: Dict[str, None] = {}
+        self._local_names: Dict[str, str] = {}
+        self._external: Dict[str, str] = {}
+        try:
+            self._read_xform()
+        except ElementTree.ParseError as err:
+            raise xlrd.XLRDError(f'Unable to read XForm {self!r}: {err}')
+        if not self._nodes:
+            raise xlrd.XLRDError(f'No primary instance found in {self!r}')
+        self._sheets = {
+            'survey': self._build_survey(),
+            'choices': self._build_choices(),
+            'settings': self._build_settings(),
+        }
+
+    def sheet_names(self) -> List[str]:
+        """Get the names of the rebuilt sheets."""
+        return list(SHEET_NAMES)
+
+    def _local_name(self, tag: str) -> str:
+        """Get the local name of a tag, remembering it for next time."""
+        name = self._local_names.get(tag)
+        if name is None:
+            name = self._local_names[tag] = local_name(tag)
+        return name
+
+    def _read_xform(self) -> None:
+        """Read the XForm in one pass and store what is needed."""
+        stack: List[ElementTree.Element] = []
+        names: List[str] = []
+        # The primary instance is the first one in the model
+        instance_id = None
+        instance_depth = None
+        primary_done = False
+        nodes_by_path: Dict[str, list] = {}
+        file = self.path if self.path is not None else MemoryFile(self.source)
+        for event, elem in ElementTree.iterparse(file,
+                                                 events=('start', 'end')):
+            if instance_id is not None:
+                # Inside a secondary instance, only whole items are read
+                if event == 'start':
+                    stack.append(elem)
+                    names.append('')
+                    continue
+                elif len(stack) > instance_depth + 3:
+                    stack.pop()
+                    names.pop()
+                    continue
+            name = self._local_name(elem.tag)
+            if event == 'start':
+                if name == 'instance' and names[-1:] == ['model']:
+                    instance_depth = len(stack)
+                    instance_id = elem.get('id', '') if primary_done else None
+                    if elem.get('src'):
+                        self._external[instance_id] = elem.get('src')
+                elif instance_depth is not None and instance_id is None:
+                    self._start_node(elem, stack[instance_depth + 1:],
+                                     nodes_by_path)
+                elif name == 'group' and elem.get('ref'):
+                    self._groups[elem.get('ref')] = {
+                        'appearance': elem.get('appearance', ''),
+                        'label': {},
+                    }
+                elif name == 'repeat' and names[-1:] == ['group']:
+                    group = self._groups.get(stack[-1].get('ref'))
+                    if group is not None:
+                        self._groups[elem.get('nodeset')] = group
+                stack.append(elem)
+                names.append(name)
+                continue
+            stack.pop()
+            names.pop()
+            parent = stack[-1] if stack else None
+            remove = False
+            if instance_depth is not None:
+                if len(stack) == instance_depth:
+                    # The end of an <instance>
+                    primary_done = True
+                    instance_depth = None
+                    instance_id = None
+                elif instance_id is None:
+                    remove = True
+                elif len(stack) == instance_depth + 2:
+                    self._add_item(instance_id, elem)
+                    remove = True
+            elif name == 'title' and not self.title:
+                self.title = self._get_text(elem)
+            elif name == 'bind':
+                self._binds[elem.get('nodeset')] = dict(elem.attrib)
+                remove = True
+            elif name == 'text' and names[-1:] == ['translation']:
+                self._add_text(parent.get('lang', self.DEFAULT_LANGUAGE), elem)
+                remove = True
+            elif name in CONTROL_TAGS and 'body' in names:
+                self._add_control(name, elem)
+                remove = True
+            elif name == 'label' and names[-1:] == ['group']:
+                group = self._groups.get(parent.get('ref'))
+                if group is not None:
+                    group['label'] = self._get_text_by_language(elem)
+            if remove and parent is not None:
+                parent.remove(elem)
+
+    def _start_node(self, elem: ElementTree.Element,
+                    ancestors: List[ElementTree.Element],
+                    nodes_by_path: Dict[str, list]) -> None:
+        """Record a node of the primary instance when it starts.
+
+        Args:
+            elem: The element for the node
+            ancestors: The elements from the instance root down to the
+                parent of this node
+            nodes_by_path: The recorded nodes so far, by path
+        """
+        if not ancestors:
+            self.instance_attrib = {
+                local_name(key): value for key, value in elem.attrib.items()
+            }
+            return
+        parent_path = '/' + '/'.join(self._local_name(i.tag)
+                                     for i in ancestors)
+        path = f'{parent_path}/{self._local_name(elem.tag)}'
+        if path in nodes_by_path:
+            # A repeat can appear twice: as a template and as an instance
+            return
+        parent = nodes_by_path.get(parent_path)
+        if parent is not None:
+            parent[3] = True
+        is_repeat = any(local_name(key) == 'template' for key in elem.attrib)
+        node = [path, len(ancestors), is_repeat, False]
+        nodes_by_path[path] = node
+        self._nodes.append(node)
+
+    def _add_item(self, instance_id: str, item: ElementTree.Element) -> None:
+        """Add an item of a secondary instance as a choice.
+
+        Items are stored by column, with None for a missing value, so
+        that there is no object per item.
+        """
+        columns = self._items[instance_id]
+        count = self._item_counts[instance_id]
+        for child in item:
+            key = self._local_name(child.tag)
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * count
+                self._item_keys[key] = None
+            if len(column) == count:
+                column.append((child.text or '').strip())
+        count += 1
+        self._item_counts[instance_id] = count
+        for column in columns.values():
+            if len(column) < count:
+                column.append(None)
+
+    def _add_text(self, language: str, text: ElementTree.Element) -> None:
+        """Add an itext translation."""
+        if language not in self._languages:
+            self._languages.append(language)
+        for value in text:
+            if local_name(value.tag) == 'value' and 'form' not in value.attrib:
+                self._itext[(language, text.get('id'))] = self._get_text(value)
+                break
+
+    def _add_control(self, name: str, elem: ElementTree.Element) -> None:
+        """Add a question from the body."""
+        control = {
+            'tag': name,
+            'attrib': {local_name(key): value
+                       for key, value in elem.attrib.items()},
+            'label': {},
+            'hint': {},
+            'items': [],
+            'list_name': None,
+        }
+        for child in elem:
+            child_name = local_name(child.tag)
+            if child_name in ('label', 'hint'):
+                control[child_name] = self._get_text_by_language(child)
+            elif child_name == 'item':
+                item = {'name': '', 'label': {}}
+                for part in child:
+                    part_name = local_name(part.tag)
+                    if part_name == 'value':
+                        item['name'] = (part.text or '').strip()
+                    elif part_name == 'label':
+                        item['label'] = self._get_text_by_language(part)
+                control['items'].append(item)
+            elif child_name == 'itemset':
+                match = INSTANCE_REGEX.search(child.get('nodeset', ''))
+                if match:
+                    control['list_name'] = match.group(1)
+        query = control['attrib'].get('query', '')
+        match = INSTANCE_REGEX.search(query)
+        if match:
+            control['list_name'] = match.group(1)
+            control['external'] = True
+        ref = control['attrib'].get('ref') or control['attrib'].get('nodeset')
+        self._controls[ref] = control
+
+    def _get_text_by_language(self, elem: ElementTree.Element) \
+            -> Dict[str, str]:
+        """Get a label or hint, by language.
+
+        The text is looked up in the itext translations if the element
+        refers to them. Otherwise, it is the inline text, as the
+        default language.
+        """
+        match = ITEXT_REGEX.search(elem.get('ref', ''))
+        if match:
+            text_id = match.group(1)
+            return {
+                language: self._itext[(language, text_id)]
+                for language in self._languages
+                if (language, text_id) in self._itext
+            }
+        return {self.DEFAULT_LANGUAGE: self._get_text(elem)}
+
+    @staticmethod
+    def _get_text(elem: ElementTree.Element) -> str:
+        """Get the text of an element, with <output> as ${name}."""
+        parts = [elem.text or '']
+        for child in elem:
+            if local_name(child.tag) == 'output':
+                value = child.get('value', '').strip()
+                parts.append('${' + value.rsplit('/', maxsplit=1)[-1] + '}')
+            parts.append(child.tail or '')
+        return ''.join(parts).strip()
+
+    def _get_languages(self, used: set) -> List[str]:
+        """Get the used languages, default first, in itext order."""
+        columns = []
+        for language in (self.DEFAULT_LANGUAGE, *self._languages):
+            if language in used and language not in columns:
+                columns.append(language)
+        return columns
+
+    @staticmethod
+    def _column_header(kind: str, language: str) -> str:
+        """Get a column header for a label or hint in a language."""
+        if language == XFormWorkbook.DEFAULT_LANGUAGE:
+            return kind
+        return f'{kind}::{language}'
+
+    def _get_row_type(self, path: str, has_children: bool,
+                      is_repeat: bool) -> str:
+        """Get the XlsForm type for a node of the primary instance."""
+        if has_children:
+            return 'begin repeat' if is_repeat else 'begin group'
+        bind = self._binds.get(path, {})
+        bind_type = bind.get('type', 'string').rsplit(':', maxsplit=1)[-1]
+        control = self._controls.get(path)
+        if control is None:
+            preload = self._get_bind_value(bind, 'preload')
+            params = self._get_bind_value(bind, 'preloadParams')
+            if (preload, params) in PRELOAD_TYPES:
+                return PRELOAD_TYPES[(preload, params)]
+            if bind.get('calculate'):
+                return 'calculate'
+            if bind_type == 'string':
+                return 'hidden'
+            return f'hidden {BIND_TYPES.get(bind_type, bind_type)}'
+        tag = control['tag']
+        list_name = control['list_name'] or path.rsplit('/', maxsplit=1)[-1]
+        if tag == 'select1':
+            return f'select_one {list_name}'
+        elif tag == 'select':
+            return f'select_multiple {list_name}'
+        elif tag == 'rank':
+            return f'rank {list_name}'
+        elif tag == 'input' and control.get('external'):
+            return f'select_one_external {list_name}'
+        elif tag == 'range':
+            return 'range'
+        elif tag == 'trigger':
+            return 'acknowledge'
+        elif tag == 'upload':
+            media = control['attrib'].get('mediatype', '')
+            return MEDIA_TYPES.get(media.split('/')[0], 'file')
+        elif bind_type == 'string' and \
+                TRUE_REGEX.fullmatch(bind.get('readonly', '')):
+            return 'note'
+        return BIND_TYPES.get(bind_type, bind_type)
+
+    @staticmethod
+    def _get_bind_value(bind: Dict[str, str], name: str) -> str:
+        """Get a bind attribute, ignoring its namespace."""
+        for key, value in bind.items():
+            if local_name(key) == name:
+                return value
+        return ''
+
+    def _build_survey(self) -> TableSheet:
+        """Build the survey sheet from the primary instance."""
+        rows = []
+        used_labels = set()
+        used_hints = set()
+        open_containers = []
+        skip_prefix = None
+        for path, depth, is_repeat, has_children in self._nodes:
+            if skip_prefix and path.startswith(skip_prefix):
+                continue
+            if depth == 1 and path.endswith('/meta') and has_children:
+                skip_prefix = path + '/'
+                continue
+            while open_containers and open_containers[-1][1] >= depth:
+                _, _, end_type = open_containers.pop()
+                rows.append({'type': end_type})
+            row_type = self._get_row_type(path, has_children, is_repeat)
+            bind = self._binds.get(path, {})
+            source = (self._groups if has_children else
+                      self._controls).get(path, {})
+            appearance = source.get('appearance', '')
+            if not appearance:
+                appearance = source.get('attrib', {}).get('appearance', '')
+            row = {
+                'type': row_type,
+                'name': path.rsplit('/', maxsplit=1)[-1],
+                'label': source.get('label', {}),
+                'hint': source.get('hint', {}),
+                'required': 'yes' if TRUE_REGEX.fullmatch(
+                    bind.get('required', '')) else '',
+                'relevant': bind.get('relevant', ''),
+                'constraint': bind.get('constraint', ''),
+                'calculation': bind.get('calculate', ''),
+                'appearance': appearance,
+            }
+            used_labels.update(row['label'])
+            used_hints.update(row['hint'])
+            rows.append(row)
+            if has_children:
+                end_type = 'end repeat' if is_repeat else 'end group'
+                open_containers.append((path, depth, end_type))
+        while open_containers:
+            rows.append({'type': open_containers.pop()[2]})
+        label_languages = self._get_languages(used_labels)
+        hint_languages = self._get_languages(used_hints)
+        header = [
+            *SURVEY_COLUMNS,
+            *(self._column_header('label', i) for i in label_languages),
+            *(self._column_header('hint', i) for i in hint_languages),
+            *EXTRA_SURVEY_COLUMNS,
+        ]
+        text_rows = [header]
+        for row in rows:
+            text_rows.append([
+                row.get('type'),
+                row.get('name'),
+                *(row.get('label', {}).get(i) for i in label_languages),
+                *(row.get('hint', {}).get(i) for i in hint_languages),
+                *(row.get(i) for i in EXTRA_SURVEY_COLUMNS),
+            ])
+        return TableSheet.from_text_rows('survey', text_rows)
+
+    def _build_choices(self) -> TableSheet:
+        """Build the choices sheet from itemsets and inline items.
+
+        The sheet is built by column, straight from the item columns.
+        """
+        lists: List[Tuple[str, int, list, Dict[str, list], dict]] = []
+        used_labels = set()
+        for instance_id, columns in self._items.items():
+            count = self._item_counts[instance_id]
+            names = columns.pop('name', None) or [None] * count
+            text_ids = columns.pop('itextId', None)
+            labels = columns.pop('label', None)
+            if text_ids is not None:
+                labels_by_language = {}
+                for language in self._languages:
+                    column = [self._itext.get((language, text_id))
+                              for text_id in text_ids]
+                    if any(label is not None for label in column):
+                        labels_by_language[language] = column
+            else:
+                labels_by_language = {
+                    self.DEFAULT_LANGUAGE: labels or [None] * count
+                }
+            used_labels.update(labels_by_language)
+            lists.append((instance_id, count, names, labels_by_language,
+                          columns))
+        self._items.clear()
+        for path, control in self._controls.items():
+            items = control['items']
+            if items:
+                list_name = path.rsplit('/', maxsplit=1)[-1]
+                languages = {i for item in items for i in item['label']}
+                labels_by_language = {
+                    language: [item['label'].get(language) for item in items]
+                    for language in languages
+                }
+                used_labels.update(languages)
+                names = [item['name'] for item in items]
+                lists.append((list_name, len(items), names,
+                              labels_by_language, {}))
+        languages = self._get_languages(used_labels)
+        extra_keys = [key for key in self._item_keys
+                      if key not in ('name', 'label', 'itextId')]
+        list_column = ['list_name']
+        name_column = ['name']
+        label_columns = [[self._column_header('label', i)] for i in languages]
+        extra_columns = [[key] for key in extra_keys]
+        for list_name, count, names, labels_by_language, extras in lists:
+            list_column.extend([list_name] * count)
+            name_column.extend(names)
+            for language, column in zip(languages, label_columns):
+                labels = labels_by_language.get(language)
+                column.extend(labels or [None] * count)
+            for key, column in zip(extra_keys, extra_columns):
+                column.extend(extras.get(key) or [None] * count)
+        columns = [list_column, name_column, *label_columns, *extra_columns]
+        return TableSheet.from_text_columns('choices', columns)
+
+    def _build_settings(self) -> TableSheet:
+        """Build the settings sheet from the title and primary instance."""
+        settings = {
+            'form_title': self.title,
+            'form_id': self.instance_attrib.get('id', ''),
+            'version': self.instance_attrib.get('version', ''),
+        }
+        header = [key for key, value in settings.items() if value]
+        values = [settings[key] for key in header]
+        return TableSheet.from_text_rows('settings', [header, values])
+
+    def load_sheet(self, sheet_name: str) -> TableSheet:
+        """Take a rebuilt sheet.
+
+        All sheets are built on initialization. A sheet is released
+        once it is taken, so it is freed after it has been parsed. If it
+        is asked for again, the XForm is read again, into a new
+        workbook that the sheet is taken from.
+        """
+        if sheet_name in self._sheets:
+            return self._sheets.pop(sheet_name)
+        if sheet_name not in SHEET_NAMES:
+            raise KeyError(sheet_name)
+        return XFormWorkbook(self.source).load_sheet(sheet_name)
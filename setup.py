@@ -22,13 +22,16 @@ VERSION = None
 
 # What packages are required for this module to be executed?
 REQUIRED = [
-    'xlrd<=2.0.0',
+    # xlrd reads .xls only. Every .xlsx goes through the streaming reader
+    # in odk2stata.odkform.workbook, so xlrd 2, without .xlsx, is fine.
+    'xlrd>=1.2.0',
     'Jinja2>=2.10',
 ]
 
 # What packages are optional?
 EXTRAS = {
     'gui': ['wxpython'],
+    'arrow': ['pyarrow'],
 }
 
 # The rest you shouldn't have to touch too much :)
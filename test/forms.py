@@ -0,0 +1,74 @@
+"""Small ODK forms and export CSVs for the tests.
+
+Forms are written as a directory of CSV files, one per sheet, which
+OdkForm reads like an XlsForm.
+
+Module attributes:
+    SURVEY: The survey sheet of a form with a group, and a repeat
+        nested in a repeat
+    CHOICES: The choices sheet of that form
+    SETTINGS: The settings sheet of that form
+    write_csv: Write rows to a CSV file
+    write_csv_form: Write a form as a directory of CSV files
+"""
+import csv
+import os
+import os.path
+from typing import Dict, List, Sequence
+
+
+SURVEY = [
+    ['type', 'name', 'label'],
+    ['text', 'name', 'Name'],
+    ['select_one yesno', 'consent', 'Consent'],
+    ['begin group', 'info', 'Info'],
+    ['integer', 'age', 'Age'],
+    ['end group'],
+    ['begin repeat', 'hh', 'Household'],
+    ['text', 'member', 'Member'],
+    ['select_multiple color', 'colors', 'Colors'],
+    ['begin group', 'details', 'Details'],
+    ['integer', 'years', 'Years'],
+    ['end group'],
+    ['begin repeat', 'visit', 'Visit'],
+    ['date', 'visit_date', 'Visit date'],
+    ['end repeat'],
+    ['end repeat'],
+]
+CHOICES = [
+    ['list_name', 'name', 'label'],
+    ['yesno', 'yes', 'Yes'],
+    ['yesno', 'no', 'No'],
+    ['color', 'red', 'Red'],
+    ['color', 'blue', 'Blue'],
+]
+SETTINGS = [
+    ['form_title', 'form_id'],
+    ['Test form', 'testform'],
+]
+
+
+def write_csv(path: str, rows: Sequence[Sequence]) -> None:
+    """Write rows to a CSV file, as UTF-8."""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+
+def write_csv_form(path: str, sheets: Dict[str, List[Sequence]] = None) \
+        -> str:
+    """Write a form as a directory of CSV files.
+
+    Args:
+        path: The directory to write. It is made if it does not exist.
+        sheets: A dictionary of sheet name to rows. If None, this is
+            the nested form in SURVEY, CHOICES and SETTINGS.
+
+    Returns:
+        The path
+    """
+    if sheets is None:
+        sheets = {'survey': SURVEY, 'choices': CHOICES, 'settings': SETTINGS}
+    os.makedirs(path, exist_ok=True)
+    for name, rows in sheets.items():
+        write_csv(os.path.join(path, f'{name}.csv'), rows)
+    return path
@@ -0,0 +1,132 @@
+"""Tests for writing the cleaned datasets as Parquet or Arrow IPC."""
+import json
+import os
+import os.path
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from odk2stata.dofile.do_file_collection import DoFileCollection
+from odk2stata.error import DoFileError
+
+from .forms import write_csv, write_csv_form
+
+
+PRIMARY = [
+    ['SubmissionDate', 'name', 'consent', 'info-age', 'SET-OF-hh',
+     'meta-instanceID', 'KEY'],
+    ['Jan 1, 2020', 'Ann', 'yes', '30', 'x', 'uuid:1', 'uuid:1'],
+    ['Jan 2, 2020', '', 'maybe', '', 'y', 'uuid:2', 'uuid:2'],
+    ['Jan 3, 2020', 'Bob', 'no', '41', 'z', 'uuid:3', 'uuid:3'],
+]
+HOUSEHOLD = [
+    ['member', 'colors', 'details-years', 'SET-OF-visit', 'PARENT_KEY',
+     'KEY'],
+    ['A', 'red blue', '3', 'v', 'uuid:1', 'uuid:1/hh[1]'],
+    ['B', '', '', 'w', 'uuid:1', 'uuid:1/hh[2]'],
+    ['C', 'blue', '120', 'x', 'uuid:3', 'uuid:3/hh[1]'],
+]
+
+
+@unittest.skipUnless(pyarrow, 'needs pyarrow')
+class ArrowExportTest(unittest.TestCase):
+    """The datasets are written with typed and labeled columns."""
+
+    def setUp(self):
+        """Write the nested form and its export CSVs."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        form_dir = write_csv_form(os.path.join(self.temp_dir.name, 'form'))
+        self.data_dir = os.path.join(self.temp_dir.name, 'data')
+        os.mkdir(self.data_dir)
+        write_csv(os.path.join(self.data_dir, 'Test form.csv'), PRIMARY)
+        write_csv(os.path.join(self.data_dir, 'Test form_hh.csv'),
+                  HOUSEHOLD)
+        self.collection = DoFileCollection.from_file(form_dir,
+                                                     data_dir=self.data_dir)
+        self.out_dir = os.path.join(self.temp_dir.name, 'out')
+
+    def tearDown(self):
+        """Remove the form, the CSVs and the files written."""
+        self.temp_dir.cleanup()
+
+    def read_household(self, file_format: str) -> 'pyarrow.Table':
+        """Write the files, and read back the household one."""
+        paths = self.collection.write_arrow(self.data_dir, self.out_dir,
+                                            file_format)
+        extension = '.parquet' if file_format == 'parquet' else '.arrow'
+        self.assertEqual(sorted(paths), [
+            os.path.join(self.out_dir, f'Test form{extension}'),
+            os.path.join(self.out_dir, f'Test form_hh{extension}'),
+        ])
+        path = os.path.join(self.out_dir, f'Test form_hh{extension}')
+        if file_format == 'parquet':
+            return pyarrow.parquet.read_table(path)
+        with pyarrow.ipc.open_file(path) as reader:
+            return reader.read_all()
+
+    def test_types_and_values(self):
+        """Numbers, binaries and strings are typed, and empty is null."""
+        table = self.read_household('parquet')
+        schema = table.schema
+        self.assertEqual(schema.names, ['member', 'colors', 'colors_1',
+                                        'colors_2', 'years', 'visit',
+                                        'parent_key', 'key'])
+        self.assertEqual(
+            [str(schema.field(i).type) for i in ('member', 'colors_1',
+                                                 'years')],
+            # 120 does not fit in a Stata byte
+            ['string', 'bool', 'int16']
+        )
+        self.assertEqual(table.column('years').to_pylist(), [3, None, 120])
+        self.assertEqual(table.column('colors_1').to_pylist(),
+                         [True, None, False])
+        self.assertEqual(table.column('colors').to_pylist(),
+                         ['red blue', None, 'blue'])
+        metadata = schema.field('colors_2').metadata
+        self.assertEqual(metadata[b'label'], b'Colors : Blue')
+        self.assertEqual(metadata[b'value_label'], b'o2s_binary_label')
+        value_labels = json.loads(schema.metadata[b'value_labels'])
+        self.assertEqual(value_labels['o2s_binary_label'],
+                         {'labels': {'0': 'No', '1': 'Yes'}})
+
+    def test_encoded(self):
+        """An encoded select_one is a dictionary of its choice names."""
+        self.collection.write_arrow(self.data_dir, self.out_dir)
+        table = pyarrow.parquet.read_table(
+            os.path.join(self.out_dir, 'Test form.parquet'))
+        consent = table.column('consent')
+        self.assertTrue(pyarrow.types.is_dictionary(consent.type))
+        self.assertEqual(sorted(set(consent.to_pylist())),
+                         ['maybe', 'no', 'yes'])
+        value_labels = json.loads(table.schema.metadata[b'value_labels'])
+        self.assertEqual(value_labels['yesno']['labels']['1'], 'Yes')
+        self.assertEqual(value_labels['yesno']['codes']['no'], 2)
+
+    def test_ipc_and_batches(self):
+        """Arrow IPC and small batches give the same table as Parquet."""
+        expected = self.read_household('parquet')
+        self.assertTrue(self.read_household('ipc').equals(expected))
+        from odk2stata.dofile.arrow_export import ArrowExport
+        do_file = next(i for i in self.collection.do_files
+                       if i.metadata.primary_base == 'Test form_hh')
+        path = os.path.join(self.temp_dir.name, 'batched.parquet')
+        csv_path = os.path.join(self.data_dir, 'Test form_hh.csv')
+        rows = ArrowExport(do_file, csv_path, batch_rows=1).write(path)
+        self.assertEqual(rows, 3)
+        batched = pyarrow.parquet.read_table(path)
+        self.assertEqual(batched.to_pylist(), expected.to_pylist())
+        self.assertEqual(pyarrow.parquet.ParquetFile(path).num_row_groups, 3)
+
+    def test_unknown_format(self):
+        """An unknown file format is a DoFileError."""
+        with self.assertRaises(DoFileError):
+            self.collection.write_arrow(self.data_dir, self.out_dir, 'xlsx')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+"""Tests for the cache of parsed forms."""
+import os
+import os.path
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+
+from benchmarks.synthetic import write_xlsx
+from odk2stata.odkform.cache import FormCache
+
+from .forms import write_csv, write_csv_form
+
+
+SURVEY = [
+    ['type', 'name', 'label'],
+    ['text', 'first', 'First'],
+    ['select_one_from_file animals.csv', 'pet', 'Pet'],
+]
+SETTINGS = [['form_title', 'form_id'], ['Cached', 'cached']]
+ANIMALS = [['name', 'label'], ['cat', 'Cat'], ['dog', 'Dog']]
+
+
+def get_names(odkform) -> list:
+    """Get the name of each survey row."""
+    return [row.row_name for row in odkform.survey]
+
+
+def get_pets(odkform) -> list:
+    """Get the names of the choices for the "pet" question."""
+    return [str(choice.row_name)
+            for choice in odkform.get_row('pet').choice_list]
+
+
+class FormCacheTest(unittest.TestCase):
+    """Store, find and evict parsed forms."""
+
+    def setUp(self):
+        """Write an XlsForm with a choice file in its media."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = FormCache(os.path.join(self.temp_dir.name, 'cache'))
+        self.path = os.path.join(self.temp_dir.name, 'form.xlsx')
+        write_xlsx(self.path, {'survey': SURVEY, 'settings': SETTINGS})
+        media_dir = os.path.join(self.temp_dir.name, 'form-media')
+        os.mkdir(media_dir)
+        self.media_path = os.path.join(media_dir, 'animals.csv')
+        write_csv(self.media_path, ANIMALS)
+
+    def tearDown(self):
+        """Remove the form and the cache."""
+        self.temp_dir.cleanup()
+
+    def get_entries(self) -> list:
+        """Get the file names in the cache directory."""
+        return sorted(os.listdir(self.cache.cache_dir))
+
+    def test_round_trip(self):
+        """A form is stored once, and then loaded from the cache."""
+        parsed = self.cache.get_odkform(self.path)
+        self.assertEqual(len(self.get_entries()), 1)
+        key = self.cache.get_key(self.path)
+        self.assertIsNotNone(self.cache.load(key))
+        cached = self.cache.get_odkform(self.path)
+        self.assertIsNot(cached, parsed)
+        self.assertEqual(get_names(cached), get_names(parsed))
+        self.assertEqual(cached.settings.form_id, 'cached')
+        self.assertEqual(cached.path, self.path)
+        self.assertEqual(get_pets(cached), ['cat', 'dog'])
+        self.assertEqual(len(self.get_entries()), 1)
+
+    def test_miss_after_form_changes(self):
+        """A changed XlsForm has a new key, and is parsed again."""
+        key = self.cache.get_key(self.path)
+        self.cache.get_odkform(self.path)
+        survey = SURVEY + [['integer', 'second', 'Second']]
+        write_xlsx(self.path, {'survey': survey, 'settings': SETTINGS})
+        self.assertNotEqual(self.cache.get_key(self.path), key)
+        odkform = self.cache.get_odkform(self.path)
+        self.assertEqual(get_names(odkform), ['first', 'pet', 'second'])
+        self.assertEqual(len(self.get_entries()), 2)
+
+    def test_miss_after_csv_sheet_changes(self):
+        """A changed CSV of a form saved as CSV files is a cache miss."""
+        form_dir = write_csv_form(
+            os.path.join(self.temp_dir.name, 'csvform'),
+            {'survey': SURVEY, 'settings': SETTINGS, 'animals': ANIMALS}
+        )
+        key = self.cache.get_key(form_dir)
+        self.assertEqual(self.cache.get_key(form_dir + os.sep), key)
+        self.cache.get_odkform(form_dir)
+        write_csv(os.path.join(form_dir, 'animals.csv'),
+                  ANIMALS + [['fish', 'Fish']])
+        self.assertNotEqual(self.cache.get_key(form_dir), key)
+        odkform = self.cache.get_odkform(form_dir)
+        self.assertEqual(get_pets(odkform), ['cat', 'dog', 'fish'])
+
+    def test_media_read_after_load(self):
+        """A choice file in the media is read as it is, not as cached."""
+        self.cache.get_odkform(self.path)
+        write_csv(self.media_path, ANIMALS + [['fish', 'Fish']])
+        odkform = self.cache.get_odkform(self.path)
+        self.assertEqual(len(self.get_entries()), 1)
+        self.assertEqual(get_pets(odkform), ['cat', 'dog', 'fish'])
+
+    def test_options_in_key(self):
+        """Options that change the parsed form are part of the key."""
+        key = self.cache.get_key(self.path)
+        self.assertEqual(self.cache.get_key(self.path, parallel=True), key)
+        self.assertEqual(self.cache.get_key(self.path, lenient=False), key)
+        self.assertNotEqual(self.cache.get_key(self.path, lenient=True), key)
+        self.assertNotEqual(self.cache.get_key(self.path, spill_rows=10),
+                            key)
+        self.assertNotEqual(self.cache.get_key(self.path, 'other.xlsx'),
+                            key)
+
+    def test_lenient_form_not_served_strictly(self):
+        """A form parsed leniently is not served to a strict caller."""
+        survey = SURVEY + [['select_one nowhere', 'lost', 'Lost']]
+        write_xlsx(self.path, {'survey': survey, 'settings': SETTINGS})
+        odkform = self.cache.get_odkform(self.path, lenient=True)
+        self.assertEqual([i.code for i in odkform.problems],
+                         ['missing-choice-list'])
+        with self.assertRaises(KeyError):
+            self.cache.get_odkform(self.path)
+
+    def test_workbook_rejected(self):
+        """A form parsed from an open workbook is not cached."""
+        with self.assertRaises(ValueError):
+            self.cache.get_odkform(self.path, workbook=object())
+
+    def test_failed_store_leaves_no_file(self):
+        """An entry that cannot be pickled is not an error, nor a file."""
+        unpicklable = (threading.Lock(), lambda: None)
+        for odkform in unpicklable:
+            self.cache.store('key', odkform)
+        self.assertEqual(self.get_entries(), [])
+
+    def test_unreadable_entry_removed(self):
+        """An entry that cannot be unpickled is a miss, and is removed."""
+        key = self.cache.get_key(self.path)
+        os.makedirs(self.cache.cache_dir)
+        with open(self.cache.get_entry_path(key), 'wb') as file:
+            file.write(pickle.dumps('truncated')[:-2])
+        self.assertIsNone(self.cache.load(key))
+        self.assertEqual(self.get_entries(), [])
+        self.assertEqual(get_names(self.cache.get_odkform(self.path)),
+                         ['first', 'pet'])
+
+
+class FormCacheEvictionTest(unittest.TestCase):
+    """Evict entries by age and by size."""
+
+    def setUp(self):
+        """Make a cache with three entries, oldest first."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = FormCache(self.temp_dir.name, max_bytes=10 ** 6,
+                               max_age=60 * 60)
+        now = time.time()
+        for i, key in enumerate(('old', 'middle', 'new')):
+            path = self.cache.get_entry_path(key)
+            with open(path, 'wb') as file:
+                file.write(bytes(1000))
+            mtime = now - (2 - i) * 60
+            os.utime(path, (mtime, mtime))
+
+    def tearDown(self):
+        """Remove the cache."""
+        self.temp_dir.cleanup()
+
+    def get_keys(self) -> list:
+        """Get the keys of the entries in the cache."""
+        return sorted(os.path.splitext(i)[0]
+                      for i in os.listdir(self.cache.cache_dir))
+
+    def test_nothing_evicted(self):
+        """Entries that are new enough and fit are kept."""
+        self.cache.evict()
+        self.assertEqual(self.get_keys(), ['middle', 'new', 'old'])
+
+    def test_evict_by_age(self):
+        """Entries older than the age limit are removed."""
+        path = self.cache.get_entry_path('old')
+        mtime = time.time() - 2 * 60 * 60
+        os.utime(path, (mtime, mtime))
+        self.cache.evict()
+        self.assertEqual(self.get_keys(), ['middle', 'new'])
+
+    def test_evict_by_size(self):
+        """The least recently used entries go first over the size limit."""
+        self.cache.max_bytes = 2500
+        self.cache.evict()
+        self.assertEqual(self.get_keys(), ['middle', 'new'])
+        self.cache.max_bytes = 999
+        self.cache.evict()
+        self.assertEqual(self.get_keys(), [])
+
+    def test_load_marks_recently_used(self):
+        """Loading an entry keeps it over newer entries."""
+        with open(self.cache.get_entry_path('old'), 'wb') as file:
+            pickle.dump('form', file)
+        self.assertEqual(self.cache.load('old'), 'form')
+        self.cache.max_bytes = 500
+        self.cache.evict()
+        self.assertEqual(self.get_keys(), ['old'])
+
+    def test_other_files_kept(self):
+        """Only cache entries are evicted or cleared."""
+        other = os.path.join(self.temp_dir.name, 'notes.txt')
+        with open(other, 'w', encoding='utf-8') as file:
+            file.write('keep')
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.temp_dir.name), ['notes.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
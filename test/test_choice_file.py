@@ -0,0 +1,130 @@
+"""Tests for choices read from files in the form's media."""
+import os
+import os.path
+import tempfile
+import unittest
+
+from benchmarks.synthetic import write_xlsx
+from odk2stata.error import ChoiceListNotFoundError
+from odk2stata.odkform.choice_file import load_choice_file
+from odk2stata.odkform.odkform import OdkForm
+
+from .forms import SETTINGS, write_csv, write_csv_form
+
+
+SURVEY = [
+    ['type', 'name', 'label'],
+    ['select_one_from_file animals.csv', 'pet', 'Pet'],
+    ['select_multiple_from_file places.xml', 'places', 'Places'],
+    ['select_one_external city', 'city', 'City'],
+]
+ANIMALS = [['name', 'label'], ['cat', 'Cat'], ['dog', 'Dog'], ['7', 'Seven']]
+PLACES = """<?xml version="1.0"?>
+<root>
+<item><name>north</name><label>North</label></item>
+<item><name>south</name><label>South</label><region>2</region></item>
+</root>
+"""
+ITEMSETS = [
+    ['list_name', 'name', 'label', 'state'],
+    ['city', 'abc', 'Abc', 'one'],
+    ['town', 'def', 'Def', 'two'],
+    ['city', 'ghi', 'Ghi', 'two'],
+]
+
+
+def get_choices(odkform: OdkForm, name: str) -> list:
+    """Get the name and label of each choice for a question."""
+    return [(i.row_name, i.get_label('label', ''))
+            for i in odkform.get_row(name).choice_list]
+
+
+class ChoiceFileTest(unittest.TestCase):
+    """Choices come from CSV and XML files, and from itemsets.csv."""
+
+    def setUp(self):
+        """Write an XlsForm with its choice files in its media."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'form.xlsx')
+        write_xlsx(self.path, {'survey': SURVEY, 'settings': SETTINGS})
+        self.media_dir = os.path.join(self.temp_dir.name, 'form-media')
+        os.mkdir(self.media_dir)
+        self.write_media_files(self.media_dir)
+
+    def tearDown(self):
+        """Remove the form and its media."""
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def write_media_files(directory: str) -> None:
+        """Write the choice files to a directory."""
+        write_csv(os.path.join(directory, 'animals.csv'), ANIMALS)
+        write_csv(os.path.join(directory, 'itemsets.csv'), ITEMSETS)
+        with open(os.path.join(directory, 'places.xml'), 'w',
+                  encoding='utf-8') as file:
+            file.write(PLACES)
+
+    def check_form(self, odkform: OdkForm) -> None:
+        """Check the choices of each question in the form."""
+        self.assertEqual(get_choices(odkform, 'pet'),
+                         [('cat', 'Cat'), ('dog', 'Dog'), (7, 'Seven')])
+        self.assertEqual(get_choices(odkform, 'places'),
+                         [('north', 'North'), ('south', 'South')])
+        self.assertEqual(get_choices(odkform, 'city'),
+                         [('abc', 'Abc'), ('ghi', 'Ghi')])
+        pet_list = odkform.get_row('pet').choice_list
+        self.assertEqual(pet_list.name, 'animals')
+        self.assertEqual(pet_list.get_choice('dog').get_label('label', ''),
+                         'Dog')
+        places = odkform.get_row('places').choice_list
+        self.assertEqual(places.get_column_values('region'), ['', 2])
+        city_list = odkform.get_row('city').choice_list
+        self.assertEqual(city_list.get_column_values('state'), ['one', 'two'])
+
+    def test_media_dir(self):
+        """Choice files are found in the form's media directory."""
+        self.check_form(OdkForm(self.path))
+
+    def test_next_to_form(self):
+        """Choice files are found next to the form, as in a CSV form."""
+        form_dir = write_csv_form(
+            os.path.join(self.temp_dir.name, 'csvform'),
+            {'survey': SURVEY, 'settings': SETTINGS}
+        )
+        self.write_media_files(form_dir)
+        self.check_form(OdkForm(form_dir))
+
+    def test_spilled(self):
+        """Spilled choice files give the same choices."""
+        self.check_form(OdkForm(self.path, spill_rows=1))
+
+    def test_missing_file(self):
+        """A missing choice file is found out when it is needed."""
+        os.remove(os.path.join(self.media_dir, 'animals.csv'))
+        odkform = OdkForm(self.path)
+        with self.assertRaises(ChoiceListNotFoundError):
+            get_choices(odkform, 'pet')
+        os.remove(os.path.join(self.media_dir, 'itemsets.csv'))
+        with self.assertRaises(ChoiceListNotFoundError):
+            get_choices(OdkForm(self.path), 'city')
+
+    def test_form_in_memory(self):
+        """A form in memory has no media."""
+        with open(self.path, 'rb') as file:
+            odkform = OdkForm(file.read())
+        with self.assertRaises(ChoiceListNotFoundError):
+            get_choices(odkform, 'pet')
+
+    def test_load_cached(self):
+        """A choice file is parsed once, and again after it changes."""
+        path = os.path.join(self.media_dir, 'animals.csv')
+        tab = load_choice_file(path, 'animals')
+        self.assertIs(load_choice_file(path, 'animals'), tab)
+        write_csv(path, ANIMALS + [['fish', 'Fish']])
+        changed = load_choice_file(path, 'animals')
+        self.assertIsNot(changed, tab)
+        self.assertEqual(len(changed['animals']), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
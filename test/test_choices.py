@@ -0,0 +1,102 @@
+"""Tests for choice lists, stored in memory or spilled to disk."""
+import os.path
+import pickle
+import tempfile
+import unittest
+
+from odk2stata.odkform.components import MappedColumn
+from odk2stata.odkform.odkform import OdkForm
+
+from .forms import SETTINGS, write_csv_form
+
+
+SURVEY = [
+    ['type', 'name', 'label'],
+    ['select_one size', 'size', 'Size'],
+    ['select_multiple fruit', 'fruits', 'Fruits'],
+]
+CHOICES = [
+    ['list_name', 'name', 'label', 'code'],
+    ['size', 1, 'Small', ''],
+    ['size', 3, 'Large', ''],
+    ['fruit', 'apple', 'Apple', ''],
+    ['fruit', 'pear', 'Pear', 5],
+    ['fruit', 'fig', 'Fig', ''],
+    ['size', 2, 'Medium', ''],
+    ['fruit', 'apple', 'Apple again', ''],
+]
+
+
+def describe(choice_list) -> dict:
+    """Get what the do files use of a choice list."""
+    return {
+        'names': [str(i.row_name) for i in choice_list],
+        'labels': [i.get_label('label', '') for i in choice_list],
+        'flexible': [tuple(i[:2]) for i in
+                     choice_list.get_choices_flexibly_numbered('code')],
+        'all_integer': choice_list.are_choice_names_all_integer(),
+        'first_apple': (choice_list.get_choice('apple').rowx
+                        if choice_list.name == 'fruit' else None),
+    }
+
+
+class ChoiceListTest(unittest.TestCase):
+    """Choice lists are the same whether spilled or not."""
+
+    def setUp(self):
+        """Write a form whose choice lists are interleaved."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = write_csv_form(
+            os.path.join(self.temp_dir.name, 'form'),
+            {'survey': SURVEY, 'choices': CHOICES, 'settings': SETTINGS}
+        )
+
+    def tearDown(self):
+        """Remove the form."""
+        self.temp_dir.cleanup()
+
+    def get_lists(self, odkform: OdkForm) -> dict:
+        """Describe the choice list of each select question."""
+        return {name: describe(odkform.get_row(name).choice_list)
+                for name in ('size', 'fruits')}
+
+    def test_choice_lists(self):
+        """Choices keep their order, numbers and first name."""
+        lists = self.get_lists(OdkForm(self.path))
+        self.assertEqual(lists['size']['names'], ['1', '3', '2'])
+        self.assertEqual(lists['size']['flexible'],
+                         [(1, '1'), (3, '3'), (2, '2')])
+        self.assertTrue(lists['size']['all_integer'])
+        self.assertEqual(lists['fruits']['labels'],
+                         ['Apple', 'Pear', 'Fig', 'Apple again'])
+        self.assertEqual(lists['fruits']['flexible'],
+                         [(1, 'apple'), (5, 'pear'), (6, 'fig'),
+                          (7, 'apple')])
+        self.assertEqual(lists['fruits']['first_apple'], 3)
+        size = OdkForm(self.path).get_row('size').choice_list
+        strict = size.get_choices_strictly_numbered()
+        self.assertEqual([i.number for i in strict], [1, 3, 2])
+        self.assertEqual(strict[-1].choice.get_label('label', ''), 'Medium')
+        with self.assertRaises(KeyError):
+            size.get_choices_strictly_numbered('value')
+
+    def test_spilled_lists_equal(self):
+        """Spilled choice lists give the same choices as in memory."""
+        expected = self.get_lists(OdkForm(self.path))
+        spilled = OdkForm(self.path, spill_rows=1)
+        table = spilled.get_row('size').choice_list.table
+        self.assertTrue(all(isinstance(i, MappedColumn)
+                            for i in table.columns))
+        self.assertEqual(self.get_lists(spilled), expected)
+        loaded = pickle.loads(pickle.dumps(spilled))
+        self.assertEqual(self.get_lists(loaded), expected)
+
+    def test_small_tabs_not_spilled(self):
+        """A tab with fewer rows than spill_rows stays in memory."""
+        odkform = OdkForm(self.path, spill_rows=len(CHOICES))
+        table = odkform.get_row('size').choice_list.table
+        self.assertTrue(all(isinstance(i, list) for i in table.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Tests for the column store of worksheet rows."""
+import pickle
+import sys
+import unittest
+
+from odk2stata.odkform.components import (
+    MappedColumn, RowDict, SheetTable
+)
+from odk2stata.error import LabelNotFoundError
+
+
+HEADER = ['type', 'name', 'label::English', 'label::French', 'hint']
+ROWS = [
+    ['text', 'first', 'First', 'Premier', ''],
+    ['integer', 'age', 'Age', '', 'In years'],
+    ['decimal', 'weight', 2.5, 'Poids', ''],
+]
+
+
+def make_table(**kwargs) -> SheetTable:
+    """Make a table of ROWS, from sheet rows 1, 3 and 4."""
+    table = SheetTable(HEADER, **kwargs)
+    for rowx, row in zip((1, 3, 4), ROWS):
+        table.append(rowx, row)
+    return table
+
+
+class SheetTableTest(unittest.TestCase):
+    """Add rows to a SheetTable and look values up."""
+
+    def test_append(self):
+        """Rows are stored by column, padded and cut to the header."""
+        table = SheetTable(HEADER)
+        self.assertEqual(table.append(1, ['text', 'first']), 0)
+        self.assertEqual(table.append(2, ROWS[1] + ['extra']), 1)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(list(table.rowxs), [1, 2])
+        self.assertEqual(table.get_row_values(0),
+                         ['text', 'first', '', '', ''])
+        self.assertEqual(table.get_row_values(1), ROWS[1])
+        self.assertEqual(table.get_column('name'), ['first', 'age'])
+        with self.assertRaises(KeyError):
+            table.get_column('choice_filter')
+
+    def test_extend(self):
+        """Kept rows of a block of columns are the same as appended rows."""
+        columns = [list(i) for i in zip(*ROWS)]
+        table = SheetTable(HEADER)
+        table.extend(1, columns, [0, 2])
+        expected = SheetTable(HEADER)
+        expected.append(1, ROWS[0])
+        expected.append(3, ROWS[2])
+        self.assertEqual(table.columns, expected.columns)
+        self.assertEqual(list(table.rowxs), [1, 3])
+
+    def test_interning(self):
+        """Text in interned columns is interned, other values are kept."""
+        interned_hint = sys.intern('In years')
+        name = ''.join(['fi', 'rst'])
+        hint = ''.join(['In ', 'years'])
+        table = SheetTable(HEADER, intern_columns=['name', 'nowhere'])
+        table.append(1, ['text', name, 'First', '', hint])
+        self.assertIs(table.get_value(0, 'name'), 'first')
+        self.assertIs(table.get_value(0, 'hint'), hint)
+        self.assertIsNot(table.get_value(0, 'hint'), interned_hint)
+        table = SheetTable(HEADER, intern_strings=True)
+        table.extend(1, [['text'], [name], [2.5], [''], [hint]], [0])
+        self.assertIs(table.get_value(0, 'name'), 'first')
+        self.assertIs(table.get_value(0, 'hint'), interned_hint)
+        self.assertEqual(table.get_value(0, 'label::English'), 2.5)
+
+    def test_get_value(self):
+        """Values are found by header, or the default is returned."""
+        table = make_table()
+        self.assertEqual(table.get_value(1, 'hint'), 'In years')
+        self.assertIsNone(table.get_value(1, 'required'))
+        self.assertEqual(table.get_value(1, 'required', 'no'), 'no')
+        row_dict = RowDict(table, 2)
+        self.assertEqual(dict(row_dict), dict(zip(HEADER, ROWS[2])))
+        self.assertIn('hint', row_dict)
+        self.assertNotIn('required', row_dict)
+
+    def test_repeated_header(self):
+        """The last of a repeated header is used."""
+        table = SheetTable(['name', 'label', 'name'])
+        table.append(1, ['first', 'First', 'second'])
+        self.assertEqual(table.get_value(0, 'name'), 'second')
+        self.assertEqual(len(RowDict(table, 0)), 2)
+
+    def test_get_label(self):
+        """Labels fall back from the extra label, and are memoized."""
+        table = make_table()
+        self.assertEqual(table.get_label(0, 'label::French', 'hint'),
+                         'Premier')
+        self.assertEqual(table.get_label(1, 'label::English', 'hint'),
+                         'In years')
+        self.assertEqual(table.get_label(2, SheetTable.FIRST_LABEL, ''),
+                         '2.5')
+        self.assertEqual(table.get_label_colx(SheetTable.FIRST_LABEL), 2)
+        self.assertIsNone(table.get_label_colx('label::Spanish'))
+        with self.assertRaises(LabelNotFoundError):
+            table.get_label(0, 'label::Spanish', '')
+        table.columns[3][0] = 'Changed'
+        self.assertEqual(table.get_label(0, 'label::French', 'hint'),
+                         'Premier')
+
+    def test_spill(self):
+        """Spilled columns give back the same values."""
+        table = make_table()
+        table.columns[1][0] = None
+        expected = [list(i) for i in table.columns]
+        table.spill()
+        self.assertTrue(all(isinstance(i, MappedColumn)
+                            for i in table.columns))
+        self.assertEqual([list(i) for i in table.columns], expected)
+        self.assertEqual([type(i) for i in table.columns[2]],
+                         [str, str, float])
+        self.assertEqual(table.columns[4][-2:], ['In years', ''])
+        self.assertEqual(table.get_label(2, 'label::French', ''), 'Poids')
+
+    def test_pickle(self):
+        """A pickled table has the same rows, spilled or not."""
+        for spill in (False, True):
+            table = make_table(intern_strings=True)
+            table.get_label(0, SheetTable.FIRST_LABEL, '')
+            if spill:
+                table.spill()
+            loaded = pickle.loads(pickle.dumps(table))
+            self.assertEqual(loaded.header, table.header)
+            self.assertEqual(list(loaded.rowxs), [1, 3, 4])
+            self.assertEqual([list(i) for i in loaded.columns],
+                             [list(i) for i in table.columns])
+            self.assertEqual(type(loaded.columns[0]), type(table.columns[0]))
+            self.assertEqual(loaded.get_label(0, SheetTable.FIRST_LABEL, ''),
+                             'First')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Tests for rewriting an export CSV before Stata imports it."""
+import configparser
+import csv
+import os
+import os.path
+import tempfile
+import unittest
+import zipfile
+
+from odk2stata.dataset.export_files import ZipMember
+from odk2stata.dofile.csv_transform import CsvTransform
+from odk2stata.dofile.do_file_collection import DoFileCollection
+from odk2stata.dofile.settings import SettingsManager
+
+from .forms import CHOICES, SETTINGS, write_csv_form
+
+
+SURVEY = [
+    ['type', 'name', 'label'],
+    ['note', 'intro', 'Hello'],
+    ['select_one yesno', 'consent', 'Consent'],
+    ['text', 'name', 'Name'],
+    ['integer', 'age', 'Age'],
+]
+# The export has name before consent, and a short last row
+EXPORT = [
+    ['SubmissionDate', 'intro', 'name', 'consent', 'age', 'meta-instanceID',
+     'KEY'],
+    ['Jan 1, 2020', '', 'Zoë', 'yes', '30', 'uuid:1', 'uuid:1'],
+    ['Jan 2, 2020', '', '', 'maybe', '', 'uuid:2', 'uuid:2'],
+    ['Jan 3, 2020', '', 'Bob, "B"\nJr.', 'no', '41', 'uuid:3', 'uuid:3'],
+    ['Jan 4, 2020', '', 'Cy', 'maybe', '4'],
+]
+
+
+def read_csv(path: str) -> list:
+    """Read the rows of a CSV, in UTF-8."""
+    with open(path, encoding='utf-8', newline='') as file:
+        return list(csv.reader(file))
+
+
+class CsvTransformTest(unittest.TestCase):
+    """Columns are dropped, encoded and reordered as the do file would."""
+
+    def setUp(self):
+        """Write the form, its export CSV, and the default settings."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.form_dir = write_csv_form(
+            os.path.join(self.temp_dir.name, 'form'),
+            {'survey': SURVEY, 'choices': CHOICES, 'settings': SETTINGS}
+        )
+        self.data_dir = os.path.join(self.temp_dir.name, 'data')
+        os.mkdir(self.data_dir)
+        self.csv_path = os.path.join(self.data_dir, 'Test form.csv')
+        # Export tools write a byte order mark
+        with open(self.csv_path, 'w', encoding='utf-8-sig',
+                  newline='') as file:
+            csv.writer(file).writerows(EXPORT)
+        self.settings_path = os.path.join(self.temp_dir.name, 'settings.ini')
+        SettingsManager().generate_default_ini(self.settings_path)
+        self.out_dir = os.path.join(self.temp_dir.name, 'out')
+
+    def tearDown(self):
+        """Remove the form, the CSVs and the settings."""
+        self.temp_dir.cleanup()
+
+    def edit_settings(self, changes: dict) -> None:
+        """Change the settings file, by section and key."""
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(self.settings_path, encoding='utf-8')
+        config.read_dict(changes)
+        with open(self.settings_path, 'w', encoding='utf-8') as file:
+            config.write(file)
+
+    def get_collection(self) -> DoFileCollection:
+        """Get the do files, with the export CSV reconciled."""
+        return DoFileCollection.from_file(
+            self.form_dir, settings_path=self.settings_path,
+            data_dir=self.data_dir
+        )
+
+    def transform(self) -> list:
+        """Rewrite the export CSV, and read back the rows written."""
+        collection = self.get_collection()
+        paths = collection.write_csv(self.data_dir, self.out_dir)
+        self.assertEqual(paths, [os.path.join(self.out_dir,
+                                              'Test form_encoded.csv')])
+        return read_csv(paths[0])
+
+    def test_rewritten(self):
+        """Notes are dropped, select ones numbered, and columns ordered."""
+        self.assertEqual(self.transform(), [
+            ['submissiondate', 'consent', 'name', 'age', 'metainstanceid',
+             'key'],
+            ['Jan 1, 2020', '1', 'Zoë', '30', 'uuid:1', 'uuid:1'],
+            ['Jan 2, 2020', '3', '', '', 'uuid:2', 'uuid:2'],
+            ['Jan 3, 2020', '2', 'Bob, "B"\nJr.', '41', 'uuid:3', 'uuid:3'],
+            ['Jan 4, 2020', '3', 'Cy', '4', '', ''],
+        ])
+
+    def test_encoding(self):
+        """The rewritten CSV is UTF-8 without a byte order mark."""
+        self.transform()
+        path = os.path.join(self.out_dir, 'Test form_encoded.csv')
+        with open(path, 'rb') as file:
+            data = file.read()
+        self.assertTrue(data.startswith(b'submissiondate,'))
+        self.assertIn('Zoë'.encode(), data)
+
+    def test_value_labels(self):
+        """Values not in the choice list are added to the value label."""
+        collection = self.get_collection()
+        do_file = collection.do_files[0]
+        transform = CsvTransform(do_file, self.csv_path)
+        transform.write(os.path.join(self.temp_dir.name, 'out.csv'))
+        self.assertEqual(transform.value_labels,
+                         {'yesno': {1: 'Yes', 2: 'No', 3: 'maybe'}})
+        self.assertEqual(transform.get_added_labels(), {'yesno': {3: 'maybe'}})
+
+    def test_do_file(self):
+        """The do file imports the rewritten CSV, and labels values."""
+        collection = self.get_collection()
+        rendered = collection.render()
+        self.assertIn('drop intro', rendered)
+        self.assertIn('encode consent', rendered)
+        collection.write_csv(self.data_dir, self.out_dir)
+        rendered = collection.render()
+        self.assertIn('import delimited "Test form_encoded.csv"', rendered)
+        self.assertNotIn('drop intro', rendered)
+        self.assertNotIn('encode consent', rendered)
+        self.assertIn('label values consent yesno', rendered)
+        self.assertIn('label define yesno 3 "maybe", add', rendered)
+
+    def test_pruned_by_settings(self):
+        """Columns dropped by name are pruned, and encoding can be skipped."""
+        self.edit_settings({
+            'drop_column': {'odk_names_to_drop': 'age'},
+            'encode_select_one': {'skip': 'true'},
+        })
+        rows = self.transform()
+        self.assertEqual(rows[0], ['submissiondate', 'consent', 'name',
+                                   'metainstanceid', 'key'])
+        self.assertEqual(rows[1], ['Jan 1, 2020', 'yes', 'Zoë', 'uuid:1',
+                                   'uuid:1'])
+
+    def test_blocks_and_zip(self):
+        """Small blocks and a CSV in a zip file give the same CSV."""
+        expected = self.transform()
+        do_file = self.get_collection().do_files[0]
+        archive = os.path.join(self.temp_dir.name, 'export.zip')
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.write(self.csv_path, 'export/Test form.csv')
+        for csv_path, block_rows in (
+                (self.csv_path, 1),
+                (ZipMember(archive, 'export/Test form.csv'), None)):
+            path = os.path.join(self.temp_dir.name, 'rewritten.csv')
+            transform = CsvTransform(do_file, csv_path, block_rows)
+            self.assertEqual(transform.write(path), 4)
+            self.assertEqual(read_csv(path), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
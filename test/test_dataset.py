@@ -0,0 +1,201 @@
+"""Tests for the tree of datasets of a form with nested repeats."""
+import os.path
+import tempfile
+import unittest
+
+from odk2stata.dataset.dataset_collection import DatasetCollection
+from odk2stata.dataset.utils import DatasetSource, get_column_separator
+from odk2stata.odkform.odkform import OdkForm
+from odk2stata.odkform.survey import AncestorPath
+
+from .forms import write_csv_form
+
+
+def get_names(columns) -> list:
+    """Get the names of some columns."""
+    return [column.column_name for column in columns]
+
+
+class DatasetTreeTest(unittest.TestCase):
+    """A repeat nested in a repeat is a dataset nested in a dataset."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Read the nested form."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cls.odkform = OdkForm(write_csv_form(
+                os.path.join(temp_dir, 'form')))
+
+    def setUp(self):
+        """Make the datasets, as from Briefcase."""
+        self.collection = DatasetCollection(self.odkform,
+                                            DatasetSource.BRIEFCASE)
+
+    def test_tree(self):
+        """Each dataset links to its parent and children."""
+        visit, hh, primary = self.collection.get_datasets()
+        self.assertIs(self.collection.primary, primary)
+        self.assertEqual([i.dataset_filename for i in (primary, hh, visit)],
+                         ['Test form.csv', 'Test form_hh.csv',
+                          'Test form_visit.csv'])
+        self.assertIsNone(primary.parent)
+        self.assertEqual(primary.children, [hh])
+        self.assertIs(hh.parent, primary)
+        self.assertEqual(hh.children, [visit])
+        self.assertIs(visit.parent, hh)
+        self.assertEqual(visit.children, [])
+        self.assertEqual([i.get_depth() for i in (primary, hh, visit)],
+                         [0, 1, 2])
+        self.assertEqual([i.is_repeat_dataset() for i in (primary, visit)],
+                         [False, True])
+        self.assertEqual(self.collection.get_repeat_datasets(), [visit, hh])
+        self.assertFalse(self.collection.can_merge_single_repeat())
+
+    def test_begin_repeat_columns(self):
+        """A repeat dataset begins at a column of its parent."""
+        visit, hh, primary = self.collection.get_datasets()
+        self.assertIs(primary[-1].repeat_dataset, hh)
+        self.assertIs(hh.begin_repeat, primary[-1])
+        self.assertIs(hh[-1].repeat_dataset, visit)
+        self.assertIs(visit.begin_repeat.survey_row,
+                      self.odkform.get_row('visit'))
+        self.assertEqual(get_names(primary),
+                         ['SubmissionDate', 'name', 'consent', 'info-age',
+                          'SET-OF-hh'])
+        self.assertEqual(get_names(hh), ['member', 'colors',
+                                         'details-years', 'SET-OF-visit'])
+        self.assertEqual(get_names(visit), ['visit_date'])
+
+    def test_column_orders(self):
+        """Columns are kept in the form's order and in appended order."""
+        inserted = get_names(self.collection.inserted_columns)
+        self.assertEqual(inserted, [
+            'SubmissionDate', 'name', 'consent', 'info-age', 'SET-OF-hh',
+            'member', 'colors', 'details-years', 'SET-OF-visit',
+            'visit_date',
+        ])
+        appended = get_names(self.collection.appended_columns)
+        self.assertEqual(appended, inserted)
+        self.assertEqual(
+            get_names(self.collection.appended_columns),
+            get_names(self.collection.primary.appended_iter())
+        )
+
+    def test_sibling_repeats(self):
+        """Sibling repeats are children in order, before their parent."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            odkform = OdkForm(write_csv_form(
+                os.path.join(temp_dir, 'form'), {'survey': [
+                    ['type', 'name', 'label'],
+                    ['begin repeat', 'a', 'A'],
+                    ['text', 'x', 'X'],
+                    ['begin repeat', 'b', 'B'],
+                    ['text', 'y', 'Y'],
+                    ['end repeat'],
+                    ['end repeat'],
+                    ['begin repeat', 'c', 'C'],
+                    ['text', 'z', 'Z'],
+                    ['end repeat'],
+                    ['text', 'last', 'Last'],
+                ]}
+            ))
+        collection = DatasetCollection(odkform, DatasetSource.BRIEFCASE)
+        filenames = [i.dataset_filename for i in collection.get_datasets()]
+        self.assertEqual(filenames, ['form_b.csv', 'form_a.csv',
+                                     'form_c.csv', 'form.csv'])
+        primary = collection.primary
+        self.assertEqual([i.dataset_filename for i in primary.children],
+                         ['form_a.csv', 'form_c.csv'])
+        self.assertEqual(get_names(collection.inserted_columns), [
+            'SubmissionDate', 'SET-OF-a', 'x', 'SET-OF-b', 'y', 'SET-OF-c',
+            'z', 'last',
+        ])
+        self.assertEqual(get_names(collection.appended_columns), [
+            'SubmissionDate', 'SET-OF-a', 'SET-OF-c', 'last', 'x',
+            'SET-OF-b', 'y', 'z',
+        ])
+
+
+class ColumnNameTest(unittest.TestCase):
+    """Column names are prefixed by the groups inside their dataset."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Read the nested form, with a group nested in a group."""
+        survey = [
+            ['type', 'name', 'label'],
+            ['begin group', 'outer', 'Outer'],
+            ['begin group', 'inner', 'Inner'],
+            ['text', 'deep', 'Deep'],
+            ['geopoint', 'where', 'Where'],
+            ['end group'],
+            ['begin repeat', 'rep', 'Repeat'],
+            ['begin group', 'g', 'G'],
+            ['integer', 'n', 'N'],
+            ['end group'],
+            ['end repeat'],
+            ['end group'],
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cls.odkform = OdkForm(write_csv_form(
+                os.path.join(temp_dir, 'form'), {'survey': survey}))
+
+    def get_columns(self, dataset_source: DatasetSource) -> list:
+        """Get the column names of each dataset, primary first."""
+        collection = DatasetCollection(self.odkform, dataset_source)
+        return [get_names(i) for i in reversed(collection.get_datasets())]
+
+    def test_briefcase(self):
+        """Briefcase joins the group names with "-"."""
+        self.assertEqual(self.get_columns(DatasetSource.BRIEFCASE), [
+            ['SubmissionDate', 'outer-inner-deep',
+             'outer-inner-where-Latitude', 'outer-inner-where-Longitude',
+             'outer-inner-where-Altitude', 'outer-inner-where-Accuracy',
+             'SET-OF-outer-rep'],
+            ['g-n'],
+        ])
+
+    def test_aggregate(self):
+        """Aggregate joins the group names with ":"."""
+        self.assertEqual(self.get_columns(DatasetSource.AGGREGATE), [
+            ['outer:inner:deep', 'outer:inner:where-Latitude',
+             'outer:inner:where-Longitude', 'outer:inner:where-Altitude',
+             'outer:inner:where-Accuracy', 'SET-OF-outer:rep'],
+            ['g:n'],
+        ])
+
+    def test_no_groups(self):
+        """Without groups, a column name is the row name."""
+        self.assertEqual(self.get_columns(DatasetSource.NO_GROUPS), [
+            ['deep', 'where-Latitude', 'where-Longitude', 'where-Altitude',
+             'where-Accuracy', 'SET-OF-rep'],
+            ['n'],
+        ])
+
+    def test_shared_prefix(self):
+        """Rows under the same groups share the memoized prefix."""
+        deep = self.odkform.get_row('deep')
+        where = self.odkform.get_row('where')
+        self.assertIs(deep.ancestor_path, where.ancestor_path)
+        self.get_columns(DatasetSource.BRIEFCASE)
+        self.assertEqual(deep.ancestor_path.prefixes[0, '-'],
+                         'outer-inner-')
+        path = self.odkform.get_row('n').ancestor_path
+        self.assertEqual((path.names, path.repeat_start),
+                         (('outer', 'rep', 'g'), 2))
+
+    def test_get_prefix(self):
+        """A prefix starts at an ancestor, with a separator after each."""
+        path = AncestorPath().child('a', False).child('b', True)
+        self.assertEqual(path.get_prefix(0, '-'), 'a-b-')
+        self.assertEqual(path.get_prefix(1, ':'), 'b:')
+        self.assertEqual(path.get_prefix(2, '-'), '')
+        self.assertEqual(path.get_prefix(0, None), '')
+        self.assertEqual([get_column_separator(i) for i in DatasetSource],
+                         ['-', ':', None])
+        with self.assertRaises(ValueError):
+            get_column_separator('briefcase')
+
+
+if __name__ == '__main__':
+    unittest.main()
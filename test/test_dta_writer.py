@@ -0,0 +1,205 @@
+"""Tests for the .dta writer, reading the written datasets back."""
+import datetime
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from odk2stata.dofile import dta_writer
+from odk2stata.dofile.dta_writer import DtaVariable, DtaWriter, NUMERIC_TYPES
+
+
+TIMESTAMP = datetime.datetime(2020, 1, 2, 3, 4)
+
+
+def _read_fixed(data: bytes, start: int, size: int) -> str:
+    """Read a null-padded text field."""
+    return data[start:start + size].split(b'\x00', 1)[0].decode()
+
+
+def _section(data: bytes, dta_map: tuple, index: int, tag: bytes) -> int:
+    """Get the start of the contents of a section, found with the map."""
+    start = dta_map[index]
+    assert data[start:start + len(tag) + 2] == b'<' + tag + b'>'
+    return start + len(tag) + 2
+
+
+def _read_value_labels(data: bytes, start: int) -> dict:
+    """Read the value label tables, starting at the first <lbl>."""
+    result = {}
+    while data.startswith(b'<lbl>', start):
+        start += len(b'<lbl>')
+        length, = struct.unpack_from('<i', data, start)
+        name = _read_fixed(data, start + 4, 129)
+        table = start + 4 + 129 + 3
+        count, text_length = struct.unpack_from('<2i', data, table)
+        offsets = struct.unpack_from(f'<{count}i', data, table + 8)
+        values = struct.unpack_from(f'<{count}i', data,
+                                    table + 8 + 4 * count)
+        texts = table + 8 + 8 * count
+        result[name] = {value: _read_fixed(data, texts + offset,
+                                           text_length - offset)
+                        for value, offset in zip(values, offsets)}
+        start += 4 + 129 + 3 + length + len(b'</lbl>')
+    return result
+
+
+def _read_dta(path: str) -> dict:
+    """Read back what a DtaWriter wrote, without Stata.
+
+    Returns:
+        A dictionary with the release, the variable names, types and
+        value label names, the rows with strLs resolved, and the value
+        labels
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    assert data.startswith(b'<stata_dta><header><release>')
+    assert data.endswith(b'</stata_dta>')
+    release = int(data[28:31])
+    count_format = '<H' if release == 118 else '<I'
+    k_start = data.index(b'<K>') + 3
+    variable_count, = struct.unpack_from(count_format, data, k_start)
+    row_count, = struct.unpack_from('<Q', data, data.index(b'<N>') + 3)
+    dta_map = struct.unpack_from('<14Q', data, data.index(b'<map>') + 5)
+    start = _section(data, dta_map, 2, b'variable_types')
+    type_codes = struct.unpack_from(f'<{variable_count}H', data, start)
+    start = _section(data, dta_map, 3, b'varnames')
+    names = [_read_fixed(data, start + 129 * i, 129)
+             for i in range(variable_count)]
+    start = _section(data, dta_map, 6, b'value_label_names')
+    value_label_names = [_read_fixed(data, start + 129 * i, 129)
+                         for i in range(variable_count)]
+    start = _section(data, dta_map, 10, b'strls')
+    strls = {}
+    while data.startswith(b'GSO', start):
+        variable, observation, _, length = struct.unpack_from(
+            '<IQBI', data, start + 3)
+        start += 3 + struct.calcsize('<IQBI')
+        strls[variable, observation] = data[start:start + length - 1]
+        start += length
+    fields = []
+    for code in type_codes:
+        numeric = [i for i in NUMERIC_TYPES.values() if i[0] == code]
+        if numeric:
+            fields.append(numeric[0][1])
+        elif code == dta_writer.STRL_CODE:
+            fields.append('Q')
+        else:
+            fields.append(f'{code}s')
+    record = struct.Struct('<' + ''.join(fields))
+    start = _section(data, dta_map, 9, b'data')
+    rows = []
+    for _ in range(row_count):
+        row = list(record.unpack_from(data, start))
+        start += record.size
+        for i, code in enumerate(type_codes):
+            if code == dta_writer.STRL_CODE:
+                shift = 16 if release == 118 else 24
+                key = (row[i] & (1 << shift) - 1, row[i] >> shift)
+                row[i] = strls[key].decode() if row[i] else ''
+            elif isinstance(row[i], bytes):
+                row[i] = row[i].split(b'\x00', 1)[0].decode()
+        rows.append(row)
+    start = _section(data, dta_map, 11, b'value_labels')
+    return {
+        'release': release,
+        'names': names,
+        'type_codes': list(type_codes),
+        'value_label_names': value_label_names,
+        'rows': rows,
+        'value_labels': _read_value_labels(data, start),
+    }
+
+
+class DtaWriterTest(unittest.TestCase):
+    """Write small datasets and read them back."""
+
+    def setUp(self):
+        """Make a directory for the datasets."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'test.dta')
+
+    def tearDown(self):
+        """Remove the datasets."""
+        self.temp_dir.cleanup()
+
+    def write(self, variables, rows, value_labels=None):
+        """Write rows to the dataset, and read it back."""
+        with DtaWriter(self.path, variables, value_labels,
+                       timestamp=TIMESTAMP) as writer:
+            for row in rows:
+                writer.write_row(list(row))
+        self.assertEqual(writer.rows, len(rows))
+        return _read_dta(self.path)
+
+    def test_round_trip(self):
+        """Numbers, strings, strLs and value labels are read back."""
+        variables = [
+            DtaVariable('id', 'long', 'The ID'),
+            DtaVariable('color', 'byte', 'Color', 'color'),
+            DtaVariable('weight', 'double'),
+            DtaVariable('name', 'str8'),
+            DtaVariable('notes', 'strL'),
+        ]
+        rows = [
+            (1, 2, 1.5, 'Anna', 'A long note ' * 200),
+            (2, 1, -0.25, 'Bé', 'Short'),
+        ]
+        labels = {'color': {1: 'Red', 2: 'Green'}}
+        result = self.write(variables, rows, labels)
+        self.assertEqual(result['release'], 118)
+        self.assertEqual(result['names'],
+                         ['id', 'color', 'weight', 'name', 'notes'])
+        self.assertEqual(result['type_codes'],
+                         [65528, 65530, 65526, 8, dta_writer.STRL_CODE])
+        self.assertEqual(result['value_label_names'],
+                         ['', 'color', '', '', ''])
+        self.assertEqual(result['rows'], [list(row) for row in rows])
+        self.assertEqual(result['value_labels'], labels)
+
+    def test_missing_values(self):
+        """None is system missing for numbers, and empty for strings."""
+        variables = [DtaVariable(f'v_{stata_type}', stata_type)
+                     for stata_type in NUMERIC_TYPES]
+        variables += [DtaVariable('text', 'str3'),
+                      DtaVariable('long_text', 'strL')]
+        result = self.write(variables, [[None] * len(variables)])
+        missing = [i[2] for i in NUMERIC_TYPES.values()]
+        self.assertEqual(result['rows'], [missing + ['', '']])
+
+    def test_value_labels_changed_until_close(self):
+        """Value labels added while rows are written are saved."""
+        labels = {'yes_no': {1: 'Yes'}}
+        variables = [DtaVariable('answer', 'byte', '', 'yes_no')]
+        with DtaWriter(self.path, variables, labels,
+                       timestamp=TIMESTAMP) as writer:
+            writer.write_row([1])
+            writer.value_labels['yes_no'][0] = 'No'
+            writer.write_row([0])
+        result = _read_dta(self.path)
+        self.assertEqual(result['rows'], [[1], [0]])
+        self.assertEqual(result['value_labels'],
+                         {'yes_no': {0: 'No', 1: 'Yes'}})
+
+    def test_format_119(self):
+        """More variables than format 118 allows switch to format 119."""
+        variables = [DtaVariable(f'v{i}', 'byte') for i in range(3)]
+        variables.append(DtaVariable('notes', 'strL'))
+        with mock.patch.object(dta_writer, 'MAX_VARIABLES_118', 3):
+            result = self.write(variables, [[1, 2, 3, 'x'], [4, 5, 6, 'y']])
+        self.assertEqual(result['release'], 119)
+        self.assertEqual(result['names'], ['v0', 'v1', 'v2', 'notes'])
+        self.assertEqual(result['rows'], [[1, 2, 3, 'x'], [4, 5, 6, 'y']])
+
+    def test_format_118_at_limit(self):
+        """Format 118 is kept up to the most variables it allows."""
+        variables = [DtaVariable(f'v{i}', 'byte') for i in range(3)]
+        with mock.patch.object(dta_writer, 'MAX_VARIABLES_118', 3):
+            result = self.write(variables, [[1, 2, 3]])
+        self.assertEqual(result['release'], 118)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Tests for finding and opening the export CSVs of a form."""
+import os
+import os.path
+import tempfile
+import unittest
+import zipfile
+
+from odk2stata.dataset.dataset_collection import DatasetCollection
+from odk2stata.dataset.export_files import (ExportFiles, ZipMember,
+                                            get_csv_filename,
+                                            get_export_filenames, open_csv)
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.error import DatasetError
+from odk2stata.odkform.odkform import OdkForm
+
+from .forms import write_csv, write_csv_form
+
+
+BRIEFCASE_NAMES = ['Test form.csv', 'Test form_hh.csv', 'Test form_visit.csv']
+CENTRAL_NAMES = ['testform.csv', 'testform-hh.csv', 'testform-visit.csv']
+
+
+class ExportFilesTest(unittest.TestCase):
+    """Export CSVs are found by their Briefcase or Central names."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Read the nested form."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            odkform = OdkForm(write_csv_form(os.path.join(temp_dir, 'form')))
+        collection = DatasetCollection(odkform, DatasetSource.BRIEFCASE)
+        cls.datasets = list(reversed(collection.get_datasets()))
+
+    def setUp(self):
+        """Make a temporary directory for the exports."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the exports."""
+        self.temp_dir.cleanup()
+
+    def write_directory(self, filenames: list, name: str = 'data') -> str:
+        """Write a directory of export CSVs, each with its name in it."""
+        data_dir = os.path.join(self.temp_dir.name, name)
+        os.makedirs(data_dir, exist_ok=True)
+        for filename in filenames:
+            write_csv(os.path.join(data_dir, filename), [[filename]])
+        return data_dir
+
+    def write_zip(self, filenames: list) -> str:
+        """Write a zip file of export CSVs in a folder, as from Central."""
+        path = os.path.join(self.temp_dir.name, 'export.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('media/photo.jpg', b'')
+            for filename in filenames:
+                archive.writestr(f'export/{filename}', f'{filename}\r\n')
+        return path
+
+    def find_all(self, path: str) -> list:
+        """Find the export CSV of each dataset, primary first."""
+        export_files = ExportFiles(path)
+        return [export_files.find(dataset) for dataset in self.datasets]
+
+    def test_export_filenames(self):
+        """Briefcase names come before Central names."""
+        self.assertEqual(
+            [get_export_filenames(dataset) for dataset in self.datasets],
+            [list(i) for i in zip(BRIEFCASE_NAMES, CENTRAL_NAMES)]
+        )
+
+    def test_directory(self):
+        """CSVs in a directory are found by either name."""
+        for tool, names in (('briefcase', BRIEFCASE_NAMES),
+                            ('central', CENTRAL_NAMES)):
+            data_dir = self.write_directory(names, tool)
+            self.assertFalse(ExportFiles(data_dir).is_zip)
+            self.assertEqual(self.find_all(data_dir),
+                             [os.path.join(data_dir, i) for i in names])
+
+    def test_briefcase_first(self):
+        """With both names, the Briefcase CSV is found."""
+        data_dir = self.write_directory(BRIEFCASE_NAMES + CENTRAL_NAMES)
+        self.assertEqual(self.find_all(data_dir),
+                         [os.path.join(data_dir, i) for i in BRIEFCASE_NAMES])
+        path = self.write_zip(CENTRAL_NAMES + BRIEFCASE_NAMES)
+        self.assertEqual(self.find_all(path),
+                         [ZipMember(path, f'export/{i}')
+                          for i in BRIEFCASE_NAMES])
+
+    def test_zip_file(self):
+        """CSVs in a zip file are found by either name, in a folder."""
+        for names in (BRIEFCASE_NAMES, CENTRAL_NAMES):
+            path = self.write_zip(names)
+            self.assertTrue(ExportFiles(path).is_zip)
+            found = self.find_all(path)
+            self.assertEqual(found, [ZipMember(path, f'export/{i}')
+                                     for i in names])
+            self.assertEqual([get_csv_filename(i) for i in found], names)
+            self.assertEqual(str(found[0]), f'{path}/export/{names[0]}')
+
+    def test_not_found(self):
+        """A CSV that is not there is not found."""
+        data_dir = self.write_directory(CENTRAL_NAMES[:1])
+        self.assertEqual(self.find_all(data_dir),
+                         [os.path.join(data_dir, CENTRAL_NAMES[0]), None,
+                          None])
+        path = self.write_zip(BRIEFCASE_NAMES[1:])
+        self.assertIsNone(self.find_all(path)[0])
+        with self.assertRaises(DatasetError):
+            ExportFiles(os.path.join(self.temp_dir.name, 'missing'))
+        with self.assertRaises(DatasetError):
+            ExportFiles(os.path.join(data_dir, CENTRAL_NAMES[0]))
+
+    def test_open_csv(self):
+        """A CSV opens as text wherever it is, and closes its zip file."""
+        data_dir = self.write_directory(BRIEFCASE_NAMES[:1])
+        with open_csv(os.path.join(data_dir, BRIEFCASE_NAMES[0])) as file:
+            self.assertEqual(file.read(), 'Test form.csv\r\n')
+        member = self.find_all(self.write_zip(CENTRAL_NAMES))[1]
+        with open_csv(member) as file:
+            self.assertEqual(file.read(), 'testform-hh.csv\r\n')
+            archive = file.archive
+            self.assertIsNotNone(archive.fp)
+        self.assertIsNone(archive.fp)
+        with self.assertRaises(KeyError):
+            open_csv(ZipMember(member.archive, 'export/missing.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
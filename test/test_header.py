@@ -0,0 +1,124 @@
+"""Tests for matching predicted columns against a real header."""
+import os.path
+import tempfile
+import unittest
+
+from odk2stata.dataset.dataset_collection import DatasetCollection
+from odk2stata.dataset.header import (HeaderReconciliation,
+                                      longest_increasing_run,
+                                      read_csv_header)
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.odkform.odkform import OdkForm
+
+from .forms import write_csv, write_csv_form
+
+
+class HeaderReconciliationTest(unittest.TestCase):
+    """Missing, extra, reordered and repeated names are found."""
+
+    def test_consistent(self):
+        """The same names in the same order are consistent."""
+        reconciliation = HeaderReconciliation(['a', 'b', 'c'],
+                                              ['a', 'b', 'c', 'KEY'])
+        self.assertTrue(reconciliation.is_consistent())
+        self.assertEqual(reconciliation.column_positions, [1, 2, 3])
+        self.assertEqual(reconciliation.get_report(), [])
+
+    def test_missing_and_extra(self):
+        """Missing names have no position, and extra names are listed."""
+        reconciliation = HeaderReconciliation(
+            ['a', 'b', 'c', 'd'], ['a', 'new', 'c', 'meta-instanceID']
+        )
+        self.assertEqual(reconciliation.missing, ['b', 'd'])
+        self.assertEqual(reconciliation.extra, ['new'])
+        self.assertEqual(reconciliation.reordered, [])
+        self.assertEqual(reconciliation.column_positions, [1, None, 3, None])
+        self.assertIsNone(reconciliation.get_position(1))
+        self.assertEqual(reconciliation.get_position(2), 3)
+        self.assertFalse(reconciliation.is_consistent())
+        self.assertEqual(reconciliation.get_report(), [
+            'Missing columns (2): b, d',
+            'Extra columns (1): new',
+        ])
+
+    def test_reordered(self):
+        """The fewest columns that would have to move are reordered."""
+        reconciliation = HeaderReconciliation(['a', 'b', 'c', 'd', 'e'],
+                                              ['b', 'c', 'd', 'a', 'e'])
+        self.assertEqual(reconciliation.column_positions, [4, 1, 2, 3, 5])
+        self.assertEqual(reconciliation.reordered, ['a'])
+        self.assertEqual(reconciliation.missing, [])
+        self.assertEqual(reconciliation.extra, [])
+        self.assertEqual(reconciliation.get_report(),
+                         ['Reordered columns (1): a'])
+        swapped = HeaderReconciliation(['a', 'b'], ['b', 'a'])
+        self.assertEqual(len(swapped.reordered), 1)
+
+    def test_repeated_names(self):
+        """The occurrences of a repeated name are matched in order."""
+        reconciliation = HeaderReconciliation(['x', 'y', 'x', 'x'],
+                                              ['x', 'x', 'y'])
+        self.assertEqual(reconciliation.column_positions, [1, 3, 2, None])
+        self.assertEqual(reconciliation.missing, ['x'])
+        self.assertEqual(reconciliation.reordered, ['y'])
+        extra = HeaderReconciliation(['x'], ['x', 'KEY', 'x'])
+        self.assertEqual(extra.extra, ['x'])
+
+    def test_longest_increasing_run(self):
+        """The longest run of values in order is found."""
+        self.assertEqual(longest_increasing_run([]), set())
+        self.assertEqual(longest_increasing_run([3, 1, 2, 5, 4]),
+                         {1, 2, 4})
+        self.assertEqual(len(longest_increasing_run(range(10, 0, -1))), 1)
+
+
+class ReadHeaderTest(unittest.TestCase):
+    """Only the header of an export CSV is read."""
+
+    def setUp(self):
+        """Make a temporary directory for the export CSVs."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove the export CSVs."""
+        self.temp_dir.cleanup()
+
+    def test_read_csv_header(self):
+        """The header skips a byte order mark, and may be quoted."""
+        path = os.path.join(self.temp_dir.name, 'export.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            file.write('a,"b\nc",d\r\n1,2,3\r\n')
+        self.assertEqual(read_csv_header(path), ['a', 'b\nc', 'd'])
+        with open(path, 'w', encoding='utf-8'):
+            pass
+        self.assertEqual(read_csv_header(path), [])
+
+    def test_reconcile_headers(self):
+        """Each dataset is matched against the CSV it is found in."""
+        odkform = OdkForm(write_csv_form(
+            os.path.join(self.temp_dir.name, 'form')))
+        collection = DatasetCollection(odkform, DatasetSource.BRIEFCASE)
+        data_dir = os.path.join(self.temp_dir.name, 'data')
+        os.mkdir(data_dir)
+        write_csv(os.path.join(data_dir, 'Test form.csv'), [
+            ['SubmissionDate', 'consent', 'name', 'info-age', 'SET-OF-hh',
+             'meta-instanceID', 'KEY'],
+        ])
+        write_csv(os.path.join(data_dir, 'Test form_hh.csv'), [
+            ['member', 'colors', 'SET-OF-visit', 'nickname', 'PARENT_KEY',
+             'KEY'],
+        ])
+        result = collection.reconcile_headers(data_dir)
+        self.assertEqual(sorted(result),
+                         ['Test form.csv', 'Test form_hh.csv'])
+        primary = result['Test form.csv']
+        self.assertIs(collection.primary.header_reconciliation, primary)
+        self.assertEqual(len(primary.reordered), 1)
+        self.assertEqual(primary.column_positions, [1, 3, 2, 4, 5])
+        household = result['Test form_hh.csv']
+        self.assertEqual(household.missing, ['details-years'])
+        self.assertEqual(household.extra, ['nickname'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+"""Tests for joining a nested repeat with the datasets it is in."""
+import csv
+import os
+import os.path
+import tempfile
+import unittest
+import zipfile
+
+from odk2stata.dataset.dataset_collection import DatasetCollection
+from odk2stata.dataset.join import KeyIndex, RepeatJoin
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.error import DatasetError
+from odk2stata.odkform.odkform import OdkForm
+
+from .forms import write_csv, write_csv_form
+
+
+EXPORTS = {
+    'Test form.csv': [
+        ['SubmissionDate', 'name', 'SET-OF-hh', 'KEY'],
+        ['d1', 'Ann', 's', 'uuid:1'],
+        ['d2', 'Bob', 's', 'uuid:2'],
+        ['d3', 'Cy', 's', 'uuid:3'],
+    ],
+    'Test form_hh.csv': [
+        ['member', 'SET-OF-visit', 'PARENT_KEY', 'KEY'],
+        ['A', 's', 'uuid:1', 'uuid:1/hh[1]'],
+        ['B', 's', 'uuid:1', 'uuid:1/hh[2]'],
+        ['C', 's', 'uuid:3', 'uuid:3/hh[1]'],
+        ['Z', 's', 'uuid:9', 'uuid:9/hh[1]'],
+    ],
+    'Test form_visit.csv': [
+        ['visit_date', 'PARENT_KEY', 'KEY'],
+        ['v1', 'uuid:1/hh[1]', 'uuid:1/hh[1]/visit[1]'],
+        ['v2', 'uuid:1/hh[1]', 'uuid:1/hh[1]/visit[2]'],
+        ['v3', 'uuid:3/hh[1]', 'uuid:3/hh[1]/visit[1]'],
+        ['v4', 'uuid:8/hh[1]', 'uuid:8/hh[1]/visit[1]'],
+    ],
+}
+# Rows without repeat rows are kept once, and orphans come last
+JOINED_VISITS = [
+    ('d1', 'Ann', 's', 'uuid:1', 'A', 's', 'uuid:1', 'v1'),
+    ('d1', 'Ann', 's', 'uuid:1', 'A', 's', 'uuid:1', 'v2'),
+    ('d1', 'Ann', 's', 'uuid:1', 'B', 's', 'uuid:1', ''),
+    ('d2', 'Bob', 's', 'uuid:2', '', '', '', ''),
+    ('d3', 'Cy', 's', 'uuid:3', 'C', 's', 'uuid:3', 'v3'),
+    ('', '', '', '', 'Z', 's', 'uuid:9', ''),
+    ('', '', '', '', '', '', '', 'v4'),
+]
+
+
+class KeyIndexTest(unittest.TestCase):
+    """Rows are taken by key, from memory or from disk."""
+
+    def check(self, index: KeyIndex, spilled: bool) -> None:
+        """Add rows to an index, and take them out."""
+        with index:
+            for i in range(20):
+                index.add(f'k{i % 3}', [str(i), 'x' * i])
+            self.assertEqual(len(index), 20)
+            self.assertEqual(index.is_spilled(), spilled)
+            self.assertEqual([row[0] for row in index.take('k1')],
+                             [str(i) for i in range(1, 20, 3)])
+            self.assertEqual(index.take('k1'), [])
+            self.assertEqual(index.take('nowhere'), [])
+            rest = [int(row[0]) for row in index.take_rest()]
+            self.assertEqual(sorted(rest),
+                             [i for i in range(20) if i % 3 != 1])
+            self.assertEqual(len(index), 0)
+
+    def test_in_memory(self):
+        """A large budget keeps every row in memory."""
+        self.check(KeyIndex(), False)
+
+    def test_spilled(self):
+        """A tiny budget spills the rows to SQLite."""
+        index = KeyIndex(memory_budget=200)
+        index.add('k', ['first'])
+        self.assertFalse(index.is_spilled())
+        index.take('k')
+        self.check(index, True)
+        index = KeyIndex(memory_budget=200)
+        for i in range(10):
+            index.add('k', [str(i)])
+        self.assertTrue(index.is_spilled())
+        self.assertEqual(index.size, 0)
+        index.close()
+
+
+class RepeatJoinTest(unittest.TestCase):
+    """A nested repeat is joined with its parent and the primary data."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Read the nested form."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            odkform = OdkForm(write_csv_form(os.path.join(temp_dir, 'form')))
+        cls.collection = DatasetCollection(odkform, DatasetSource.BRIEFCASE)
+        cls.visit, cls.hh, cls.primary = cls.collection.get_datasets()
+
+    def setUp(self):
+        """Write the export CSVs."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.temp_dir.name, 'data')
+        os.mkdir(self.data_dir)
+        for filename, rows in EXPORTS.items():
+            write_csv(os.path.join(self.data_dir, filename), rows)
+
+    def tearDown(self):
+        """Remove the export CSVs."""
+        self.temp_dir.cleanup()
+
+    def test_nested_repeat(self):
+        """The rows of each level are joined depth first."""
+        join = RepeatJoin(self.visit, self.data_dir)
+        self.assertEqual(join.datasets, [self.primary, self.hh, self.visit])
+        self.assertEqual(join.header, [
+            'SubmissionDate', 'name', 'SET-OF-hh', 'KEY', 'member',
+            'SET-OF-visit', 'PARENT_KEY', 'visit_date',
+        ])
+        self.assertEqual(list(join), JOINED_VISITS)
+
+    def test_spilled(self):
+        """Indexes spilled to SQLite give the same rows."""
+        for memory_budget in (1, 150):
+            join = RepeatJoin(self.visit, self.data_dir,
+                              memory_budget=memory_budget)
+            self.assertEqual(list(join), JOINED_VISITS)
+
+    def test_inserted_columns(self):
+        """Without merge_append, a repeat follows its begin column."""
+        join = RepeatJoin(self.visit, self.data_dir, merge_append=False)
+        self.assertEqual(join.header, [
+            'SubmissionDate', 'name', 'SET-OF-hh', 'member', 'SET-OF-visit',
+            'visit_date', 'PARENT_KEY', 'KEY',
+        ])
+        self.assertEqual(list(join)[0], ('d1', 'Ann', 's', 'A', 's', 'v1',
+                                         'uuid:1', 'uuid:1'))
+
+    def test_zip_file(self):
+        """The CSVs are read from a zip file without extracting them."""
+        archive = os.path.join(self.temp_dir.name, 'export.zip')
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            for filename in EXPORTS:
+                zipped.write(os.path.join(self.data_dir, filename),
+                             f'export/{filename}')
+        join = RepeatJoin(self.visit, archive, memory_budget=1)
+        self.assertEqual(list(join), JOINED_VISITS)
+
+    def test_join_repeats(self):
+        """Each repeat with all its CSVs found is written as a long CSV."""
+        out_dir = os.path.join(self.temp_dir.name, 'out')
+        paths = self.collection.join_repeats(self.data_dir, out_dir,
+                                             memory_budget=1)
+        self.assertEqual(sorted(os.path.basename(i) for i in paths),
+                         ['Test form_hh_long.csv', 'Test form_visit_long.csv'])
+        path = os.path.join(out_dir, 'Test form_visit_long.csv')
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual([tuple(i) for i in rows[1:]], JOINED_VISITS)
+        os.remove(os.path.join(self.data_dir, 'Test form_hh.csv'))
+        self.assertEqual(self.collection.join_repeats(self.data_dir,
+                                                      out_dir), [])
+
+    def test_errors(self):
+        """A join needs a repeat, its CSVs, and the keys to join on."""
+        with self.assertRaises(DatasetError):
+            RepeatJoin(self.primary, self.data_dir)
+        write_csv(os.path.join(self.data_dir, 'Test form_hh.csv'),
+                  [['member', 'KEY'], ['A', 'uuid:1/hh[1]']])
+        with self.assertRaises(DatasetError):
+            RepeatJoin(self.visit, self.data_dir)
+        os.remove(os.path.join(self.data_dir, 'Test form_hh.csv'))
+        with self.assertRaises(DatasetError):
+            RepeatJoin(self.visit, self.data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
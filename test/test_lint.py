@@ -0,0 +1,143 @@
+"""Tests for finding every problem in a form and its settings."""
+import configparser
+import os.path
+import tempfile
+import unittest
+
+from odk2stata.dofile.lint import lint_form
+from odk2stata.dofile.settings import SettingsManager
+from odk2stata.odkform.diagnostic import ERROR, WARNING, format_diagnostic
+
+from .forms import SETTINGS, write_csv_form
+
+
+# Each problem is noted at the end of its row
+BROKEN_SURVEY = [
+    ['type', 'name', 'label'],
+    ['text', 'name', 'Name'],
+    ['select_one yesno', 'consent', 'Consent'],
+    ['select_one nowhere', 'lost', 'Lost'],  # missing list
+    ['begin group', 'g', 'Group'],
+    ['text', 'name', 'Name again'],  # same name, other group
+    ['end repeat'],  # mismatched end
+    ['text', 'name', 'Name again'],  # same name, same group
+    ['end group'],  # unmatched end
+    ['begin repeat', 'r', 'Repeat'],  # not closed
+    ['select_one_from_file missing.csv', 'pet', 'Pet'],  # missing file
+    ['select_one twice', 'twice', 'Twice'],
+]
+BROKEN_CHOICES = [
+    ['list_name', 'name', 'label', 'o2s_number'],
+    ['yesno', 'yes', 'Yes', ''],
+    ['yesno', 'yes', 'Yes again', ''],  # repeated name
+    ['twice', 'x', 'X', 1],
+    ['twice', 'y', 'Y', 1],  # repeated number
+]
+
+
+def summarize(diagnostics: list) -> list:
+    """Get what locates each diagnostic, without its message."""
+    return [(i.severity, i.code, i.sheet, i.row, i.name, i.path)
+            for i in diagnostics]
+
+
+class LintFormTest(unittest.TestCase):
+    """Lint a broken form with broken settings."""
+
+    def setUp(self):
+        """Write the broken form, and the default settings."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.form_dir = write_csv_form(
+            os.path.join(self.temp_dir.name, 'form'),
+            {'survey': BROKEN_SURVEY, 'choices': BROKEN_CHOICES,
+             'settings': SETTINGS}
+        )
+        self.settings_path = os.path.join(self.temp_dir.name, 'settings.ini')
+        SettingsManager().generate_default_ini(self.settings_path)
+
+    def tearDown(self):
+        """Remove the form and the settings."""
+        self.temp_dir.cleanup()
+
+    def edit_settings(self, changes: dict, remove: tuple = ()) -> None:
+        """Change the settings file, by section and key."""
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(self.settings_path, encoding='utf-8')
+        config.read_dict(changes)
+        for section in remove:
+            config.remove_section(section)
+        with open(self.settings_path, 'w', encoding='utf-8') as file:
+            config.write(file)
+
+    def test_clean_form(self):
+        """A good form with the default settings has no problems."""
+        form_dir = write_csv_form(os.path.join(self.temp_dir.name, 'good'))
+        self.assertEqual(lint_form(form_dir), [])
+        self.assertEqual(lint_form(form_dir, self.settings_path), [])
+
+    def test_form_problems(self):
+        """Every problem in the form is found, in order."""
+        diagnostics = lint_form(self.form_dir)
+        self.assertEqual(summarize(diagnostics), [
+            (ERROR, 'mismatched-end', 'survey', 7, None, None),
+            (ERROR, 'unmatched-end', 'survey', 9, None, None),
+            (ERROR, 'unclosed-begin', 'survey', 10, 'r', None),
+            (ERROR, 'missing-choice-list', 'survey', 4, 'lost', None),
+            (ERROR, 'missing-choice-list', 'survey', 11, 'pet', None),
+            (WARNING, 'duplicate-name', 'survey', 6, 'name', None),
+            (ERROR, 'duplicate-name', 'survey', 8, 'name', None),
+            (WARNING, 'duplicate-choice-name', 'choices', 3, 'yes', None),
+            (ERROR, 'duplicate-choice-number', 'choices', 5, 'y', None),
+        ])
+        self.assertEqual(
+            format_diagnostic(diagnostics[3], 'form'),
+            'form:survey:4: error: Unable to find choice list "nowhere" in '
+            '"choices" [missing-choice-list]'
+        )
+
+    def test_settings_problems(self):
+        """Every problem in the settings is found, after the form's."""
+        self.edit_settings({
+            'DEFAULT': {'dataset_source': 'nowhere'},
+            'drop_column': {'skip': 'maybe', 'dataset_source': 'nowhere'},
+            'label_variable': {'which_label': 'label::Spanish'},
+            'encode_select_one': {'strict_numbering': 'true',
+                                  'number_column': 'code'},
+            'rename': {'direct_rename': 'name\nold new-name'},
+            'metadata': {'colour': 'blue'},
+            'extras': {},
+        }, remove=('destring',))
+        diagnostics = lint_form(self.form_dir, self.settings_path)
+        form_codes = [i.code for i in lint_form(self.form_dir)]
+        form_codes.remove('duplicate-choice-number')
+        path = self.settings_path
+        self.assertEqual([i.code for i in diagnostics[:len(form_codes)]],
+                         form_codes)
+        self.assertEqual(summarize(diagnostics[len(form_codes):]), [
+            (ERROR, 'strict-numbering', 'choices', None, 'yesno', None),
+            (ERROR, 'strict-numbering', 'choices', None, 'twice', None),
+            (ERROR, 'invalid-setting', 'label_variable', None,
+             'which_label', path),
+            (ERROR, 'invalid-rename', 'rename', None, 'direct_rename', path),
+            (ERROR, 'invalid-rename', 'rename', None, 'direct_rename', path),
+            (ERROR, 'invalid-setting', 'DEFAULT', None, 'dataset_source',
+             path),
+            (WARNING, 'unknown-setting', 'extras', None, None, path),
+            (ERROR, 'missing-settings-section', 'destring', None, None,
+             path),
+            (ERROR, 'invalid-setting', 'drop_column', None, 'skip', path),
+            (WARNING, 'unknown-setting', 'metadata', None, 'colour', path),
+        ])
+
+    def test_unreadable(self):
+        """A form or settings that cannot be read is a single problem."""
+        missing = os.path.join(self.temp_dir.name, 'missing.ini')
+        diagnostics = lint_form(b'not a form', missing, 'form.xls')
+        self.assertEqual(summarize(diagnostics), [
+            (ERROR, 'unreadable-form', None, None, None, None),
+            (ERROR, 'unreadable-settings', None, None, None, missing),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
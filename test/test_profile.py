@@ -0,0 +1,208 @@
+"""Tests for profiling the data in export CSVs."""
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import os
+import os.path
+import re
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+from odk2stata.dataset.export_files import ZipMember
+from odk2stata.dataset.profile import (ColumnProfile, DistinctSketch,
+                                       find_chunks, profile_csv)
+from odk2stata.dofile.cli import cli
+from odk2stata.dofile.do_file_collection import DoFileCollection
+from odk2stata.odkform.cache import FormCache
+
+from .forms import write_csv, write_csv_form
+
+
+HEADER = ['SubmissionDate', 'name', 'consent', 'info-age', 'SET-OF-hh',
+          'KEY']
+
+
+def make_rows(count: int) -> list:
+    """Make the records of a primary export CSV, with quoted newlines."""
+    rows = []
+    for i in range(count):
+        name = f'Person {i}\nline two' if i % 7 == 0 else f'Person {i}'
+        rows.append(['2020-01-01', name, 'yes' if i % 2 else '',
+                     str(i % 90), f'uuid:{i}', f'uuid:{i}'])
+    return rows
+
+
+def summarize(profile) -> tuple:
+    """Get everything a profile found, to compare profiles."""
+    columns = [(i.name, i.non_empty, i.numeric, i.integral, i.minimum,
+                i.maximum, i.max_length, i.count_distinct())
+               for i in profile.columns]
+    return profile.header, profile.rows, columns
+
+
+def render_without_dates(do_file_collection: DoFileCollection) -> str:
+    """Render the do files, without the date they were made."""
+    return re.sub(r' \*  Date:.*', '', do_file_collection.render())
+
+
+def run_cli(*args: str) -> str:
+    """Run the command-line interface, and get the do files it prints."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with mock.patch('sys.argv', ['odk2stata', *args]), \
+            contextlib.redirect_stdout(stdout), \
+            contextlib.redirect_stderr(stderr):
+        cli()
+    return re.sub(r' \*  Date:.*', '', stdout.getvalue())
+
+
+class ColumnProfileTest(unittest.TestCase):
+    """A column profile and its sketch sum up the values."""
+
+    def test_update(self):
+        """Counts, ranges and lengths come from the values."""
+        profile = ColumnProfile('x')
+        profile.update(('1', '', '3', '1'))
+        profile.update(('-2.0', ''))
+        self.assertEqual((profile.non_empty, profile.minimum,
+                          profile.maximum), (4, -2.0, 3.0))
+        self.assertTrue(profile.is_numeric())
+        self.assertTrue(profile.integral)
+        self.assertEqual(profile.count_distinct(), 3)
+        self.assertEqual(profile.get_storage_type(), 'byte')
+        profile.update(('é',))
+        self.assertFalse(profile.is_numeric())
+        self.assertIsNone(profile.minimum)
+        self.assertEqual(profile.get_storage_type(), 'str4')
+
+    def test_storage_type(self):
+        """The storage type fits the values."""
+        cases = [((), 'byte'), (('100',), 'byte'), (('101',), 'int'),
+                 (('40000',), 'long'), (('3000000000',), 'double'),
+                 (('0.5',), 'double'), (('a' * 2046,), 'strL')]
+        for values, expected in cases:
+            profile = ColumnProfile('x')
+            profile.update(values)
+            self.assertEqual(profile.get_storage_type(), expected)
+
+    def test_merge(self):
+        """Merged profiles are the profile of all the values."""
+        whole = ColumnProfile('x')
+        whole.update(('1', '2', '', 'b'))
+        first, second = ColumnProfile('x'), ColumnProfile('x')
+        first.update(('1', '2'))
+        second.update(('', 'b'))
+        first.merge(second)
+        self.assertEqual(
+            [(i.non_empty, i.numeric, i.max_length, i.count_distinct())
+             for i in (whole, first)],
+            [(3, False, 1, 3)] * 2
+        )
+
+    def test_distinct_sketch(self):
+        """Small counts are exact, large counts are estimated."""
+        sketch = DistinctSketch()
+        sketch.update(str(i) for i in range(100))
+        self.assertEqual(sketch.count(), 100)
+        self.assertIsNone(sketch.registers)
+        other = DistinctSketch()
+        other.update(str(i) for i in range(50, 10050))
+        sketch.merge(other)
+        self.assertIsNone(sketch.values)
+        self.assertAlmostEqual(sketch.count(), 10050, delta=10050 * 0.1)
+
+
+class ProfileCsvTest(unittest.TestCase):
+    """A CSV gives the same profile however it is read."""
+
+    def setUp(self):
+        """Write a form and a primary export CSV."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.temp_dir.name, 'data')
+        os.mkdir(self.data_dir)
+        self.path = os.path.join(self.data_dir, 'Test form.csv')
+        write_csv(self.path, [HEADER] + make_rows(500))
+
+    def tearDown(self):
+        """Remove the form and the export CSV."""
+        self.temp_dir.cleanup()
+
+    def test_find_chunks(self):
+        """Chunks end at record boundaries, not at quoted newlines."""
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        header_end, chunks = find_chunks(data, 100)
+        self.assertEqual(data[:header_end].decode(),
+                         ','.join(HEADER) + '\r\n')
+        self.assertEqual(chunks[0][0], header_end)
+        self.assertEqual(chunks[-1][1], len(data))
+        for (_, end), (start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 2:end], b'\r\n')
+            self.assertNotEqual(data[end:end + 1], b'l')
+
+    def test_chunks_and_streams(self):
+        """Chunked, parallel and zipped CSVs give the same profile."""
+        expected = summarize(profile_csv(self.path))
+        self.assertEqual(expected[1], 500)
+        self.assertEqual(summarize(profile_csv(self.path, chunk_bytes=100)),
+                         expected)
+        with ProcessPoolExecutor(2) as executor:
+            parallel = profile_csv(self.path, executor, chunk_bytes=1000)
+        self.assertEqual(summarize(parallel), expected)
+        archive = os.path.join(self.temp_dir.name, 'export.zip')
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.write(self.path, 'export/Test form.csv')
+        member = ZipMember(archive, 'export/Test form.csv')
+        for chunk_bytes in (100, 1 << 20):
+            streamed = profile_csv(member, chunk_bytes=chunk_bytes)
+            self.assertEqual(summarize(streamed), expected)
+
+    def test_empty_file(self):
+        """An empty CSV has no columns."""
+        path = os.path.join(self.temp_dir.name, 'empty.csv')
+        with open(path, 'wb'):
+            pass
+        self.assertEqual(summarize(profile_csv(path)), ([], 0, []))
+
+    def test_same_do_files(self):
+        """Parallel and cached runs give the same do files as serial."""
+        form_dir = write_csv_form(os.path.join(self.temp_dir.name, 'form'))
+        serial = DoFileCollection.from_file(form_dir, data_dir=self.data_dir,
+                                            profile=True)
+        profiles = serial.dataset_collection.primary.data_profile
+        self.assertEqual(profiles.rows, 500)
+        expected = render_without_dates(serial)
+        parallel = DoFileCollection.from_file(
+            form_dir, data_dir=self.data_dir, profile=True, parallel=True
+        )
+        self.assertEqual(render_without_dates(parallel), expected)
+        self.assertEqual(
+            summarize(parallel.dataset_collection.primary.data_profile),
+            summarize(profiles)
+        )
+        cache = FormCache(os.path.join(self.temp_dir.name, 'cache'))
+        for _ in range(2):
+            cached = DoFileCollection.from_file(
+                form_dir, cache=cache, parallel=True,
+                data_dir=self.data_dir, profile=True
+            )
+            self.assertEqual(render_without_dates(cached), expected)
+
+    def test_same_cli_output(self):
+        """The command line prints the same with --parallel and --cache."""
+        form_dir = write_csv_form(os.path.join(self.temp_dir.name, 'form'))
+        cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        args = [form_dir, '--data-dir', self.data_dir, '--profile']
+        expected = run_cli(*args)
+        self.assertIn('Test form.csv', expected)
+        self.assertEqual(run_cli(*args, '--parallel'), expected)
+        for _ in range(2):
+            self.assertEqual(run_cli(*args, '--parallel', '--cache',
+                                     '--cache-dir', cache_dir), expected)
+        self.assertTrue(os.listdir(cache_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests for forms read from memory instead of from a path."""
+import io
+import json
+import mmap
+import os.path
+import pathlib
+import tempfile
+import unittest
+
+from benchmarks.synthetic import write_xlsx
+from odk2stata.odkform.odkform import OdkForm
+from odk2stata.odkform.source import MemoryFile, as_buffer, sniff_extension
+from odk2stata.odkform.textform import JsonWorkbook
+from odk2stata.odkform.workbook import open_workbook
+
+from .forms import CHOICES, SURVEY
+
+
+class Reader:
+    """A binary file-like object that can only be read."""
+
+    def __init__(self, contents: bytes):
+        """Initialize a Reader over some bytes."""
+        self._file = io.BytesIO(contents)
+
+    def read(self, size: int = -1) -> bytes:
+        """Read bytes."""
+        return self._file.read(size)
+
+
+def describe(odkform: OdkForm) -> dict:
+    """Get the survey rows, choice lists and settings of a form."""
+    return {
+        'survey': [row.row_values for row in odkform.survey],
+        'choices': {row.row_name: [i.row_name for i in row.choice_list]
+                    for row in odkform.survey if row.choice_list},
+        'settings': (odkform.settings.form_title, odkform.settings.form_id),
+    }
+
+
+class FormSourceTest(unittest.TestCase):
+    """A form in memory is the same as the form at a path."""
+
+    def setUp(self):
+        """Write the nested form, without settings, as an .xlsx."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'household.xlsx')
+        write_xlsx(self.path, {'survey': SURVEY, 'choices': CHOICES})
+        with open(self.path, 'rb') as file:
+            self.contents = file.read()
+        self.expected = describe(OdkForm(self.path))
+
+    def tearDown(self):
+        """Remove the form."""
+        self.temp_dir.cleanup()
+
+    def check(self, source, filename: str = 'household.xlsx', **kwargs) \
+            -> OdkForm:
+        """Check that the form from a source is the expected form."""
+        odkform = OdkForm(source, filename=filename, **kwargs)
+        self.assertEqual(describe(odkform), self.expected)
+        self.assertIsNone(odkform.path)
+        return odkform
+
+    def test_expected(self):
+        """The title and ID of the form at a path come from its name."""
+        self.assertEqual(self.expected['settings'],
+                         ('household', 'household'))
+        odkform = OdkForm(pathlib.Path(self.path))
+        self.assertEqual(odkform.path, self.path)
+        self.assertEqual(describe(odkform), self.expected)
+
+    def test_buffers(self):
+        """Bytes, a bytearray and a memoryview are read the same."""
+        self.check(self.contents)
+        self.check(bytearray(self.contents))
+        self.check(memoryview(self.contents))
+        self.check(memoryview(self.contents).cast('c'))
+
+    def test_files(self):
+        """A real file, an mmap, a BytesIO and a plain reader also are."""
+        with open(self.path, 'rb') as file:
+            self.assertIsInstance(as_buffer(file), mmap.mmap)
+            self.check(file)
+            # The form keeps views of the map, so it is not closed here
+            self.check(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        self.check(io.BytesIO(self.contents))
+        self.assertEqual(as_buffer(Reader(self.contents)), self.contents)
+        self.check(Reader(self.contents))
+
+    def test_filename(self):
+        """The logical file name, if any, gives the default title."""
+        odkform = OdkForm(self.contents)
+        self.assertIsNone(odkform.filename)
+        self.assertEqual(odkform.get_row('hh').row_name, 'hh')
+        odkform = OdkForm(self.contents, filename='other.xlsx')
+        self.assertEqual(odkform.settings.form_title, 'other')
+
+    def test_json_in_memory(self):
+        """A JSON form in memory is found out from its content."""
+        document = json.dumps({'survey': SURVEY, 'choices': CHOICES})
+        encoded = b'\xef\xbb\xbf\n' + document.encode()
+        self.assertEqual(sniff_extension(encoded), '.json')
+        self.assertIsInstance(open_workbook(encoded), JsonWorkbook)
+        self.check(encoded, 'household.json')
+        self.check(document.encode(), 'household.json', parallel=True)
+
+    def test_sniff_extension(self):
+        """Forms are told apart by their first bytes."""
+        self.assertEqual(sniff_extension(self.contents), '.xlsx')
+        self.assertEqual(sniff_extension(b'  <?xml version="1.0"?>'), '.xml')
+        self.assertEqual(sniff_extension(b'\xd0\xcf\x11\xe0'), '.xls')
+
+    def test_memory_file(self):
+        """A MemoryFile reads and seeks like a file."""
+        memory_file = MemoryFile(b'abcdef')
+        self.assertEqual(memory_file.read(2), b'ab')
+        self.assertEqual(memory_file.seek(-1, io.SEEK_END), 5)
+        self.assertEqual(memory_file.read(), b'f')
+        self.assertEqual(memory_file.read(), b'')
+        memory_file.seek(1)
+        self.assertEqual(memory_file.seek(2, io.SEEK_CUR), 3)
+        self.assertEqual(memory_file.read(10), b'def')
+        with self.assertRaises(OSError):
+            memory_file.seek(-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
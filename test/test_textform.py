@@ -0,0 +1,122 @@
+"""Tests for XlsForms saved as CSV files or as JSON."""
+import json
+import os
+import os.path
+import tempfile
+import unittest
+
+import xlrd
+
+from benchmarks.synthetic import write_xlsx
+from odk2stata.odkform.odkform import OdkForm
+from odk2stata.odkform.textform import CsvWorkbook, JsonWorkbook
+from odk2stata.odkform.workbook import open_workbook
+
+from .forms import CHOICES, SETTINGS, SURVEY, write_csv, write_csv_form
+
+
+def describe(odkform: OdkForm) -> dict:
+    """Get the survey rows, choice lists and settings of a form."""
+    return {
+        'survey': [{key: value for key, value in row.row_dict.items()
+                    if value != ''} for row in odkform.survey],
+        'choices': {row.row_name: [(i.row_name, i.get_label('label', ''))
+                                   for i in row.choice_list]
+                    for row in odkform.survey if row.choice_list},
+        'settings': (odkform.settings.form_id, odkform.settings.form_title),
+    }
+
+
+def as_objects(rows: list) -> list:
+    """Turn a header and rows into JSON objects without empty cells."""
+    header = rows[0]
+    return [{key: value for key, value in zip(header, row) if value != ''}
+            for row in rows[1:]]
+
+
+class TextFormTest(unittest.TestCase):
+    """A form read from text is the same as from a spreadsheet."""
+
+    def setUp(self):
+        """Write the nested form as an XlsForm, CSV files and JSON."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        sheets = {'survey': SURVEY, 'choices': CHOICES, 'settings': SETTINGS}
+        self.xlsx_path = os.path.join(self.temp_dir.name, 'form.xlsx')
+        write_xlsx(self.xlsx_path, sheets)
+        self.csv_path = write_csv_form(
+            os.path.join(self.temp_dir.name, 'form'))
+        self.json_path = os.path.join(self.temp_dir.name, 'form.json')
+        document = {
+            'survey': as_objects(SURVEY),
+            'choices': CHOICES,
+            'settings': dict(zip(*SETTINGS)),
+        }
+        with open(self.json_path, 'w', encoding='utf-8') as file:
+            json.dump(document, file)
+        self.expected = describe(OdkForm(self.xlsx_path))
+
+    def tearDown(self):
+        """Remove the forms."""
+        self.temp_dir.cleanup()
+
+    def test_expected(self):
+        """The XlsForm is read as written."""
+        names = [row['name'] for row in self.expected['survey']]
+        self.assertEqual(names, [row[1] for row in SURVEY[1:] if len(row) > 1])
+        self.assertEqual(self.expected['choices']['colors'],
+                         [('red', 'Red'), ('blue', 'Blue')])
+        self.assertEqual(self.expected['settings'], ('testform', 'Test form'))
+
+    def test_csv_form(self):
+        """A directory of CSV files, with or without a slash, is the same."""
+        self.assertIsInstance(open_workbook(self.csv_path), CsvWorkbook)
+        self.assertEqual(describe(OdkForm(self.csv_path)), self.expected)
+        odkform = OdkForm(self.csv_path + os.sep)
+        self.assertEqual(describe(odkform), self.expected)
+        self.assertEqual(odkform.settings.form_id, 'testform')
+
+    def test_json_form(self):
+        """A JSON document, on disk or in memory, is the same."""
+        self.assertIsInstance(open_workbook(self.json_path), JsonWorkbook)
+        self.assertEqual(describe(OdkForm(self.json_path)), self.expected)
+        with open(self.json_path, 'rb') as file:
+            contents = file.read()
+        self.assertEqual(describe(OdkForm(contents)), self.expected)
+
+    def test_csv_cells(self):
+        """CSV text that looks like a plain number is a number."""
+        path = os.path.join(self.temp_dir.name, 'cells')
+        os.mkdir(path)
+        write_csv(os.path.join(path, 'Data.csv'),
+                  [['12', '-0.5', '007', '1e3', ' 3 ', '']])
+        book = CsvWorkbook(path)
+        self.assertEqual(book.sheet_names(), ['Data'])
+        row = book.sheet_by_name('Data').row(0)
+        self.assertEqual([(i.ctype, i.value) for i in row], [
+            (xlrd.XL_CELL_NUMBER, 12.0), (xlrd.XL_CELL_NUMBER, -0.5),
+            (xlrd.XL_CELL_TEXT, '007'), (xlrd.XL_CELL_TEXT, '1e3'),
+            (xlrd.XL_CELL_NUMBER, 3.0), (xlrd.XL_CELL_EMPTY, ''),
+        ])
+        with self.assertRaises(xlrd.XLRDError):
+            book.sheet_by_name('survey')
+
+    def test_json_cells(self):
+        """JSON values are read as the matching cells."""
+        book = JsonWorkbook(json.dumps({
+            'data': [['a', 1, True, None, ''], [[1, 2], {'b': 'c'}]],
+        }).encode())
+        rows = list(book.sheet_by_name('data').get_rows())
+        self.assertEqual([(i.ctype, i.value) for i in rows[0]], [
+            (xlrd.XL_CELL_TEXT, 'a'), (xlrd.XL_CELL_NUMBER, 1.0),
+            (xlrd.XL_CELL_BOOLEAN, 1), (xlrd.XL_CELL_EMPTY, ''),
+            (xlrd.XL_CELL_EMPTY, ''),
+        ])
+        self.assertEqual([i.value for i in rows[1]],
+                         ['[1, 2]', '{"b": "c"}', '', '', ''])
+        for document in ('[]', '{"data": 1}', '{"data": [[1], {}]}'):
+            with self.assertRaises(xlrd.XLRDError):
+                JsonWorkbook(document.encode()).sheet_by_name('data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+"""Tests for the streaming .xlsx reader."""
+import os.path
+import tempfile
+import unittest
+import zipfile
+
+import xlrd
+import xlrd.sheet
+
+from odk2stata.odkform.components import Worksheet
+from odk2stata.odkform.workbook import XlsxWorkbook, open_workbook
+
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+REL_TYPE = REL_NS
+# Cell styles: general, built-in date, custom date and time, a number
+# format with a quoted "d", and a built-in number format
+STYLES = f"""<styleSheet xmlns="{MAIN_NS}">
+<numFmts count="2">
+<numFmt numFmtId="164" formatCode="yyyy\\-mm\\-dd hh:mm"/>
+<numFmt numFmtId="165" formatCode="0.0&quot; days&quot;"/>
+</numFmts>
+<cellXfs count="5">
+<xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="164"/>
+<xf numFmtId="165"/><xf numFmtId="2"/>
+</cellXfs>
+</styleSheet>"""
+SHARED_STRINGS = f"""<sst xmlns="{MAIN_NS}" count="3" uniqueCount="3">
+<si><t xml:space="preserve"> padded </t></si>
+<si><r><t>rich </t></r><r><t>text</t></r></si>
+<si><t>kanji</t><rPh sb="0" eb="1"><t>phonetic</t></rPh></si>
+</sst>"""
+# Each cell, with the cell type and raw value that xlrd gives it
+CELLS = [
+    ('<c r="A1" t="s"><v>0</v></c>', xlrd.XL_CELL_TEXT, ' padded '),
+    ('<c r="B1" t="s"><v>1</v></c>', xlrd.XL_CELL_TEXT, 'rich text'),
+    ('<c r="C1" t="s"><v>2</v></c>', xlrd.XL_CELL_TEXT, 'kanji'),
+    ('<c r="D1"><v>3</v></c>', xlrd.XL_CELL_NUMBER, 3.0),
+    ('<c r="E1" s="4"><v>2.5</v></c>', xlrd.XL_CELL_NUMBER, 2.5),
+    ('<c r="F1" t="b"><v>1</v></c>', xlrd.XL_CELL_BOOLEAN, 1),
+    ('<c r="G1" t="b"><v>0</v></c>', xlrd.XL_CELL_BOOLEAN, 0),
+    ('<c r="H1" s="1"><v>43831</v></c>', xlrd.XL_CELL_DATE, 43831.0),
+    ('<c r="I1" s="2"><v>43831.5</v></c>', xlrd.XL_CELL_DATE, 43831.5),
+    ('<c r="J1" s="1"><v>0.25</v></c>', xlrd.XL_CELL_DATE, 0.25),
+    ('<c r="K1" s="3"><v>7</v></c>', xlrd.XL_CELL_NUMBER, 7.0),
+    ('<c r="L1" t="e"><v>#N/A</v></c>', xlrd.XL_CELL_ERROR, 0x2A),
+    ('<c r="M1" t="inlineStr"><is><t>inline</t></is></c>',
+     xlrd.XL_CELL_TEXT, 'inline'),
+    ('<c r="N1" t="str"><f>A1</f><v>formula</v></c>', xlrd.XL_CELL_TEXT,
+     'formula'),
+    ('<c r="P1"><v>-1</v></c>', xlrd.XL_CELL_NUMBER, -1.0),
+]
+EXPECTED = [' padded ', 'rich text', 'kanji', 3, 2.5, True, False,
+            '2020-01-01 00:00:00', '2020-01-01 12:00:00', '06:00:00', 7,
+            '#ERROR(42)', 'inline', 'formula', '', -1]
+
+
+def write_workbook(path: str, rows: list, date1904: bool = False) -> None:
+    """Write an .xlsx file with one sheet, "data", of raw <row> XML."""
+    workbook_pr = '<workbookPr date1904="1"/>' if date1904 else ''
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('xl/workbook.xml', (
+            f'<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">{workbook_pr}'
+            '<sheets><sheet name="data" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/'
+            'package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{REL_TYPE}/worksheet" '
+            'Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{REL_TYPE}/styles" '
+            'Target="styles.xml"/>'
+            f'<Relationship Id="rId3" Type="{REL_TYPE}/sharedStrings" '
+            'Target="sharedStrings.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr('xl/styles.xml', STYLES)
+        archive.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', (
+            f'<worksheet xmlns="{MAIN_NS}"><sheetData>{"".join(rows)}'
+            '</sheetData></worksheet>'
+        ))
+
+
+class XlsxWorkbookTest(unittest.TestCase):
+    """Read cells of every kind, as xlrd would."""
+
+    def setUp(self):
+        """Write a workbook with a row of every kind of cell."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cells.xlsx')
+        cells = ''.join(i[0] for i in CELLS)
+        rows = [f'<row r="1">{cells}</row>',
+                '<row r="3"><c r="B3" t="s"><v>1</v></c></row>']
+        write_workbook(self.path, rows)
+
+    def tearDown(self):
+        """Remove the workbook."""
+        self.temp_dir.cleanup()
+
+    def test_open_workbook(self):
+        """An .xlsx is read by the streaming reader, from a path or bytes."""
+        self.assertIsInstance(open_workbook(self.path), XlsxWorkbook)
+        with open(self.path, 'rb') as file:
+            contents = file.read()
+        book = open_workbook(contents)
+        self.assertIsInstance(book, XlsxWorkbook)
+        self.assertEqual(book.sheet_names(), ['data'])
+        with self.assertRaises(xlrd.XLRDError):
+            book.sheet_by_name('survey')
+
+    def test_cells_match_xlrd(self):
+        """Each cell has the type and value, and so the same conversion."""
+        book = XlsxWorkbook(self.path)
+        row = book.sheet_by_name('data').row(0)
+        cells = {i: cell for i, cell in enumerate(row)
+                 if cell.ctype != xlrd.XL_CELL_EMPTY}
+        xlrd_cells = [xlrd.sheet.Cell(ctype, value)
+                      for _, ctype, value in CELLS]
+        self.assertEqual([(i.ctype, i.value) for i in cells.values()],
+                         [(i.ctype, i.value) for i in xlrd_cells])
+        values = [Worksheet.cell_to_value(cell, book.datemode)
+                  for cell in row]
+        expected = [Worksheet.cell_to_value(cell, 0) for cell in xlrd_cells]
+        self.assertEqual([values[i] for i in cells], expected)
+        self.assertEqual(values, [value.strip() if isinstance(value, str)
+                                  else value for value in EXPECTED])
+        self.assertEqual([type(i) for i in values],
+                         [type(i) for i in EXPECTED])
+
+    def test_rows(self):
+        """Missing rows and cells are empty, and rows are as wide."""
+        sheet = XlsxWorkbook(self.path).sheet_by_name('data')
+        rows = list(sheet.get_rows())
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({len(i) for i in rows}, {len(EXPECTED)})
+        self.assertEqual({i.ctype for i in rows[1]}, {xlrd.XL_CELL_EMPTY})
+        self.assertEqual(rows[2][1].value, 'rich text')
+        with self.assertRaises(IndexError):
+            sheet.row(3)
+
+    def test_column_blocks_match_rows(self):
+        """Reading by column gives the same cells as reading by row."""
+        sheet = XlsxWorkbook(self.path).sheet_by_name('data')
+        rows = list(sheet.get_rows())
+        ncols = len(rows[0])
+        blocks = list(sheet.iter_column_blocks(ncols, block_size=2))
+        self.assertEqual([i[0] for i in blocks], [0, 2])
+        for first_rowx, types, values in blocks:
+            for colx in range(ncols):
+                for k, (ctype, value) in enumerate(zip(types[colx],
+                                                       values[colx])):
+                    cell = rows[first_rowx + k][colx]
+                    self.assertEqual((ctype, value),
+                                     (cell.ctype, cell.value))
+
+    def test_date1904(self):
+        """Dates are read in the date mode of the workbook."""
+        write_workbook(self.path, [
+            '<row r="1"><c r="A1" s="1"><v>1</v></c>'
+            '<c r="B1" t="d"><v>1904-01-03T12:00:00</v></c></row>'
+        ], date1904=True)
+        book = XlsxWorkbook(self.path)
+        self.assertEqual(book.datemode, 1)
+        row = book.sheet_by_name('data').row(0)
+        self.assertEqual([cell.value for cell in row], [1.0, 2.5])
+        self.assertEqual([Worksheet.cell_to_value(cell, book.datemode)
+                          for cell in row],
+                         [str(xlrd.xldate.xldate_as_datetime(cell.value, 1))
+                          for cell in row])
+        self.assertEqual(Worksheet.cell_to_value(row[0], book.datemode),
+                         '1904-01-02 00:00:00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""Tests for forms rebuilt from their compiled XForm."""
+import os.path
+import re
+import tempfile
+import unittest
+
+from odk2stata.dataset.dataset_collection import DatasetCollection
+from odk2stata.dataset.utils import DatasetSource
+from odk2stata.dofile.do_file_collection import DoFileCollection
+from odk2stata.dofile.settings import SettingsManager
+from odk2stata.error import OdkFormError
+from odk2stata.odkform.odkform import OdkForm
+from odk2stata.odkform.xform import XFormWorkbook
+from odk2stata.odkform.workbook import open_workbook
+
+from .forms import write_csv_form
+
+
+# The nested test form compiled to an XForm, with plain labels and the
+# choice lists as secondary instances
+XFORM = """<?xml version="1.0"?>
+<h:html xmlns="http://www.w3.org/2002/xforms"
+ xmlns:h="http://www.w3.org/1999/xhtml"
+ xmlns:jr="http://openrosa.org/javarosa">
+<h:head><h:title>Test form</h:title><model>
+<instance><data id="testform"><name/><consent/><info><age/></info>
+<hh jr:template=""><member/><colors/><details><years/></details>
+<visit jr:template=""><visit_date/></visit></hh>
+<meta><instanceID/></meta></data></instance>
+<instance id="yesno"><root>
+<item><name>yes</name><label>Yes</label></item>
+<item><name>no</name><label>No</label></item>
+</root></instance>
+<instance id="color"><root>
+<item><name>red</name><label>Red</label></item>
+<item><name>blue</name><label>Blue</label></item>
+</root></instance>
+<bind nodeset="/data/name" type="string"/>
+<bind nodeset="/data/consent" type="string"/>
+<bind nodeset="/data/info/age" type="int"/>
+<bind nodeset="/data/hh/member" type="string"/>
+<bind nodeset="/data/hh/colors" type="string"/>
+<bind nodeset="/data/hh/details/years" type="int"/>
+<bind nodeset="/data/hh/visit/visit_date" type="date"/>
+<bind nodeset="/data/meta/instanceID" type="string" jr:preload="uid"/>
+</model></h:head>
+<h:body>
+<input ref="/data/name"><label>Name</label></input>
+<select1 ref="/data/consent"><label>Consent</label>
+<itemset nodeset="instance('yesno')/root/item">
+<value ref="name"/><label ref="label"/></itemset></select1>
+<group ref="/data/info"><label>Info</label>
+<input ref="/data/info/age"><label>Age</label></input></group>
+<group ref="/data/hh"><label>Household</label><repeat nodeset="/data/hh">
+<input ref="/data/hh/member"><label>Member</label></input>
+<select ref="/data/hh/colors"><label>Colors</label>
+<itemset nodeset="instance('color')/root/item">
+<value ref="name"/><label ref="label"/></itemset></select>
+<group ref="/data/hh/details"><label>Details</label>
+<input ref="/data/hh/details/years"><label>Years</label></input></group>
+<group ref="/data/hh/visit"><label>Visit</label>
+<repeat nodeset="/data/hh/visit">
+<input ref="/data/hh/visit/visit_date"><label>Visit date</label></input>
+</repeat></group>
+</repeat></group>
+</h:body></h:html>
+"""
+
+
+def describe(odkform: OdkForm) -> dict:
+    """Get the survey rows, choice lists and settings of a form."""
+    survey = []
+    for row in odkform.survey:
+        choices = None
+        if row.choice_list:
+            numbered = row.choice_list.get_choices_flexibly_numbered()
+            choices = [tuple(i[:2]) + (i.choice.get_label('label', ''),)
+                       for i in numbered]
+        survey.append((row.row_type.type_string, row.row_name,
+                       row.get_label('label', ''),
+                       [i.row_name for i in row.ancestors], choices))
+    settings = odkform.settings
+    return {'survey': survey,
+            'settings': (settings.form_title, settings.form_id)}
+
+
+def render(odkform: OdkForm) -> str:
+    """Render the Briefcase do files, without the header metadata."""
+    source = DatasetSource.from_string('briefcase')
+    datasets = DatasetCollection(odkform, source)
+    text = DoFileCollection(datasets, SettingsManager()).render()
+    return re.sub(r' \*  (Date|Author|ODK Source):.*', '', text)
+
+
+class XFormTest(unittest.TestCase):
+    """An XForm gives the same form as the XlsForm it came from."""
+
+    def setUp(self):
+        """Write the nested form as CSV files and as an XForm."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.xlsform = OdkForm(write_csv_form(
+            os.path.join(self.temp_dir.name, 'form')))
+        self.path = os.path.join(self.temp_dir.name, 'form.xml')
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(XFORM)
+
+    def tearDown(self):
+        """Remove the forms."""
+        self.temp_dir.cleanup()
+
+    def test_same_form(self):
+        """Survey rows, choice lists and settings are the same."""
+        self.assertIsInstance(open_workbook(self.path), XFormWorkbook)
+        expected = describe(self.xlsform)
+        self.assertEqual(describe(OdkForm(self.path)), expected)
+        self.assertEqual(describe(OdkForm.from_xform(self.path)), expected)
+        in_memory = OdkForm.from_xform(XFORM.encode())
+        self.assertEqual(describe(in_memory), expected)
+
+    def test_same_do_files(self):
+        """The do files for the XForm are those for the XlsForm."""
+        self.assertEqual(render(OdkForm.from_xform(self.path)),
+                         render(self.xlsform))
+
+    def test_inline_items(self):
+        """Inline items make a choice list named after the question."""
+        xform = XFORM.replace(
+            '<itemset nodeset="instance(\'yesno\')/root/item">\n'
+            '<value ref="name"/><label ref="label"/></itemset>',
+            '<item><label>Sure</label><value>1</value></item>'
+            '<item><label>Nope</label><value>0</value></item>'
+        )
+        odkform = OdkForm.from_xform(xform.encode())
+        consent = odkform.get_row('consent')
+        self.assertEqual(consent.row_type.type_string, 'select_one consent')
+        self.assertEqual([(i.row_name, i.get_label('label', ''))
+                          for i in consent.choice_list],
+                         [(1, 'Sure'), (0, 'Nope')])
+
+    def test_not_an_xform(self):
+        """XML that is not well formed is an OdkFormError."""
+        with self.assertRaises(OdkFormError):
+            OdkForm.from_xform(XFORM[:200].encode())
+
+
+if __name__ == '__main__':
+    unittest.main()